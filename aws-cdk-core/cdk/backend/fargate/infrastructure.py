@@ -105,6 +105,18 @@ class BackEndServer(Construct):
             )
         )
 
+        # builds and looks up images of the model inference engine
+        self.backend_execution_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "codebuild:StartBuild",
+                    "codebuild:BatchGetBuilds",
+                    "ecr:DescribeImages",
+                ],
+                resources=["*"],
+            )
+        )
+
         # Attach S3FullAccess IAM Policy
         self.backend_execution_role.add_managed_policy(
             iam.ManagedPolicy.from_aws_managed_policy_name("AmazonS3FullAccess")
@@ -133,6 +145,11 @@ class BackEndServer(Construct):
         )
 
         self.fargate_service.target_group.configure_health_check(path="/docs")
+        # passed on to the inference engines the backend starts, which call it back
+        self.fargate_service.task_definition.default_container.add_environment(
+            "PRELOOP_API_ENDPOINT",
+            f"http://{self.fargate_service.load_balancer.load_balancer_dns_name}",
+        )
         if deploy_env == "dev":
             self.fargate_service.service.node.default_child.add_property_override(
                 "DesiredCount", 0
@@ -58,4 +58,14 @@ class ECRRepos(Construct):
             repository_name="preloop-model-inference-engine",
             removal_policy=RemovalPolicy.DESTROY,
             auto_delete_images=True,
+            lifecycle_rules=[
+                # images built with the libraries of ML models, which the backend
+                # builds again when a model needs one that expired
+                ecr.LifecycleRule(
+                    description="Keep the most recent images built with libraries",
+                    tag_status=ecr.TagStatus.TAGGED,
+                    tag_prefix_list=["libraries-"],
+                    max_image_count=100,
+                )
+            ],
         )
@@ -1,6 +1,6 @@
 import os
 
-from aws_cdk import RemovalPolicy
+from aws_cdk import Duration, RemovalPolicy
 from aws_cdk import aws_s3 as s3
 from constructs import Construct
 
@@ -35,6 +35,17 @@ class s3Buckets(Construct):
             removal_policy=RemovalPolicy.DESTROY,
         )
 
+        # datasource reads cached by the execution engine, under a prefix per organization.
+        # Reads are marked as used by rewriting them, so unused ones expire
+        self.preloop_datasource_cache_bucket = s3.Bucket(
+            self,
+            "PreloopDatasourceCacheBucket",
+            bucket_name=f"preloop-datasource-cache-{deploy_env}",
+            removal_policy=RemovalPolicy.DESTROY,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            lifecycle_rules=[s3.LifecycleRule(expiration=Duration.days(30))],
+        )
+
         self.preloop_public_bucket = s3.Bucket(
             self,
             "PreloopPublicBucket",
@@ -1,3 +1,5 @@
+import os
+
 from aws_cdk import Duration, RemovalPolicy
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_ecr as ecr
@@ -8,6 +10,9 @@ from aws_cdk import aws_stepfunctions as sfn
 from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
 from constructs import Construct
 
+deploy_env = os.getenv("CDK_DEPLOY_ENVIRONMENT")
+datasource_cache_bucket_name = f"preloop-datasource-cache-{deploy_env}"
+
 
 class ECSFargateStack(Construct):
     def __init__(self, scope: Construct, id_: str):
@@ -50,6 +55,20 @@ class ECSFargateStack(Construct):
             )
         )
 
+        # the datasource cache evicts the least recently used reads of an organization
+        self.execution_engine_fargate_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["s3:ListBucket"],
+                resources=[f"arn:aws:s3:::{datasource_cache_bucket_name}"],
+            )
+        )
+        self.execution_engine_fargate_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=["s3:DeleteObject"],
+                resources=[f"arn:aws:s3:::{datasource_cache_bucket_name}/*"],
+            )
+        )
+
         # Attach a custom policy to the role for step functions permissions
         self.execution_engine_fargate_role.add_to_policy(
             iam.PolicyStatement(
@@ -92,6 +111,19 @@ class ECSFargateStack(Construct):
 
         self.container.add_port_mappings(ecs.PortMapping(container_port=80))
 
+        # datasource reads are cached under a prefix per organization in the bucket, so
+        # later executions of the organization find them, and memory mapped from the
+        # ephemeral storage of the task
+        self.container.add_environment(
+            "PRELOOP_DATASOURCE_CACHE_BUCKET", datasource_cache_bucket_name
+        )
+        self.container.add_environment(
+            "PRELOOP_DATASOURCE_CACHE_DIR", "/tmp/preloop-datasource-cache"
+        )
+        self.container.add_environment(
+            "PRELOOP_DATASOURCE_CACHE_MAX_BYTES", str(20 * 1024 * 1024 * 1024)
+        )
+
         self.run_task = sfn_tasks.EcsRunTask(
             self,
             "ExecutionEngineRun",
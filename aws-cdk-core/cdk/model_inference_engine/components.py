@@ -2,6 +2,9 @@ from aws_cdk import Stack
 from constructs import Construct
 
 from cdk.model_inference_engine.ecs.infrastructure import ModelInferenceEngineECS
+from cdk.model_inference_engine.image_build.infrastructure import (
+    ModelInferenceEngineImageBuild,
+)
 
 
 class ModelInferenceEngine(Stack):
@@ -9,3 +12,4 @@ class ModelInferenceEngine(Stack):
         super().__init__(scope, id, **kwargs)
 
         ModelInferenceEngineECS(self, "ModelInferenceEngineECS")
+        ModelInferenceEngineImageBuild(self, "ModelInferenceEngineImageBuild")
@@ -0,0 +1,66 @@
+import aws_cdk.aws_codebuild as codebuild
+import aws_cdk.aws_ecr as ecr
+from aws_cdk import Duration
+from constructs import Construct
+
+
+class ModelInferenceEngineImageBuild(Construct):
+    """
+    Builds images of the model inference engine with the libraries of ML models
+    installed, so inference tasks start without installing packages. The backend
+    starts a build with the BASE_IMAGE to build on, the comma separated LIBRARIES
+    to install and the IMAGE_URI to push the image to.
+    """
+
+    def __init__(self, scope: Construct, id: str):
+        super().__init__(scope, id)
+
+        self.repository = ecr.Repository.from_repository_name(
+            self, "ModelInferenceEngineRepo", "preloop-model-inference-engine"
+        )
+
+        self.project = codebuild.Project(
+            self,
+            "ModelInferenceEngineImageBuildProject",
+            project_name="ModelInferenceEngineImageBuild",
+            environment=codebuild.BuildEnvironment(
+                build_image=codebuild.LinuxBuildImage.STANDARD_7_0,
+                compute_type=codebuild.ComputeType.MEDIUM,
+                # needed to run docker
+                privileged=True,
+            ),
+            timeout=Duration.minutes(30),
+            build_spec=codebuild.BuildSpec.from_object(
+                {
+                    "version": "0.2",
+                    "env": {"shell": "bash"},
+                    "phases": {
+                        "pre_build": {
+                            "commands": [
+                                "aws ecr get-login-password | docker login "
+                                "--username AWS --password-stdin ${IMAGE_URI%%/*}",
+                            ]
+                        },
+                        "build": {
+                            "commands": [
+                                # the libraries are resolved into the lock file of
+                                # the image, from pypi rather than codeartifact
+                                "printf '%s\\n' "
+                                "'ARG BASE_IMAGE' "
+                                "'FROM $BASE_IMAGE' "
+                                "'ARG LIBRARIES' "
+                                "'RUN poetry source remove preloop_main || true' "
+                                "'RUN poetry source remove pypi-store || true' "
+                                "'RUN poetry add $LIBRARIES' "
+                                "> Dockerfile",
+                                "docker build --build-arg BASE_IMAGE=$BASE_IMAGE "
+                                '--build-arg LIBRARIES="${LIBRARIES//,/ }" '
+                                "-t $IMAGE_URI .",
+                                "docker push $IMAGE_URI",
+                            ]
+                        },
+                    },
+                }
+            ),
+        )
+        self.repository.grant_pull_push(self.project)
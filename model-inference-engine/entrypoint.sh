@@ -1,18 +1,19 @@
 #!/bin/bash
 
-# Remove codeartifact repos from pyproject.toml during runtime
-poetry source remove preloop_main
-poetry source remove pypi-store
+# Libraries of the model are installed when its image is built, so tasks start
+# without installing packages
 
-# Install libraries in libs
+# Shared hosts load the inference scripts of their models themselves, when they are first used
+if [ "$HOSTING_MODE" = "shared" ]; then
+    poetry run gunicorn src.shared:app --config gunicorn.conf.py
+    exit $?
+fi
+
+# Only task definitions created before images were built with their libraries still pass them
 if [ -n "$LIBRARIES" ]; then
-    OLD_IFS="$IFS"
-    IFS=',' 
-    read -ra LIBRARIES <<< "$LIBRARIES"
-    for lib in "${LIBRARIES[@]}"; do
-        poetry add $lib
-    done
-    IFS="$OLD_IFS"
+    poetry source remove preloop_main
+    poetry source remove pypi-store
+    poetry add ${LIBRARIES//,/ }
 fi
 
 while IFS='=' read -r key value; do
@@ -20,4 +21,4 @@ while IFS='=' read -r key value; do
 done < <(echo "$ENV_VARS" | jq -r 'to_entries[] | "\(.key)=\(.value)"')
 
 aws s3 cp $INFERENCE_SCRIPT_LOC /app/src/
-poetry run gunicorn src.main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:80
+poetry run gunicorn src.main:app --config gunicorn.conf.py
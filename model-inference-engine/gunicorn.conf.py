@@ -0,0 +1,32 @@
+import gc
+
+from src.workers import HOSTING_MODE, MAX_REQUESTS, PRELOAD_MODEL, WORKERS, available_cpus, worker_count
+
+bind = "0.0.0.0:80"
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = PRELOAD_MODEL
+# replaced in when_ready once the model has been measured
+workers = WORKERS or available_cpus()
+# restarts are spread out, so the workers don't all restart at once
+max_requests = MAX_REQUESTS
+max_requests_jitter = MAX_REQUESTS // 10
+
+
+def when_ready(server):
+    if HOSTING_MODE == "shared":
+        server.log.info(f"Starting {server.num_workers} workers, each loads the shared models it serves")
+        return
+    if not PRELOAD_MODEL:
+        server.log.info(f"Starting {server.num_workers} workers, each loads the model")
+        return
+    # the app, and so the model, was loaded in this process before forking
+    from src.main import model_memory_bytes, worker_memory_bytes
+
+    gc.collect()
+    gc.freeze()
+    if not WORKERS:
+        server.num_workers = worker_count(model_memory_bytes, worker_memory_bytes, preload=True)
+    server.log.info(
+        f"Starting {server.num_workers} workers sharing a model of {model_memory_bytes / 2**20:.0f} MiB, "
+        f"each worker takes about {worker_memory_bytes / 2**20:.0f} MiB more"
+    )
@@ -0,0 +1,173 @@
+"""
+Verification of the API keys sent with requests to models deployed with require_api_key.
+A key is verified once by the Preloop API, which checks its secret against the bcrypt hash
+and that it belongs to the organization of the model, and the result is cached, so later
+requests with the same key only cost a sha256 and a dictionary lookup. Keys are cached for
+API_KEY_CACHE_TTL_SECONDS, keys that were rejected for API_KEY_REJECTED_TTL_SECONDS, and at
+most API_KEY_CACHE_SIZE keys are kept, the least recently used are dropped first. Requests
+with the same key that arrive while it is being verified wait for that verification.
+
+Every API_KEY_REVOCATION_POLL_SECONDS, the ids of the cached keys are sent to the API, and
+keys that were deleted since they were verified are dropped. Every worker process keeps
+its own cache and polls on its own.
+
+The metrics of the engine are only served to the Preloop API, which sends the internal key
+the engine was started with.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import requests
+
+from src.metrics import registry
+
+REQUIRE_API_KEY = bool(os.getenv("REQUIRE_API_KEY"))
+PRELOOP_API_ENDPOINT = os.getenv("PRELOOP_API_ENDPOINT", "")
+PRELOOP_KEY_ID = os.getenv("PRELOOP_KEY_ID", "")
+PRELOOP_SECRET = os.getenv("PRELOOP_SECRET", "")
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", 10000))
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", 300))
+API_KEY_REJECTED_TTL_SECONDS = float(os.getenv("API_KEY_REJECTED_TTL_SECONDS", 5))
+API_KEY_REVOCATION_POLL_SECONDS = float(os.getenv("API_KEY_REVOCATION_POLL_SECONDS", 15))
+API_KEY_VERIFY_TIMEOUT_SECONDS = float(os.getenv("API_KEY_VERIFY_TIMEOUT_SECONDS", 5))
+
+log = logging.getLogger("uvicorn")
+
+
+class Unverified(Exception):
+    """
+    Raised when the API can't be reached to verify a key.
+    """
+
+
+def is_internal_key(key_id: str | None, secret: str | None) -> bool:
+    if not (PRELOOP_KEY_ID and PRELOOP_SECRET and key_id and secret):
+        return False
+    # both are compared, so the time taken doesn't tell which one differs
+    key_id_matches = hmac.compare_digest(key_id.encode(), PRELOOP_KEY_ID.encode())
+    return hmac.compare_digest(secret.encode(), PRELOOP_SECRET.encode()) and key_id_matches
+
+
+class ApiKeyVerifier:
+    def __init__(self, endpoint: str, key_id: str, secret: str, max_size: int, ttl: float, rejected_ttl: float) -> None:
+        self.endpoint = endpoint
+        # the internal key of the owner of the model, which the API verifies keys for
+        self.headers = {"User-Agent": "PreloopInferenceEngine/1.0", "key-id": key_id, "secret": secret}
+        self.max_size = max_size
+        self.ttl = ttl
+        self.rejected_ttl = rejected_ttl
+        self.session = requests.Session()
+        # digests of key ids and secrets, secrets aren't kept. Only used on the event loop
+        self.entries: OrderedDict[str, Tuple[float, bool, str]] = OrderedDict()
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.hits = registry.counter("preloop_api_key_cache_hits_total", "API keys verified from the cache.")
+        self.misses = registry.counter("preloop_api_key_cache_misses_total", "API keys verified by the Preloop API.")
+        self.rejected = registry.counter("preloop_api_keys_rejected_total", "Requests rejected for their API key.")
+        self.revoked = registry.counter(
+            "preloop_api_keys_revoked_total", "Cached API keys dropped because they were deleted."
+        )
+
+    def verify_with_api(self, key_id: str, secret: str) -> bool:
+        try:
+            response = self.session.post(
+                f"{self.endpoint}/api/api-key/verify",
+                headers=self.headers,
+                json={"key_id": key_id, "secret": secret},
+                timeout=API_KEY_VERIFY_TIMEOUT_SECONDS,
+            )
+        except requests.RequestException as e:
+            # the cause is logged rather than sent, since it names internal hosts
+            log.warning(f"Unable to reach the Preloop API to verify an API key: {e}")
+            raise Unverified("Unable to verify the API key, retry later") from e
+        if response.status_code == 200:
+            return True
+        # the API also answers 401 when the key of the model itself isn't valid
+        if response.status_code == 401 and "Invalid key or secret" in response.text:
+            return False
+        log.warning(f"The Preloop API answered {response.status_code} to verify an API key: {response.text}")
+        raise Unverified("Unable to verify the API key, retry later")
+
+    def get(self, digest: str) -> bool | None:
+        entry = self.entries.get(digest)
+        if entry is None:
+            return None
+        expires_at, valid, _ = entry
+        if expires_at < time.monotonic():
+            del self.entries[digest]
+            return None
+        self.entries.move_to_end(digest)
+        return valid
+
+    def put(self, digest: str, valid: bool, key_id: str) -> None:
+        ttl = self.ttl if valid else self.rejected_ttl
+        self.entries[digest] = (time.monotonic() + ttl, valid, key_id)
+        self.entries.move_to_end(digest)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def run(self, digest: str, key_id: str, secret: str) -> bool:
+        try:
+            valid = await asyncio.to_thread(self.verify_with_api, key_id, secret)
+        finally:
+            del self.in_flight[digest]
+        # failures aren't cached, the next request tries the API again
+        self.put(digest, valid, key_id)
+        return valid
+
+    async def verify(self, key_id: str | None, secret: str | None) -> bool:
+        if not key_id or not secret:
+            self.rejected.inc()
+            return False
+        digest = hashlib.sha256(f"{key_id}\n{secret}".encode()).hexdigest()
+        valid = self.get(digest)
+        if valid is not None:
+            self.hits.inc()
+        else:
+            task = self.in_flight.get(digest)
+            if task is not None:
+                self.hits.inc()
+            else:
+                self.misses.inc()
+                # a task of its own, so the verification isn't tied to the request that started it
+                task = asyncio.ensure_future(self.run(digest, key_id, secret))
+                # the error is raised to the callers, this only stops asyncio logging it when nobody waited
+                task.add_done_callback(lambda done: done.cancelled() or done.exception())
+                self.in_flight[digest] = task
+            # shielded, so a request that goes away doesn't cancel the verification of the others
+            valid = await asyncio.shield(task)
+        if not valid:
+            self.rejected.inc()
+        return valid
+
+    def check_with_api(self, key_ids: list) -> set:
+        response = self.session.post(
+            f"{self.endpoint}/api/api-key/check",
+            headers=self.headers,
+            json={"key_ids": key_ids},
+            timeout=API_KEY_VERIFY_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        return set(response.json()["key_ids"])
+
+    async def poll_revocations(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            key_ids = sorted({key_id for _, valid, key_id in self.entries.values() if valid})
+            if not key_ids:
+                continue
+            try:
+                existing_key_ids = await asyncio.to_thread(self.check_with_api, key_ids)
+            except Exception as e:
+                # keys stay cached until they expire, as they would without polling
+                log.warning(f"Unable to check the cached API keys: {e}")
+                continue
+            for digest, (_, valid, key_id) in list(self.entries.items()):
+                if valid and key_id not in existing_key_ids:
+                    del self.entries[digest]
+                    self.revoked.inc()
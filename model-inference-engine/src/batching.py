@@ -0,0 +1,121 @@
+"""
+Micro-batching of predictions. Requests that arrive within max_wait_ms of each other are
+queued and passed to the predict function in one call of at most max_batch_size requests,
+which lets vectorized models (sklearn, xgboost, torch) score many rows for about the cost
+of one.
+
+When batching is on, the predict function is called with each of its arguments as a list
+holding one value per request, and must return a sequence with one prediction per request,
+in the same order.
+
+At most MAX_QUEUED_BATCH_REQUESTS requests wait to be batched. Requests past that are
+rejected like those the prediction executor can't queue, so callers are told to back off.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from src.execution import Overloaded, PredictionExecutor
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 1))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", 5))
+MAX_QUEUED_BATCH_REQUESTS = int(os.getenv("MAX_QUEUED_BATCH_REQUESTS", 256))
+
+
+def predict_columns(predict_function: Callable, columns: Dict[str, List[Any]]) -> List[Any]:
+    """
+    Calls a predict function that takes lists of values, and returns its predictions as a
+    list with one prediction per row.
+    """
+    num_rows = len(next(iter(columns.values()), []))
+    predictions = predict_function(**columns)
+    if hasattr(predictions, "tolist"):
+        predictions = predictions.tolist()
+    predictions = list(predictions)
+    if len(predictions) != num_rows:
+        raise ValueError(f"The predict function returned {len(predictions)} predictions for a batch of {num_rows}")
+    return predictions
+
+
+def predict_rows(predict_function: Callable, columns: Dict[str, List[Any]]) -> List[Any]:
+    """
+    Calls a predict function that takes single values once for each row of the columns.
+    """
+    names = list(columns)
+    return [predict_function(**dict(zip(names, values))) for values in zip(*columns.values())]
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        predict_function: Callable,
+        executor: PredictionExecutor,
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_queued: int = MAX_QUEUED_BATCH_REQUESTS,
+    ) -> None:
+        self.predict_function = predict_function
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queued = max_queued
+        self.queue: asyncio.Queue | None = None
+        self.worker: asyncio.Task | None = None
+        # batches being predicted, kept so their tasks aren't garbage collected
+        self.running = set()
+
+    async def predict(self, request: Dict[str, Any]) -> Any:
+        if self.worker is None:
+            # created here, since the queue and task belong to the event loop of the worker process
+            self.queue = asyncio.Queue(maxsize=self.max_queued)
+            self.worker = asyncio.create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((request, future))
+        except asyncio.QueueFull as e:
+            self.executor.rejected.inc()
+            raise Overloaded("The model is serving as many requests as it can, retry later") from e
+        return await future
+
+    async def next_batch(self) -> List[Tuple[Dict[str, Any], asyncio.Future]]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self) -> None:
+        while True:
+            batch = await self.next_batch()
+            # requests can only be stacked into columns if they have the same arguments
+            groups: Dict[Tuple[str, ...], List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+            for request, future in batch:
+                groups.setdefault(tuple(sorted(request)), []).append((request, future))
+            # batches run on the executor, so the next batch is collected while they run
+            for argument_names, group in groups.items():
+                task = asyncio.create_task(self.run_group(argument_names, group))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+
+    async def run_group(
+        self, argument_names: Tuple[str, ...], group: List[Tuple[Dict[str, Any], asyncio.Future]]
+    ) -> None:
+        columns = {name: [request[name] for request, _ in group] for name in argument_names}
+        try:
+            predictions = await self.executor.run(predict_columns, self.predict_function, columns)
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), prediction in zip(group, predictions):
+            # the request may have been cancelled while it waited
+            if not future.done():
+                future.set_result(prediction)
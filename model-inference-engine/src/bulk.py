@@ -0,0 +1,214 @@
+"""
+Reading and writing the columnar bodies of the bulk prediction endpoint. Requests hold
+one column per argument of the predict function, as an Arrow IPC stream or file, a
+parquet file, or a JSON object of column arrays, and may be compressed with gzip,
+deflate, br, zstd or lz4. Predictions are made on chunks of BULK_CHUNK_ROWS rows and each
+chunk is written to the response as soon as it is ready, in the format of the request.
+
+Bodies are read up to BULK_MAX_BODY_BYTES and decompressed up to BULK_MAX_DECOMPRESSED_BYTES,
+so a small compressed body can't expand to fill the memory of the worker. Every chunk is
+parsed and validated before any predictions are made, because once the response has started
+a bad row can only end it early.
+"""
+import io
+import json
+import os
+import zlib
+from typing import Any, Callable, Dict, Iterator, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import ValidationError
+from starlette.requests import Request
+
+from src.encoding import dumps
+
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", 10000))
+BULK_MAX_BODY_BYTES = int(os.getenv("BULK_MAX_BODY_BYTES", 256 * 2**20))
+BULK_MAX_DECOMPRESSED_BYTES = int(os.getenv("BULK_MAX_DECOMPRESSED_BYTES", 2**30))
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+JSON_MEDIA_TYPE = "application/json"
+MEDIA_TYPES = (ARROW_STREAM_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE, PARQUET_MEDIA_TYPE, JSON_MEDIA_TYPE)
+
+# content encodings that arrow can decompress, by their name in the Content-Encoding header
+ARROW_CODECS = {"gzip": "gzip", "x-gzip": "gzip", "br": "brotli", "zstd": "zstd", "lz4": "lz4"}
+
+
+class UnsupportedBody(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class InvalidRows(Exception):
+    """
+    Raised when rows of a request don't match the arguments of the predict function, with
+    the validation errors located by the index of the row in the whole request.
+    """
+
+    def __init__(self, errors: List[Dict[str, Any]]) -> None:
+        super().__init__(f"{len(errors)} validation errors")
+        self.errors = errors
+
+
+def media_type(content_type: str | None) -> str:
+    media = (content_type or JSON_MEDIA_TYPE).split(";")[0].strip().lower()
+    if media == "application/x-parquet":
+        return PARQUET_MEDIA_TYPE
+    if media not in MEDIA_TYPES:
+        raise UnsupportedBody(f"Unsupported content type {content_type}, use one of {', '.join(MEDIA_TYPES)}")
+    return media
+
+
+async def read_body(request: Request, max_bytes: int = BULK_MAX_BODY_BYTES) -> bytes:
+    """
+    Reads the body of a request as it arrives, and stops as soon as it is larger than
+    max_bytes, whether or not the client sent a Content-Length.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+        raise BodyTooLarge(f"The request body is larger than {max_bytes} bytes")
+    body = bytearray()
+    async for data in request.stream():
+        body += data
+        if len(body) > max_bytes:
+            raise BodyTooLarge(f"The request body is larger than {max_bytes} bytes")
+    return bytes(body)
+
+
+def decompress(body: bytes, content_encoding: str | None, max_bytes: int = BULK_MAX_DECOMPRESSED_BYTES) -> bytes:
+    # encodings are listed in the order they were applied, so they are undone in reverse
+    encodings = [encoding.strip().lower() for encoding in (content_encoding or "").split(",") if encoding.strip()]
+    for encoding in reversed(encodings):
+        if encoding == "identity":
+            continue
+        # one byte more than the limit is read, to tell a body of exactly max_bytes from a larger one
+        if encoding == "deflate":
+            body = zlib.decompressobj().decompress(body, max_bytes + 1)
+        elif encoding in ARROW_CODECS:
+            body = pa.CompressedInputStream(pa.BufferReader(body), ARROW_CODECS[encoding]).read(max_bytes + 1)
+        else:
+            raise UnsupportedBody(f"Unsupported content encoding {encoding}")
+        if len(body) > max_bytes:
+            raise BodyTooLarge(f"The decompressed request body is larger than {max_bytes} bytes")
+    return body
+
+
+def iter_chunks(body: bytes, media: str, chunk_rows: int = BULK_CHUNK_ROWS) -> Iterator[Dict[str, List[Any]]]:
+    """
+    Yields the rows of a request body as dictionaries of column lists, at most chunk_rows
+    rows at a time.
+    """
+    if media == JSON_MEDIA_TYPE:
+        columns = json.loads(body)
+        if not isinstance(columns, dict) or not all(isinstance(column, list) for column in columns.values()):
+            raise UnsupportedBody("JSON bodies must be an object with an array of values for each argument")
+        num_rows = {len(column) for column in columns.values()}
+        if len(num_rows) > 1:
+            raise UnsupportedBody("All columns must have the same number of values")
+        for start in range(0, num_rows.pop() if num_rows else 0, chunk_rows):
+            yield {name: column[start : start + chunk_rows] for name, column in columns.items()}
+        return
+
+    if media == PARQUET_MEDIA_TYPE:
+        batches = pq.ParquetFile(pa.BufferReader(body)).iter_batches(batch_size=chunk_rows)
+        for batch in batches:
+            yield batch.to_pydict()
+        return
+
+    if media == ARROW_FILE_MEDIA_TYPE:
+        table = pa.ipc.open_file(pa.BufferReader(body)).read_all()
+    else:
+        table = pa.ipc.open_stream(pa.BufferReader(body)).read_all()
+    for start in range(0, table.num_rows, chunk_rows):
+        yield table.slice(start, chunk_rows).to_pydict()
+
+
+def row_error(error: Dict[str, Any], offset: int) -> Dict[str, Any]:
+    # errors of a column value are located by the name of the column then the index in the chunk
+    loc = error["loc"]
+    if len(loc) > 1 and isinstance(loc[1], int):
+        loc = (loc[0], loc[1] + offset, *loc[2:])
+    return {**error, "loc": loc}
+
+
+def read_chunks(
+    body: bytes,
+    content_encoding: str | None,
+    media: str,
+    validate: Callable[[Dict[str, List[Any]]], Dict[str, List[Any]]],
+    chunk_rows: int = BULK_CHUNK_ROWS,
+) -> List[Dict[str, List[Any]]]:
+    """
+    Decompresses and parses a request body, and validates every chunk with validate, so
+    that a request with a bad row is rejected before any of its predictions are sent.
+    Blocks while it works through the whole body, so it is called on a thread.
+    """
+    chunks = []
+    offset = 0
+    for chunk in iter_chunks(decompress(body, content_encoding), media, chunk_rows):
+        try:
+            chunks.append(validate(chunk))
+        except ValidationError as e:
+            raise InvalidRows([row_error(error, offset) for error in e.errors(include_url=False)]) from e
+        offset += len(next(iter(chunk.values()), []))
+    return chunks
+
+
+class PredictionWriter:
+    """
+    Encodes chunks of predictions in a response format. write returns the bytes that are
+    ready to be sent after each chunk and close returns the rest.
+    """
+
+    def __init__(self, media: str) -> None:
+        self.media = media
+        self.sink = io.BytesIO()
+        self.writer = None
+        self.schema = None
+        self.started = False
+
+    def drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def open(self, schema: pa.Schema) -> None:
+        self.schema = schema
+        if self.media == PARQUET_MEDIA_TYPE:
+            self.writer = pq.ParquetWriter(self.sink, schema)
+        elif self.media == ARROW_FILE_MEDIA_TYPE:
+            self.writer = pa.ipc.new_file(self.sink, schema)
+        else:
+            self.writer = pa.ipc.new_stream(self.sink, schema)
+
+    def write(self, predictions: List[Any]) -> bytes:
+        if self.media == JSON_MEDIA_TYPE:
+            values = dumps(predictions)[1:-1]
+            if not values:
+                return b""
+            prefix = b"," if self.started else b'{"prediction":['
+            self.started = True
+            return prefix + values
+
+        table = pa.table({"prediction": predictions})
+        if self.writer is None:
+            self.open(table.schema)
+        # later chunks may infer a narrower type, e.g. ints after floats
+        self.writer.write_table(table.cast(self.schema))
+        return self.drain()
+
+    def close(self) -> bytes:
+        if self.media == JSON_MEDIA_TYPE:
+            return b"]}" if self.started else b'{"prediction":[]}'
+        if self.writer is None:
+            # no rows were sent, so there are no predictions to take a type from
+            self.open(pa.schema([("prediction", pa.null())]))
+        self.writer.close()
+        return self.drain()
@@ -0,0 +1,98 @@
+"""
+Cache of predictions, for callers that send the same inputs again within a short time.
+Predictions are keyed by a hash of the request body, with keys in sorted order, and the
+version of the model, and are kept for PREDICTION_CACHE_TTL_SECONDS. At most
+PREDICTION_CACHE_SIZE predictions are kept, the least recently used are dropped first.
+Identical requests that arrive while a prediction is running wait for that prediction
+instead of running their own. Every worker process keeps its own cache.
+
+The cache is off unless PREDICTION_CACHE_SIZE is set, since it is only correct for predict
+functions that always return the same prediction for the same inputs.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from src.encoding import dumps
+from src.metrics import registry
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 0))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", 60))
+
+
+def cache_key(request: Dict[str, Any], version: str) -> str:
+    return hashlib.sha256(version.encode() + b"\n" + dumps(request, sort_keys=True)).hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, max_size: int, ttl: float, version: str) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = version
+        # only used on the event loop, so it needs no lock
+        self.entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = registry.counter("preloop_prediction_cache_hits_total", "Predictions served from the cache.")
+        self.coalesced = registry.counter(
+            "preloop_prediction_cache_coalesced_total", "Predictions that waited for an identical running prediction."
+        )
+        self.misses = registry.counter("preloop_prediction_cache_misses_total", "Predictions that had to be run.")
+        registry.gauge(
+            "preloop_prediction_cache_hit_ratio",
+            "Share of predictions that did not have to be run.",
+            self.hit_ratio,
+        )
+        registry.gauge("preloop_prediction_cache_entries", "Predictions in the cache.", lambda: len(self.entries))
+
+    def hit_ratio(self) -> float:
+        served = self.hits.value + self.coalesced.value
+        total = served + self.misses.value
+        return served / total if total else 0.0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, prediction = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, prediction
+
+    def put(self, key: str, prediction: Any) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, prediction)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            prediction = await compute()
+        finally:
+            del self.in_flight[key]
+        # errors aren't cached, the next request runs the prediction again
+        self.put(key, prediction)
+        return prediction
+
+    async def predict(self, request: Dict[str, Any], compute: Callable[[], Awaitable[Any]]) -> Any:
+        key = cache_key(request, self.version)
+        found, prediction = self.get(key)
+        if found:
+            self.hits.inc()
+            return prediction
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced.inc()
+        else:
+            self.misses.inc()
+            # a task of its own, so the prediction isn't tied to the request that started it
+            task = asyncio.ensure_future(self.run(key, compute))
+            # the error is raised to the callers, this only stops asyncio logging it when nobody waited
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self.in_flight[key] = task
+        # shielded, so a caller that goes away doesn't cancel the prediction of the others
+        return await asyncio.shield(task)
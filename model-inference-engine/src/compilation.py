@@ -0,0 +1,252 @@
+"""
+Compilation of scikit-learn and xgboost models to ONNX, which ONNX Runtime runs without
+the overhead of the python predict path of the libraries, so a prediction for a single row
+takes tens of microseconds instead of hundreds. With COMPILE_MODEL, the models that the
+inference script loaded into its globals are converted when the model is loaded, and each
+is replaced by its compiled version only if both make the same predictions on a sample of
+COMPILE_VERIFICATION_ROWS rows: the same labels for classifiers, and probabilities and
+predicted values within COMPILED_MODEL_TOLERANCE. Models that can't be converted, or whose
+predictions differ, are served by their library as before.
+
+No holdout data is kept with the model, so the sample is drawn over the range of values
+the model was fit on, taken from the split thresholds of tree models and from the scaler
+at the start of a pipeline.
+"""
+import copy
+import logging
+import os
+import time
+from types import ModuleType
+from typing import Any, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.metrics import registry
+
+COMPILE_MODEL = os.getenv("COMPILE_MODEL", "False") == "True"
+COMPILED_MODEL_TOLERANCE = float(os.getenv("COMPILED_MODEL_TOLERANCE", 1e-4))
+COMPILE_VERIFICATION_ROWS = int(os.getenv("COMPILE_VERIFICATION_ROWS", 1000))
+
+# models of these modules, and pipelines ending with one, are converted
+SUPPORTED_MODULES = ("sklearn.linear_model", "sklearn.tree", "sklearn.ensemble", "xgboost")
+
+log = logging.getLogger("uvicorn")
+
+compiled_models = 0
+registry.gauge(
+    "preloop_compiled_models", "Models served by ONNX Runtime instead of their library.", lambda: compiled_models
+)
+compiled_fallbacks = registry.counter(
+    "preloop_compiled_model_fallbacks_total", "Predictions the compiled model couldn't make, made by the library."
+)
+
+
+class NotCompiled(Exception):
+    pass
+
+
+class CompiledModel:
+    """
+    Makes the predictions of a model with an ONNX Runtime session. Inputs the session can't
+    take, like dataframes with columns of strings, are predicted by the original model, and
+    any other attribute is looked up on it.
+    """
+
+    def __init__(self, original, session, dtype: type, classifier: bool) -> None:
+        self.original = original
+        self.session = session
+        self.dtype = dtype
+        self.classifier = classifier
+        self.input_name = session.get_inputs()[0].name
+        feature_names = getattr(original, "feature_names_in_", None)
+        self.feature_names = None if feature_names is None else pd.Index(feature_names)
+        # set once verified, so predictions come back with the types the library returns
+        self.output_dtypes = {}
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for attributes that aren't set on the compiled model
+        if "original" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.__dict__["original"], name)
+
+    def run(self, X) -> List[np.ndarray]:
+        # columns are only reordered when they differ, which costs more than the prediction
+        if isinstance(X, pd.DataFrame) and self.feature_names is not None and not X.columns.equals(self.feature_names):
+            X = X[self.feature_names]
+        return self.session.run(None, {self.input_name: np.asarray(X, dtype=self.dtype)})
+
+    def predict(self, X) -> np.ndarray:
+        try:
+            outputs = self.run(X)
+        except Exception:
+            compiled_fallbacks.inc()
+            return self.original.predict(X)
+        prediction = outputs[0]
+        if prediction.ndim == 2 and prediction.shape[1] == 1:
+            prediction = prediction.ravel()
+        return prediction.astype(self.output_dtypes.get("predict", prediction.dtype), copy=False)
+
+    def predict_proba(self, X) -> np.ndarray:
+        try:
+            outputs = self.run(X)
+        except Exception:
+            compiled_fallbacks.inc()
+            return self.original.predict_proba(X)
+        return outputs[1].astype(self.output_dtypes.get("predict_proba", outputs[1].dtype), copy=False)
+
+
+def is_supported(model) -> bool:
+    if type(model).__module__.startswith("sklearn.pipeline"):
+        return bool(getattr(model, "steps", None)) and is_supported(model.steps[-1][1])
+    return type(model).__module__.startswith(SUPPORTED_MODULES) and hasattr(model, "n_features_in_")
+
+
+def tree_thresholds(model) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Returns the features and thresholds of the splits of a tree model, as pairs of arrays.
+    """
+    if hasattr(model, "tree_"):
+        split = model.tree_.feature >= 0
+        return [(model.tree_.feature[split], model.tree_.threshold[split])]
+    if hasattr(model, "get_booster"):
+        trees = model.get_booster().trees_to_dataframe()
+        trees = trees[trees["Feature"] != "Leaf"]
+        names = list(getattr(model, "feature_names_in_", []))
+        features = [names.index(name) if name in names else int(name[1:]) for name in trees["Feature"]]
+        return [(np.asarray(features, dtype=int), trees["Split"].to_numpy(dtype=float))]
+    thresholds = []
+    # a list of trees, or an array of them for gradient boosting with one tree per class
+    for estimator in np.ravel(np.asarray(getattr(model, "estimators_", []), dtype=object)):
+        thresholds.extend(tree_thresholds(estimator))
+    return thresholds
+
+
+def feature_ranges(model, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    low, high = np.full(n_features, -3.0), np.full(n_features, 3.0)
+    if type(model).__module__.startswith("sklearn.pipeline"):
+        scaler = model.steps[0][1]
+        if hasattr(scaler, "mean_") and hasattr(scaler, "scale_"):
+            return scaler.mean_ - 3 * scaler.scale_, scaler.mean_ + 3 * scaler.scale_
+        return low, high
+    thresholds = tree_thresholds(model)
+    if not thresholds:
+        return low, high
+    features = np.concatenate([pair[0] for pair in thresholds])
+    values = np.concatenate([pair[1] for pair in thresholds])
+    for feature in np.unique(features):
+        feature_values = values[features == feature]
+        # widened, so the sample also falls on both sides of the outermost splits
+        margin = 0.1 * (feature_values.max() - feature_values.min()) + 1
+        low[feature], high[feature] = feature_values.min() - margin, feature_values.max() + margin
+    return low, high
+
+
+def verification_sample(model) -> np.ndarray:
+    n_features = model.n_features_in_
+    low, high = feature_ranges(model, n_features)
+    return np.random.default_rng(0).uniform(low, high, size=(COMPILE_VERIFICATION_ROWS, n_features))
+
+
+def convert(model, dtype: type):
+    n_features = model.n_features_in_
+    if type(model).__module__.startswith("xgboost"):
+        import onnxmltools
+        from onnxmltools.convert.common.data_types import FloatTensorType
+
+        if dtype is not np.float32:
+            raise NotCompiled("xgboost models are only converted with float32 inputs")
+        if getattr(model, "feature_names_in_", None) is not None:
+            # the converter only takes features named f0, f1... and inputs are reordered before predicting
+            model = copy.deepcopy(model)
+            model.get_booster().feature_names = None
+        return onnxmltools.convert_xgboost(model, initial_types=[("input", FloatTensorType([None, n_features]))])
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import DoubleTensorType, FloatTensorType
+
+    tensor_type = DoubleTensorType if dtype is np.float64 else FloatTensorType
+    options = {"zipmap": False} if hasattr(model, "predict_proba") else None
+    return convert_sklearn(model, initial_types=[("input", tensor_type([None, n_features]))], options=options)
+
+
+def compile_model(model):
+    """
+    Returns the model compiled for ONNX Runtime. Float64 inputs are tried first, as they
+    keep the precision of the library, and float32 next, which some converters only support.
+    """
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    # ONNX Runtime threads must not exist before gunicorn forks the workers
+    options.intra_op_num_threads = 1
+    options.inter_op_num_threads = 1
+    classifier = hasattr(model, "predict_proba")
+    sample = verification_sample(model)
+    if isinstance(getattr(model, "feature_names_in_", None), np.ndarray):
+        sample = pd.DataFrame(sample, columns=model.feature_names_in_)
+    errors = []
+    for dtype in (np.float64, np.float32):
+        try:
+            onnx_model = convert(model, dtype)
+            session = onnxruntime.InferenceSession(
+                onnx_model.SerializeToString(), options, providers=["CPUExecutionProvider"]
+            )
+            compiled = CompiledModel(model, session, dtype, classifier)
+            expected = {"predict": np.asarray(model.predict(sample))}
+            actual = {"predict": np.asarray(compiled.predict(sample))}
+            if classifier:
+                expected["predict_proba"] = np.asarray(model.predict_proba(sample))
+                actual["predict_proba"] = np.asarray(compiled.predict_proba(sample))
+            for method, values in expected.items():
+                exact = classifier and method == "predict"
+                if values.shape != actual[method].shape or not (
+                    np.array_equal(values, actual[method])
+                    if exact
+                    else np.allclose(
+                        values, actual[method], rtol=COMPILED_MODEL_TOLERANCE, atol=COMPILED_MODEL_TOLERANCE
+                    )
+                ):
+                    raise NotCompiled(f"the compiled {method} differs from the library's")
+            compiled.output_dtypes = {method: values.dtype for method, values in expected.items()}
+            return compiled, sample
+        except Exception as e:
+            # converter errors can hold the whole model
+            errors.append(f"{np.dtype(dtype).name}: {str(e).splitlines()[0][:200]}")
+    raise NotCompiled("; ".join(errors))
+
+
+def row_latency_seconds(predict, row, repeats: int = 100) -> float:
+    started_at = time.perf_counter()
+    for _ in range(repeats):
+        predict(row)
+    return (time.perf_counter() - started_at) / repeats
+
+
+def compile_models(module: ModuleType) -> None:
+    """
+    Replaces the supported models in the globals of the inference script with their
+    compiled versions.
+    """
+    global compiled_models
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        log.warning("ONNX Runtime isn't installed, models are served by their library")
+        return
+    for name, model in list(vars(module).items()):
+        if name.startswith("__") or not is_supported(model):
+            continue
+        try:
+            compiled, sample = compile_model(model)
+        except Exception as e:
+            log.warning(f"{name} is served by its library, it couldn't be compiled: {e}")
+            continue
+        row = sample[:1]
+        library_seconds = row_latency_seconds(model.predict, row)
+        compiled_seconds = row_latency_seconds(compiled.predict, row)
+        setattr(module, name, compiled)
+        compiled_models += 1
+        log.info(
+            f"{name} is served by ONNX Runtime with {np.dtype(compiled.dtype).name} inputs, a prediction for "
+            f"one row takes {compiled_seconds * 1e6:.0f}µs instead of {library_seconds * 1e6:.0f}µs"
+        )
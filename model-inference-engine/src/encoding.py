@@ -0,0 +1,33 @@
+"""
+JSON encoding of predictions. Responses are encoded with orjson, which writes numpy arrays
+and scalars natively instead of going through FastAPI's generic encoder, and is much
+faster for large lists. NaN and infinity are written as null, since JSON can't hold them.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def default(value: Any) -> Any:
+    # types orjson doesn't write itself, like pandas objects and arrays of objects
+    if hasattr(value, "to_dict") and hasattr(value, "columns"):
+        return value.to_dict("records")
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Predictions of type {type(value).__name__} can't be written as JSON")
+
+
+def dumps(value: Any, sort_keys: bool = False) -> bytes:
+    return orjson.dumps(value, default=default, option=(OPTIONS | orjson.OPT_SORT_KEYS) if sort_keys else OPTIONS)
+
+
+class PredictionResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,85 @@
+"""
+Runs predict functions off the event loop, so a slow prediction doesn't hold up health
+checks and other requests handled by the same worker. Predictions run on a thread pool,
+which suits models that release the GIL (numpy, sklearn, xgboost, torch), or on a process
+pool for models written in pure python. At most PREDICT_WORKERS predictions run at once
+and MAX_QUEUED_PREDICTIONS more can wait for a free worker. Predictions past that are
+rejected, so callers are told to back off instead of waiting on a growing queue.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from src.metrics import registry
+
+PREDICT_EXECUTOR = os.getenv("PREDICT_EXECUTOR", "thread")
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", os.cpu_count() or 1))
+MAX_QUEUED_PREDICTIONS = int(os.getenv("MAX_QUEUED_PREDICTIONS", 32))
+# seconds that rejected callers are asked to wait before retrying
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", 1))
+
+
+class Overloaded(Exception):
+    pass
+
+
+def _timed_call(function: Callable, args):
+    # module level, so it can be sent to a process pool
+    started_at = time.monotonic()
+    try:
+        return started_at, function(*args), None
+    except Exception as e:
+        return started_at, None, e
+
+
+class PredictionExecutor:
+    def __init__(self, kind: str, workers: int, max_queued: int) -> None:
+        if kind not in ("thread", "process"):
+            raise ValueError(f"PREDICT_EXECUTOR must be thread or process, not {kind}")
+        self.kind = kind
+        # created on first use, so gunicorn workers forked from a master that loaded the app
+        # each get their own pool instead of sharing the master's queues
+        self.executor = None
+        self.workers = workers
+        self.max_queued = max_queued
+        # predictions submitted and not yet finished, only changed on the event loop
+        self.pending = 0
+        registry.gauge(
+            "preloop_prediction_queue_depth",
+            "Predictions waiting for a free worker.",
+            lambda: max(0, self.pending - self.workers),
+        )
+        self.wait_seconds = registry.histogram(
+            "preloop_prediction_queue_wait_seconds", "Time predictions waited for a free worker."
+        )
+        # the time of the predict function itself, the rest of the request latency is the engine's
+        self.run_seconds = registry.histogram("preloop_prediction_run_seconds", "Time spent running predictions.")
+        self.rejected = registry.counter(
+            "preloop_predictions_rejected_total", "Predictions rejected because the queue was full."
+        )
+
+    async def run(self, function: Callable, *args, shed: bool = True) -> Any:
+        # shed is turned off for work that was already accepted, like the later chunks of a bulk request
+        if shed and self.pending >= self.workers + self.max_queued:
+            self.rejected.inc()
+            raise Overloaded("The model is serving as many requests as it can, retry later")
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="predict")
+        self.pending += 1
+        submitted_at = time.monotonic()
+        try:
+            started_at, result, error = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _timed_call, function, args
+            )
+        finally:
+            self.pending -= 1
+        self.wait_seconds.observe(started_at - submitted_at)
+        self.run_seconds.observe(time.monotonic() - started_at)
+        if error is not None:
+            raise error
+        return result
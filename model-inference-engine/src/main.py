@@ -1,25 +1,223 @@
+import asyncio
+import contextlib
+import functools
 import importlib
 import logging
 import os
+import time
 from typing import Any, Dict
 
-from fastapi import FastAPI, Header, HTTPException
-from passlib.context import CryptContext
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 
+from src.api_keys import (
+    API_KEY_CACHE_SIZE,
+    API_KEY_CACHE_TTL_SECONDS,
+    API_KEY_REJECTED_TTL_SECONDS,
+    API_KEY_REVOCATION_POLL_SECONDS,
+    PRELOOP_API_ENDPOINT,
+    PRELOOP_KEY_ID,
+    PRELOOP_SECRET,
+    REQUIRE_API_KEY,
+    ApiKeyVerifier,
+    Unverified,
+    is_internal_key,
+)
+from src.batching import MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS, MicroBatcher, predict_columns, predict_rows
+from src.bulk import BodyTooLarge, InvalidRows, PredictionWriter, UnsupportedBody, media_type, read_body, read_chunks
+from src.cache import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS, PredictionCache
+from src.compilation import COMPILE_MODEL, compile_models
+from src.encoding import PredictionResponse
+from src.execution import (
+    MAX_QUEUED_PREDICTIONS,
+    PREDICT_EXECUTOR,
+    PREDICT_WORKERS,
+    RETRY_AFTER_SECONDS,
+    Overloaded,
+    PredictionExecutor,
+)
+from src.metrics import RequestMetricsMiddleware, registry, resident_memory_bytes
+from src.quantization import QUANTIZE_MODEL, quantize_models
+from src.schema import ML_MODEL_INPUTS, RequestSchema
+
+log = logging.getLogger("uvicorn")
+
+# importing the inference script loads the model
+worker_memory_bytes = resident_memory_bytes()
+load_started_at = time.monotonic()
 inference_module = importlib.import_module("src.inference")
+if COMPILE_MODEL:
+    compile_models(inference_module)
+if QUANTIZE_MODEL:
+    quantize_models(inference_module)
+model_load_seconds = time.monotonic() - load_started_at
+model_memory_bytes = resident_memory_bytes() - worker_memory_bytes
+log.info(
+    f"Worker {os.getpid()} loaded the model in {model_load_seconds:.2f}s "
+    f"and holds {resident_memory_bytes() / 2**20:.0f} MiB"
+)
+registry.gauge("preloop_model_load_seconds", "Time the worker took to load the model.", lambda: model_load_seconds)
+registry.gauge(
+    "preloop_worker_resident_memory_bytes",
+    "Memory of the worker, including memory-mapped model objects it has read.",
+    resident_memory_bytes,
+)
 
 predict_function = getattr(inference_module, os.getenv("PREDICT_FUNCTION_NAME", "predict"))
+request_schema = RequestSchema(predict_function, ML_MODEL_INPUTS, batched=MAX_BATCH_SIZE > 1)
+predict_function = request_schema.bind(predict_function)
 
-log = logging.getLogger("uvicorn")
 
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI):
+    # runs in each worker, which shares its metrics with the others through files
+    registry.start_flushing()
+    revocation_poller = None
+    if api_key_verifier is not None:
+        revocation_poller = asyncio.create_task(api_key_verifier.poll_revocations(API_KEY_REVOCATION_POLL_SECONDS))
+    yield
+    if revocation_poller is not None:
+        revocation_poller.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# keys are verified by the Preloop API, with the internal key of the owner of the model
+api_key_verifier = (
+    ApiKeyVerifier(
+        PRELOOP_API_ENDPOINT,
+        PRELOOP_KEY_ID,
+        PRELOOP_SECRET,
+        API_KEY_CACHE_SIZE,
+        API_KEY_CACHE_TTL_SECONDS,
+        API_KEY_REJECTED_TTL_SECONDS,
+    )
+    if REQUIRE_API_KEY
+    else None
+)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+model_path = f"/{os.getenv('ML_MODEL_NAME')}/{os.getenv('URL_VERSION')}"
 
-@app.post(f"/{os.getenv('ML_MODEL_NAME')}/{os.getenv('URL_VERSION')}")
-async def predict_inference(request: Dict[str, Any], key_id: str = Header(None), secret: str = Header(None)):
+app.add_middleware(
+    RequestMetricsMiddleware,
+    routes={model_path: "predict", f"{model_path}/bulk": "bulk", f"{model_path}/metrics": "metrics"},
+)
+
+prediction_executor = PredictionExecutor(PREDICT_EXECUTOR, PREDICT_WORKERS, MAX_QUEUED_PREDICTIONS)
+
+# batching is only used when the deployment allows more than one request per call
+batcher = (
+    MicroBatcher(predict_function, prediction_executor, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+    if MAX_BATCH_SIZE > 1
+    else None
+)
+
+prediction_cache = (
+    PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS, os.getenv("VERSION", ""))
+    if PREDICTION_CACHE_SIZE > 0
+    else None
+)
+
+
+async def authenticate(key_id: str | None, secret: str | None) -> None:
+    if api_key_verifier is None:
+        return
     try:
-        prediction = predict_function(**request)
+        valid = await api_key_verifier.verify(key_id, secret)
+    except Unverified as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}) from e
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid key or secret")
+
+
+async def run_prediction(request: Dict[str, Any]) -> Any:
+    if batcher is not None:
+        return await batcher.predict(request)
+    return await prediction_executor.run(functools.partial(predict_function, **request))
+
+
+@app.post(
+    model_path,
+    response_class=PredictionResponse,
+    openapi_extra={
+        "requestBody": {"required": True, "content": {"application/json": {"schema": request_schema.json_schema()}}}
+    },
+)
+async def predict_inference(request: Request, key_id: str = Header(None), secret: str = Header(None)):
+    await authenticate(key_id, secret)
+    try:
+        arguments = request_schema.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        ) from e
+    try:
+        if prediction_cache is not None:
+            prediction = await prediction_cache.predict(arguments, functools.partial(run_prediction, arguments))
+        else:
+            prediction = await run_prediction(arguments)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}) from e
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
-    return {"prediction": prediction}
+    # returned as a response, so FastAPI doesn't run the prediction through its own encoder
+    return PredictionResponse({"prediction": prediction})
+
+
+@app.post(f"{model_path}/bulk")
+async def bulk_predict_inference(request: Request, key_id: str = Header(None), secret: str = Header(None)):
+    """
+    Makes predictions for every row of a columnar body, and streams them back in the same
+    format. Predict functions that take lists of values, the same as for batching, are
+    called once per chunk, and other predict functions are called once per row. If a later
+    chunk fails to predict, the response ends without the closing bytes of its format.
+    """
+    await authenticate(key_id, secret)
+    try:
+        media = media_type(request.headers.get("content-type"))
+        body = await read_body(request)
+        chunks = await asyncio.to_thread(
+            read_chunks, body, request.headers.get("content-encoding"), media, request_schema.validate_columns
+        )
+    except UnsupportedBody as e:
+        raise HTTPException(status_code=415, detail=str(e)) from e
+    except BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    except InvalidRows as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors]) from e
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unable to read the request body: {e}") from e
+    first_chunk = chunks[0] if chunks else None
+    predict = predict_columns if MAX_BATCH_SIZE > 1 else predict_rows
+    writer = PredictionWriter(media)
+
+    # the first chunk is predicted before responding, so overloads and errors get a status code
+    first_predictions = None
+    if first_chunk is not None:
+        try:
+            first_predictions = await prediction_executor.run(predict, predict_function, first_chunk)
+        except Overloaded as e:
+            raise HTTPException(
+                status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+            ) from e
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+
+    async def stream():
+        if first_predictions is not None:
+            yield writer.write(first_predictions)
+            for chunk in chunks[1:]:
+                predictions = await prediction_executor.run(predict, predict_function, chunk, shed=False)
+                yield writer.write(predictions)
+        yield writer.close()
+
+    return StreamingResponse(stream(), media_type=media)
+
+
+@app.get(f"{model_path}/metrics", response_class=PlainTextResponse)
+async def metrics(key_id: str = Header(None), secret: str = Header(None)):
+    if not is_internal_key(key_id, secret):
+        raise HTTPException(status_code=401, detail="Invalid key or secret")
+    return registry.render()
@@ -0,0 +1,268 @@
+"""
+Metrics of the inference engine, served in the Prometheus text format. Every worker process
+keeps its own values, so samples carry the pid of the worker they come from. Workers write
+their samples to METRICS_DIR every METRICS_FLUSH_SECONDS, and the worker that serves a
+scrape adds the last samples of the other workers to its own, so every scrape covers the
+whole task.
+
+Requests are counted and timed per route by RequestMetricsMiddleware, with fixed buckets
+and without logging, so recording a request costs a few additions.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/preloop-metrics")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+
+
+def resident_memory_bytes() -> float:
+    # the second field of statm is the number of pages in memory, shared pages included
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def samples(self, labels: str = "") -> List[str]:
+        return [f'{self.name}{{{labels}pid="{os.getpid()}"}} {self.value}']
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def samples(self, labels: str = "") -> List[str]:
+        return [f'{self.name}{{{labels}pid="{os.getpid()}"}} {self.function()}']
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket and one for values above the last bucket, cumulated when rendered
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self, labels: str = "") -> List[str]:
+        pid = os.getpid()
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{{labels}le="{bound}",pid="{pid}"}} {cumulative}')
+        lines.append(f'{self.name}_count{{{labels}pid="{pid}"}} {cumulative}')
+        lines.append(f'{self.name}_sum{{{labels}pid="{pid}"}} {total}')
+        return lines
+
+
+class Family:
+    """
+    Metrics of one name that differ by the values of their labels, like the route of a request.
+    """
+
+    def __init__(self, metric: type, name: str, documentation: str, label_names: Sequence[str], *args) -> None:
+        self.kind = metric.kind
+        self.metric = metric
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        # further arguments of each metric, like the buckets of a histogram
+        self.args = args
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.metric(self.name, self.documentation, *self.args))
+        return child
+
+    def samples(self, labels: str = "") -> List[str]:
+        lines = []
+        for values, child in list(self.children.items()):
+            child_labels = "".join(f'{name}="{value}",' for name, value in zip(self.label_names, values))
+            lines.extend(child.samples(labels + child_labels))
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics = []
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter | Family:
+        metric = Family(Counter, name, documentation, label_names) if label_names else Counter(name, documentation)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]) -> Gauge:
+        metric = Gauge(name, documentation, function)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS, label_names: Sequence[str] = ()
+    ) -> Histogram | Family:
+        if label_names:
+            metric = Family(Histogram, name, documentation, label_names, buckets)
+        else:
+            metric = Histogram(name, documentation, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self) -> Dict[str, List[str]]:
+        return {metric.name: metric.samples() for metric in self.metrics}
+
+    def flush(self) -> None:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        with open(f"{path}.part", "w") as samples_file:
+            json.dump(self.collect(), samples_file)
+        os.replace(f"{path}.part", path)
+
+    def start_flushing(self) -> None:
+        def flush_forever():
+            while True:
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+                time.sleep(METRICS_FLUSH_SECONDS)
+
+        threading.Thread(target=flush_forever, name="metrics-flush", daemon=True).start()
+
+    def collect_other_workers(self) -> Dict[str, List[str]]:
+        samples: Dict[str, List[str]] = {}
+        try:
+            file_names = os.listdir(METRICS_DIR)
+        except OSError:
+            return samples
+        for file_name in file_names:
+            pid, extension = os.path.splitext(file_name)
+            if extension != ".json" or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            path = os.path.join(METRICS_DIR, file_name)
+            try:
+                if not os.path.exists(f"/proc/{pid}"):
+                    # the worker exited, gunicorn replaces it with a worker of another pid
+                    os.remove(path)
+                    continue
+                with open(path) as samples_file:
+                    worker_samples = json.load(samples_file)
+            except (OSError, ValueError):
+                continue
+            for name, lines in worker_samples.items():
+                samples.setdefault(name, []).extend(lines)
+        return samples
+
+    def render(self) -> str:
+        other_workers = self.collect_other_workers()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+            lines.extend(other_workers.get(metric.name, []))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the number, status, latency and body sizes of the requests to each route.
+    Routes are looked up by path and other paths are recorded as "other", so the number of
+    label values stays small.
+    """
+
+    def __init__(self, app, routes: Dict[str, str]) -> None:
+        self.app = app
+        self.routes = routes
+        self.in_progress = 0
+        self.requests = registry.counter(
+            "preloop_http_requests_total", "Requests served, by route and status code.", ("route", "status")
+        )
+        self.duration = registry.histogram(
+            "preloop_http_request_duration_seconds",
+            "Time from receiving a request to sending the end of its response.",
+            LATENCY_BUCKETS,
+            ("route",),
+        )
+        self.request_size = registry.histogram(
+            "preloop_http_request_size_bytes", "Size of request bodies.", SIZE_BUCKETS, ("route",)
+        )
+        self.response_size = registry.histogram(
+            "preloop_http_response_size_bytes", "Size of response bodies.", SIZE_BUCKETS, ("route",)
+        )
+        registry.gauge("preloop_http_requests_in_progress", "Requests being served.", lambda: self.in_progress)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self.routes.get(scope["path"], "other")
+        started_at = time.perf_counter()
+        request_bytes = 0
+        response_bytes = 0
+        # requests that fail before a response is started are answered with a 500 by the server
+        status = 500
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message) -> None:
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            else:
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        self.in_progress += 1
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            self.in_progress -= 1
+            self.requests.labels(route, str(status)).inc()
+            self.duration.labels(route).observe(time.perf_counter() - started_at)
+            self.request_size.labels(route).observe(request_bytes)
+            self.response_size.labels(route).observe(response_bytes)
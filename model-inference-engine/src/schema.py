@@ -0,0 +1,148 @@
+"""
+Typed requests for the predict function. The types of the arguments of the predict
+function, as found by the compiler and stored in the ml_model_inputs of the ML model, are
+passed in ML_MODEL_INPUTS and compiled at startup into a validator that parses request
+bodies straight from JSON. Arguments without a known type accept any value, and which
+arguments are required is taken from the signature of the predict function.
+
+Arguments typed as numpy arrays or pandas series or dataframes are converted to those
+types just before the predict function is called, on the prediction executor. When
+batching is on, each argument is typed as a list of values, so each request is validated
+against the type of one element and the stacked column is converted. Bulk requests are
+validated a chunk of columns at a time, each column against a list of the argument type.
+"""
+import functools
+import inspect
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pydantic import ConfigDict, TypeAdapter
+from typing_extensions import NotRequired, Required, TypedDict
+
+ML_MODEL_INPUTS: Dict[str, str] = json.loads(os.getenv("ML_MODEL_INPUTS") or "{}")
+
+# types are stored as the name of the type followed by its parameters, like dict[str][float]
+TYPE_PATTERN = re.compile(r"^(?:\w+\.)*(\w+)((?:\[[\w.]+\])*)$")
+
+SCALAR_TYPES = {"int": int, "float": float, "str": str, "bool": bool, "Any": Any, "object": Any}
+LIST_TYPES = {"list", "List", "Sequence", "Iterable", "set", "Set"}
+TUPLE_TYPES = {"tuple", "Tuple"}
+DICT_TYPES = {"dict", "Dict", "Mapping"}
+
+# numpy and pandas types, which are sent as JSON and converted before calling the predict function
+ARRAY_TYPES = {"ndarray": np.asarray, "array": np.asarray, "Series": pd.Series, "DataFrame": pd.DataFrame}
+ARRAY_REQUEST_TYPES = {
+    "ndarray": List[Any],
+    "array": List[Any],
+    "Series": List[Any],
+    # an object of columns, or a list of rows
+    "DataFrame": Dict[str, List[Any]] | List[Dict[str, Any]],
+}
+# a single row of a batched argument
+ARRAY_ELEMENT_TYPES = {"ndarray": Any, "array": Any, "Series": Any, "DataFrame": Dict[str, Any]}
+
+
+def parse_type(type_string: str) -> Tuple[str, List[str]]:
+    match = TYPE_PATTERN.match(type_string.replace(" ", ""))
+    if match is None:
+        return "", []
+    name, parameters = match.groups()
+    return name, [parameter.rsplit(".", 1)[-1] for parameter in re.findall(r"\[([\w.]+)\]", parameters)]
+
+
+def request_type(type_string: str) -> Any:
+    """
+    Returns the type a JSON value must have to be passed as an argument of the given type.
+    """
+    name, parameters = parse_type(type_string)
+    if name in ARRAY_REQUEST_TYPES:
+        return ARRAY_REQUEST_TYPES[name]
+    parameter_types = [SCALAR_TYPES.get(parameter, Any) for parameter in parameters]
+    if name in LIST_TYPES:
+        return List[parameter_types[0] if parameter_types else Any]
+    if name in TUPLE_TYPES:
+        return Tuple[tuple(parameter_types)] if parameter_types else Tuple[Any, ...]
+    if name in DICT_TYPES:
+        return Dict[str, parameter_types[1] if len(parameter_types) == 2 else Any]
+    if name == "Optional" and parameter_types:
+        return Optional[parameter_types[0]]
+    return SCALAR_TYPES.get(name, Any)
+
+
+def element_type(type_string: str) -> Any:
+    """
+    Returns the type of one value of a batched argument of the given type.
+    """
+    name, parameters = parse_type(type_string)
+    if name in ARRAY_ELEMENT_TYPES:
+        return ARRAY_ELEMENT_TYPES[name]
+    if name in LIST_TYPES and parameters:
+        return SCALAR_TYPES.get(parameters[0], Any)
+    return Any
+
+
+def call_with_converted_arguments(
+    predict_function: Callable, converters: Dict[str, Callable], *args, **arguments
+) -> Any:
+    # module level, so it can be sent to a process pool
+    for name, converter in converters.items():
+        if name in arguments:
+            arguments[name] = converter(arguments[name])
+    return predict_function(*args, **arguments)
+
+
+class RequestSchema:
+    def __init__(self, predict_function: Callable, inputs: Dict[str, str], batched: bool) -> None:
+        fields = {}
+        column_fields = {}
+        self.converters = {}
+        try:
+            parameters = inspect.signature(predict_function).parameters
+            allows_other_arguments = False
+        except (TypeError, ValueError):
+            # callables without a signature, like some builtins, get their requests unchecked
+            parameters = {}
+            allows_other_arguments = True
+        for name, parameter in parameters.items():
+            if parameter.kind == parameter.VAR_KEYWORD:
+                allows_other_arguments = True
+                continue
+            if parameter.kind in (parameter.VAR_POSITIONAL, parameter.POSITIONAL_ONLY):
+                continue
+            type_string = inputs.get(name, "")
+            field_type = element_type(type_string) if batched else request_type(type_string)
+            required = parameter.default is parameter.empty
+            fields[name] = Required[field_type] if required else NotRequired[field_type]
+            column_fields[name] = Required[List[field_type]] if required else NotRequired[List[field_type]]
+            converter = ARRAY_TYPES.get(parse_type(type_string)[0])
+            if converter is not None:
+                self.converters[name] = converter
+
+        config = ConfigDict(extra="allow" if allows_other_arguments else "forbid")
+        request = TypedDict("PredictRequest", fields)
+        request.__pydantic_config__ = config
+        self.adapter = TypeAdapter(request)
+        columns = TypedDict("PredictColumns", column_fields)
+        columns.__pydantic_config__ = config
+        self.columns_adapter = TypeAdapter(columns)
+
+    def validate_json(self, body: bytes) -> Dict[str, Any]:
+        return self.adapter.validate_json(body)
+
+    def validate_columns(self, columns: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+        return self.columns_adapter.validate_python(columns)
+
+    def json_schema(self) -> Dict[str, Any]:
+        return self.adapter.json_schema()
+
+    def bind(self, predict_function: Callable) -> Callable:
+        """
+        Returns the predict function, wrapped to convert its numpy and pandas arguments.
+        """
+        if not self.converters:
+            return predict_function
+        return functools.partial(call_with_converted_arguments, predict_function, self.converters)
@@ -0,0 +1,442 @@
+"""
+Shared hosting, where one inference engine serves every model of an organization that was
+deployed with hosting="shared", instead of one engine per model version. The engine lists
+its models from the Preloop API every SHARED_MODELS_POLL_SECONDS, and again when a request
+comes for a path it doesn't know. Each model is loaded on its first request, from the
+inference script in its S3 script directory, and stays loaded while it is used. When the
+loaded models take more than SHARED_MODEL_MEMORY_BYTES, the least recently used models
+that aren't serving requests are unloaded until the others fit. The memory of a model is
+measured as the growth of the worker while it loads, with garbage collected before and
+after, so the budget is approximate: it misses memory the model allocates later, and the
+allocator doesn't always return the memory of unloaded models to the system. MAX_REQUESTS
+restarts each worker after that many requests, which returns all of it.
+
+Every worker process loads its own models, so the budget defaults to the share of the
+memory of the task the workers are sized to use, divided between the workers. Models are
+served on the thread executor, without batching or the prediction cache, which are
+settings of dedicated engines.
+"""
+import asyncio
+import contextlib
+import functools
+import gc
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+import boto3
+import requests
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+
+from src.api_keys import (
+    API_KEY_CACHE_SIZE,
+    API_KEY_CACHE_TTL_SECONDS,
+    API_KEY_REJECTED_TTL_SECONDS,
+    API_KEY_REVOCATION_POLL_SECONDS,
+    API_KEY_VERIFY_TIMEOUT_SECONDS,
+    PRELOOP_API_ENDPOINT,
+    PRELOOP_KEY_ID,
+    PRELOOP_SECRET,
+    ApiKeyVerifier,
+    Unverified,
+    is_internal_key,
+)
+from src.batching import predict_rows
+from src.bulk import BodyTooLarge, InvalidRows, PredictionWriter, UnsupportedBody, media_type, read_body, read_chunks
+from src.encoding import PredictionResponse
+from src.execution import (
+    MAX_QUEUED_PREDICTIONS,
+    PREDICT_WORKERS,
+    RETRY_AFTER_SECONDS,
+    Overloaded,
+    PredictionExecutor,
+)
+from src.metrics import RequestMetricsMiddleware, registry, resident_memory_bytes
+from src.schema import RequestSchema
+from src.workers import MEMORY_UTILIZATION, WORKERS, available_cpus, memory_limit_bytes
+
+SHARED_HOST_ID = os.getenv("SHARED_HOST_ID", "")
+SHARED_MODELS_DIR = os.getenv("SHARED_MODELS_DIR", "/tmp/preloop-models")
+SHARED_MODELS_POLL_SECONDS = float(os.getenv("SHARED_MODELS_POLL_SECONDS", 30))
+# requests for paths the engine doesn't know list the models again at most this often
+SHARED_MODELS_MISS_REFRESH_SECONDS = float(os.getenv("SHARED_MODELS_MISS_REFRESH_SECONDS", 5))
+SHARED_MODEL_MEMORY_BYTES = int(os.getenv("SHARED_MODEL_MEMORY_BYTES", 0)) or int(
+    memory_limit_bytes() * MEMORY_UTILIZATION // (WORKERS or available_cpus())
+)
+
+log = logging.getLogger("uvicorn")
+
+
+class Unavailable(Exception):
+    """
+    Raised when the API can't be reached to list the models of the host.
+    """
+
+
+class LoadedModel:
+    def __init__(self, spec: Dict[str, Any], module_name: str, schema: RequestSchema, predict_function, memory_bytes):
+        self.spec = spec
+        self.module_name = module_name
+        self.schema = schema
+        self.predict_function = predict_function
+        self.memory_bytes = memory_bytes
+        # requests being served with the model, only changed on the event loop
+        self.in_use = 0
+
+
+class SharedModels:
+    def __init__(self, endpoint: str, key_id: str, secret: str, host_id: str, memory_budget: int, routes: dict) -> None:
+        self.endpoint = endpoint
+        self.headers = {"User-Agent": "PreloopInferenceEngine/1.0", "key-id": key_id, "secret": secret}
+        self.host_id = host_id
+        self.memory_budget = memory_budget
+        # the routes of the metrics middleware, kept up to date with the paths of the models
+        self.routes = routes
+        self.session = requests.Session()
+        # created on first use, since boto3 clients can't be shared with forked workers
+        self.s3_client = None
+        # what the API lists for each model, by path
+        self.specs: Dict[str, Dict[str, Any]] = {}
+        self.listed_at = float("-inf")
+        self.listing = asyncio.Lock()
+        # loaded models, the least recently used first. Only used on the event loop
+        self.loaded: OrderedDict[str, LoadedModel] = OrderedDict()
+        self.loading: Dict[str, asyncio.Task] = {}
+        # scripts register themselves in sys.modules under a shared name while they are
+        # imported, so they are imported one at a time
+        self.import_lock = threading.Lock()
+        self.loads = registry.counter("preloop_shared_model_loads_total", "Models loaded on their first request.")
+        self.unloads = registry.counter("preloop_shared_model_unloads_total", "Models unloaded to free memory.")
+        self.load_seconds = registry.histogram(
+            "preloop_shared_model_load_seconds",
+            "Time taken to load a model.",
+            (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+        )
+        registry.gauge("preloop_shared_models_loaded", "Models loaded by the worker.", lambda: len(self.loaded))
+        registry.gauge(
+            "preloop_shared_models_memory_bytes",
+            "Memory the models loaded by the worker took to load.",
+            lambda: sum(model.memory_bytes for model in self.loaded.values()),
+        )
+
+    def list_with_api(self) -> Dict[str, Dict[str, Any]]:
+        response = self.session.post(
+            f"{self.endpoint}/api/ml-model/list-shared-models",
+            headers=self.headers,
+            json={"shared_host_id": self.host_id},
+            timeout=API_KEY_VERIFY_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        return {spec["path"]: spec for spec in response.json()["shared_ml_models"]}
+
+    async def refresh(self) -> None:
+        async with self.listing:
+            specs = await asyncio.to_thread(self.list_with_api)
+            self.specs = specs
+            self.listed_at = time.monotonic()
+        self.routes.clear()
+        for path in specs:
+            self.routes.update({path: "predict", f"{path}/bulk": "bulk", f"{path}/metrics": "metrics"})
+        # models that were stopped, or whose latest version changed, are dropped, requests
+        # being served with them finish with the model they started with
+        for path, model in list(self.loaded.items()):
+            if specs.get(path) != model.spec:
+                self.unload(path)
+
+    async def poll(self, interval: float) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.warning(f"Unable to list the shared models: {e}")
+            await asyncio.sleep(interval)
+
+    def load(self, spec: Dict[str, Any]) -> LoadedModel:
+        script_path = os.path.join(SHARED_MODELS_DIR, spec["id"], "inference.py")
+        os.makedirs(os.path.dirname(script_path), exist_ok=True)
+        if self.s3_client is None:
+            self.s3_client = boto3.client("s3")
+        bucket, key = spec["inference_script_loc"].removeprefix("s3://").split("/", 1)
+        self.s3_client.download_file(bucket, key, script_path)
+
+        module_name = f"preloop_model_{spec['id'].replace('-', '_')}"
+        with self.import_lock:
+            # garbage left by earlier loads and requests would count towards the model
+            gc.collect()
+            memory_before = resident_memory_bytes()
+            started_at = time.monotonic()
+            # scripts register themselves as the training script module for their pickled
+            # objects, which must not find the script of another model there
+            sys.modules.pop("training_script_module", None)
+            module_spec = importlib.util.spec_from_file_location(module_name, script_path)
+            module = importlib.util.module_from_spec(module_spec)
+            # read by the script to find the objects of its version, the environment holds
+            # the version of no model since it is shared by all of them
+            module.__preloop_version__ = str(spec["version"])
+            sys.modules[module_name] = module
+            try:
+                module_spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[module_name]
+                raise
+            finally:
+                sys.modules.pop("training_script_module", None)
+            load_seconds = time.monotonic() - started_at
+            gc.collect()
+            memory_bytes = max(0, resident_memory_bytes() - memory_before)
+        self.loads.inc()
+        self.load_seconds.observe(load_seconds)
+        log.info(
+            f"Worker {os.getpid()} loaded the model at {spec['path']} in {load_seconds:.2f}s, "
+            f"taking {memory_bytes / 2**20:.0f} MiB"
+        )
+
+        predict_function = getattr(module, spec["predict_function_name"] or "predict")
+        schema = RequestSchema(predict_function, spec["ml_model_inputs"] or {}, batched=False)
+        return LoadedModel(spec, module_name, schema, schema.bind(predict_function), memory_bytes)
+
+    def start_loading(self, path: str, spec: Dict[str, Any]) -> asyncio.Task:
+        # a task of its own, so a caller that goes away doesn't cancel the load of the others
+        async def load() -> LoadedModel:
+            try:
+                model = await asyncio.to_thread(self.load, spec)
+            finally:
+                del self.loading[path]
+            if self.specs.get(path) == spec:
+                self.loaded[path] = model
+            else:
+                # the model changed while it loaded, it serves the requests that waited for it
+                sys.modules.pop(model.module_name, None)
+            return model
+
+        task = asyncio.create_task(load())
+        # the error is raised to the callers, this only stops asyncio logging it when nobody waited
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self.loading[path] = task
+        return task
+
+    async def acquire(self, path: str) -> LoadedModel | None:
+        """
+        Returns the model served at the path, loading it if needed, or None if the host
+        doesn't serve one. The model must be released once the request is served.
+        """
+        spec = self.specs.get(path)
+        if spec is None and time.monotonic() - self.listed_at >= SHARED_MODELS_MISS_REFRESH_SECONDS:
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.warning(f"Unable to list the shared models: {e}")
+                raise Unavailable("Unable to find the model, retry later") from e
+            spec = self.specs.get(path)
+        if spec is None:
+            return None
+        model = self.loaded.get(path)
+        if model is None:
+            task = self.loading.get(path) or self.start_loading(path, spec)
+            model = await asyncio.shield(task)
+        else:
+            self.loaded.move_to_end(path)
+        model.in_use += 1
+        self.unload_least_recently_used()
+        return model
+
+    def release(self, model: LoadedModel) -> None:
+        model.in_use -= 1
+
+    def unload(self, path: str) -> LoadedModel:
+        model = self.loaded.pop(path)
+        module = sys.modules.pop(model.module_name, None)
+        # the globals of the script hold its objects, and stay reachable from whatever the
+        # script registered elsewhere, so they are cleared once no request uses them
+        if module is not None and not model.in_use:
+            vars(module).clear()
+        return model
+
+    def unload_least_recently_used(self) -> None:
+        loaded_bytes = sum(model.memory_bytes for model in self.loaded.values())
+        unloaded = False
+        for path, model in list(self.loaded.items()):
+            if loaded_bytes <= self.memory_budget:
+                break
+            # models serving requests would only be loaded again
+            if model.in_use:
+                continue
+            self.unload(path)
+            loaded_bytes -= model.memory_bytes
+            self.unloads.inc()
+            unloaded = True
+            log.info(f"Worker {os.getpid()} unloaded the model at {path} to free memory")
+        if unloaded:
+            # the objects of a model can hold reference cycles, which only a collection frees
+            gc.collect()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI):
+    registry.start_flushing()
+    models_poller = asyncio.create_task(shared_models.poll(SHARED_MODELS_POLL_SECONDS))
+    revocation_poller = asyncio.create_task(api_key_verifier.poll_revocations(API_KEY_REVOCATION_POLL_SECONDS))
+    yield
+    models_poller.cancel()
+    revocation_poller.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# models can require API keys or not, keys are verified for those that do
+api_key_verifier = ApiKeyVerifier(
+    PRELOOP_API_ENDPOINT,
+    PRELOOP_KEY_ID,
+    PRELOOP_SECRET,
+    API_KEY_CACHE_SIZE,
+    API_KEY_CACHE_TTL_SECONDS,
+    API_KEY_REJECTED_TTL_SECONDS,
+)
+
+routes: Dict[str, str] = {}
+app.add_middleware(RequestMetricsMiddleware, routes=routes)
+
+shared_models = SharedModels(
+    PRELOOP_API_ENDPOINT,
+    PRELOOP_KEY_ID,
+    PRELOOP_SECRET,
+    SHARED_HOST_ID,
+    SHARED_MODEL_MEMORY_BYTES,
+    routes,
+)
+
+prediction_executor = PredictionExecutor("thread", PREDICT_WORKERS, MAX_QUEUED_PREDICTIONS)
+
+
+async def acquire_model(path: str, key_id: str | None, secret: str | None) -> LoadedModel:
+    try:
+        model = await shared_models.acquire(path)
+    except Unavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}) from e
+    except Exception as e:
+        log.error(f"Unable to load the model at {path}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Unable to load the model: {e}") from e
+    if model is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not model.spec["require_api_key"]:
+        return model
+    try:
+        valid = await api_key_verifier.verify(key_id, secret)
+    except Unverified as e:
+        shared_models.release(model)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}) from e
+    if not valid:
+        shared_models.release(model)
+        raise HTTPException(status_code=401, detail="Invalid key or secret")
+    return model
+
+
+@app.post("/shared/{ml_model_name}/{url_version}", response_class=PredictionResponse)
+async def predict_inference(
+    ml_model_name: str,
+    url_version: str,
+    request: Request,
+    key_id: str = Header(None),
+    secret: str = Header(None),
+):
+    model = await acquire_model(f"/shared/{ml_model_name}/{url_version}", key_id, secret)
+    try:
+        try:
+            arguments = model.schema.validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+            ) from e
+        try:
+            prediction = await prediction_executor.run(functools.partial(model.predict_function, **arguments))
+        except Overloaded as e:
+            raise HTTPException(
+                status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+            ) from e
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+    finally:
+        shared_models.release(model)
+    return PredictionResponse({"prediction": prediction})
+
+
+@app.post("/shared/{ml_model_name}/{url_version}/bulk")
+async def bulk_predict_inference(
+    ml_model_name: str,
+    url_version: str,
+    request: Request,
+    key_id: str = Header(None),
+    secret: str = Header(None),
+):
+    """
+    Makes predictions for every row of a columnar body, calling the predict function once
+    per row, the same as the bulk endpoint of dedicated engines without batching.
+    """
+    model = await acquire_model(f"/shared/{ml_model_name}/{url_version}", key_id, secret)
+    # released by the stream once every chunk is predicted, or here if it never starts
+    streaming = False
+    try:
+        try:
+            media = media_type(request.headers.get("content-type"))
+            body = await read_body(request)
+            chunks = await asyncio.to_thread(
+                read_chunks, body, request.headers.get("content-encoding"), media, model.schema.validate_columns
+            )
+        except UnsupportedBody as e:
+            raise HTTPException(status_code=415, detail=str(e)) from e
+        except BodyTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e)) from e
+        except InvalidRows as e:
+            raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors]) from e
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Unable to read the request body: {e}") from e
+        first_chunk = chunks[0] if chunks else None
+        writer = PredictionWriter(media)
+
+        first_predictions = None
+        if first_chunk is not None:
+            try:
+                first_predictions = await prediction_executor.run(predict_rows, model.predict_function, first_chunk)
+            except Overloaded as e:
+                raise HTTPException(
+                    status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+                ) from e
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e)) from e
+
+        async def stream():
+            try:
+                if first_predictions is not None:
+                    yield writer.write(first_predictions)
+                    for chunk in chunks[1:]:
+                        predictions = await prediction_executor.run(
+                            predict_rows, model.predict_function, chunk, shed=False
+                        )
+                        yield writer.write(predictions)
+                yield writer.close()
+            finally:
+                shared_models.release(model)
+
+        streaming = True
+        return StreamingResponse(stream(), media_type=media)
+    finally:
+        if not streaming:
+            shared_models.release(model)
+
+
+@app.get("/shared/{ml_model_name}/{url_version}/metrics", response_class=PlainTextResponse)
+async def metrics(ml_model_name: str, url_version: str, key_id: str = Header(None), secret: str = Header(None)):
+    if not is_internal_key(key_id, secret):
+        raise HTTPException(status_code=401, detail="Invalid key or secret")
+    if f"/shared/{ml_model_name}/{url_version}" not in shared_models.specs:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # the metrics of the whole host, which every model serves
+    return registry.render()
@@ -0,0 +1,55 @@
+"""
+Sizing of the gunicorn worker pool. With PRELOAD_MODEL, the model is loaded once in the
+gunicorn master before the workers are forked, and the objects it created are frozen out
+of the garbage collector so that collections in the workers don't write to, and so copy,
+the pages they share with the master. The number of workers is then derived from the
+cpus and memory available to the task and the memory the model was measured to take,
+unless WORKERS sets it.
+
+Shared hosts, with HOSTING_MODE=shared, load their models in each worker on demand, so
+they start one worker per cpu and each worker keeps its models within its share of the
+memory.
+"""
+import os
+
+HOSTING_MODE = os.getenv("HOSTING_MODE", "dedicated")
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "True") == "True" and HOSTING_MODE != "shared"
+WORKERS = int(os.getenv("WORKERS", 0))
+# share of the memory of the task that the workers are sized to use
+MEMORY_UTILIZATION = float(os.getenv("MEMORY_UTILIZATION", 0.8))
+# requests after which a worker is restarted, off by default
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", 0))
+
+
+def available_cpus() -> int:
+    return len(os.sched_getaffinity(0))
+
+
+def memory_limit_bytes() -> int:
+    limit = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    # the container's own limit, from cgroup v2 or v1, when it is lower than the host's memory
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as cgroup_limit:
+                value = cgroup_limit.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            limit = min(limit, int(value))
+    return limit
+
+
+def worker_count(model_bytes: int, worker_bytes: int, preload: bool) -> int:
+    """
+    Returns how many workers fit on the cpus and in the memory of the task, given the
+    memory the model takes and the memory a worker takes without the model. Preloaded
+    models are counted once, since their pages are shared by every worker.
+    """
+    budget = memory_limit_bytes() * MEMORY_UTILIZATION
+    if preload:
+        budget -= model_bytes
+        per_worker = worker_bytes
+    else:
+        per_worker = worker_bytes + model_bytes
+    workers_in_memory = int(budget // max(per_worker, 1))
+    return max(1, min(available_cpus(), workers_in_memory))
@@ -0,0 +1,66 @@
+"""Unit tests for the verification of API keys"""
+import asyncio
+import hashlib
+import time
+
+import pytest
+
+import src.api_keys as api_keys
+from src.api_keys import ApiKeyVerifier, is_internal_key
+
+
+def test_only_the_internal_key_is_accepted(monkeypatch):
+    monkeypatch.setattr(api_keys, "PRELOOP_KEY_ID", "internal")
+    monkeypatch.setattr(api_keys, "PRELOOP_SECRET", "secret")
+    assert is_internal_key("internal", "secret")
+    assert not is_internal_key("internal", "other")
+    assert not is_internal_key("other", "secret")
+    assert not is_internal_key(None, None)
+
+
+def test_no_key_is_accepted_without_an_internal_key(monkeypatch):
+    monkeypatch.setattr(api_keys, "PRELOOP_KEY_ID", "")
+    monkeypatch.setattr(api_keys, "PRELOOP_SECRET", "")
+    assert not is_internal_key("", "")
+
+
+def test_keys_are_verified_once(monkeypatch):
+    calls = []
+
+    def verify_with_api(key_id, secret):
+        calls.append(key_id)
+        return secret == "right"
+
+    async def main():
+        verifier = ApiKeyVerifier("http://api", "internal", "secret", 10, 60, 60)
+        monkeypatch.setattr(verifier, "verify_with_api", verify_with_api)
+        first = await asyncio.gather(*(verifier.verify("key", "right") for _ in range(3)))
+        return first + [await verifier.verify("key", "right"), await verifier.verify("key", "wrong")]
+
+    assert asyncio.run(main()) == [True, True, True, True, False]
+    assert calls == ["key", "key"]
+
+
+def test_requests_without_a_key_are_rejected():
+    verifier = ApiKeyVerifier("http://api", "internal", "secret", 10, 60, 60)
+    assert asyncio.run(verifier.verify(None, "secret")) is False
+
+
+def test_waiters_are_verified_when_the_first_request_is_cancelled(monkeypatch):
+    def verify_with_api(key_id, secret):
+        time.sleep(0.01)
+        return True
+
+    async def main():
+        verifier = ApiKeyVerifier("http://api", "internal", "secret", 10, 60, 60)
+        monkeypatch.setattr(verifier, "verify_with_api", verify_with_api)
+        first = asyncio.ensure_future(verifier.verify("key", "right"))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(verifier.verify("key", "right"))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await waiter, verifier.get(hashlib.sha256(b"key\nright").hexdigest())
+
+    assert asyncio.run(main()) == (True, True)
@@ -0,0 +1,49 @@
+"""Unit tests for the micro-batching of predictions"""
+import asyncio
+
+import pytest
+
+from src.batching import MicroBatcher, predict_columns, predict_rows
+from src.execution import Overloaded, PredictionExecutor
+
+
+def double(x):
+    return [value * 2 for value in x]
+
+
+def test_predict_columns_checks_the_number_of_predictions():
+    assert predict_columns(double, {"x": [1, 2]}) == [2, 4]
+    with pytest.raises(ValueError):
+        predict_columns(lambda x: [0], {"x": [1, 2]})
+
+
+def test_predict_rows_calls_the_function_once_per_row():
+    assert predict_rows(lambda x, y: x + y, {"x": [1, 2], "y": [10, 20]}) == [11, 22]
+
+
+def test_requests_are_predicted_in_one_batch():
+    calls = []
+
+    def predict(x):
+        calls.append(list(x))
+        return double(x)
+
+    async def main():
+        batcher = MicroBatcher(predict, PredictionExecutor("thread", 1, 8), 8, 50)
+        return await asyncio.gather(*(batcher.predict({"x": i}) for i in range(4)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6]
+    assert calls == [[0, 1, 2, 3]]
+
+
+def test_requests_past_the_queue_size_are_rejected():
+    async def main():
+        batcher = MicroBatcher(double, PredictionExecutor("thread", 1, 8), 8, 50, max_queued=2)
+        accepted = [asyncio.ensure_future(batcher.predict({"x": i})) for i in range(2)]
+        # lets the accepted requests reach the queue before the worker takes them
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await batcher.predict({"x": 2})
+        return await asyncio.gather(*accepted)
+
+    assert asyncio.run(main()) == [0, 2]
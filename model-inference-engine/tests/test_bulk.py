@@ -0,0 +1,130 @@
+"""Unit tests for the columnar bodies of bulk predictions"""
+import asyncio
+import gzip
+import io
+import json
+import zlib
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from starlette.requests import Request
+
+from src.bulk import (
+    ARROW_FILE_MEDIA_TYPE,
+    ARROW_STREAM_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE,
+    BodyTooLarge,
+    InvalidRows,
+    PredictionWriter,
+    UnsupportedBody,
+    decompress,
+    iter_chunks,
+    media_type,
+    read_body,
+    read_chunks,
+)
+from src.schema import RequestSchema
+
+TABLE = pa.table({"x": list(range(5)), "y": [float(i) for i in range(5)]})
+
+
+def encode(table: pa.Table, media: str) -> bytes:
+    sink = io.BytesIO()
+    if media == JSON_MEDIA_TYPE:
+        return json.dumps(table.to_pydict()).encode()
+    if media == PARQUET_MEDIA_TYPE:
+        pq.write_table(table, sink)
+    elif media == ARROW_FILE_MEDIA_TYPE:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
+
+
+def request(body: bytes, headers=()) -> Request:
+    pieces = [body[start : start + 4] for start in range(0, len(body), 4)] or [b""]
+
+    async def receive():
+        piece = pieces.pop(0)
+        return {"type": "http.request", "body": piece, "more_body": bool(pieces)}
+
+    return Request({"type": "http", "method": "POST", "headers": list(headers)}, receive)
+
+
+def test_media_type_defaults_to_json():
+    assert media_type(None) == JSON_MEDIA_TYPE
+    assert media_type("application/x-parquet") == PARQUET_MEDIA_TYPE
+    assert media_type("Application/Vnd.Apache.Arrow.Stream; charset=utf-8") == ARROW_STREAM_MEDIA_TYPE
+    with pytest.raises(UnsupportedBody):
+        media_type("text/csv")
+
+
+@pytest.mark.parametrize("media", [JSON_MEDIA_TYPE, PARQUET_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE])
+def test_bodies_are_read_in_chunks(media):
+    chunks = list(iter_chunks(encode(TABLE, media), media, chunk_rows=2))
+    assert [chunk["x"] for chunk in chunks] == [[0, 1], [2, 3], [4]]
+    assert chunks[2] == {"x": [4], "y": [4.0]}
+
+
+def test_json_columns_must_have_the_same_length():
+    with pytest.raises(UnsupportedBody):
+        list(iter_chunks(b'{"x": [1, 2], "y": [1]}', JSON_MEDIA_TYPE))
+
+
+def test_encodings_are_undone_in_reverse():
+    body = b'{"x": [1]}'
+    encoded = zlib.compress(gzip.compress(body))
+    assert decompress(encoded, "gzip, deflate", max_bytes=100) == body
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+def test_decompression_stops_at_the_limit(encoding):
+    # a megabyte of zeros compresses to about a kilobyte
+    body = bytes(2**20)
+    encoded = gzip.compress(body) if encoding == "gzip" else zlib.compress(body)
+    with pytest.raises(BodyTooLarge):
+        decompress(encoded, encoding, max_bytes=2**16)
+
+
+def test_bodies_over_the_limit_are_rejected_while_streaming():
+    assert asyncio.run(read_body(request(b"0123456789"), max_bytes=10)) == b"0123456789"
+    with pytest.raises(BodyTooLarge):
+        asyncio.run(read_body(request(b"0123456789"), max_bytes=9))
+    with pytest.raises(BodyTooLarge):
+        asyncio.run(read_body(request(b"", headers=[(b"content-length", b"100")]), max_bytes=9))
+
+
+def test_every_chunk_is_validated_before_predicting():
+    def predict(x: int, y: float):
+        return x * y
+
+    schema = RequestSchema(predict, {"x": "int", "y": "float"}, batched=False)
+    table = TABLE.set_column(1, "y", pa.array(["0", "1", "2", "3", "four"]))
+    body = encode(table, PARQUET_MEDIA_TYPE)
+
+    with pytest.raises(InvalidRows) as e:
+        read_chunks(body, None, PARQUET_MEDIA_TYPE, schema.validate_columns, chunk_rows=2)
+    # located by the row of the whole request, not of its chunk
+    assert [error["loc"] for error in e.value.errors] == [("y", 4)]
+
+    chunks = read_chunks(encode(TABLE, PARQUET_MEDIA_TYPE), None, PARQUET_MEDIA_TYPE, schema.validate_columns, 2)
+    assert [chunk["x"] for chunk in chunks] == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.parametrize("media", [PARQUET_MEDIA_TYPE, ARROW_FILE_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE])
+def test_predictions_are_written_in_the_format_of_the_request(media):
+    writer = PredictionWriter(media)
+    body = writer.write([1.5, 2.5]) + writer.write([3]) + writer.close()
+    table = pa.concat_tables(pa.Table.from_pydict(chunk) for chunk in iter_chunks(body, media, chunk_rows=10))
+    assert table.column("prediction").to_pylist() == [1.5, 2.5, 3.0]
+
+
+def test_json_predictions_are_one_object():
+    writer = PredictionWriter(JSON_MEDIA_TYPE)
+    body = writer.write([1, 2]) + writer.write([]) + writer.write([3]) + writer.close()
+    assert json.loads(body) == {"prediction": [1, 2, 3]}
+    assert json.loads(PredictionWriter(JSON_MEDIA_TYPE).close()) == {"prediction": []}
@@ -0,0 +1,77 @@
+"""Unit tests for the prediction cache"""
+import asyncio
+
+import pytest
+
+from src.cache import PredictionCache, cache_key
+
+
+def test_cache_key_ignores_the_order_of_arguments():
+    assert cache_key({"a": 1, "b": 2}, "1") == cache_key({"b": 2, "a": 1}, "1")
+    assert cache_key({"a": 1}, "1") != cache_key({"a": 1}, "2")
+
+
+def test_least_recently_used_predictions_are_dropped():
+    cache = PredictionCache(2, 60, "1")
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_expired_predictions_are_not_served():
+    cache = PredictionCache(2, -1, "1")
+    cache.put("a", 1)
+    assert cache.get("a") == (False, None)
+
+
+def test_identical_requests_share_one_prediction():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main():
+        cache = PredictionCache(8, 60, "1")
+        predictions = await asyncio.gather(*(cache.predict({"x": 1}, compute) for _ in range(3)))
+        return predictions + [await cache.predict({"x": 1}, compute)]
+
+    assert asyncio.run(main()) == [42, 42, 42, 42]
+    assert len(calls) == 1
+
+
+def test_waiters_get_the_prediction_when_the_first_request_is_cancelled():
+    async def compute():
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def main():
+        cache = PredictionCache(8, 60, "1")
+        first = asyncio.ensure_future(cache.predict({"x": 1}, compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.predict({"x": 1}, compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await waiter
+
+    assert asyncio.run(main()) == 42
+
+
+def test_errors_are_raised_to_every_waiter_and_not_cached():
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad input")
+
+    async def main():
+        cache = PredictionCache(8, 60, "1")
+        results = await asyncio.gather(*(cache.predict({"x": 1}, compute) for _ in range(2)), return_exceptions=True)
+        return results, cache
+
+    results, cache = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert not cache.entries and not cache.in_flight
@@ -0,0 +1,82 @@
+"""Unit tests for the compilation of models to ONNX"""
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("skl2onnx")
+
+from sklearn.linear_model import LinearRegression, LogisticRegression  # noqa: E402
+from sklearn.pipeline import make_pipeline  # noqa: E402
+from sklearn.preprocessing import StandardScaler  # noqa: E402
+from sklearn.tree import DecisionTreeClassifier  # noqa: E402
+
+from src.compilation import (  # noqa: E402
+    CompiledModel,
+    compile_model,
+    compile_models,
+    compiled_fallbacks,
+    feature_ranges,
+    is_supported,
+)
+
+X = np.random.default_rng(0).normal(size=(200, 3))
+y = (X[:, 0] + X[:, 1] > 0).astype(int)
+
+
+def test_supported_models():
+    assert is_supported(LogisticRegression().fit(X, y))
+    assert is_supported(make_pipeline(StandardScaler(), LogisticRegression()).fit(X, y))
+    # not fit, so the number of features is unknown
+    assert not is_supported(LogisticRegression())
+    assert not is_supported(StandardScaler().fit(X))
+
+
+def test_feature_ranges_follow_the_splits_of_trees():
+    tree = DecisionTreeClassifier(max_depth=3, random_state=0).fit(X * 100, y)
+    low, high = feature_ranges(tree, 3)
+    split_features = np.unique(tree.tree_.feature[tree.tree_.feature >= 0])
+    assert all(low[feature] < -3 and high[feature] > 3 for feature in split_features)
+
+
+def test_compiled_classifier_makes_the_same_predictions():
+    model = LogisticRegression().fit(X, y)
+    compiled, _ = compile_model(model)
+    assert isinstance(compiled, CompiledModel)
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=1e-4, atol=1e-4)
+    assert compiled.predict(X).dtype == model.predict(X).dtype
+    # other attributes are read from the original model
+    assert compiled.classes_ is model.classes_
+
+
+def test_dataframe_columns_are_reordered():
+    frame = pd.DataFrame(X, columns=["a", "b", "c"])
+    model = LinearRegression().fit(frame, X[:, 0] * 2)
+    compiled, _ = compile_model(model)
+    reordered = frame[["c", "a", "b"]]
+    np.testing.assert_allclose(compiled.predict(reordered), model.predict(frame), rtol=1e-4, atol=1e-4)
+
+
+def test_inputs_the_session_rejects_are_predicted_by_the_library(monkeypatch):
+    model = LinearRegression().fit(X, X[:, 0])
+    compiled, _ = compile_model(model)
+
+    def run(*args, **kwargs):
+        raise ValueError("unsupported input")
+
+    monkeypatch.setattr(compiled, "run", run)
+    fallbacks = compiled_fallbacks.value
+    np.testing.assert_array_equal(compiled.predict(X), model.predict(X))
+    assert compiled_fallbacks.value == fallbacks + 1
+
+
+def test_compile_models_replaces_the_globals_of_the_script():
+    module = types.ModuleType("inference")
+    module.model = LogisticRegression().fit(X, y)
+    module.scaler = StandardScaler().fit(X)
+    compile_models(module)
+    assert isinstance(module.model, CompiledModel)
+    assert isinstance(module.scaler, StandardScaler)
@@ -0,0 +1,53 @@
+"""Unit tests for the quantization of PyTorch models"""
+import types
+
+import pytest
+
+import src.quantization as quantization
+from src.quantization import NotQuantized, first_tensor, quantize_models, quantize_module
+
+torch = pytest.importorskip("torch")
+
+
+def test_first_tensor_unwraps_tuples():
+    assert first_tensor(((1, 2), 3)) == 1
+    assert first_tensor(4) == 4
+
+
+def test_linear_modules_are_quantized():
+    module = torch.nn.Sequential(torch.nn.Linear(16, 32), torch.nn.ReLU(), torch.nn.Linear(32, 4))
+    script = types.ModuleType("inference")
+    script.model = module
+    quantize_models(script)
+    assert script.model is not module
+    assert any(".quantized.dynamic" in type(layer).__module__ for layer in script.model.modules())
+
+
+def test_modules_starting_with_other_layers_are_kept():
+    module = torch.nn.Sequential(torch.nn.Conv1d(1, 1, 3), torch.nn.Flatten(), torch.nn.Linear(2, 1))
+    with pytest.raises(NotQuantized):
+        quantize_module("model", module)
+
+
+def test_modules_whose_predictions_differ_are_kept(monkeypatch):
+    monkeypatch.setattr(quantization, "QUANTIZED_MODEL_TOLERANCE", 0.0)
+    module = torch.nn.Sequential(torch.nn.Linear(16, 4))
+    script = types.ModuleType("inference")
+    script.model = module
+    quantize_models(script)
+    assert script.model is module
+
+
+def test_the_check_runs_on_one_thread():
+    threads = []
+
+    class Recorder(torch.nn.Module):
+        def forward(self, inputs):
+            threads.append(torch.get_num_threads())
+            return inputs
+
+    module = torch.nn.Sequential(torch.nn.Linear(16, 4), Recorder())
+    num_threads = torch.get_num_threads()
+    quantize_module("model", module)
+    assert set(threads) == {1}
+    assert torch.get_num_threads() == num_threads
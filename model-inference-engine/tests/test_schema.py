@@ -0,0 +1,81 @@
+"""Unit tests for the validation of prediction requests"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+from pydantic import ValidationError
+
+from src.schema import RequestSchema, element_type, parse_type, request_type
+
+
+def test_parse_type_drops_module_prefixes():
+    assert parse_type("dict[str][float]") == ("dict", ["str", "float"])
+    assert parse_type("numpy.ndarray") == ("ndarray", [])
+    assert parse_type("List[builtins.int]") == ("List", ["int"])
+    assert parse_type("not a type!") == ("", [])
+
+
+def test_request_type_maps_stored_types():
+    assert request_type("int") is int
+    assert request_type("list[float]") == List[float]
+    assert request_type("Dict[str][int]") == Dict[str, int]
+    assert request_type("Optional[str]") == Optional[str]
+    assert request_type("ndarray") == List[Any]
+    assert request_type("SomeClass") is Any
+
+
+def test_element_type_is_the_type_of_one_row():
+    assert element_type("list[int]") is int
+    assert element_type("DataFrame") == Dict[str, Any]
+
+
+def test_requests_are_validated_against_the_signature():
+    def predict(x: int, y: float = 1.0):
+        return x * y
+
+    schema = RequestSchema(predict, {"x": "int", "y": "float"}, batched=False)
+    assert schema.validate_json(b'{"x": 2}') == {"x": 2}
+    with pytest.raises(ValidationError):
+        schema.validate_json(b'{"y": 2}')
+    with pytest.raises(ValidationError):
+        schema.validate_json(b'{"x": "two"}')
+    with pytest.raises(ValidationError):
+        schema.validate_json(b'{"x": 2, "z": 3}')
+
+
+def test_other_arguments_are_allowed_with_var_keyword():
+    def predict(x, **kwargs):
+        return x
+
+    schema = RequestSchema(predict, {}, batched=False)
+    assert schema.validate_json(b'{"x": 1, "z": 3}') == {"x": 1, "z": 3}
+
+
+def test_array_arguments_are_converted_before_predicting():
+    def predict(values, frame):
+        return type(values), type(frame)
+
+    schema = RequestSchema(predict, {"values": "numpy.ndarray", "frame": "pandas.DataFrame"}, batched=False)
+    arguments = schema.validate_json(b'{"values": [1, 2], "frame": {"a": [1]}}')
+    assert schema.bind(predict)(**arguments) == (np.ndarray, pd.DataFrame)
+
+
+def test_functions_without_array_arguments_are_not_wrapped():
+    def predict(x: int):
+        return x
+
+    assert RequestSchema(predict, {"x": "int"}, batched=True).bind(predict) is predict
+
+
+def test_bulk_columns_are_validated_against_lists_of_the_argument_type():
+    def predict(x: int, y: float = 1.0):
+        return x * y
+
+    schema = RequestSchema(predict, {"x": "int", "y": "float"}, batched=False)
+    assert schema.validate_columns({"x": [1, 2]}) == {"x": [1, 2]}
+    with pytest.raises(ValidationError) as e:
+        schema.validate_columns({"x": [1, "two"]})
+    assert e.value.errors()[0]["loc"] == ("x", 1)
+    with pytest.raises(ValidationError):
+        schema.validate_columns({"x": [1], "z": [3]})
@@ -0,0 +1,69 @@
+"""Unit tests for the models of shared hosts"""
+import os
+import shutil
+import sys
+
+import src.shared as shared
+from src.shared import SharedModels
+
+SCRIPT = """
+VERSION = globals().get("__preloop_version__")
+weights = [0] * 1000
+
+
+def predict(x: int):
+    return x + 1
+"""
+
+
+class FakeS3Client:
+    def __init__(self, script_path: str) -> None:
+        self.script_path = script_path
+
+    def download_file(self, bucket, key, path):
+        shutil.copy(self.script_path, path)
+
+
+def shared_models(tmp_path, monkeypatch, memory_budget: int = 2**40) -> SharedModels:
+    script_path = tmp_path / "inference.py"
+    script_path.write_text(SCRIPT)
+    monkeypatch.setattr(shared, "SHARED_MODELS_DIR", str(tmp_path / "models"))
+    models = SharedModels("http://api", "internal", "secret", "host", memory_budget, {})
+    models.s3_client = FakeS3Client(str(script_path))
+    return models
+
+
+def spec(model_id: str, version: int) -> dict:
+    return {
+        "id": model_id,
+        "path": f"/shared/{model_id}/latest",
+        "version": version,
+        "inference_script_loc": "s3://bucket/inference.py",
+        "predict_function_name": "predict",
+        "ml_model_inputs": None,
+    }
+
+
+def test_each_model_sees_its_own_version(tmp_path, monkeypatch):
+    models = shared_models(tmp_path, monkeypatch)
+    os.environ.pop("VERSION", None)
+    first = models.load(spec("a", 1))
+    second = models.load(spec("b", 2))
+    assert sys.modules[first.module_name].VERSION == "1"
+    assert sys.modules[second.module_name].VERSION == "2"
+    assert "VERSION" not in os.environ
+    assert first.predict_function(x=1) == 2
+
+
+def test_unused_models_are_unloaded_over_the_budget(tmp_path, monkeypatch):
+    models = shared_models(tmp_path, monkeypatch, memory_budget=0)
+    for model_id in ("c", "d"):
+        model = models.load(spec(model_id, 1))
+        model.memory_bytes = 1
+        models.loaded[model.spec["path"]] = model
+    in_use = models.loaded["/shared/d/latest"]
+    in_use.in_use = 1
+    models.unload_least_recently_used()
+    assert list(models.loaded) == ["/shared/d/latest"]
+    assert "preloop_model_c" not in sys.modules
+    assert sys.modules[in_use.module_name].weights
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import List
 
 from pydantic import BaseModel
 
@@ -15,3 +16,11 @@ class VerifyApiKeyRequest(BaseModel):
 
     key_id: str
     secret: str
+
+
+class CheckApiKeysRequest(BaseModel):
+    """
+    The request body for checking which of a list of API keys still exist.
+    """
+
+    key_ids: List[str]
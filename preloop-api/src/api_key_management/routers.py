@@ -5,9 +5,10 @@ from typing import Annotated, Dict, List, Optional
 from fastapi import APIRouter, Depends, Form, Header, HTTPException, status
 from pydantic import BaseModel, Field, Json
 
-from src.api_key_management.models import VerifyApiKeyRequest
+from src.api_key_management.models import CheckApiKeysRequest, VerifyApiKeyRequest
 from src.api_key_management.utilities import (
     Hasher,
+    api_key_check,
     api_key_creation,
     api_key_deletion,
     api_key_list,
@@ -30,6 +31,7 @@ class APIPath(str, Enum):
     API_KEY_DELETE = "/api/api-key/delete"
     API_KEY_LIST = "/api/api-key/list"
     API_KEY_VERIFY = "/api/api-key/verify"
+    API_KEY_CHECK = "/api/api-key/check"
 
 
 @router.post(APIPath.API_KEY_CREATE, status_code=status.HTTP_201_CREATED)
@@ -102,3 +104,19 @@ async def verify_api_key(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid key or secret"
         )
     return {"result": result}
+
+
+@router.post(APIPath.API_KEY_CHECK, status_code=status.HTTP_200_OK)
+async def check_api_keys(
+    request: CheckApiKeysRequest,
+    user=Depends(check),
+) -> Dict[str, List[str]]:
+    """
+    API endpoint to check which of the given API keys still exist, so that
+    inference engines can drop deleted keys they have cached.
+    """
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
+        )
+    return {"key_ids": api_key_check(user, request.key_ids)}
@@ -219,3 +219,22 @@ def api_key_verify(user: UserClass, key_id: str, secret: str):
         return True
     else:
         return False
+
+
+def api_key_check(user: UserClass, key_ids: list[str]) -> list[str]:
+    """
+    Returns the key ids, out of the given ones, of the external API keys of the
+    organization of the user that still exist. Used by inference engines to drop
+    deleted keys from their caches.
+    """
+    with Session.begin() as session:
+        existing_keys = (
+            session.query(ApiKeys.key_id)
+            .filter(
+                ApiKeys.org_id == user.org_id,
+                ApiKeys.visibility == models.Visibility.EXTERNAL.value,
+                ApiKeys.key_id.in_(key_ids),
+            )
+            .all()
+        )
+    return [row[0] for row in existing_keys]
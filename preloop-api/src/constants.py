@@ -37,6 +37,16 @@ EXECUTION_ENGINE_RETRY_COUNT = 1000
 EXECUTION_ENGINE_RETRY_DELAY = 6
 LB_MAX_RETRIES = 100
 LB_RETRY_DELAY = 5
+# Inference engine image builds, which take a few minutes
+INFERENCE_IMAGE_BUILD_RETRY_COUNT = 180
+INFERENCE_IMAGE_BUILD_RETRY_DELAY = 10
+
+# Seconds to wait for the metrics endpoint of a hosted ML model
+HOSTED_ML_MODEL_METRICS_TIMEOUT = 5
+
+# Batch scoring, features written by scoring jobs are marked with this creation method
+SCORING_FEATURE_CREATION_METHOD = "scoring"
+SCORING_SCRIPT_NAME = "scoring_script.py"
 
 DEPLOY_ENVIRONMENT = os.getenv("DEPLOY_ENVIRONMENT")
 AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION")
@@ -58,10 +68,17 @@ MODEL_INFERENCE_ENGINE_FARGATE_EXECUTION_ROLE_ARN = (
 MODEL_INFERENCE_ENGINE_FARGATE_TASK_ROLE_ARN = (
     f"arn:aws:iam::{AWS_ACCOUNT_ID}:role/model-inference-engine-fargate-task-role"
 )
+MODEL_INFERENCE_ENGINE_REPOSITORY = "preloop-model-inference-engine"
+MODEL_INFERENCE_ENGINE_IMAGE = f"{AWS_ACCOUNT_ID}.dkr.ecr.{AWS_DEFAULT_REGION}.amazonaws.com/{MODEL_INFERENCE_ENGINE_REPOSITORY}"
+# builds images of the inference engine with the libraries of ML models installed
+MODEL_INFERENCE_ENGINE_IMAGE_BUILD_PROJECT = "ModelInferenceEngineImageBuild"
 EXECUTION_ENGINE_STATE_MACHINE_EXECUTION_ARN = f"arn:aws:states:{AWS_DEFAULT_REGION}:{AWS_ACCOUNT_ID}:stateMachine:ExecutionEngineStateMachine"
 MODEL_ENDPOINT_ROUTE_53_HOSTED_ZONE_ID = os.getenv(
     "MODEL_ENDPOINT_ROUTE_53_HOSTED_ZONE_ID"
 )
+# the internal address of this API, set on its task definition and passed on
+# to the inference engines it starts
+PRELOOP_API_ENDPOINT = os.getenv("PRELOOP_API_ENDPOINT", "")
 
 # Model related constants TODO: put this in its own Python package
 
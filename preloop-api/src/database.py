@@ -151,6 +151,48 @@ feature_versions = Table(
     ),
 )
 
+feature_uploads = Table(
+    "feature_uploads",
+    metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True),
+    Column(
+        "feature_id",
+        UUID(as_uuid=True),
+        ForeignKey(feature.c.id, ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("location_string", String, nullable=False),
+    Column("creation_date", DateTime, server_default=func.now(), nullable=False),
+)
+
+datasource_watermarks = Table(
+    "datasource_watermarks",
+    metadata,
+    Column(
+        "id",
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=text("gen_random_uuid()"),
+    ),
+    Column(
+        "datasource_id",
+        UUID(as_uuid=True),
+        ForeignKey(datasource.c.id, ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column(
+        "feature_id",
+        UUID(as_uuid=True),
+        ForeignKey(feature.c.id, ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("watermark_column", String, nullable=False),
+    Column("watermark_value", String, nullable=False),
+    Column("execution_id", UUID(as_uuid=True), nullable=True),
+    Column("record_date", DateTime, server_default=func.now(), nullable=False),
+    Column("last_updated", DateTime, onupdate=func.now()),
+)
+
 feature_drift = Table(
     "feature_drift",
     metadata,
@@ -243,6 +285,54 @@ ml_model_training_jobs = Table(
     Column("cloudwatch_log_stream_name", String, nullable=True),
 )
 
+ml_model_scoring_jobs = Table(
+    "ml_model_scoring_jobs",
+    metadata,
+    Column(
+        "id",
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=text("gen_random_uuid()"),
+    ),
+    Column(
+        "user_id",
+        UUID(as_uuid=True),
+        ForeignKey(all_users.c.user_id, ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column(
+        "ml_model_id",
+        UUID(as_uuid=True),
+        ForeignKey(ml_model.c.id, ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("ml_model_version", Integer, nullable=False),
+    Column(
+        "feature_id",
+        UUID(as_uuid=True),
+        ForeignKey(feature.c.id, ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("feature_version", Integer, nullable=True),
+    Column(
+        "output_feature_id",
+        UUID(as_uuid=True),
+        ForeignKey(feature.c.id, ondelete="SET NULL"),
+        nullable=True,
+    ),
+    Column("output_feature_version", Integer, nullable=True),
+    Column("start_time", DateTime, server_default=func.now(), nullable=False),
+    Column("end_time", DateTime, nullable=True),
+    Column("status", String, nullable=False),
+    Column("reason", String, nullable=True),
+    Column("rows_scored", Integer, nullable=False, server_default=text("0")),
+    Column("total_rows", Integer, nullable=True),
+    Column("ecs_cluster_arn", String, nullable=True),
+    Column("ecs_task_arn", String, nullable=True),
+    Column("cloudwatch_log_group_name", String, nullable=True),
+    Column("cloudwatch_log_stream_name", String, nullable=True),
+)
+
 ml_model_versions = Table(
     "ml_model_versions",
     metadata,
@@ -297,6 +387,58 @@ org_load_balancers = Table(
     Column("security_group_id", String, nullable=False),
 )
 
+shared_inference_hosts = Table(
+    "shared_inference_hosts",
+    metadata,
+    Column(
+        "id",
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=text("gen_random_uuid()"),
+    ),
+    Column(
+        "org_id",
+        UUID(as_uuid=True),
+        ForeignKey(organizations.c.org_id, ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    ),
+    Column(
+        "user_id",
+        UUID(as_uuid=True),
+        ForeignKey(all_users.c.user_id, ondelete="CASCADE"),
+        nullable=False,
+    ),
+    Column("load_balancer_id", UUID(as_uuid=True), nullable=True),
+    Column("target_group_arn", String, nullable=True),
+    Column("listener_rule_arn", String, nullable=True),
+    Column("ecs_cluster_name", String, nullable=True),
+    Column("ecs_service_name", String, nullable=True),
+    Column("task_security_group_id", String, nullable=True),
+    Column("task_definition_arn", String, nullable=True),
+    Column("status", String, nullable=False),
+    Column("reason", String, nullable=True),
+    Column("creation_date", DateTime, server_default=func.now(), nullable=False),
+)
+
+inference_images = Table(
+    "inference_images",
+    metadata,
+    Column(
+        "id",
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=text("gen_random_uuid()"),
+    ),
+    Column("dependency_hash", String, nullable=False, unique=True),
+    Column("libraries", String, nullable=False),
+    Column("image_uri", String, nullable=False),
+    Column("build_id", String, nullable=True),
+    Column("status", String, nullable=False),
+    Column("reason", String, nullable=True),
+    Column("creation_date", DateTime, server_default=func.now(), nullable=False),
+)
+
 hosted_ml_models = Table(
     "hosted_ml_models",
     metadata,
@@ -338,6 +480,13 @@ hosted_ml_models = Table(
     Column(
         "require_api_key", Boolean, nullable=False, server_default=expression.true()
     ),
+    Column("hosting", String, nullable=False, server_default="dedicated"),
+    Column(
+        "shared_host_id",
+        UUID(as_uuid=True),
+        ForeignKey(shared_inference_hosts.c.id),
+        nullable=True,
+    ),
 )
 
 executions = Table(
@@ -449,10 +598,18 @@ class FeatureVersions:
     pass
 
 
+class FeatureUploads:
+    pass
+
+
 class FeatureDrift:
     pass
 
 
+class DatasourceWatermarks:
+    pass
+
+
 class MLModel:
     pass
 
@@ -461,6 +618,10 @@ class MLModelTrainingJobs:
     pass
 
 
+class MLModelScoringJobs:
+    pass
+
+
 class MLModelVersions:
     pass
 
@@ -469,6 +630,14 @@ class OrgLoadBalancers:
     pass
 
 
+class SharedInferenceHosts:
+    pass
+
+
+class InferenceImages:
+    pass
+
+
 class HostedMLModels:
     pass
 
@@ -495,10 +664,15 @@ mapper.map_imperatively(Datasource, datasource)
 mapper.map_imperatively(Feature, feature)
 mapper.map_imperatively(FeatureVersions, feature_versions)
 mapper.map_imperatively(FeatureDrift, feature_drift)
+mapper.map_imperatively(FeatureUploads, feature_uploads)
+mapper.map_imperatively(DatasourceWatermarks, datasource_watermarks)
 mapper.map_imperatively(MLModel, ml_model)
 mapper.map_imperatively(MLModelTrainingJobs, ml_model_training_jobs)
+mapper.map_imperatively(MLModelScoringJobs, ml_model_scoring_jobs)
 mapper.map_imperatively(MLModelVersions, ml_model_versions)
 mapper.map_imperatively(OrgLoadBalancers, org_load_balancers)
+mapper.map_imperatively(SharedInferenceHosts, shared_inference_hosts)
+mapper.map_imperatively(InferenceImages, inference_images)
 mapper.map_imperatively(HostedMLModels, hosted_ml_models)
 mapper.map_imperatively(Executions, executions)
 mapper.map_imperatively(ApiKeys, api_keys)
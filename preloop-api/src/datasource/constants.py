@@ -0,0 +1,6 @@
+class Constants:
+    # bytes read from the end of a parquet object to capture its footer. Larger
+    # footers are fetched with a second ranged read of the exact size.
+    S3_PARQUET_FOOTER_READ_SIZE = 64 * 1024
+    # bytes read from the start of a csv object to infer its schema
+    S3_CSV_SAMPLE_READ_SIZE = 64 * 1024
@@ -13,6 +13,7 @@ class DataSourceType(str, Enum):
     """
 
     POSTGRES = "postgres"
+    POSTGRES_QUERY = "postgres_query"
     MYSQL = "mysql"
     S3 = "s3"
 
@@ -38,6 +39,8 @@ class APIPaths(str, Enum):
     DATASOURCE_CONNECT = "/api/datasource/connect"  # internal use only
     DATASOURCE_GET = "/api/datasource/get"
     DATASOURCE_GET_ID = "/api/datasource/get/id"
+    DATASOURCE_GET_WATERMARK = "/api/datasource/watermark/get"
+    DATASOURCE_STORE_WATERMARK = "/api/datasource/watermark/store"
 
 
 class SQLConnectionParams(BaseModel):
@@ -47,6 +50,22 @@ class SQLConnectionParams(BaseModel):
     database_name: str
     table_name: str
     schema_name: str | None = None
+    watermark_column: str | None = None
+
+
+class SQLQueryConnectionParams(BaseModel):
+    """
+    Connection params for a datasource defined by a SELECT query instead of
+    a whole table. Parameters are referenced in the query as :name and their
+    values are given in query_parameters.
+    """
+
+    user_name: str
+    host_name: str
+    port_number: int
+    database_name: str
+    query: str
+    query_parameters: Dict[str, Any] | None = None
 
 
 class SQLAuthParams(BaseModel):
@@ -63,6 +82,11 @@ class SQLConnectionDetails(BaseModel):
     auth_params: SQLAuthParams
 
 
+class SQLQueryConnectionDetails(BaseModel):
+    connection_params: SQLQueryConnectionParams
+    auth_params: SQLAuthParams
+
+
 # Pydantic models to validate inputs
 class CreateDatasourceRequest(BaseModel):
     datasource_name: str
@@ -72,7 +96,7 @@ class CreateDatasourceRequest(BaseModel):
         default="Description of this datasource.",
     )
     datasource_type: DataSourceType
-    connection_details: SQLConnectionDetails | S3ConnectionDetails
+    connection_details: SQLConnectionDetails | SQLQueryConnectionDetails | S3ConnectionDetails
     execution_id: uuid.UUID
 
 
@@ -86,7 +110,7 @@ class DataSource(BaseModel):
     datasource_name_script: str
     datasource_name_generic: str
     datasource_description: Optional[str] = None
-    connection_details: SQLConnectionDetails | S3ConnectionDetails
+    connection_details: SQLConnectionDetails | SQLQueryConnectionDetails | S3ConnectionDetails
     datasource_type: DataSourceType
     datasource_details: Optional[Dict[Any, Any]] = None
     hashed_value: Optional[str] = None
@@ -101,17 +125,22 @@ class CreationResponse(BaseModel):
 
 class ModificationField(BaseModel):
     datasource_description: Optional[str] = None
-    connection_details: Optional[SQLConnectionDetails | S3ConnectionDetails] = None
+    connection_details: Optional[
+        SQLConnectionDetails | SQLQueryConnectionDetails | S3ConnectionDetails
+    ] = None
 
 
 class DataSourceDetails(BaseModel):
     id: str | uuid.UUID
+    # the organization of the user listing the datasource, which scopes its cached reads
+    org_id: Optional[str | uuid.UUID] = None
     team: Optional[str] = None
     datasource_name: str
     datasource_description: Optional[str] = None
     datasource_type: DataSourceType
-    connection_details: SQLConnectionDetails | S3ConnectionDetails
+    connection_details: SQLConnectionDetails | SQLQueryConnectionDetails | S3ConnectionDetails
     datasource_details: Optional[Dict[Any, Any]] = None
+    hashed_value: Optional[str] = None
     creation_date: datetime
     last_updated: datetime | None
 
@@ -141,3 +170,16 @@ class DatasourceIDRequest(BaseModel):
 class DatasourceIDResponse(BaseModel):
     message: str
     details: Dict[Any, Any]
+
+
+class DatasourceWatermarkRequest(BaseModel):
+    datasource_id: uuid.UUID
+    feature_id: uuid.UUID
+
+
+class StoreDatasourceWatermarkRequest(BaseModel):
+    datasource_id: uuid.UUID
+    feature_id: uuid.UUID
+    watermark_column: str
+    watermark_value: str
+    execution_id: Optional[uuid.UUID] = None
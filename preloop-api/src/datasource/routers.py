@@ -59,13 +59,16 @@ async def list_datasources(
     dsc = DataSourceCore(user_id=user_id, org_id=org_id, role=role)
     if fields is None:
         datasource_list = dsc.list_datasources()
-        return models.ListDatasourcesResult(datasources=datasource_list)
     else:
         datasource_id = fields.datasource_id
         datasource_list = dsc.return_datasource_details(datasource_id=datasource_id)
         if datasource_list == []:
             raise HTTPException(status_code=404, detail="Datasource not found")
 
+    # datasources are only shared with teams of the user's organization
+    datasource_list = [
+        {**datasource, "org_id": org_id} for datasource in datasource_list
+    ]
     return models.ListDatasourcesResult(datasources=datasource_list)
 
 
@@ -223,3 +226,53 @@ async def get_datasource_id(
     except exc.NoResultFound as e:
         raise HTTPException(status_code=422, detail=str(e))
     return {"message": "success", "details": {"datasource_id": datasource_id}}
+
+
+@router.post(
+    models.APIPaths.DATASOURCE_GET_WATERMARK,
+    status_code=status.HTTP_200_OK,
+    response_model=models.DataSourceAPIGenericResponse,
+)
+async def get_datasource_watermark(
+    inputs: models.DatasourceWatermarkRequest, user=Depends(current_active_user)
+):
+    user_id = user.id
+    org_id = user.org_id
+    role = user.role
+
+    dsc = DataSourceCore(user_id=user_id, org_id=org_id, role=role)
+    try:
+        watermark = dsc.get_datasource_watermark(
+            datasource_id=inputs.datasource_id, feature_id=inputs.feature_id
+        )
+    except exc.NoResultFound as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"message": "success", "details": watermark}
+
+
+@router.post(
+    models.APIPaths.DATASOURCE_STORE_WATERMARK,
+    status_code=status.HTTP_201_CREATED,
+    response_model=models.DataSourceAPIGenericResponse,
+)
+async def store_datasource_watermark(
+    inputs: models.StoreDatasourceWatermarkRequest, user=Depends(current_active_user)
+):
+    user_id = user.id
+    org_id = user.org_id
+    role = user.role
+
+    dsc = DataSourceCore(user_id=user_id, org_id=org_id, role=role)
+    try:
+        dsc.store_datasource_watermark(
+            datasource_id=inputs.datasource_id,
+            feature_id=inputs.feature_id,
+            watermark_column=inputs.watermark_column,
+            watermark_value=inputs.watermark_value,
+            execution_id=inputs.execution_id,
+        )
+    except exc.NoResultFound as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except exc.IntegrityError as e:
+        raise HTTPException(status_code=422, detail="Feature not found")
+    return {"message": "success", "details": None}
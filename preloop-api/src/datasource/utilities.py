@@ -2,32 +2,47 @@
 This module contains classes and methods to provide 
 functionality to the Preloop datasource API. 
 """
+import datetime
+import decimal
 import hashlib
+import io
 import json
 import logging
+import math
+import struct
 import uuid
 from typing import Any, Dict, List, Optional
 
 import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import sqlparse
 from fastapi import HTTPException
 from pydantic import ValidationError
 from sqlalchemy import and_, create_engine, exc, or_, text
-from sqlparse.sql import Identifier, IdentifierList
-from sqlparse.tokens import DML, Keyword
+from sqlparse.sql import Identifier, IdentifierList, Parenthesis
+from sqlparse.tokens import DDL, DML, Keyword
 
 from src.auth import utilities as auth_utilities
 from src.common import are_credentials_valid
-from src.database import AllUsers, Datasource, Feature, Session
+from src.database import (
+    AllUsers,
+    Datasource,
+    DatasourceWatermarks,
+    Feature,
+    Session,
+)
 from src.team import utilities as team_utilities
 
+from .constants import Constants
 from .models import (
     CreateDatasourceRequest,
     DataSource,
     DataSourceType,
     S3ConnectionDetails,
     SQLConnectionDetails,
+    SQLQueryConnectionDetails,
 )
 
 log = logging.getLogger("uvicorn")
@@ -48,6 +63,11 @@ def extract_from_part(parsed):
         if from_seen:
             if is_subselect(item):
                 yield from extract_from_part(item)
+            elif item.ttype is Keyword and (
+                item.value.upper().endswith("JOIN") or item.value.upper() == "ON"
+            ):
+                # joined tables are read as well, their join conditions are skipped
+                continue
             elif item.ttype is Keyword:
                 return
             else:
@@ -56,13 +76,21 @@ def extract_from_part(parsed):
             from_seen = True
 
 
+def extract_table_name(identifier):
+    # subqueries in the FROM clause read the tables in their own FROM clause
+    if isinstance(identifier.tokens[0], Parenthesis):
+        yield from extract_table_identifiers(extract_from_part(identifier.tokens[0]))
+    else:
+        yield identifier.get_real_name()
+
+
 def extract_table_identifiers(token_stream):
     for item in token_stream:
         if isinstance(item, IdentifierList):
             for identifier in item.get_identifiers():
-                yield identifier.get_name()
+                yield from extract_table_name(identifier)
         elif isinstance(item, Identifier):
-            yield item.get_name()
+            yield from extract_table_name(item)
         # It's a bug to check for Keyword here, but in the example
         # above some tables names are identified as keywords...
         elif item.ttype is Keyword:
@@ -74,6 +102,192 @@ def extract_tables(sql):
     return list(extract_table_identifiers(stream))
 
 
+def validate_select_query(query: str) -> List[str]:
+    """
+    Checks that a query datasource is a single read only SELECT statement and
+    returns the tables it reads from.
+
+    Inputs:
+        query (str): The SQL query stored with the datasource.
+
+    Returns:
+        A list of the table names referenced in the query.
+    """
+    statements = [
+        statement
+        for statement in sqlparse.parse(query)
+        if statement.value.strip().strip(";")
+    ]
+    if len(statements) != 1:
+        raise ValueError("The query must contain exactly one SQL statement")
+    statement = statements[0]
+    if statement.get_type() != "SELECT" or not is_subselect(statement):
+        raise ValueError("The query must be a SELECT statement")
+    for token in statement.flatten():
+        if token.ttype is DDL or (
+            token.ttype is DML and token.value.upper() != "SELECT"
+        ):
+            raise ValueError(f"The query must not contain {token.value.upper()}")
+        if token.ttype is Keyword and token.value.upper() == "INTO":
+            raise ValueError("The query must not contain INTO")
+    tables = extract_tables(query)
+    if tables == []:
+        raise ValueError("The query must select from at least one table")
+    return tables
+
+
+def json_safe_statistic(value: Any) -> Any:
+    """
+    Converts a parquet column statistic into a value that can be stored in a
+    JSONB column. Integers, finite floats and strings are kept as is. Other
+    values, like timestamps and decimals, are stored as a dictionary with
+    their type and a string of their value, so that clients can restore the
+    type and compare the statistic with the values of their filters.
+    """
+    if isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        if math.isfinite(value):
+            return value
+        return {"type": "float", "value": str(value)}
+    if isinstance(value, bytes):
+        return {"type": "bytes", "value": value.hex()}
+    if isinstance(value, datetime.datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"type": "date", "value": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"type": "time", "value": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"type": "decimal", "value": str(value)}
+    return str(value)
+
+
+def read_s3_parquet_footer(
+    s3_client, bucket_name: str, object_key: str, object_size: int
+) -> Dict[str, Any]:
+    """
+    Reads the footer of a parquet object with ranged reads, without
+    downloading any of the row data.
+
+    Inputs:
+        s3_client: A boto3 s3 client.
+        bucket_name (str): The bucket containing the object.
+        object_key (str): The key of the parquet object.
+        object_size (int): The size of the object in bytes.
+
+    Returns:
+        A dictionary containing the schema, row count and the statistics
+        of every row group in the object.
+    """
+    read_size = min(object_size, Constants.S3_PARQUET_FOOTER_READ_SIZE)
+    tail = s3_client.get_object(
+        Bucket=bucket_name,
+        Key=object_key,
+        Range=f"bytes={object_size - read_size}-{object_size - 1}",
+    )["Body"].read()
+    if len(tail) < 8 or tail[-4:] != b"PAR1":
+        raise ValueError("The object is not a valid parquet file")
+    footer_size = struct.unpack("<I", tail[-8:-4])[0] + 8
+    if footer_size > object_size:
+        raise ValueError("The object is not a valid parquet file")
+    if footer_size > len(tail):
+        tail = s3_client.get_object(
+            Bucket=bucket_name,
+            Key=object_key,
+            Range=f"bytes={object_size - footer_size}-{object_size - 1}",
+        )["Body"].read()
+    file_metadata = pq.read_metadata(pa.BufferReader(tail[-footer_size:]))
+
+    row_groups = []
+    for i in range(file_metadata.num_row_groups):
+        row_group = file_metadata.row_group(i)
+        column_statistics = {}
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            statistics = column.statistics
+            if statistics is None or not statistics.has_min_max:
+                continue
+            column_statistics[column.path_in_schema] = {
+                "min": json_safe_statistic(statistics.min),
+                "max": json_safe_statistic(statistics.max),
+                "null_count": statistics.null_count,
+            }
+        row_groups.append(
+            {
+                "num_rows": row_group.num_rows,
+                "total_byte_size": row_group.total_byte_size,
+                "columns": column_statistics,
+            }
+        )
+
+    return {
+        "schema_and_types": {
+            field.name: str(field.type)
+            for field in file_metadata.schema.to_arrow_schema()
+        },
+        "num_rows": file_metadata.num_rows,
+        "row_groups": row_groups,
+    }
+
+
+def read_s3_csv_header(
+    s3_client, bucket_name: str, object_key: str, object_size: int
+) -> Dict[str, Any]:
+    """
+    Infers the schema of a csv object from a ranged read of its first rows.
+
+    Inputs:
+        s3_client: A boto3 s3 client.
+        bucket_name (str): The bucket containing the object.
+        object_key (str): The key of the csv object.
+        object_size (int): The size of the object in bytes.
+
+    Returns:
+        A dictionary containing the schema of the object.
+    """
+    read_size = min(object_size, Constants.S3_CSV_SAMPLE_READ_SIZE)
+    head = s3_client.get_object(
+        Bucket=bucket_name, Key=object_key, Range=f"bytes=0-{read_size - 1}"
+    )["Body"].read()
+    lines = head.splitlines()
+    if read_size < object_size:
+        # the last line is most likely cut off by the ranged read
+        lines = lines[:-1]
+    sample = pd.read_csv(io.BytesIO(b"\n".join(lines)))
+    return {"schema_and_types": sample.dtypes.astype(str).to_dict()}
+
+
+def read_s3_object_metadata(bucket_name: str, object_key: str) -> Dict[str, Any]:
+    """
+    Captures the metadata of an s3 object without downloading it. A HEAD
+    request provides the ETag and size, and the schema is read from the
+    parquet footer or the first rows of a csv object.
+
+    Inputs:
+        bucket_name (str): The bucket containing the object.
+        object_key (str): The key of the object.
+
+    Returns:
+        A dictionary that is stored as the datasource_details of the datasource.
+    """
+    s3_client = boto3.client("s3")
+    head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    object_size = head["ContentLength"]
+    if object_size == 0:
+        raise ValueError("The object is empty")
+    object_metadata = {"etag": head["ETag"].strip('"'), "size": object_size}
+    if object_key.endswith(".parquet"):
+        object_metadata.update(
+            read_s3_parquet_footer(s3_client, bucket_name, object_key, object_size)
+        )
+    else:
+        object_metadata.update(
+            read_s3_csv_header(s3_client, bucket_name, object_key, object_size)
+        )
+    return object_metadata
+
+
 def datasource_name_exists(org_id: uuid.UUID, datasource_name: str) -> bool:
     """
     Checks if the datasource name already exists, and returns a boolean result.
@@ -255,6 +469,67 @@ class DataSourceCore:
                 results = [dict(result) for result in results]
                 self.datasource_preview = results
 
+        if datasource_type == DataSourceType.POSTGRES_QUERY:
+            referenced_tables = validate_select_query(connection_params["query"])
+            query = connection_params["query"].strip().rstrip(";")
+            query_parameters = connection_params.get("query_parameters") or {}
+            missing_parameters = set(text(query).compile().params) - set(
+                query_parameters
+            )
+            if missing_parameters:
+                raise ValueError(
+                    f"No values given for the query parameters {sorted(missing_parameters)}"
+                )
+
+            user_name = connection_params["user_name"]
+            host_name = connection_params["host_name"]
+            port = connection_params["port_number"]
+            database_name = connection_params["database_name"]
+            passwd = auth_params["password"]
+
+            connection_string = (
+                f"postgresql://{user_name}:{passwd}@{host_name}:{port}/{database_name}"
+            )
+            engine_datasource = create_engine(connection_string)
+
+            if are_credentials_valid(engine_datasource.url) == False:
+                raise ConnectionError("Connection failed")
+
+            with engine_datasource.begin() as datasource_connection:
+                datasource_connection.execute(text("set transaction read only;"))
+
+                # run the query once to get its columns and a preview of the data
+                preview_query = text(
+                    f"select * from ({query}) as preloop_query limit 5;"
+                )
+                results = datasource_connection.execute(preview_query, query_parameters)
+                type_codes = {
+                    column[0]: column[1] for column in results.cursor.description
+                }
+                self.datasource_preview = [
+                    dict(result) for result in results.mappings().all()
+                ]
+
+                # the cursor only describes columns by type oid, so look up their names
+                type_query = text(
+                    "select oid, format_type(oid, null) from pg_type where oid = any(:type_codes);"
+                )
+                type_names = dict(
+                    datasource_connection.execute(
+                        type_query, {"type_codes": list(set(type_codes.values()))}
+                    ).fetchall()
+                )
+                self.datasource_schema = {
+                    column_name: type_names.get(type_code)
+                    for column_name, type_code in type_codes.items()
+                }
+
+            return {
+                "schema_and_types": self.datasource_schema,
+                "datasource_preview": self.datasource_preview,
+                "referenced_tables": referenced_tables,
+            }
+
         return {
             "schema_and_types": self.datasource_schema,
             "datasource_preview": self.datasource_preview,
@@ -276,7 +551,14 @@ class DataSourceCore:
         Returns:
             None
         """
-        if not isinstance(sql_datasource.connection_details, SQLConnectionDetails):
+        if sql_datasource.datasource_type == DataSourceType.POSTGRES_QUERY:
+            if not isinstance(
+                sql_datasource.connection_details, SQLQueryConnectionDetails
+            ):
+                raise TypeError(
+                    "The connection details must be of type SQLQueryConnectionDetails"
+                )
+        elif not isinstance(sql_datasource.connection_details, SQLConnectionDetails):
             raise TypeError(
                 "The connection details must be of type SQLConnectionDetails"
             )
@@ -294,6 +576,14 @@ class DataSourceCore:
             )
         except exc.NoSuchTableError as e:
             raise ValueError(e.args[0])
+        watermark_column = connection_params.get("watermark_column")
+        if (
+            watermark_column is not None
+            and watermark_column not in schema_and_preview["schema_and_types"]
+        ):
+            raise ValueError(
+                f"The watermark column {watermark_column} is not a column in the datasource"
+            )
         variables = sql_datasource.model_dump()
         hash_obj = hashlib.sha256()
 
@@ -306,6 +596,10 @@ class DataSourceCore:
         datasource_details = {
             "schema_and_types": schema_and_preview["schema_and_types"]
         }
+        if "referenced_tables" in schema_and_preview:
+            datasource_details["referenced_tables"] = schema_and_preview[
+                "referenced_tables"
+            ]
 
         # Get the hexadecimal digest of the hash
         variables["hashed_value"] = hash_obj.hexdigest()
@@ -370,15 +664,18 @@ class DataSourceCore:
         ):
             raise ValueError("The object key must be a csv or parquet file")
         try:
-            boto3.client("s3").get_object(
-                Bucket=s3_datasource.connection_details.bucket_name,
-                Key=s3_datasource.connection_details.object_key,
+            datasource_details = read_s3_object_metadata(
+                bucket_name=s3_datasource.connection_details.bucket_name,
+                object_key=s3_datasource.connection_details.object_key,
             )
         except Exception as e:
             log.error(str(e), exc_info=True)
             raise ValueError(
                 f"Unable to connect to s3 datasource with name {s3_datasource.datasource_name}. Please check the connection details and try again. (Could also be a permissions issue)"
             )
+        hash_obj = hashlib.sha256()
+        hash_obj.update(s3_datasource.connection_details.model_dump_json().encode())
+        hash_obj.update(json.dumps(datasource_details["schema_and_types"]).encode())
         with Session.begin() as session:
             # check if dataset exists already. If it does, then return an error message
             is_name_exist = datasource_name_exists(
@@ -396,6 +693,8 @@ class DataSourceCore:
                     datasource_description=s3_datasource.datasource_description,
                     connection_details=s3_datasource.connection_details,
                     datasource_type=s3_datasource.datasource_type,
+                    datasource_details=datasource_details,
+                    hashed_value=hash_obj.hexdigest(),
                     execution_id=s3_datasource.execution_id,
                 )
                 new_datasource = Datasource(**new_datasource.model_dump())
@@ -412,7 +711,10 @@ class DataSourceCore:
             }
 
     def create_datasource(self, datasource: CreateDatasourceRequest) -> uuid.UUID:
-        if datasource.datasource_type == DataSourceType.POSTGRES:
+        if datasource.datasource_type in (
+            DataSourceType.POSTGRES,
+            DataSourceType.POSTGRES_QUERY,
+        ):
             return self.create_sql_datasource(datasource)
         if datasource.datasource_type == DataSourceType.S3:
             return self.create_s3_datasource(datasource)
@@ -581,7 +883,10 @@ class DataSourceCore:
             if any(
                 field in params_to_modify.keys() for field in ["connection_details"]
             ):
-                if getattr(row_to_modify, "datasource_type") == DataSourceType.POSTGRES:
+                if getattr(row_to_modify, "datasource_type") in (
+                    DataSourceType.POSTGRES,
+                    DataSourceType.POSTGRES_QUERY,
+                ):
                     connection_details = getattr(row_to_modify, "connection_details")
                     connection_params_existing = connection_details["connection_params"]
                     auth_params_existing = connection_details["auth_params"]
@@ -599,14 +904,49 @@ class DataSourceCore:
                         "auth_params"
                     ]
 
-                    schema_new = self.connect_to_datasource(
+                    schema_and_preview_new = self.connect_to_datasource(
                         datasource_type, connection_params_new, auth_params_new
-                    )["schema_and_types"]
+                    )
+                    schema_new = schema_and_preview_new["schema_and_types"]
 
                     if schema_existing != schema_new:
                         raise ValueError(
                             "Schema mismatch detected. Please check your connection params and auth params."
                         )
+                    if "referenced_tables" in schema_and_preview_new:
+                        params_to_modify["datasource_details"] = {
+                            "schema_and_types": schema_new,
+                            "referenced_tables": schema_and_preview_new[
+                                "referenced_tables"
+                            ],
+                        }
+
+                if getattr(row_to_modify, "datasource_type") == DataSourceType.S3:
+                    try:
+                        datasource_details = read_s3_object_metadata(
+                            bucket_name=params_to_modify["connection_details"][
+                                "bucket_name"
+                            ],
+                            object_key=params_to_modify["connection_details"][
+                                "object_key"
+                            ],
+                        )
+                    except Exception as e:
+                        log.error(str(e), exc_info=True)
+                        raise ConnectionError(
+                            "Unable to connect to the s3 object. Please check the connection details and try again."
+                        )
+                    schema_existing = (
+                        getattr(row_to_modify, "datasource_details") or {}
+                    ).get("schema_and_types")
+                    if (
+                        schema_existing is not None
+                        and schema_existing != datasource_details["schema_and_types"]
+                    ):
+                        raise ValueError(
+                            "Schema mismatch detected. Please check your connection details."
+                        )
+                    params_to_modify["datasource_details"] = datasource_details
 
             for key, value in params_to_modify.items():
                 setattr(row_to_modify, key, value)
@@ -731,6 +1071,99 @@ class DataSourceCore:
 
             return result.id
 
+    def get_datasource_watermark(
+        self, datasource_id: uuid.UUID, feature_id: uuid.UUID
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the high-water mark recorded by the last successful execution
+        of a feature for a given datasource. Incremental reads only fetch rows
+        past this value.
+
+        Inputs:
+            datasource_id (uuid.UUID): The id of the datasource.
+            feature_id (uuid.UUID): The id of the feature reading the datasource.
+
+        Returns:
+            A dictionary with the watermark column and value, or None if the
+            feature has not read the datasource incrementally yet.
+        """
+        if self.return_datasource_details(datasource_id=datasource_id) == []:
+            raise exc.NoResultFound(
+                f"The datasource with id {datasource_id} doesn't exist"
+            )
+        with Session.begin() as session:
+            result = (
+                session.query(DatasourceWatermarks)
+                .filter(
+                    and_(
+                        DatasourceWatermarks.datasource_id == datasource_id,
+                        DatasourceWatermarks.feature_id == feature_id,
+                    )
+                )
+                .first()
+            )
+            if result is None:
+                return None
+
+            return {
+                "watermark_column": result.watermark_column,
+                "watermark_value": result.watermark_value,
+            }
+
+    def store_datasource_watermark(
+        self,
+        datasource_id: uuid.UUID,
+        feature_id: uuid.UUID,
+        watermark_column: str,
+        watermark_value: str,
+        execution_id: Optional[uuid.UUID] = None,
+    ) -> None:
+        """
+        Records the high-water mark for a datasource and feature pair. This is
+        called once the feature data has been written, so that a failed
+        execution never advances the watermark.
+
+        Inputs:
+            datasource_id (uuid.UUID): The id of the datasource.
+            feature_id (uuid.UUID): The id of the feature reading the datasource.
+            watermark_column (str): The column used to track new or changed rows.
+            watermark_value (str): The largest value of the watermark column read.
+            execution_id (uuid.UUID): The execution that read the rows.
+
+        Returns:
+            None
+        """
+        if self.return_datasource_details(datasource_id=datasource_id) == []:
+            raise exc.NoResultFound(
+                f"The datasource with id {datasource_id} doesn't exist"
+            )
+        with Session.begin() as session:
+            row_to_modify = (
+                session.query(DatasourceWatermarks)
+                .filter(
+                    and_(
+                        DatasourceWatermarks.datasource_id == datasource_id,
+                        DatasourceWatermarks.feature_id == feature_id,
+                    )
+                )
+                .first()
+            )
+            if row_to_modify is None:
+                session.add(
+                    DatasourceWatermarks(
+                        datasource_id=datasource_id,
+                        feature_id=feature_id,
+                        watermark_column=watermark_column,
+                        watermark_value=watermark_value,
+                        execution_id=execution_id,
+                    )
+                )
+                return
+
+            row_to_modify.watermark_column = watermark_column
+            row_to_modify.watermark_value = watermark_value
+            row_to_modify.execution_id = execution_id
+
     def clean_up_created_datasources(self, created_datasource_ids: List[str]):
         for datasource_id in created_datasource_ids:
             try:
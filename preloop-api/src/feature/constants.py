@@ -5,3 +5,8 @@ class Constants:
     DEPLOY_ENVIRONMENT = os.getenv("DEPLOY_ENVIRONMENT")
     S3_FEATURE_SCRIPTS_BUCKET = f"preloop-feature-scripts-{DEPLOY_ENVIRONMENT}"
     EXECUTION_ENGINE_LAMBDA_NAME = "ExecutionEngineLambda"
+    # column of a staging table that records which part of an upload a row came from
+    UPLOAD_PART_COLUMN = "__preloop_upload_part"
+    # staging tables of uploads that were neither committed nor aborted after this
+    # many hours are dropped
+    STALE_UPLOAD_HOURS = int(os.getenv("STALE_FEATURE_UPLOAD_HOURS", 24))
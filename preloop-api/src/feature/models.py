@@ -17,6 +17,17 @@ class CreationMethod(str, Enum):
     INCEPTION = "inception"
 
 
+class FeatureWriteMode(str, Enum):
+    """
+    How rows sent to the insert endpoint are combined with the data that
+    is already stored for a feature. MERGE is used by incremental reads,
+    where only new or changed rows are sent on each execution.
+    """
+
+    OVERWRITE = "overwrite"
+    MERGE = "merge"
+
+
 class ExecutionStatus(str, Enum):
     PENDING = "pending"
     SUCCEEDED = "succeeded"
@@ -43,7 +54,11 @@ class APIPaths(str, Enum):
     FEATURE_MODIFY = "/api/feature/modify"
     FEATURE_RUN = "/api/feature/run"
     FEATURE_INSERT = "/api/feature/insert"
+    FEATURE_INSERT_PART = "/api/feature/insert/part"
+    FEATURE_INSERT_COMMIT = "/api/feature/insert/commit"
+    FEATURE_INSERT_ABORT = "/api/feature/insert/abort"
     FEATURE_GET = "/api/feature/get"
+    FEATURE_STREAM = "/api/feature/stream"
     FEATURE_EXPERIMENTAL_GET = "/api/feature/experimental/get"
     FEATURE_EXPERIMENTAL_CREATE = "/api/feature/experimental/create"
     FEATURE_GET_ID = "/api/feature/get/id"
@@ -84,6 +99,20 @@ class FeatureAPIGenericInput(BaseModel):
     version: Optional[int] = None
 
 
+class StreamFeatureInput(FeatureAPIGenericInput):
+    """
+    Reads a version of a feature as a stream of parquet chunks of at most
+    chunk_rows rows, so it can be processed without loading all of it.
+    """
+
+    chunk_rows: int = Field(default=100000, gt=0)
+
+
+class AbortFeatureUploadInput(BaseModel):
+    feature_id: uuid.UUID
+    upload_id: uuid.UUID
+
+
 class ModifyFeatureRequest(BaseModel):
     feature_id: uuid.UUID
     modifications: ModificationFields
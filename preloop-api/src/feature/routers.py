@@ -20,7 +20,7 @@ from sqlalchemy import and_, create_engine, exc
 from src.auth.db import User
 from src.common import check as current_active_user
 from src.config import preloop_datastore_url
-from src.database import Feature, FeatureVersions, Session
+from src.database import Feature, FeatureUploads, FeatureVersions, Session
 from src.datasource.models import CreateDatasourceRequest
 from src.datasource.utilities import DataSourceCore
 from src.feature import models
@@ -167,15 +167,122 @@ async def delete_feature(
     return {"message": "success", "details": None}
 
 
+def _next_feature_version(feature_details: dict, operation_type: str):
+    """
+    Returns the version that inserted rows are stored as, and whether that
+    version has to be recorded. Features without versioning always store
+    their rows as version 1, which is only recorded on the first run.
+    """
+    if feature_details["versioning"] is False and (
+        operation_type != ExecutionType.FIRST_RUN.value
+    ):
+        return 1, False
+    if operation_type == ExecutionType.FIRST_RUN.value:
+        return 1, True
+    return feature_details["latest_version"] + 1, True
+
+
+def _lock_feature(session, feature_details: dict) -> dict:
+    """
+    Locks the row of the feature until the session ends, so that concurrent
+    inserts into the feature are stored as versions one after the other, and
+    returns the feature details with the latest version read under the lock.
+    """
+    feature_row = (
+        session.query(Feature)
+        .filter(Feature.id == feature_details["id"])
+        .with_for_update()
+        .one()
+    )
+    return {**feature_details, "latest_version": feature_row.latest_version}
+
+
+def _record_feature_version(session, feature_details: dict, user_id, version: int):
+    # update the feature version table with the newest version
+    session.add(FeatureVersions(feature_id=feature_details["id"], version=version))
+
+    row_to_modify = (
+        session.query(Feature)
+        .filter(
+            and_(Feature.id == feature_details["id"]),
+            and_(Feature.user_id == user_id),
+        )
+        .one()
+    )
+
+    row_to_modify.latest_version = version
+
+
+def _delete_unrecorded_version(feature_details: dict, version: int):
+    """
+    Deletes the rows stored as a version whose recording in the control
+    database failed after the datastore had committed them. The feature is
+    locked again first, and the rows are kept if another insert has recorded
+    the version since.
+    """
+    try:
+        with Session.begin() as session:
+            _lock_feature(session, feature_details)
+            recorded = (
+                session.query(FeatureVersions)
+                .filter(
+                    FeatureVersions.feature_id == feature_details["id"],
+                    FeatureVersions.version == version,
+                )
+                .first()
+            )
+            if recorded is None:
+                FeatureCore.delete_feature_version(
+                    location_string=feature_details["location_string"],
+                    version=version,
+                )
+    except Exception as e:
+        log.error(e, exc_info=True)
+
+
+def _register_upload(
+    background_tasks: BackgroundTasks,
+    upload_id: uuid.UUID,
+    feature_id: uuid.UUID,
+    location_string: str,
+):
+    # stale uploads are looked for whenever a new upload starts
+    if FeatureCore.register_upload(upload_id, feature_id, location_string):
+        background_tasks.add_task(FeatureCore.drop_stale_uploads)
+
+
+def _upload_feature_details(feature: FeatureCore, feature_id) -> dict:
+    try:
+        feature_details = feature.return_feature_details(feature_id=feature_id)
+
+    except exc.NoResultFound as e:
+        raise HTTPException(
+            status_code=422, detail=f"The feature with id {feature_id} does not exist"
+        )
+
+    except Exception as e:
+        log.error(e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    if feature_details == []:
+        raise HTTPException(
+            status_code=422, detail=f"The feature with id {feature_id} does not exist"
+        )
+    return feature_details[0]
+
+
 @router.post(
     models.APIPaths.FEATURE_INSERT,
     status_code=status.HTTP_201_CREATED,
     response_model=models.FeatureAPIGenericResponse,
 )
-async def insert_feature(
+def insert_feature(
     feature_id: Annotated[str, Form()],
     operation_type: Annotated[str, Form()],
     data: Annotated[UploadFile, Form()],
+    write_mode: Annotated[
+        models.FeatureWriteMode, Form()
+    ] = models.FeatureWriteMode.OVERWRITE,
     user=Depends(current_active_user),
 ):
     user_id = user.id
@@ -196,66 +303,197 @@ async def insert_feature(
         raise HTTPException(status_code=500, detail="Internal server error")
 
     location_string = feature_details[0]["location_string"]
-    version = 1
-    if feature_details[0]["versioning"] is True or (
-        feature_details[0]["versioning"] is False
-        and operation_type == ExecutionType.FIRST_RUN.value
-    ):
-        if operation_type == ExecutionType.FIRST_RUN.value:
-            version = 1
-        else:
-            version = feature_details[0]["latest_version"] + 1
+    data = pd.read_parquet(data.file)
+    engine = create_engine(preloop_datastore_url)
+    schema = location_string.split(".")[0]
+    table_name = location_string.split(".")[1]
 
-        # update the feature version table with the newest version
+    unrecorded_version = None
+    try:
         with Session.begin() as session:
-            session.add(FeatureVersions(feature_id=feature_id, version=version))
+            locked_feature_details = _lock_feature(session, feature_details[0])
+            prior_version = locked_feature_details["latest_version"]
+            version, new_version = _next_feature_version(
+                locked_feature_details, operation_type
+            )
 
-            row_to_modify = (
-                session.query(Feature)
-                .filter(
-                    and_(Feature.id == feature_details[0]["id"]),
-                    and_(Feature.user_id == user_id),
+            if (
+                write_mode == models.FeatureWriteMode.MERGE
+                and operation_type != ExecutionType.FIRST_RUN.value
+            ):
+                data = FeatureCore.merge_with_prior_version(
+                    data=data,
+                    location_string=location_string,
+                    id_cols=feature_details[0]["id_cols"],
+                    version=prior_version,
                 )
-                .one()
-            )
 
-            row_to_modify.latest_version = version
-    data = await data.read()
-    buffer = BytesIO(data)
-    data = pd.read_parquet(buffer)
+            data["__preloop_version"] = version
 
-    # write this to the datastore
-    engine = create_engine(preloop_datastore_url)
-    schema = location_string.split(".")[0]
-    table_name = location_string.split(".")[1]
+            # the version is recorded before its rows are written, so a failure
+            # in the control database stores nothing. It is committed after them.
+            if new_version:
+                _record_feature_version(
+                    session, locked_feature_details, user_id, version
+                )
+                session.flush()
+
+            # write this to the datastore, in one transaction
+            with engine.begin() as connection:
+                data.to_sql(
+                    name=table_name,
+                    con=connection,
+                    schema=schema,
+                    chunksize=10000,
+                    if_exists=(
+                        "append"
+                        if feature_details[0]["versioning"] is True
+                        else "replace"
+                    ),
+                    index=True,
+                )
+            if new_version:
+                unrecorded_version = version
+        unrecorded_version = None
+    except exc.ProgrammingError as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    finally:
+        # the rows were stored but recording their version failed
+        if unrecorded_version is not None:
+            _delete_unrecorded_version(feature_details[0], unrecorded_version)
+
+    return {"message": "success", "details": [{"latest_version": version}]}
 
-    data["__preloop_version"] = version
+
+# chunked uploads, used to insert features too large to send in one request.
+# Parts are staged in the datastore as they arrive, and the final part is sent
+# to the commit endpoint, which stores all the staged rows as a new version.
+@router.post(
+    models.APIPaths.FEATURE_INSERT_PART,
+    status_code=status.HTTP_201_CREATED,
+    response_model=models.FeatureAPIGenericResponse,
+)
+def insert_feature_part(
+    feature_id: Annotated[uuid.UUID, Form()],
+    upload_id: Annotated[uuid.UUID, Form()],
+    part_number: Annotated[int, Form()],
+    data: Annotated[UploadFile, Form()],
+    background_tasks: BackgroundTasks,
+    user=Depends(current_active_user),
+):
+    feature = FeatureCore(user_id=user.id, org_id=user.org_id, role=user.role)
+    feature_details = _upload_feature_details(feature, str(feature_id))
+    _register_upload(
+        background_tasks, upload_id, feature_id, feature_details["location_string"]
+    )
 
     try:
-        if feature_details[0]["versioning"] is True:
-            data.to_sql(
-                name=table_name,
-                con=engine,
-                schema=schema,
-                chunksize=10000,
-                if_exists="append",
-                index=True,
-            )
-        else:
-            data.to_sql(
-                name=table_name,
-                con=engine,
-                schema=schema,
-                chunksize=10000,
-                if_exists="replace",
-                index=True,
+        FeatureCore.insert_feature_part(
+            data=pd.read_parquet(data.file),
+            location_string=feature_details["location_string"],
+            upload_id=upload_id,
+            part_number=part_number,
+        )
+    except exc.ProgrammingError as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+
+    return {"message": "success", "details": [{"part_number": part_number}]}
+
+
+@router.post(
+    models.APIPaths.FEATURE_INSERT_COMMIT,
+    status_code=status.HTTP_201_CREATED,
+    response_model=models.FeatureAPIGenericResponse,
+)
+def commit_feature_upload(
+    feature_id: Annotated[uuid.UUID, Form()],
+    operation_type: Annotated[str, Form()],
+    upload_id: Annotated[uuid.UUID, Form()],
+    part_number: Annotated[int, Form()],
+    total_rows: Annotated[int, Form()],
+    data: Annotated[UploadFile, Form()],
+    background_tasks: BackgroundTasks,
+    write_mode: Annotated[
+        models.FeatureWriteMode, Form()
+    ] = models.FeatureWriteMode.OVERWRITE,
+    user=Depends(current_active_user),
+):
+    user_id = user.id
+    feature = FeatureCore(user_id=user_id, org_id=user.org_id, role=user.role)
+    feature_details = _upload_feature_details(feature, str(feature_id))
+    location_string = feature_details["location_string"]
+    _register_upload(background_tasks, upload_id, feature_id, location_string)
+
+    engine = create_engine(preloop_datastore_url)
+    unrecorded_version = None
+    try:
+        FeatureCore.insert_feature_part(
+            data=pd.read_parquet(data.file),
+            location_string=location_string,
+            upload_id=upload_id,
+            part_number=part_number,
+        )
+        with Session.begin() as session:
+            feature_details = _lock_feature(session, feature_details)
+            merge_version = None
+            if (
+                write_mode == models.FeatureWriteMode.MERGE
+                and operation_type != ExecutionType.FIRST_RUN.value
+            ):
+                merge_version = feature_details["latest_version"]
+            version, new_version = _next_feature_version(
+                feature_details, operation_type
             )
+            # the version is recorded before its rows are stored, so a failure
+            # in the control database stores nothing. It is committed after them.
+            if new_version:
+                _record_feature_version(session, feature_details, user_id, version)
+            session.query(FeatureUploads).filter(
+                FeatureUploads.id == upload_id
+            ).delete()
+            session.flush()
+            with engine.begin() as connection:
+                FeatureCore.commit_feature_upload(
+                    connection=connection,
+                    location_string=location_string,
+                    upload_id=upload_id,
+                    total_rows=total_rows,
+                    version=version,
+                    replace=feature_details["versioning"] is False,
+                    id_cols=feature_details["id_cols"],
+                    merge_version=merge_version,
+                )
+            if new_version:
+                unrecorded_version = version
+        unrecorded_version = None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
     except exc.ProgrammingError as e:
         raise HTTPException(status_code=422, detail=e.args[0])
+    finally:
+        # the rows were stored but recording their version failed
+        if unrecorded_version is not None:
+            _delete_unrecorded_version(feature_details, unrecorded_version)
 
     return {"message": "success", "details": [{"latest_version": version}]}
 
 
+@router.post(
+    models.APIPaths.FEATURE_INSERT_ABORT,
+    status_code=status.HTTP_200_OK,
+    response_model=models.FeatureAPIGenericResponse,
+)
+def abort_feature_upload(
+    fields: models.AbortFeatureUploadInput, user=Depends(current_active_user)
+):
+    feature = FeatureCore(user_id=user.id, org_id=user.org_id, role=user.role)
+    feature_details = _upload_feature_details(feature, str(fields.feature_id))
+    FeatureCore.abort_feature_upload(
+        location_string=feature_details["location_string"], upload_id=fields.upload_id
+    )
+    return {"message": "success", "details": None}
+
+
 @router.post(models.APIPaths.FEATURE_GET, status_code=status.HTTP_200_OK)
 async def get_feature(
     fields: models.FeatureAPIGenericInput, user=Depends(current_active_user)
@@ -305,6 +543,35 @@ async def get_feature(
     return StreamingResponse(iter(), media_type="application/octet-stream")
 
 
+@router.post(models.APIPaths.FEATURE_STREAM, status_code=status.HTTP_200_OK)
+def stream_feature(
+    fields: models.StreamFeatureInput, user=Depends(current_active_user)
+):
+    """
+    Streams a version of a feature in chunks, see FeatureCore.stream_feature_version.
+    The route is sync, so its database reads don't block the event loop.
+    """
+    feature = FeatureCore(user_id=user.id, org_id=user.org_id, role=user.role)
+    try:
+        feature_details = feature.return_feature_details(feature_id=fields.feature_id)
+    except exc.NoResultFound as e:
+        raise HTTPException(status_code=422, detail=e.args[0])
+    version = fields.version or feature_details[0]["latest_version"]
+    if not feature.check_valid_get_feature_request(
+        feature_id=fields.feature_id, version=version
+    ):
+        raise HTTPException(
+            status_code=422, detail="Feature not found or Version does not exist"
+        )
+    chunks = FeatureCore.stream_feature_version(
+        location_string=feature_details[0]["location_string"],
+        version=version,
+        id_cols=feature_details[0]["id_cols"],
+        chunk_rows=fields.chunk_rows,
+    )
+    return StreamingResponse(chunks, media_type="application/octet-stream")
+
+
 @router.post(models.APIPaths.FEATURE_EXPERIMENTAL_GET, status_code=status.HTTP_200_OK)
 async def experiment_get_feature(
     input: models.ExperimentFeatureGetRequest, user=Depends(current_active_user)
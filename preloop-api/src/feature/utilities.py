@@ -6,25 +6,30 @@ import ast
 import json
 import logging
 import os
+import struct
 import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
 import boto3
 import botocore
+import pandas as pd
 from fastapi import UploadFile
 from pydantic import ValidationError
-from sqlalchemy import Table, and_, create_engine, exc, func, or_, text
+from sqlalchemy import Table, and_, create_engine, exc, func, inspect, or_, text
+from sqlalchemy.dialects.postgresql import insert
 
 import src.feature.models as models
 from src.api_key_management.utilities import get_internal_api_key
+from src.config import preloop_datastore_url
 from src.database import (
     AllUsers,
     Datasource,
     Executions,
     Feature,
     FeatureDrift,
+    FeatureUploads,
     FeatureVersions,
     Session,
     metadata,
@@ -496,6 +501,303 @@ class FeatureCore:
 
             return True
 
+    @staticmethod
+    def merge_with_prior_version(
+        data: pd.DataFrame, location_string: str, id_cols: List[str], version: int
+    ) -> pd.DataFrame:
+        """
+        Merges incrementally read rows with a previously stored version of
+        a feature. Rows in the new data replace stored rows that share the
+        same id columns, and all other stored rows are carried over.
+
+        Inputs:
+            data (pd.DataFrame): The new or changed rows, indexed by the id columns.
+            location_string (str): The schema.table the feature is stored in.
+            id_cols (List[str]): The id columns of the feature.
+            version (int): The stored version to merge the rows into.
+
+        Returns:
+            A dataframe containing the merged rows, indexed by the id columns.
+        """
+        engine = create_engine(preloop_datastore_url)
+        schema = location_string.split(".")[0]
+        table_name = location_string.split(".")[1]
+        query = (
+            f'SELECT * FROM "{schema}"."{table_name}" WHERE __preloop_version={version}'
+        )
+        try:
+            prior_data = pd.read_sql(query, engine)
+        except exc.ProgrammingError:
+            # nothing has been written for this feature yet
+            return data
+        prior_data.drop(columns=["__preloop_version"], inplace=True)
+        prior_data.set_index(id_cols, inplace=True)
+        prior_data = prior_data[~prior_data.index.isin(data.index)]
+        return pd.concat([prior_data, data])
+
+    @staticmethod
+    def upload_table_name(upload_id: uuid.UUID) -> str:
+        """
+        Returns the name of the staging table that the parts of a chunked
+        upload are written to. Staging tables live in the schema of the
+        feature they are uploaded for.
+        """
+        return f"preloop_upload_{upload_id.hex}"
+
+    @staticmethod
+    def register_upload(
+        upload_id: uuid.UUID, feature_id: uuid.UUID, location_string: str
+    ) -> bool:
+        """
+        Records a chunked upload when its first part arrives, so its staging
+        table can be dropped if the upload is never committed or aborted.
+
+        Returns:
+            True if the upload was not recorded before.
+        """
+        with Session.begin() as session:
+            result = session.execute(
+                insert(FeatureUploads)
+                .values(
+                    id=upload_id,
+                    feature_id=feature_id,
+                    location_string=location_string,
+                )
+                .on_conflict_do_nothing(index_elements=["id"])
+            )
+            return result.rowcount == 1
+
+    @staticmethod
+    def drop_stale_uploads():
+        """
+        Drops the staging tables of uploads that were started more than
+        STALE_UPLOAD_HOURS ago and never committed or aborted, e.g. because
+        the client crashed. Uploads being dropped by another request are
+        skipped.
+        """
+        engine = create_engine(preloop_datastore_url)
+        cutoff = datetime.now() - timedelta(hours=Constants.STALE_UPLOAD_HOURS)
+        with Session.begin() as session:
+            stale_uploads = (
+                session.query(FeatureUploads)
+                .filter(FeatureUploads.creation_date < cutoff)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for upload in stale_uploads:
+                schema = upload.location_string.split(".")[0]
+                upload_table = FeatureCore.upload_table_name(upload.id)
+                with engine.begin() as connection:
+                    connection.execute(
+                        text(f'DROP TABLE IF EXISTS "{schema}"."{upload_table}"')
+                    )
+                session.delete(upload)
+                log.info(f"Dropped the staging table of stale upload {upload.id}")
+
+    @staticmethod
+    def insert_feature_part(
+        data: pd.DataFrame, location_string: str, upload_id: uuid.UUID, part_number: int
+    ):
+        """
+        Writes one part of a chunked upload to the staging table of the
+        upload. Any rows previously written for the same part are replaced,
+        so a part that is sent again after a failure is not stored twice.
+
+        Inputs:
+            data (pd.DataFrame): The rows of the part.
+            location_string (str): The schema.table the feature is stored in.
+            upload_id (uuid.UUID): The id of the upload, chosen by the client.
+            part_number (int): The position of the part in the upload.
+        """
+        engine = create_engine(preloop_datastore_url)
+        schema = location_string.split(".")[0]
+        upload_table = FeatureCore.upload_table_name(upload_id)
+        data[Constants.UPLOAD_PART_COLUMN] = part_number
+        with engine.begin() as connection:
+            if inspect(connection).has_table(upload_table, schema=schema):
+                connection.execute(
+                    text(
+                        f'DELETE FROM "{schema}"."{upload_table}" '
+                        f'WHERE "{Constants.UPLOAD_PART_COLUMN}" = :part_number'
+                    ),
+                    {"part_number": part_number},
+                )
+            data.to_sql(
+                name=upload_table,
+                con=connection,
+                schema=schema,
+                chunksize=10000,
+                if_exists="append",
+                index=True,
+            )
+
+    @staticmethod
+    def commit_feature_upload(
+        connection,
+        location_string: str,
+        upload_id: uuid.UUID,
+        total_rows: int,
+        version: int,
+        replace: bool,
+        id_cols: List[str],
+        merge_version: Optional[int] = None,
+    ):
+        """
+        Moves the rows of a chunked upload from its staging table into the
+        feature table as the given version. This runs on a connection of the
+        datastore inside a transaction, so readers see either none or all of
+        the rows of the version.
+
+        Inputs:
+            connection: A datastore connection with an open transaction.
+            location_string (str): The schema.table the feature is stored in.
+            upload_id (uuid.UUID): The id of the upload.
+            total_rows (int): The number of rows the client sent in all parts.
+            version (int): The version the rows are stored as.
+            replace (bool): Whether the rows replace the feature table instead
+                of being appended to it, used for features without versioning.
+            id_cols (List[str]): The id columns of the feature.
+            merge_version (Optional[int]): A stored version to carry rows over
+                from, for rows whose ids are not in the upload.
+        """
+        schema = location_string.split(".")[0]
+        table_name = location_string.split(".")[1]
+        upload_table = FeatureCore.upload_table_name(upload_id)
+        upload_ref = f'"{schema}"."{upload_table}"'
+        table_ref = f'"{schema}"."{table_name}"'
+
+        inspector = inspect(connection)
+        if not inspector.has_table(upload_table, schema=schema):
+            raise ValueError(f"The upload with id {upload_id} does not exist")
+        received_rows = connection.execute(
+            text(f"SELECT count(*) FROM {upload_ref}")
+        ).scalar_one()
+        if received_rows != total_rows:
+            raise ValueError(
+                f"The upload with id {upload_id} has {received_rows} rows, expected {total_rows}"
+            )
+        columns = [
+            column["name"]
+            for column in inspector.get_columns(upload_table, schema=schema)
+            if column["name"] != Constants.UPLOAD_PART_COLUMN
+        ]
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        table_exists = inspector.has_table(table_name, schema=schema)
+
+        if merge_version is not None and table_exists:
+            # the same as merge_with_prior_version, without loading either side
+            id_match = " AND ".join(
+                f'upload."{column}" IS NOT DISTINCT FROM prior."{column}"'
+                for column in id_cols
+            )
+            prior_column_list = ", ".join(f'prior."{column}"' for column in columns)
+            connection.execute(
+                text(
+                    f"INSERT INTO {upload_ref} ({column_list}) "
+                    f"SELECT {prior_column_list} FROM {table_ref} AS prior "
+                    f"WHERE prior.__preloop_version = :merge_version "
+                    f"AND NOT EXISTS (SELECT 1 FROM {upload_ref} AS upload WHERE {id_match})"
+                ),
+                {"merge_version": merge_version},
+            )
+
+        if table_exists and not replace:
+            connection.execute(
+                text(
+                    f"INSERT INTO {table_ref} ({column_list}, __preloop_version) "
+                    f"SELECT {column_list}, :version FROM {upload_ref}"
+                ),
+                {"version": version},
+            )
+            connection.execute(text(f"DROP TABLE {upload_ref}"))
+            return
+
+        # the staging table becomes the feature table, so its rows are not copied
+        if table_exists:
+            connection.execute(text(f"DROP TABLE {table_ref}"))
+        connection.execute(
+            text(
+                f'ALTER TABLE {upload_ref} DROP COLUMN "{Constants.UPLOAD_PART_COLUMN}"'
+            )
+        )
+        connection.execute(
+            text(
+                f"ALTER TABLE {upload_ref} ADD COLUMN __preloop_version BIGINT "
+                f"NOT NULL DEFAULT {int(version)}"
+            )
+        )
+        connection.execute(
+            text(
+                f"ALTER TABLE {upload_ref} ALTER COLUMN __preloop_version DROP DEFAULT"
+            )
+        )
+        connection.execute(text(f'ALTER TABLE {upload_ref} RENAME TO "{table_name}"'))
+
+    @staticmethod
+    def stream_feature_version(
+        location_string: str, version: int, id_cols: List[str], chunk_rows: int
+    ) -> Iterator[bytes]:
+        """
+        Reads a version of a feature with a server side cursor, so it is read
+        once and never held in memory as a whole. Each chunk of at most
+        chunk_rows rows is yielded as a parquet file indexed by the id
+        columns, preceded by its size as an 8 byte big endian integer.
+        """
+        engine = create_engine(preloop_datastore_url)
+        schema = location_string.split(".")[0]
+        table_name = location_string.split(".")[1]
+        query = text(
+            f'SELECT * FROM "{schema}"."{table_name}" WHERE __preloop_version = :version'
+        )
+        with engine.connect() as connection:
+            connection = connection.execution_options(
+                stream_results=True, max_row_buffer=chunk_rows
+            )
+            for data in pd.read_sql(
+                query, connection, params={"version": version}, chunksize=chunk_rows
+            ):
+                data.set_index(id_cols, inplace=True)
+                data.drop(columns=["__preloop_version"], inplace=True)
+                part = data.to_parquet()
+                yield struct.pack(">Q", len(part)) + part
+
+    @staticmethod
+    def delete_feature_version(location_string: str, version: int):
+        """
+        Deletes the rows stored as a version of a feature, for a version that
+        could not be recorded after its rows were stored.
+        """
+        engine = create_engine(preloop_datastore_url)
+        schema = location_string.split(".")[0]
+        table_name = location_string.split(".")[1]
+        with engine.begin() as connection:
+            if inspect(connection).has_table(table_name, schema=schema):
+                connection.execute(
+                    text(
+                        f'DELETE FROM "{schema}"."{table_name}" '
+                        f"WHERE __preloop_version = :version"
+                    ),
+                    {"version": version},
+                )
+
+    @staticmethod
+    def abort_feature_upload(location_string: str, upload_id: uuid.UUID):
+        """
+        Removes the staging table of a chunked upload that will not be
+        committed.
+        """
+        engine = create_engine(preloop_datastore_url)
+        schema = location_string.split(".")[0]
+        upload_table = FeatureCore.upload_table_name(upload_id)
+        with engine.begin() as connection:
+            connection.execute(
+                text(f'DROP TABLE IF EXISTS "{schema}"."{upload_table}"')
+            )
+        with Session.begin() as session:
+            session.query(FeatureUploads).filter(
+                FeatureUploads.id == upload_id
+            ).delete()
+
     def signature_search(self, signature: str) -> str:
         """Check if a feature signature exists. If it does, return feature name and id."""
         with Session.begin() as session:
@@ -128,17 +128,31 @@ async def deploy_ml_model(
             ml_model_name,
             inference_script_loc,
         ) = ml_model_core.start_ml_model(
-            request.ml_model_id, request.version, request.require_api_key
-        )
-        background_tasks.add_task(
-            ml_model_core.start_ml_model_async,
             request.ml_model_id,
-            ml_model_name,
-            -1 if request.version == "latest" else request.version,
-            inference_script_loc,
+            request.version,
             request.require_api_key,
-            hosted_ml_model_id,
+            hosting=request.hosting,
+            inference_config=request.inference_config,
         )
+        if request.hosting == HostingMode.SHARED.value:
+            background_tasks.add_task(
+                ml_model_core.start_shared_ml_model_async,
+                request.ml_model_id,
+                ml_model_name,
+                -1 if request.version == "latest" else request.version,
+                hosted_ml_model_id,
+            )
+        else:
+            background_tasks.add_task(
+                ml_model_core.start_ml_model_async,
+                request.ml_model_id,
+                ml_model_name,
+                -1 if request.version == "latest" else request.version,
+                inference_script_loc,
+                request.require_api_key,
+                hosted_ml_model_id,
+                inference_config=request.inference_config,
+            )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
@@ -154,11 +168,12 @@ async def deploy_ml_model(
     status_code=status.HTTP_200_OK,
     response_model=ListHostedMLModelsResult,
 )
-async def list_hosted_ml_models(
+def list_hosted_ml_models(
     request: Optional[ListHostedMLModelsRequest] = None, user=Depends(check)
 ):
     """
-    Lists all the hosted ML models.
+    Lists all the hosted ML models. The route is sync, so reading the metrics
+    of the models runs on the threadpool instead of blocking the event loop.
     """
     user_id = user.id
     org_id = user.org_id
@@ -170,8 +185,10 @@ async def list_hosted_ml_models(
         hosted_ml_models = ml_model_core.list_hosted_ml_models()
         return ListHostedMLModelsResult(hosted_ml_models=hosted_ml_models)
 
-    hosted_ml_models = ml_model_core.list_hosted_ml_models(request.ml_model_id)
-    if hosted_ml_models == []:
+    hosted_ml_models = ml_model_core.list_hosted_ml_models(
+        request.ml_model_id, include_metrics=request.include_metrics
+    )
+    if request.ml_model_id is not None and hosted_ml_models == []:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=f"ML Model {request.ml_model_id} does not exist",
@@ -179,6 +196,26 @@ async def list_hosted_ml_models(
     return ListHostedMLModelsResult(hosted_ml_models=hosted_ml_models)
 
 
+@router.post(
+    APIPaths.ML_MODEL_LIST_SHARED_MODELS,
+    status_code=status.HTTP_200_OK,
+    response_model=ListSharedMLModelsResult,
+)
+async def list_shared_ml_models(
+    request: ListSharedMLModelsRequest, user=Depends(check)
+):
+    """
+    Lists the models served by a shared inference host, for the host itself.
+    """
+    user_id = user.id
+    org_id = user.org_id
+    role = user.role
+
+    ml_model_core = MLModelCore(user_id, org_id, role)
+    shared_ml_models = ml_model_core.list_shared_ml_models(request.shared_host_id)
+    return ListSharedMLModelsResult(shared_ml_models=shared_ml_models)
+
+
 @router.post(
     APIPaths.ML_MODEL_STOP,
     status_code=status.HTTP_200_OK,
@@ -294,6 +331,105 @@ async def list_training_jobs(
     return ListTrainingJobsResult(training_jobs=training_jobs)
 
 
+@router.post(
+    APIPaths.ML_MODEL_SCORE,
+    status_code=status.HTTP_200_OK,
+    response_model=MLModelGenericResponse,
+)
+async def create_scoring_job(
+    request: CreateScoringJobRequest,
+    background_tasks: BackgroundTasks,
+    user=Depends(check),
+):
+    """
+    Scores a version of a feature with an ML model, and stores the predictions
+    as a new version of the output feature.
+    """
+    user_id = user.id
+    org_id = user.org_id
+    role = user.role
+
+    ml_model_core = MLModelCore(user_id, org_id, role)
+    try:
+        scoring_job_id = ml_model_core.create_scoring_job(request)
+        background_tasks.add_task(
+            ml_model_core.create_scoring_job_async, scoring_job_id, request.vectorized
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    return MLModelGenericResponse(
+        message="Success",
+        details={
+            "ml_model_scoring_job_id": scoring_job_id,
+            "status": MLModelScoringJobStatus.SCORING.value,
+        },
+    )
+
+
+@router.post(
+    APIPaths.ML_MODEL_LIST_SCORING_JOBS,
+    status_code=status.HTTP_200_OK,
+    response_model=ListScoringJobsResult,
+)
+async def list_scoring_jobs(
+    request: Optional[ListScoringJobsRequest] = None, user=Depends(check)
+):
+    """
+    Lists the scoring jobs, of one ML model or with one id when given.
+    """
+    user_id = user.id
+    org_id = user.org_id
+    role = user.role
+
+    ml_model_core = MLModelCore(user_id, org_id, role)
+
+    if request is None:
+        scoring_jobs = ml_model_core.list_scoring_jobs()
+        return ListScoringJobsResult(scoring_jobs=scoring_jobs)
+
+    scoring_jobs = ml_model_core.list_scoring_jobs(
+        job_id=request.job_id, ml_model_id=request.ml_model_id
+    )
+    if request.job_id is not None and scoring_jobs == []:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Job {request.job_id} does not exist",
+        )
+    return ListScoringJobsResult(scoring_jobs=scoring_jobs)
+
+
+@router.post(
+    APIPaths.ML_MODEL_STORE_SCORING_PROGRESS,
+    status_code=status.HTTP_201_CREATED,
+    response_model=MLModelGenericResponse,
+)
+async def store_scoring_progress(
+    request: StoreScoringProgressRequest, user=Depends(check)
+):
+    """
+    Stores how many rows a scoring job has scored.
+    """
+    user_id = user.id
+    org_id = user.org_id
+    role = user.role
+
+    ml_model_core = MLModelCore(user_id, org_id, role)
+    try:
+        ml_model_core.store_scoring_progress(
+            request.scoring_job_id,
+            request.rows_scored,
+            request.prediction_type,
+            request.total_rows,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    return MLModelGenericResponse(message="Success", details={})
+
+
 @router.post(
     APIPaths.ML_MODEL_DELETE,
     status_code=status.HTTP_200_OK,
@@ -0,0 +1,238 @@
+"""
+Scores a version of a feature with a version of an ML model. This script is uploaded next
+to the inference script of the model and run by the execution engine, which exports the
+parameters of the scoring job as environment variables.
+
+The feature is read once, as a stream of chunks that the API reads with a server side
+cursor, and the chunks are scored by a pool of worker processes. Each worker imports the
+inference script once, which loads the pickled model, and predicts a whole chunk in one
+call when the predict function is vectorized. The predictions of each chunk are sent as
+one part of a chunked feature upload, which stores them as a new version of the output
+feature when the last part is sent. The rows of each chunk are counted from its parquet
+footer as it arrives, so the total is reported once the stream ends, without counting
+the feature before scoring.
+"""
+import importlib
+import inspect
+import io
+import json
+import os
+import struct
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import boto3
+import pandas as pd
+import pyarrow.parquet as pq
+import requests
+
+API_ENDPOINT = os.environ["PRELOOP_API_ENDPOINT"]
+HEADERS = {
+    "User-Agent": "PreloopClient/1.0",
+    "key-id": os.environ["KEY_ID"],
+    "secret": os.environ["SECRET"],
+}
+
+SCORING_JOB_ID = os.environ["SCORING_JOB_ID"]
+FEATURE_ID = os.environ["FEATURE_ID"]
+FEATURE_VERSION = int(os.environ["FEATURE_VERSION"])
+OUTPUT_FEATURE_ID = os.environ["OUTPUT_FEATURE_ID"]
+ID_COLS = json.loads(os.environ["ID_COLS"])
+OPERATION_TYPE = os.environ["OPERATION_TYPE"]
+INFERENCE_SCRIPT_LOC = os.environ["INFERENCE_SCRIPT_LOC"]
+PREDICT_FUNCTION_NAME = os.environ["PREDICT_FUNCTION_NAME"]
+VECTORIZED = os.environ["VECTORIZED"] == "True"
+
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", os.cpu_count() or 1))
+# rows in each chunk, which bounds the memory a worker needs at once
+SCORING_CHUNK_ROWS = int(os.getenv("SCORING_CHUNK_ROWS", 200000))
+# chunks read ahead of the workers, which bounds the memory of this process
+SCORING_CHUNKS_IN_FLIGHT = int(
+    os.getenv("SCORING_CHUNKS_IN_FLIGHT", 2 * SCORING_WORKERS)
+)
+
+# set in each worker process by load_model
+predict_function = None
+
+
+def download_inference_script() -> None:
+    # pickled objects of the training script are unpickled from the src.inference module
+    bucket, key = INFERENCE_SCRIPT_LOC.removeprefix("s3://").split("/", 1)
+    os.makedirs("src", exist_ok=True)
+    open(os.path.join("src", "__init__.py"), "a").close()
+    boto3.client("s3").download_file(bucket, key, os.path.join("src", "inference.py"))
+
+
+def load_model() -> None:
+    global predict_function
+    inference_module = importlib.import_module("src.inference")
+    predict_function = getattr(inference_module, PREDICT_FUNCTION_NAME)
+
+
+def predict(features: pd.DataFrame) -> list:
+    arguments = [
+        name
+        for name in inspect.signature(predict_function).parameters
+        if name in features.columns
+    ]
+    if not VECTORIZED:
+        return [
+            predict_function(**row) for row in features[arguments].to_dict("records")
+        ]
+    predictions = predict_function(
+        **{name: features[name].tolist() for name in arguments}
+    )
+    if hasattr(predictions, "tolist"):
+        predictions = predictions.tolist()
+    predictions = list(predictions)
+    if len(predictions) != len(features):
+        raise ValueError(
+            f"The predict function returned {len(predictions)} predictions for {len(features)} rows"
+        )
+    return predictions
+
+
+def iter_chunks():
+    """
+    Yields the chunks of the feature as they arrive, each a parquet file preceded by its
+    size as an 8 byte big endian integer.
+    """
+    response = requests.post(
+        url=f"{API_ENDPOINT}/api/feature/stream",
+        headers=HEADERS,
+        json={
+            "feature_id": FEATURE_ID,
+            "version": FEATURE_VERSION,
+            "chunk_rows": SCORING_CHUNK_ROWS,
+        },
+        stream=True,
+    )
+    response.raise_for_status()
+    response.raw.decode_content = True
+    with response:
+        while header := response.raw.read(8):
+            (size,) = struct.unpack(">Q", header)
+            chunk = response.raw.read(size)
+            if len(chunk) != size:
+                raise ConnectionError(
+                    "The feature stream ended in the middle of a chunk"
+                )
+            yield chunk
+
+
+def score_chunk(chunk: bytes):
+    """
+    Returns the predictions of a chunk of the feature as parquet, with the id columns of
+    the feature as the index, along with the number of rows and the type of the predictions.
+    """
+    features = pd.read_parquet(io.BytesIO(chunk))
+    predictions = predict(features.reset_index()) if len(features) else []
+    scored = pd.DataFrame({"prediction": predictions}, index=features.index)
+    buffer = io.BytesIO()
+    scored.to_parquet(buffer)
+    return buffer.getvalue(), len(scored), str(scored["prediction"].dtype)
+
+
+def empty_part() -> bytes:
+    """
+    Returns a part without rows, indexed by the id columns of the feature, which is sent
+    when the feature has no rows so the scoring job still stores an empty version.
+    """
+    scored = pd.DataFrame({"prediction": [], **{col: [] for col in ID_COLS}})
+    buffer = io.BytesIO()
+    scored.set_index(ID_COLS).to_parquet(buffer)
+    return buffer.getvalue()
+
+
+def send_part(path: str, fields: dict, part: bytes) -> None:
+    response = requests.post(
+        url=f"{API_ENDPOINT}{path}",
+        headers=HEADERS,
+        data={"feature_id": OUTPUT_FEATURE_ID, **fields},
+        files={"data": ("part.parquet", part)},
+    )
+    response.raise_for_status()
+
+
+def store_progress(
+    rows_scored: int, prediction_type: str | None, total_rows: int | None
+) -> None:
+    response = requests.post(
+        url=f"{API_ENDPOINT}/api/ml-model/store-scoring-progress",
+        headers=HEADERS,
+        json={
+            "scoring_job_id": SCORING_JOB_ID,
+            "rows_scored": rows_scored,
+            "prediction_type": prediction_type,
+            "total_rows": total_rows,
+        },
+    )
+    response.raise_for_status()
+
+
+def main() -> None:
+    download_inference_script()
+    upload_id = str(uuid.uuid4())
+    rows_scored = 0
+    # counted from the footer of each chunk as it arrives, and known once the stream ends
+    rows_read = 0
+    total_rows = None
+    prediction_type = None
+    part_number = 0
+    # the last part is held back, since it has to be sent with the commit
+    last_part = None
+
+    def collect(future) -> None:
+        nonlocal rows_scored, prediction_type, part_number, last_part
+        part, num_rows, dtype = future.result()
+        rows_scored += num_rows
+        if last_part is not None:
+            send_part(
+                "/api/feature/insert/part",
+                {"upload_id": upload_id, "part_number": part_number},
+                last_part,
+            )
+            part_number += 1
+        last_part = part
+        if num_rows and prediction_type is None:
+            prediction_type = dtype
+        store_progress(rows_scored, prediction_type, total_rows)
+
+    pool = ProcessPoolExecutor(max_workers=SCORING_WORKERS, initializer=load_model)
+    try:
+        running = set()
+        for chunk in iter_chunks():
+            if len(running) >= SCORING_CHUNKS_IN_FLIGHT:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+            rows_read += pq.ParquetFile(io.BytesIO(chunk)).metadata.num_rows
+            running.add(pool.submit(score_chunk, chunk))
+        total_rows = rows_read
+        if not running:
+            store_progress(rows_scored, prediction_type, total_rows)
+        for future in wait(running).done:
+            collect(future)
+        send_part(
+            "/api/feature/insert/commit",
+            {
+                "upload_id": upload_id,
+                "part_number": part_number,
+                "total_rows": rows_scored,
+                "operation_type": OPERATION_TYPE,
+            },
+            last_part if last_part is not None else empty_part(),
+        )
+    except Exception:
+        requests.post(
+            url=f"{API_ENDPOINT}/api/feature/insert/abort",
+            headers=HEADERS,
+            json={"feature_id": OUTPUT_FEATURE_ID, "upload_id": upload_id},
+        )
+        raise
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
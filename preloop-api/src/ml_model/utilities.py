@@ -1,13 +1,18 @@
+import hashlib
 import json
 import logging
+import math
 import os
 import random
+import re
 import string
 import time
 import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import BytesIO
-from typing import List, Optional
+from typing import Dict, List, Optional
 import base64
 import subprocess
 import tempfile
@@ -16,24 +21,33 @@ import boto3
 from kubernetes import client, config
 import nbconvert
 import nbformat
+import requests
 from cryptography.fernet import Fernet
 from fastapi import UploadFile
 from preloop.compiler import ScriptGenerator
 from pylint import lint
-from sqlalchemy import and_, exc, or_
+from sqlalchemy import and_, create_engine, exc, func, or_, text
 
 import src.constants as constants
 from src.api_key_management.utilities import get_internal_api_key
 from src.auth import utilities as auth_utilities
+from src.config import preloop_datastore_url
 from src.database import (
     AllUsers,
+    Feature,
+    FeatureVersions,
     HostedMLModels,
+    InferenceImages,
     MLModel,
+    MLModelScoringJobs,
     MLModelTrainingJobs,
     MLModelVersions,
     OrgLoadBalancers,
     Session,
+    SharedInferenceHosts,
 )
+from src.feature.models import ExecutionType
+from src.feature.utilities import FeatureCore, feature_name_exists
 from src.ml_model.models import *
 
 log = logging.getLogger("uvicorn")
@@ -257,6 +271,7 @@ class MLModelCore:
         client.Configuration.set_default(configuration)
         scheduler_client = boto3.client("scheduler")
         libs_string = self.get_required_libraries(ml_model.libraries)
+        self.prebuild_inference_image(libs_string)
         sfn_client = boto3.client("stepfunctions")
         s3_client = boto3.client("s3")
         ml_model = self.list_ml_models(ml_model_id)[0]
@@ -794,7 +809,12 @@ class MLModelCore:
         #     self.clean_up_aws_resources(aws_resources)
 
     def start_ml_model(
-        self, ml_model_id: uuid.UUID, version: int | str, require_api_key: bool
+        self,
+        ml_model_id: uuid.UUID,
+        version: int | str,
+        require_api_key: bool,
+        hosting: str = HostingMode.DEDICATED.value,
+        inference_config: Optional[InferenceConfig] = None,
     ):
         with Session.begin() as session:
             query_results = (
@@ -822,6 +842,10 @@ class MLModelCore:
                 raise ValueError(
                     f"Version {version} does not exist for model {ml_model_id}"
                 )
+            if hosting == HostingMode.SHARED.value:
+                self.validate_shared_hosting(session, ml_model, inference_config)
+            if inference_config is not None:
+                self.validate_inference_config(ml_model, inference_config)
             latest_hosted_ml_model = (
                 session.query(HostedMLModels)
                 .filter(
@@ -842,6 +866,7 @@ class MLModelCore:
                     status=HostedMLModelStatus.DEPLOYING.value,
                     require_api_key=require_api_key,
                     version=-1,
+                    hosting=hosting,
                 )
                 session.add(hosted_model_object)
                 session.flush()
@@ -878,6 +903,7 @@ class MLModelCore:
                 status=HostedMLModelStatus.DEPLOYING.value,
                 require_api_key=require_api_key,
                 version=version,
+                hosting=hosting,
             )
             session.add(hosted_model_object)
             session.flush()
@@ -898,10 +924,399 @@ class MLModelCore:
         hosted_ml_model_id,
         lb_max_retries=100,
         lb_retry_interval=5,
+        inference_config: Optional[InferenceConfig] = None,
     ):
         ml_model_name = ml_model_name.replace(" ", "-").lower()
-        elb_client = boto3.client("elbv2")
         aws_resources = []
+        load_balancer = self.get_available_load_balancer(
+            hosted_ml_model_id, lb_max_retries, lb_retry_interval
+        )
+        with Session.begin() as session:
+            session.query(OrgLoadBalancers).filter(
+                OrgLoadBalancers.id == load_balancer.id
+            ).update({"num_target_groups": load_balancer.num_target_groups + 1})
+            ml_model = session.query(MLModel).filter(MLModel.id == ml_model_id).first()
+        try:
+            if version == -1:
+                container_env_version = ml_model.latest_deployed_version
+                url_version = "latest"
+            else:
+                container_env_version = version
+                url_version = str(version)
+            with Session.begin() as session:
+                ml_model = (
+                    session.query(MLModel)
+                    .filter(
+                        MLModel.id == ml_model_id,
+                        MLModel.user_id.in_(self.access_resolution_list),
+                    )
+                    .first()
+                )
+            libs_string = self.get_required_libraries(ml_model.libraries)
+            predict_function_name = ml_model.predict_function_name
+            # the API reads the metrics of the model with this key, and verifies
+            # the keys sent to the model with it when require_api_key is set
+            api_key = get_internal_api_key(self.user_id)
+            image = self.get_inference_image(libs_string)
+            inference_service = self.create_inference_service(
+                load_balancer,
+                # the model path and the endpoints under it, e.g. /bulk
+                [
+                    f"/{ml_model_name}/{url_version}",
+                    f"/{ml_model_name}/{url_version}/*",
+                ],
+                [
+                    {"name": "ML_MODEL_NAME", "value": ml_model_name},
+                    {
+                        "name": "INFERENCE_SCRIPT_LOC",
+                        "value": inference_script_loc,
+                    },
+                    {
+                        "name": "PREDICT_FUNCTION_NAME",
+                        "value": predict_function_name,
+                    },
+                    {
+                        "name": "ML_MODEL_INPUTS",
+                        "value": json.dumps(ml_model.ml_model_inputs)
+                        if ml_model.ml_model_inputs is not None
+                        else "",
+                    },
+                    {"name": "ML_MODEL_TRAINING", "value": "True"},
+                    {"name": "VERSION", "value": str(container_env_version)},
+                    {"name": "URL_VERSION", "value": url_version},
+                    {
+                        "name": "REQUIRE_API_KEY",
+                        "value": str(require_api_key) if require_api_key else "",
+                    },
+                    {"name": "PRELOOP_KEY_ID", "value": api_key["key_id"]},
+                    {"name": "PRELOOP_SECRET", "value": api_key["secret"]},
+                    {
+                        "name": "ENV_VARS",
+                        "value": self.decrypt_env_vars(ml_model.env_vars)
+                        if ml_model.env_vars is not None
+                        else "",
+                    },
+                    *self.get_inference_environment(inference_config),
+                ],
+                image,
+                aws_resources,
+            )
+            time.sleep(70)
+            with Session.begin() as session:
+                session.query(HostedMLModels).filter(
+                    HostedMLModels.id == hosted_ml_model_id,
+                ).update(
+                    {
+                        **inference_service,
+                        "load_balancer_id": load_balancer.id,
+                        "status": HostedMLModelStatus.AVAILABLE.value,
+                        "endpoint_url": f"{load_balancer.url}/{ml_model_name}/{url_version}",
+                    }
+                )
+        except Exception as e:
+            log.error(str(e), exc_info=True)
+            with Session.begin() as session:
+                session.query(OrgLoadBalancers).filter(
+                    OrgLoadBalancers.id == load_balancer.id
+                ).update({"num_target_groups": load_balancer.num_target_groups})
+                session.query(HostedMLModels).filter(
+                    HostedMLModels.id == hosted_ml_model_id,
+                ).update(
+                    {
+                        "status": HostedMLModelStatus.FAILED.value,
+                        "reason": "Resources failed to create",
+                    }
+                )
+            self.clean_up_aws_resources(aws_resources)
+
+    def validate_inference_config(
+        self, ml_model: dict, inference_config: InferenceConfig
+    ):
+        # models traced before their package was recorded are let through, the
+        # inference engine skips the models it can't compile or quantize
+        ml_model_package = (ml_model.get("ml_model_details") or {}).get("package")
+        if ml_model_package is None:
+            return
+        if inference_config.compile_model and ml_model_package not in (
+            constants.PackageName.SCIKIT_LEARN.value,
+            constants.PackageName.XGBOOST.value,
+        ):
+            raise ValueError(
+                "Only scikit-learn and xgboost models can be compiled, "
+                f"not {ml_model_package} models"
+            )
+        if (
+            inference_config.quantize_model
+            and ml_model_package != constants.PackageName.PYTORCH.value
+        ):
+            raise ValueError(
+                f"Only PyTorch models can be quantized, not {ml_model_package} models"
+            )
+
+    def validate_shared_hosting(
+        self, session, ml_model: dict, inference_config: Optional[InferenceConfig]
+    ):
+        # every model of a shared host runs in the same environment and with the
+        # same engine settings, so models that need their own get a dedicated host
+        if self.get_required_libraries(ml_model["libraries"]):
+            raise ValueError(
+                "Models that need extra libraries can't use shared hosting"
+            )
+        if ml_model.get("env_vars") is not None:
+            raise ValueError(
+                "Models with environment variables can't use shared hosting"
+            )
+        if inference_config is not None:
+            raise ValueError("Shared hosting doesn't take an inference config")
+        # scripts generated before shared hosting take the version of their objects
+        # from the environment of the engine, which a shared host doesn't set per model
+        inference_script = (
+            boto3.client("s3")
+            .get_object(
+                Bucket=f"preloop-ml-objects-{constants.DEPLOY_ENVIRONMENT}",
+                Key=f"{ml_model['script_dir']}inference.py",
+            )["Body"]
+            .read()
+        )
+        if b"__preloop_version__" not in inference_script:
+            raise ValueError(
+                "The inference script of this model predates shared hosting, "
+                "create the model again to use shared hosting"
+            )
+        shared_host = (
+            session.query(SharedInferenceHosts)
+            .filter(SharedInferenceHosts.org_id == self.org_id)
+            .first()
+        )
+        if (
+            shared_host is not None
+            and shared_host.status == HostedMLModelStatus.STOPPING.value
+        ):
+            raise ValueError(
+                "The shared inference host of the organization is stopping, retry later"
+            )
+
+    def start_shared_ml_model_async(
+        self,
+        ml_model_id,
+        ml_model_name,
+        version,
+        hosted_ml_model_id,
+        lb_max_retries=100,
+        lb_retry_interval=5,
+    ):
+        """
+        Serves a hosted ML model from the shared inference host of the organization,
+        which is created with the first shared model. Nothing is created for the model
+        itself, the host loads it on its first request.
+        """
+        ml_model_name = ml_model_name.replace(" ", "-").lower()
+        url_version = "latest" if version == -1 else str(version)
+        try:
+            shared_host_id = self.get_shared_inference_host(
+                hosted_ml_model_id, lb_max_retries, lb_retry_interval
+            )
+            with Session.begin() as session:
+                # locked, so the host isn't stopped for being idle while the model is added
+                shared_host = (
+                    session.query(SharedInferenceHosts)
+                    .filter(
+                        SharedInferenceHosts.id == shared_host_id,
+                        SharedInferenceHosts.status
+                        == HostedMLModelStatus.AVAILABLE.value,
+                    )
+                    .with_for_update()
+                    .first()
+                )
+                if shared_host is None:
+                    raise Exception("Shared inference host is not available")
+                load_balancer = (
+                    session.query(OrgLoadBalancers)
+                    .filter(OrgLoadBalancers.id == shared_host.load_balancer_id)
+                    .first()
+                )
+                session.query(HostedMLModels).filter(
+                    HostedMLModels.id == hosted_ml_model_id,
+                ).update(
+                    {
+                        "shared_host_id": shared_host.id,
+                        "load_balancer_id": load_balancer.id,
+                        "status": HostedMLModelStatus.AVAILABLE.value,
+                        "endpoint_url": f"{load_balancer.url}/shared/{ml_model_name}/{url_version}",
+                    }
+                )
+        except Exception as e:
+            log.error(str(e), exc_info=True)
+            with Session.begin() as session:
+                # unless a more precise reason was already given
+                session.query(HostedMLModels).filter(
+                    HostedMLModels.id == hosted_ml_model_id,
+                    HostedMLModels.status == HostedMLModelStatus.DEPLOYING.value,
+                ).update(
+                    {
+                        "status": HostedMLModelStatus.FAILED.value,
+                        "reason": "Shared inference host failed to start",
+                    }
+                )
+
+    def get_shared_inference_host(
+        self, hosted_ml_model_id, lb_max_retries=100, lb_retry_interval=5
+    ):
+        """
+        Returns the id of the shared inference host of the organization once it is
+        available, creating the host if the organization has none. Organizations have
+        at most one host, so deploys that find it being created wait for it.
+        """
+        try:
+            with Session.begin() as session:
+                shared_host = (
+                    session.query(SharedInferenceHosts)
+                    .filter(SharedInferenceHosts.org_id == self.org_id)
+                    .first()
+                )
+                created = shared_host is None
+                if created:
+                    shared_host = SharedInferenceHosts(
+                        org_id=self.org_id,
+                        user_id=self.user_id,
+                        status=HostedMLModelStatus.DEPLOYING.value,
+                    )
+                    session.add(shared_host)
+                    session.flush()
+                shared_host_id = shared_host.id
+        except exc.IntegrityError:
+            # another deploy created the host first
+            with Session.begin() as session:
+                shared_host_id = (
+                    session.query(SharedInferenceHosts.id)
+                    .filter(SharedInferenceHosts.org_id == self.org_id)
+                    .scalar()
+                )
+            created = False
+
+        if not created:
+            for _ in range(lb_max_retries):
+                with Session.begin() as session:
+                    shared_host = (
+                        session.query(SharedInferenceHosts)
+                        .filter(SharedInferenceHosts.id == shared_host_id)
+                        .first()
+                    )
+                if shared_host is None or shared_host.status in (
+                    HostedMLModelStatus.FAILED.value,
+                    HostedMLModelStatus.STOPPING.value,
+                ):
+                    raise Exception("Shared inference host is not available")
+                if shared_host.status == HostedMLModelStatus.AVAILABLE.value:
+                    return shared_host_id
+                time.sleep(lb_retry_interval)
+            raise Exception("Shared inference host creation timed out")
+
+        log.info(f"Creating shared inference host {shared_host_id}")
+        aws_resources = []
+        load_balancer = None
+        try:
+            load_balancer = self.get_available_load_balancer(
+                hosted_ml_model_id, lb_max_retries, lb_retry_interval
+            )
+            with Session.begin() as session:
+                session.query(OrgLoadBalancers).filter(
+                    OrgLoadBalancers.id == load_balancer.id
+                ).update({"num_target_groups": OrgLoadBalancers.num_target_groups + 1})
+            # the host lists its models and verifies API keys with the key of its creator
+            api_key = get_internal_api_key(self.user_id)
+            inference_service = self.create_inference_service(
+                load_balancer,
+                ["/shared/*"],
+                [
+                    {"name": "HOSTING_MODE", "value": HostingMode.SHARED.value},
+                    {"name": "SHARED_HOST_ID", "value": str(shared_host_id)},
+                    {"name": "ML_MODEL_TRAINING", "value": "True"},
+                    {"name": "PRELOOP_KEY_ID", "value": api_key["key_id"]},
+                    {"name": "PRELOOP_SECRET", "value": api_key["secret"]},
+                ],
+                # shared models can't use extra libraries
+                self.get_inference_image(""),
+                aws_resources,
+            )
+            time.sleep(70)
+            with Session.begin() as session:
+                session.query(SharedInferenceHosts).filter(
+                    SharedInferenceHosts.id == shared_host_id
+                ).update(
+                    {
+                        **inference_service,
+                        "load_balancer_id": load_balancer.id,
+                        "status": HostedMLModelStatus.AVAILABLE.value,
+                    }
+                )
+        except Exception:
+            with Session.begin() as session:
+                if load_balancer is not None:
+                    session.query(OrgLoadBalancers).filter(
+                        OrgLoadBalancers.id == load_balancer.id
+                    ).update(
+                        {"num_target_groups": OrgLoadBalancers.num_target_groups - 1}
+                    )
+                # deleted rather than failed, so the next shared deploy tries again
+                session.query(SharedInferenceHosts).filter(
+                    SharedInferenceHosts.id == shared_host_id
+                ).delete()
+            self.clean_up_aws_resources(aws_resources)
+            raise
+        return shared_host_id
+
+    def list_shared_ml_models(self, shared_host_id: uuid.UUID):
+        """
+        Lists the models a shared inference host of the organization serves, with what
+        the host needs to load them.
+        """
+        with Session.begin() as session:
+            query_results = (
+                session.query(HostedMLModels, MLModel)
+                .join(MLModel, HostedMLModels.ml_model_id == MLModel.id)
+                .join(
+                    SharedInferenceHosts,
+                    HostedMLModels.shared_host_id == SharedInferenceHosts.id,
+                )
+                .filter(
+                    SharedInferenceHosts.id == shared_host_id,
+                    SharedInferenceHosts.org_id == self.org_id,
+                    HostedMLModels.status == HostedMLModelStatus.AVAILABLE.value,
+                )
+                .all()
+            )
+            shared_ml_models = []
+            for hosted_ml_model, ml_model in query_results:
+                ml_model_name = ml_model.ml_model_name.replace(" ", "-").lower()
+                if hosted_ml_model.version == -1:
+                    version = ml_model.latest_deployed_version
+                    url_version = "latest"
+                else:
+                    version = hosted_ml_model.version
+                    url_version = str(version)
+                shared_ml_models.append(
+                    {
+                        "id": hosted_ml_model.id,
+                        "path": f"/shared/{ml_model_name}/{url_version}",
+                        "inference_script_loc": f"s3://preloop-ml-objects-{constants.DEPLOY_ENVIRONMENT}/{ml_model.script_dir}inference.py",
+                        "predict_function_name": ml_model.predict_function_name,
+                        "version": version,
+                        "ml_model_inputs": ml_model.ml_model_inputs,
+                        "require_api_key": hosted_ml_model.require_api_key,
+                    }
+                )
+        return shared_ml_models
+
+    def get_available_load_balancer(
+        self, hosted_ml_model_id, lb_max_retries=100, lb_retry_interval=5
+    ):
+        """
+        Returns a load balancer of the organization with room for another target group,
+        creating one if there is none, and waits for it to be active. The hosted ML model
+        is marked as failed when no load balancer can be found.
+        """
+        elb_client = boto3.client("elbv2")
         with Session.begin() as session:
             load_balancer = (
                 session.query(OrgLoadBalancers)
@@ -992,269 +1407,203 @@ class MLModelCore:
                             }
                         )
                     raise Exception("Load balancer creation failed")
-        with Session.begin() as session:
-            session.query(OrgLoadBalancers).filter(
-                OrgLoadBalancers.id == load_balancer.id
-            ).update({"num_target_groups": load_balancer.num_target_groups + 1})
-            ml_model = session.query(MLModel).filter(MLModel.id == ml_model_id).first()
-        try:
-            if version == -1:
-                container_env_version = ml_model.latest_deployed_version
-                url_version = "latest"
-            else:
-                container_env_version = version
-                url_version = str(version)
-            # Create target group for service
-            log.info("Creating target group")
-            target_group_name = "".join(
-                random.choice(string.ascii_lowercase) for _ in range(10)
-            )
-            target_group_response = elb_client.create_target_group(
-                Name=target_group_name,
-                Protocol="HTTP",
-                Port=80,
-                VpcId=constants.VPC_ID,
-                HealthCheckPath="/docs",
-                Matcher={"HttpCode": "200"},
-                TargetType="ip",
-            )
-            aws_resources.append(
+        return load_balancer
+
+    def create_inference_service(
+        self,
+        load_balancer,
+        path_patterns: List[str],
+        environment: List[dict],
+        image: str,
+        aws_resources,
+    ):
+        """
+        Creates an inference engine service behind the load balancer, serving the given
+        paths, with the given environment and image. The resources created are added to aws_resources
+        as they are created, so they can be cleaned up on failure, and the names of the
+        ones to keep track of are returned.
+        """
+        elb_client = boto3.client("elbv2")
+        # Create target group for service
+        log.info("Creating target group")
+        target_group_name = "".join(
+            random.choice(string.ascii_lowercase) for _ in range(10)
+        )
+        target_group_response = elb_client.create_target_group(
+            Name=target_group_name,
+            Protocol="HTTP",
+            Port=80,
+            VpcId=constants.VPC_ID,
+            HealthCheckPath="/docs",
+            Matcher={"HttpCode": "200"},
+            TargetType="ip",
+        )
+        aws_resources.append(
+            {
+                "resource_type": "target_group",
+                "resource_arn": target_group_response["TargetGroups"][0][
+                    "TargetGroupArn"
+                ],
+                "priority": 2,
+            }
+        )
+
+        # Create listener rule for target group
+        log.info("Creating listener rule")
+        listener_rule_response = elb_client.create_rule(
+            ListenerArn=load_balancer.listener_arn,
+            Conditions=[{"Field": "path-pattern", "Values": path_patterns}],
+            Priority=self.find_smallest_priority_available_in_alb(
+                load_balancer.listener_arn
+            ),
+            Actions=[
                 {
-                    "resource_type": "target_group",
-                    "resource_arn": target_group_response["TargetGroups"][0][
+                    "Type": "forward",
+                    "TargetGroupArn": target_group_response["TargetGroups"][0][
                         "TargetGroupArn"
                     ],
-                    "priority": 2,
                 }
-            )
+            ],
+        )
+        aws_resources.append(
+            {
+                "resource_type": "listener_rule",
+                "resource_arn": listener_rule_response["Rules"][0]["RuleArn"],
+                "priority": 1,
+            }
+        )
 
-            # Create listener rule for target group
-            log.info("Creating listener rule")
-            listener_rule_response = elb_client.create_rule(
-                ListenerArn=load_balancer.listener_arn,
-                Conditions=[
-                    {
-                        "Field": "path-pattern",
-                        "Values": [f"/{ml_model_name}/{url_version}"],
-                    }
-                ],
-                Priority=self.find_smallest_priority_available_in_alb(load_balancer.listener_arn),
-                Actions=[
-                    {
-                        "Type": "forward",
-                        "TargetGroupArn": target_group_response["TargetGroups"][0][
-                            "TargetGroupArn"
-                        ],
-                    }
-                ],
-            )
-            aws_resources.append(
-                {
-                    "resource_type": "listener_rule",
-                    "resource_arn": listener_rule_response["Rules"][0]["RuleArn"],
-                    "priority": 1,
-                }
-            )
+        # Create security group for ecs service
+        log.info("Creating security group")
+        ec2_client = boto3.client("ec2")
+        security_group_name = "".join(
+            random.choice(string.ascii_lowercase) for i in range(10)
+        )
+        security_group_response = ec2_client.create_security_group(
+            Description="Security group for ECS target to allow traffic from ALB",
+            GroupName=security_group_name,
+            VpcId=constants.VPC_ID,
+        )
+        aws_resources.append(
+            {
+                "resource_type": "security_group",
+                "group_id": security_group_response["GroupId"],
+                "priority": 3,
+            }
+        )
 
-            # Create security group for ecs service
-            log.info("Creating security group")
-            ec2_client = boto3.client("ec2")
-            security_group_name = "".join(
-                random.choice(string.ascii_lowercase) for i in range(10)
-            )
-            security_group_response = ec2_client.create_security_group(
-                Description="Security group for ECS target to allow traffic from ALB",
-                GroupName=security_group_name,
-                VpcId=constants.VPC_ID,
-            )
-            aws_resources.append(
+        # Add ingress rule to security group to allow traffic from ALB to ECS
+        security_group_ingress_response = ec2_client.authorize_security_group_ingress(
+            GroupId=security_group_response["GroupId"],
+            IpPermissions=[
                 {
-                    "resource_type": "security_group",
-                    "group_id": security_group_response["GroupId"],
-                    "priority": 3,
+                    "IpProtocol": "tcp",
+                    "FromPort": 80,
+                    "ToPort": 80,
+                    "UserIdGroupPairs": [{"GroupId": load_balancer.security_group_id}],
                 }
-            )
+            ],
+        )
 
-            # Add ingress rule to security group to allow traffic from ALB to ECS
-            security_group_ingress_response = (
-                ec2_client.authorize_security_group_ingress(
-                    GroupId=security_group_response["GroupId"],
-                    IpPermissions=[
+        # Register a fargate task definition
+        log.info("Registering fargate task definition")
+        ecs_client = boto3.client("ecs")
+        task_definition_name = "".join(
+            random.choice(string.ascii_lowercase) for i in range(20)
+        )
+        ecs_service_name = "".join(
+            random.choice(string.ascii_lowercase) for i in range(20)
+        )
+        task_definition_response = ecs_client.register_task_definition(
+            family=task_definition_name,
+            taskRoleArn=constants.MODEL_INFERENCE_ENGINE_FARGATE_TASK_ROLE_ARN,
+            executionRoleArn=constants.MODEL_INFERENCE_ENGINE_FARGATE_EXECUTION_ROLE_ARN,
+            networkMode="awsvpc",
+            containerDefinitions=[
+                {
+                    "name": "ModelInferenceEngineContainer",
+                    "image": image,
+                    "essential": True,
+                    "portMappings": [{"containerPort": 80}],
+                    "logConfiguration": {
+                        "logDriver": "awslogs",
+                        "options": {
+                            "awslogs-group": "/ecs/model-inference-engine",
+                            "awslogs-region": constants.AWS_DEFAULT_REGION,
+                            "awslogs-stream-prefix": "ModelInferenceEngine",
+                        },
+                    },
+                    "environment": [
+                        *environment,
+                        {"name": "ECS_SERVICE_NAME", "value": ecs_service_name},
                         {
-                            "IpProtocol": "tcp",
-                            "FromPort": 80,
-                            "ToPort": 80,
-                            "UserIdGroupPairs": [
-                                {"GroupId": load_balancer.security_group_id}
-                            ],
-                        }
-                    ],
-                )
-            )
-            with Session.begin() as session:
-                ml_model = (
-                    session.query(MLModel)
-                    .filter(
-                        MLModel.id == ml_model_id,
-                        MLModel.user_id.in_(self.access_resolution_list),
-                    )
-                    .first()
-                )
-            libs_string = self.get_required_libraries(ml_model.libraries)
-            predict_function_name = ml_model.predict_function_name
-            # Register a fargate task definition
-            log.info("Registering fargate task definition")
-            ecs_client = boto3.client("ecs")
-            task_definition_name = "".join(
-                random.choice(string.ascii_lowercase) for i in range(20)
-            )
-            ecs_service_name = "".join(
-                random.choice(string.ascii_lowercase) for i in range(20)
-            )
-            key_id = ""
-            secret = ""
-            if require_api_key:
-                api_key = get_internal_api_key(self.user_id)
-                key_id = api_key["key_id"]
-                secret = api_key["secret"]
-            task_definition_response = ecs_client.register_task_definition(
-                family=task_definition_name,
-                taskRoleArn=constants.MODEL_INFERENCE_ENGINE_FARGATE_TASK_ROLE_ARN,
-                executionRoleArn=constants.MODEL_INFERENCE_ENGINE_FARGATE_EXECUTION_ROLE_ARN,
-                networkMode="awsvpc",
-                containerDefinitions=[
-                    {
-                        "name": "ModelInferenceEngineContainer",
-                        "image": f"{constants.AWS_ACCOUNT_ID}.dkr.ecr.{constants.AWS_DEFAULT_REGION}.amazonaws.com/preloop-model-inference-engine:latest",
-                        "essential": True,
-                        "portMappings": [{"containerPort": 80}],
-                        "logConfiguration": {
-                            "logDriver": "awslogs",
-                            "options": {
-                                "awslogs-group": "/ecs/model-inference-engine",
-                                "awslogs-region": constants.AWS_DEFAULT_REGION,
-                                "awslogs-stream-prefix": "ModelInferenceEngine",
-                            },
+                            "name": "PRELOOP_API_ENDPOINT",
+                            "value": constants.PRELOOP_API_ENDPOINT,
                         },
-                        "environment": [
-                            {"name": "ML_MODEL_NAME", "value": ml_model_name},
-                            {
-                                "name": "INFERENCE_SCRIPT_LOC",
-                                "value": inference_script_loc,
-                            },
-                            {
-                                "name": "PREDICT_FUNCTION_NAME",
-                                "value": predict_function_name,
-                            },
-                            {"name": "ML_MODEL_TRAINING", "value": "True"},
-                            {"name": "VERSION", "value": str(container_env_version)},
-                            {"name": "URL_VERSION", "value": url_version},
-                            {
-                                "name": "REQUIRE_API_KEY",
-                                "value": str(require_api_key)
-                                if require_api_key
-                                else "",
-                            },
-                            {"name": "PRELOOP_KEY_ID", "value": key_id},
-                            {"name": "PRELOOP_SECRET", "value": secret},
-                            {"name": "ECS_SERVICE_NAME", "value": ecs_service_name},
-                            {"name": "LIBRARIES", "value": libs_string},
-                            {
-                                "name": "ENV_VARS",
-                                "value": self.decrypt_env_vars(ml_model.env_vars)
-                                if ml_model.env_vars is not None
-                                else "",
-                            },
-                        ],
-                    }
-                ],
-                cpu="2 vCPU",
-                memory="16 GB",
-            )
-            aws_resources.append(
-                {
-                    "resource_type": "ecs_task_definition",
-                    "task_definition_arn": task_definition_response["taskDefinition"][
-                        "taskDefinitionArn"
                     ],
-                    "priority": 1,
                 }
-            )
-
-            # create ECS service
-            log.info("Creating ECS service")
-            ecs_client = boto3.client("ecs")
-            response = ecs_client.create_service(
-                cluster="ModelInferenceEngineCluster",
-                serviceName=ecs_service_name,
-                taskDefinition=task_definition_name,
-                loadBalancers=[
-                    {
-                        "targetGroupArn": target_group_response["TargetGroups"][0][
-                            "TargetGroupArn"
-                        ],
-                        "containerName": "ModelInferenceEngineContainer",
-                        "containerPort": 80,
-                    }
+            ],
+            cpu="2 vCPU",
+            memory="16 GB",
+        )
+        aws_resources.append(
+            {
+                "resource_type": "ecs_task_definition",
+                "task_definition_arn": task_definition_response["taskDefinition"][
+                    "taskDefinitionArn"
                 ],
-                desiredCount=2,
-                launchType="FARGATE",
-                networkConfiguration={
-                    "awsvpcConfiguration": {
-                        "subnets": [
-                            constants.COMPUTE_SUBNET_1,
-                            constants.COMPUTE_SUBNET_2,
-                        ],
-                        "securityGroups": [security_group_response["GroupId"]],
-                    }
-                },
-            )
-            aws_resources.append(
+                "priority": 1,
+            }
+        )
+
+        # create ECS service
+        log.info("Creating ECS service")
+        ecs_client = boto3.client("ecs")
+        response = ecs_client.create_service(
+            cluster="ModelInferenceEngineCluster",
+            serviceName=ecs_service_name,
+            taskDefinition=task_definition_name,
+            loadBalancers=[
                 {
-                    "resource_type": "ecs_service",
-                    "cluster_name": "ModelInferenceEngineCluster",
-                    "service_name": ecs_service_name,
-                    "priority": 2,
+                    "targetGroupArn": target_group_response["TargetGroups"][0][
+                        "TargetGroupArn"
+                    ],
+                    "containerName": "ModelInferenceEngineContainer",
+                    "containerPort": 80,
                 }
-            )
-            time.sleep(70)
-            with Session.begin() as session:
-                session.query(HostedMLModels).filter(
-                        HostedMLModels.id == hosted_ml_model_id,
-                    ).update(
-                    {
-                        "ecs_cluster_name": "ModelInferenceEngineCluster",
-                        "ecs_service_name": ecs_service_name,
-                        "target_group_arn": target_group_response["TargetGroups"][0][
-                            "TargetGroupArn"
-                        ],
-                        "listener_rule_arn": listener_rule_response["Rules"][0][
-                            "RuleArn"
-                        ],
-                        "task_security_group_id": security_group_response["GroupId"],
-                        "task_definition_arn": task_definition_response[
-                            "taskDefinition"
-                        ]["taskDefinitionArn"],
-                        "load_balancer_id": load_balancer.id,
-                        "status": HostedMLModelStatus.AVAILABLE.value,
-                        "endpoint_url": f"{load_balancer.url}/{ml_model_name}/{url_version}",
-                    }
-                )
-        except Exception as e:
-            log.error(str(e), exc_info=True)
-            with Session.begin() as session:
-                session.query(OrgLoadBalancers).filter(
-                    OrgLoadBalancers.id == load_balancer.id
-                ).update({"num_target_groups": load_balancer.num_target_groups})
-                session.query(HostedMLModels).filter(
-                        HostedMLModels.id == hosted_ml_model_id,
-                    ).update(
-                    {
-                        "status": HostedMLModelStatus.FAILED.value,
-                        "reason": "Resources failed to create",
-                    }
-                )
-            self.clean_up_aws_resources(aws_resources)
+            ],
+            desiredCount=2,
+            launchType="FARGATE",
+            networkConfiguration={
+                "awsvpcConfiguration": {
+                    "subnets": [
+                        constants.COMPUTE_SUBNET_1,
+                        constants.COMPUTE_SUBNET_2,
+                    ],
+                    "securityGroups": [security_group_response["GroupId"]],
+                }
+            },
+        )
+        aws_resources.append(
+            {
+                "resource_type": "ecs_service",
+                "cluster_name": "ModelInferenceEngineCluster",
+                "service_name": ecs_service_name,
+                "priority": 2,
+            }
+        )
+        return {
+            "ecs_cluster_name": "ModelInferenceEngineCluster",
+            "ecs_service_name": ecs_service_name,
+            "target_group_arn": target_group_response["TargetGroups"][0][
+                "TargetGroupArn"
+            ],
+            "listener_rule_arn": listener_rule_response["Rules"][0]["RuleArn"],
+            "task_security_group_id": security_group_response["GroupId"],
+            "task_definition_arn": task_definition_response["taskDefinition"][
+                "taskDefinitionArn"
+            ],
+        }
 
     def retrain_ml_model(self, ml_model_id: uuid.UUID):
         with Session.begin() as session:
@@ -1298,6 +1647,9 @@ class MLModelCore:
     def retrain_ml_model_async(self, ml_model_id, ml_model_training_job_id):
         sfn_client = boto3.client("stepfunctions")
         ml_model = self.list_ml_models(ml_model_id)[0]
+        self.prebuild_inference_image(
+            self.get_required_libraries(ml_model["libraries"])
+        )
         task_metadata_retrieved = False
         log.info("Starting the training script execution")
         api_key = get_internal_api_key(self.user_id)
@@ -1545,6 +1897,7 @@ class MLModelCore:
     def list_hosted_ml_models(
         self,
         ml_model_id: Optional[uuid.UUID] = None,
+        include_metrics: bool = False,
     ):
         with Session.begin() as session:
             if ml_model_id is None:
@@ -1584,89 +1937,592 @@ class MLModelCore:
                         HostedMLModels.user_id.in_(self.access_resolution_list),
                         HostedMLModels.ml_model_id == ml_model_id,
                     )
-                    .all()
-                )
-
-            hosted_ml_models = []
-            if not query_results:
-                return []
-
-            for row in query_results:
-                hosted_ml_models.append(
+                    .all()
+                )
+
+            hosted_ml_models = []
+            if not query_results:
+                return []
+
+            for row in query_results:
+                hosted_ml_models.append(
+                    {
+                        "id": row[0].id,
+                        "ml_model_id": row[0].ml_model_id,
+                        "ml_model_name": row[3],
+                        "version": row[4] if row[0].version == -1 else row[0].version,
+                        "status": row[0].status,
+                        "endpoint_url": row[0].endpoint_url,
+                        "creation_date": row[0].creation_date,
+                        "reason": row[0].reason,
+                        "require_api_key": row[0].require_api_key,
+                        "owner": row[1]
+                        if row[2] == "root"
+                        else row[1].split(constants.ORG_ACCOUNT_SPLIT_TOKEN)[1],
+                        "is_latest_version": row[0].version == -1,
+                        "hosting": row[0].hosting,
+                    }
+                )
+        if include_metrics:
+            self.add_hosted_ml_model_metrics(hosted_ml_models)
+        return hosted_ml_models
+
+    def add_hosted_ml_model_metrics(self, hosted_ml_models: List[dict]):
+        # endpoints are read in parallel, models that don't answer are listed without metrics
+        available_ml_models = [
+            hosted_ml_model
+            for hosted_ml_model in hosted_ml_models
+            if hosted_ml_model["status"] == HostedMLModelStatus.AVAILABLE.value
+            and hosted_ml_model["endpoint_url"]
+        ]
+        if not available_ml_models:
+            return
+        # engines only serve their metrics with the internal key they were started
+        # with, that of the user who deployed the model or created its shared host
+        with Session.begin() as session:
+            key_users = dict(
+                session.query(
+                    HostedMLModels.id,
+                    func.coalesce(SharedInferenceHosts.user_id, HostedMLModels.user_id),
+                )
+                .outerjoin(
+                    SharedInferenceHosts,
+                    HostedMLModels.shared_host_id == SharedInferenceHosts.id,
+                )
+                .filter(
+                    HostedMLModels.id.in_(
+                        [
+                            hosted_ml_model["id"]
+                            for hosted_ml_model in available_ml_models
+                        ]
+                    )
+                )
+                .all()
+            )
+        api_keys = {
+            user_id: get_internal_api_key(user_id)
+            for user_id in set(key_users.values())
+        }
+        with ThreadPoolExecutor(max_workers=min(len(available_ml_models), 16)) as pool:
+            all_metrics = pool.map(
+                self.get_hosted_ml_model_metrics,
+                [
+                    hosted_ml_model["endpoint_url"]
+                    for hosted_ml_model in available_ml_models
+                ],
+                [
+                    api_keys[key_users[hosted_ml_model["id"]]]
+                    for hosted_ml_model in available_ml_models
+                ],
+            )
+            for hosted_ml_model, metrics in zip(available_ml_models, all_metrics):
+                hosted_ml_model["metrics"] = metrics
+
+    def get_hosted_ml_model_metrics(self, endpoint_url: str, api_key: dict):
+        try:
+            response = requests.get(
+                f"{endpoint_url}/metrics",
+                headers={"key-id": api_key["key_id"], "secret": api_key["secret"]},
+                timeout=constants.HOSTED_ML_MODEL_METRICS_TIMEOUT,
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            log.warning(f"Unable to read the metrics of {endpoint_url}: {e}")
+            return None
+        return self.summarize_inference_metrics(response.text)
+
+    def summarize_inference_metrics(self, metrics_text: str):
+        """
+        Summarizes the Prometheus metrics of an inference engine. Every worker of the
+        engine reports its own samples, which are added up.
+        """
+        requests_served = 0
+        errors = 0
+        latency_buckets: Dict[float, float] = defaultdict(float)
+        totals: Dict[str, float] = defaultdict(float)
+        for line in metrics_text.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            name_and_labels, _, value = line.rpartition(" ")
+            name, _, labels = name_and_labels.partition("{")
+            labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+            route = labels.get("route")
+            if name == "preloop_http_requests_total" and route in ("predict", "bulk"):
+                requests_served += float(value)
+                if int(labels["status"]) >= 400:
+                    errors += float(value)
+            elif (
+                name == "preloop_http_request_duration_seconds_bucket"
+                and route == "predict"
+            ):
+                latency_buckets[float(labels["le"])] += float(value)
+            elif name.endswith(("_sum", "_count")) and route in (None, "predict"):
+                totals[name] += float(value)
+
+        def mean(metric_name: str, scale: float = 1000):
+            count = totals[f"{metric_name}_count"]
+            return totals[f"{metric_name}_sum"] / count * scale if count else None
+
+        def percentile(quantile: float):
+            # linear interpolation within the bucket of the quantile, as Prometheus does
+            bounds = sorted(latency_buckets)
+            if not bounds or not latency_buckets[bounds[-1]]:
+                return None
+            rank = quantile * latency_buckets[bounds[-1]]
+            lower_bound, lower_count = 0.0, 0.0
+            for bound in bounds:
+                count = latency_buckets[bound]
+                if count >= rank:
+                    if math.isinf(bound):
+                        return lower_bound * 1000
+                    fraction = (rank - lower_count) / (count - lower_count)
+                    return (lower_bound + (bound - lower_bound) * fraction) * 1000
+                lower_bound, lower_count = bound, count
+            return None
+
+        return {
+            "requests": int(requests_served),
+            "errors": int(errors),
+            "error_rate": errors / requests_served if requests_served else 0.0,
+            "mean_latency_ms": mean("preloop_http_request_duration_seconds"),
+            "p50_latency_ms": percentile(0.5),
+            "p95_latency_ms": percentile(0.95),
+            "p99_latency_ms": percentile(0.99),
+            "mean_predict_ms": mean("preloop_prediction_run_seconds"),
+            "mean_queue_wait_ms": mean("preloop_prediction_queue_wait_seconds"),
+            "mean_request_bytes": mean("preloop_http_request_size_bytes", scale=1),
+        }
+
+    def list_training_jobs(
+        self,
+        job_id: Optional[uuid.UUID] = None,
+        ml_model_id: Optional[uuid.UUID] = None,
+    ):
+        with Session.begin() as session:
+            if job_id is None and ml_model_id is None:
+                query_results = (
+                    session.query(MLModelTrainingJobs, AllUsers.email, AllUsers.role)
+                    .join(AllUsers)
+                    .filter(
+                        MLModelTrainingJobs.user_id.in_(self.access_resolution_list)
+                    )
+                    .all()
+                )
+            else:
+                if job_id is not None and ml_model_id is None:
+                    query_results = (
+                        session.query(
+                            MLModelTrainingJobs, AllUsers.email, AllUsers.role
+                        )
+                        .join(AllUsers)
+                        .filter(
+                            MLModelTrainingJobs.user_id.in_(
+                                self.access_resolution_list
+                            ),
+                            MLModelTrainingJobs.id == job_id,
+                        )
+                        .all()
+                    )
+
+                elif ml_model_id is not None and job_id is None:
+                    query_results = (
+                        session.query(
+                            MLModelTrainingJobs, AllUsers.email, AllUsers.role
+                        )
+                        .join(AllUsers)
+                        .filter(
+                            MLModelTrainingJobs.user_id.in_(
+                                self.access_resolution_list
+                            ),
+                            MLModelTrainingJobs.ml_model_id == ml_model_id,
+                        )
+                        .all()
+                    )
+
+                else:
+                    return []
+
+            if not query_results:
+                return []
+
+            training_jobs = []
+
+            for row in query_results:
+                training_jobs.append(
+                    {
+                        **{
+                            key: row[0].__dict__[key]
+                            for key in row[0].__dict__
+                            if not key.startswith("_sa_")
+                        },
+                        "owner": row[1]
+                        if row[2] == "root"
+                        else row[1].split(constants.ORG_ACCOUNT_SPLIT_TOKEN)[1],
+                    }
+                )
+
+            return training_jobs
+
+    def create_scoring_job(self, request: CreateScoringJobRequest):
+        if (request.output_feature_name is None) == (request.output_feature_id is None):
+            raise ValueError(
+                "Exactly one of output_feature_name or output_feature_id must be specified"
+            )
+        feature_core = FeatureCore(self.user_id, self.org_id, self.role)
+        feature_details = feature_core.return_feature_details(
+            feature_id=str(request.feature_id)
+        )
+        if not feature_details:
+            raise ValueError(f"Feature {request.feature_id} does not exist")
+        feature_details = feature_details[0]
+        feature_version = request.feature_version or feature_details["latest_version"]
+        if not feature_core.check_valid_get_feature_request(
+            feature_id=str(request.feature_id), version=feature_version
+        ):
+            raise ValueError(
+                f"Version {feature_version} does not exist for feature {request.feature_id}"
+            )
+        if (
+            request.output_feature_name is not None
+            and feature_name_exists(self.org_id, request.output_feature_name)
+        ):
+            raise ValueError(f"Feature {request.output_feature_name} already exists")
+        with Session.begin() as session:
+            ml_model = (
+                session.query(MLModel)
+                .filter(
+                    MLModel.id == request.ml_model_id,
+                    MLModel.user_id.in_(self.access_resolution_list),
+                )
+                .first()
+            )
+            if ml_model is None:
+                raise ValueError(f"Ml model {request.ml_model_id} does not exist")
+            if ml_model.latest_version is None:
+                raise ValueError(
+                    f"Ml model {request.ml_model_id} has not been trained yet"
+                )
+            ml_model_version = (
+                ml_model.latest_version
+                if request.version == "latest"
+                else request.version
+            )
+            if ml_model_version > ml_model.latest_version:
+                raise ValueError(
+                    f"Version {ml_model_version} does not exist for model {request.ml_model_id}"
+                )
+            if request.output_feature_id is not None:
+                output_feature = (
+                    session.query(Feature)
+                    .filter(
+                        Feature.id == request.output_feature_id,
+                        Feature.user_id.in_(self.access_resolution_list),
+                    )
+                    .first()
+                )
+                if output_feature is None:
+                    raise ValueError(
+                        f"Feature {request.output_feature_id} does not exist"
+                    )
+                if (
+                    output_feature.creation_method
+                    != constants.SCORING_FEATURE_CREATION_METHOD
+                    or output_feature.id_cols != feature_details["id_cols"]
+                ):
+                    raise ValueError(
+                        f"Feature {request.output_feature_id} is not the output of a scoring job "
+                        f"with the same id columns as feature {request.feature_id}"
+                    )
+            else:
+                # deleted by create_scoring_job_async if the job fails before storing
+                # its first version
+                output_feature = Feature(
+                    user_id=self.user_id,
+                    datasource_ids=feature_details["datasource_ids"],
+                    feature_name_script=request.output_feature_name,
+                    feature_name_generic=request.output_feature_name,
+                    feature_description=f"Predictions of {ml_model.ml_model_name} for {feature_details['feature_name']}",
+                    # the type of the predictions is stored once the first rows are scored
+                    column_types={
+                        **{
+                            col: feature_details["column_types"].get(col)
+                            for col in feature_details["id_cols"]
+                        },
+                        "prediction": None,
+                    },
+                    feature_dest="preloop datastore",
+                    feature_cols=["prediction"],
+                    id_cols=feature_details["id_cols"],
+                    creation_method=constants.SCORING_FEATURE_CREATION_METHOD,
+                    script_loc=f"s3://preloop-ml-objects-{constants.DEPLOY_ENVIRONMENT}/{ml_model.script_dir}{constants.SCORING_SCRIPT_NAME}",
+                    versioning=True,
+                    latest_version=1,
+                    feature_drift_enabled=False,
+                )
+                session.add(output_feature)
+                session.flush()
+                output_feature.location_string = (
+                    f"features_{str(self.user_id).replace('-', '_')}."
+                    f"{str(output_feature.id).replace('-', '_')}"
+                )
+            ml_model_scoring_job = MLModelScoringJobs(
+                user_id=self.user_id,
+                ml_model_id=request.ml_model_id,
+                ml_model_version=ml_model_version,
+                feature_id=request.feature_id,
+                feature_version=feature_version,
+                output_feature_id=output_feature.id,
+                status=MLModelScoringJobStatus.SCORING.value,
+            )
+            session.add(ml_model_scoring_job)
+            session.flush()
+            ml_model_scoring_job_id = ml_model_scoring_job.id
+        return ml_model_scoring_job_id
+
+    def create_scoring_job_async(self, ml_model_scoring_job_id, vectorized: bool):
+        """
+        Runs a scoring job and waits for it to finish. A job that fails is marked as
+        failed, and a new output feature it created is deleted when no version of it
+        was stored, so it isn't left behind with a latest version that has no rows.
+        """
+        try:
+            self._run_scoring_job(ml_model_scoring_job_id, vectorized)
+        except Exception as e:
+            with Session.begin() as session:
+                scoring_job = (
+                    session.query(MLModelScoringJobs)
+                    .filter(MLModelScoringJobs.id == ml_model_scoring_job_id)
+                    .first()
+                )
+                if scoring_job.status == MLModelScoringJobStatus.SCORING.value:
+                    scoring_job.status = MLModelScoringJobStatus.FAILED.value
+                    scoring_job.reason = str(e)
+                    scoring_job.end_time = datetime.now()
+                output_feature_id = scoring_job.output_feature_id
+            try:
+                self._delete_unscored_output_feature(output_feature_id)
+            except Exception:
+                log.exception(
+                    f"Unable to delete output feature {output_feature_id} "
+                    f"of failed scoring job {ml_model_scoring_job_id}"
+                )
+            raise
+
+    @staticmethod
+    def _delete_unscored_output_feature(output_feature_id: uuid.UUID):
+        with Session.begin() as session:
+            output_feature = (
+                session.query(Feature)
+                .filter(Feature.id == output_feature_id)
+                .with_for_update()
+                .first()
+            )
+            if output_feature is None:
+                return
+            has_versions = (
+                session.query(FeatureVersions)
+                .filter(FeatureVersions.feature_id == output_feature_id)
+                .count()
+                > 0
+            )
+            # another job may be scoring into the same feature
+            other_jobs_running = (
+                session.query(MLModelScoringJobs)
+                .filter(
+                    MLModelScoringJobs.output_feature_id == output_feature_id,
+                    MLModelScoringJobs.status == MLModelScoringJobStatus.SCORING.value,
+                )
+                .count()
+                > 0
+            )
+            if has_versions or other_jobs_running:
+                return
+            # the rows of a version that failed to record are deleted by the upload,
+            # but not the table it created
+            schema, table_name = output_feature.location_string.split(".")
+            with create_engine(preloop_datastore_url).begin() as connection:
+                connection.execute(
+                    text(f'DROP TABLE IF EXISTS "{schema}"."{table_name}"')
+                )
+            session.delete(output_feature)
+
+    def _run_scoring_job(self, ml_model_scoring_job_id, vectorized: bool):
+        sfn_client = boto3.client("stepfunctions")
+        s3_client = boto3.client("s3")
+        with Session.begin() as session:
+            scoring_job = (
+                session.query(MLModelScoringJobs)
+                .filter(MLModelScoringJobs.id == ml_model_scoring_job_id)
+                .first()
+            )
+            # output features get their first version from the first job that succeeds
+            operation_type = (
+                ExecutionType.AD_HOC.value
+                if session.query(FeatureVersions)
+                .filter(FeatureVersions.feature_id == scoring_job.output_feature_id)
+                .count()
+                > 0
+                else ExecutionType.FIRST_RUN.value
+            )
+            id_cols = (
+                session.query(Feature.id_cols)
+                .filter(Feature.id == scoring_job.feature_id)
+                .scalar()
+            )
+        ml_model = self.list_ml_models(scoring_job.ml_model_id)[0]
+        scoring_script_path = os.path.join(
+            os.path.dirname(__file__), constants.SCORING_SCRIPT_NAME
+        )
+        s3_client.upload_file(
+            scoring_script_path,
+            f"preloop-ml-objects-{constants.DEPLOY_ENVIRONMENT}",
+            f"{ml_model['script_dir']}{constants.SCORING_SCRIPT_NAME}",
+        )
+        env_vars = (
+            json.loads(self.decrypt_env_vars(ml_model["env_vars"]))
+            if ml_model["env_vars"] is not None
+            else {}
+        )
+        # the scoring script reads the job from these, after the model's own
+        # variables so a model can't change which job is run
+        env_vars.update(
+            {
+                "SCORING_JOB_ID": str(ml_model_scoring_job_id),
+                "FEATURE_ID": str(scoring_job.feature_id),
+                "FEATURE_VERSION": str(scoring_job.feature_version),
+                "OUTPUT_FEATURE_ID": str(scoring_job.output_feature_id),
+                "ID_COLS": json.dumps(id_cols),
+                "OPERATION_TYPE": operation_type,
+                "INFERENCE_SCRIPT_LOC": f"s3://preloop-ml-objects-{constants.DEPLOY_ENVIRONMENT}/{ml_model['script_dir']}inference.py",
+                "PREDICT_FUNCTION_NAME": ml_model["predict_function_name"],
+                "VECTORIZED": str(vectorized),
+            }
+        )
+        log.info("Starting the scoring script execution")
+        api_key = get_internal_api_key(self.user_id)
+        sfn_input = {
+            "SCRIPT_LOC": f"s3://preloop-ml-objects-{constants.DEPLOY_ENVIRONMENT}/{ml_model['script_dir']}{constants.SCORING_SCRIPT_NAME}",
+            "KEY_ID": api_key["key_id"],
+            "SECRET": api_key["secret"],
+            "SCHEDULING_EXPRESSION": None,
+            "VERSIONING": None,
+            "EXECUTION_TYPE": None,
+            "EXECUTION_ID": None,
+            "FEATURE_DRIFT_ENABLED": None,
+            "LATEST_VERSION": None,
+            "VERSION": str(scoring_job.ml_model_version),
+            "ML_MODEL_TRAINING": None,
+            "ML_MODEL_RETRAINING": None,
+            "ML_MODEL_ID": str(scoring_job.ml_model_id),
+            "LIBRARIES": self.get_required_libraries(ml_model["libraries"]),
+            "LOOP_LINE_NUMBERS": None,
+            "ENV_VARS": json.dumps(env_vars),
+        }
+        sfn_response = sfn_client.start_execution(
+            stateMachineArn=constants.EXECUTION_ENGINE_STATE_MACHINE_EXECUTION_ARN,
+            input=json.dumps(sfn_input),
+        )
+        execution_arn = sfn_response["executionArn"]
+        task_metadata_retrieved = False
+        retry = 0
+        while retry < constants.EXECUTION_ENGINE_RETRY_COUNT:
+            if not task_metadata_retrieved:
+                execution_history = sfn_client.get_execution_history(
+                    executionArn=execution_arn
+                )
+                for event in execution_history["events"]:
+                    if event["type"] == "TaskSubmitted":
+                        task_submitted_output = json.loads(
+                            event["taskSubmittedEventDetails"]["output"]
+                        )
+                        cluster_arn = task_submitted_output["Tasks"][0]["ClusterArn"]
+                        task_arn = task_submitted_output["Tasks"][0]["Containers"][0][
+                            "TaskArn"
+                        ]
+                        task_id = task_arn.split("/")[-1]
+                        with Session.begin() as session:
+                            session.query(MLModelScoringJobs).filter(
+                                MLModelScoringJobs.id == ml_model_scoring_job_id
+                            ).update(
+                                {
+                                    "ecs_task_arn": task_arn,
+                                    "ecs_cluster_arn": cluster_arn,
+                                    "cloudwatch_log_group_name": "/ecs/execution-engine",
+                                    "cloudwatch_log_stream_name": f"ExecutionEngine/ExecutionEngineContainer/{task_id}",
+                                }
+                            )
+                        task_metadata_retrieved = True
+                        break
+            execution_response = sfn_client.describe_execution(
+                executionArn=execution_arn
+            )
+            if execution_response["status"] == "SUCCEEDED":
+                break
+            if execution_response["status"] in ("TIMED_OUT", "FAILED"):
+                with Session.begin() as session:
+                    session.query(MLModelScoringJobs).filter(
+                        MLModelScoringJobs.id == ml_model_scoring_job_id
+                    ).update(
+                        {
+                            "status": MLModelScoringJobStatus.FAILED.value,
+                            "reason": "Timeout reached during scoring"
+                            if execution_response["status"] == "TIMED_OUT"
+                            else execution_response["cause"],
+                            "end_time": datetime.now(),
+                        }
+                    )
+                raise Exception("Scoring script execution failed")
+            retry += 1
+            time.sleep(constants.EXECUTION_ENGINE_RETRY_DELAY)
+        else:
+            with Session.begin() as session:
+                session.query(MLModelScoringJobs).filter(
+                    MLModelScoringJobs.id == ml_model_scoring_job_id
+                ).update(
                     {
-                        "id": row[0].id,
-                        "ml_model_id": row[0].ml_model_id,
-                        "ml_model_name": row[3],
-                        "version": row[4] if row[0].version == -1 else row[0].version,
-                        "status": row[0].status,
-                        "endpoint_url": row[0].endpoint_url,
-                        "creation_date": row[0].creation_date,
-                        "reason": row[0].reason,
-                        "require_api_key": row[0].require_api_key,
-                        "owner": row[1]
-                        if row[2] == "root"
-                        else row[1].split(constants.ORG_ACCOUNT_SPLIT_TOKEN)[1],
-                        "is_latest_version": row[0].version == -1,
+                        "status": MLModelScoringJobStatus.FAILED.value,
+                        "reason": "Timeout reached while waiting for scoring",
+                        "end_time": datetime.now(),
                     }
                 )
-            return hosted_ml_models
+            raise Exception("Scoring script execution failed")
+        with Session.begin() as session:
+            output_feature = (
+                session.query(Feature)
+                .filter(Feature.id == scoring_job.output_feature_id)
+                .first()
+            )
+            session.query(MLModelScoringJobs).filter(
+                MLModelScoringJobs.id == ml_model_scoring_job_id
+            ).update(
+                {
+                    "status": MLModelScoringJobStatus.SUCCEEDED.value,
+                    "output_feature_version": output_feature.latest_version,
+                    "end_time": datetime.now(),
+                }
+            )
 
-    def list_training_jobs(
+    def list_scoring_jobs(
         self,
         job_id: Optional[uuid.UUID] = None,
         ml_model_id: Optional[uuid.UUID] = None,
     ):
         with Session.begin() as session:
-            if job_id is None and ml_model_id is None:
-                query_results = (
-                    session.query(MLModelTrainingJobs, AllUsers.email, AllUsers.role)
-                    .join(AllUsers)
-                    .filter(
-                        MLModelTrainingJobs.user_id.in_(self.access_resolution_list)
-                    )
-                    .all()
-                )
-            else:
-                if job_id is not None and ml_model_id is None:
-                    query_results = (
-                        session.query(
-                            MLModelTrainingJobs, AllUsers.email, AllUsers.role
-                        )
-                        .join(AllUsers)
-                        .filter(
-                            MLModelTrainingJobs.user_id.in_(
-                                self.access_resolution_list
-                            ),
-                            MLModelTrainingJobs.id == job_id,
-                        )
-                        .all()
-                    )
-
-                elif ml_model_id is not None and job_id is None:
-                    query_results = (
-                        session.query(
-                            MLModelTrainingJobs, AllUsers.email, AllUsers.role
-                        )
-                        .join(AllUsers)
-                        .filter(
-                            MLModelTrainingJobs.user_id.in_(
-                                self.access_resolution_list
-                            ),
-                            MLModelTrainingJobs.ml_model_id == ml_model_id,
-                        )
-                        .all()
-                    )
-
-                else:
-                    return []
+            query = (
+                session.query(MLModelScoringJobs, AllUsers.email, AllUsers.role)
+                .join(AllUsers)
+                .filter(MLModelScoringJobs.user_id.in_(self.access_resolution_list))
+            )
+            if job_id is not None:
+                query = query.filter(MLModelScoringJobs.id == job_id)
+            if ml_model_id is not None:
+                query = query.filter(MLModelScoringJobs.ml_model_id == ml_model_id)
+            query_results = query.all()
 
-            if not query_results:
-                return []
-
-            training_jobs = []
+            scoring_jobs = []
 
             for row in query_results:
-                training_jobs.append(
+                scoring_jobs.append(
                     {
                         **{
                             key: row[0].__dict__[key]
@@ -1679,7 +2535,40 @@ class MLModelCore:
                     }
                 )
 
-            return training_jobs
+            return scoring_jobs
+
+    def store_scoring_progress(
+        self,
+        scoring_job_id: uuid.UUID,
+        rows_scored: int,
+        prediction_type: Optional[str] = None,
+        total_rows: Optional[int] = None,
+    ):
+        with Session.begin() as session:
+            scoring_job = (
+                session.query(MLModelScoringJobs)
+                .filter(
+                    MLModelScoringJobs.id == scoring_job_id,
+                    MLModelScoringJobs.user_id.in_(self.access_resolution_list),
+                )
+                .first()
+            )
+            if scoring_job is None:
+                raise ValueError(f"Scoring job {scoring_job_id} does not exist")
+            scoring_job.rows_scored = rows_scored
+            if total_rows is not None:
+                scoring_job.total_rows = total_rows
+            if prediction_type is not None:
+                output_feature = (
+                    session.query(Feature)
+                    .filter(Feature.id == scoring_job.output_feature_id)
+                    .first()
+                )
+                # column_types is JSONB, so it is replaced rather than changed in place
+                output_feature.column_types = {
+                    **output_feature.column_types,
+                    "prediction": prediction_type,
+                }
 
     def create_application_load_balancer(self, max_retries=100, retry_interval=5):
         aws_resources = []
@@ -1906,83 +2795,144 @@ class MLModelCore:
                 )
                 .first()
             )
-            session.query(OrgLoadBalancers).filter(
-                OrgLoadBalancers.id == hosted_ml_model.load_balancer_id
-            ).update({"num_target_groups": OrgLoadBalancers.num_target_groups - 1})
-            org_load_balancer = (
-                session.query(OrgLoadBalancers)
-                .filter(OrgLoadBalancers.id == hosted_ml_model.load_balancer_id)
-                .first()
-            )
-            if org_load_balancer.num_target_groups == 0:
-                aws_resources.append(
-                    {
-                        "resource_type": "load_balancer",
-                        "resource_arn": org_load_balancer.load_balancer_arn,
-                        "priority": 1,
-                    }
-                )
-                aws_resources.append(
-                    {
-                        "resource_type": "security_group",
-                        "group_id": org_load_balancer.security_group_id,
-                        "priority": 4,
-                    }
+            if hosted_ml_model.hosting != HostingMode.SHARED.value:
+                self.release_load_balancer(
+                    session, hosted_ml_model.load_balancer_id, aws_resources
                 )
-                if org_load_balancer.route_53_record is not None:
-                    aws_resources.append(
-                        {
-                            "resource_type": "route_53_record",
-                            "record_set": org_load_balancer.route_53_record,
-                            "priority": 1,
-                        }
-                    )
-                session.query(OrgLoadBalancers).filter(
-                    OrgLoadBalancers.id == org_load_balancer.id
+        if hosted_ml_model.hosting == HostingMode.SHARED.value:
+            # shared models have no resources of their own, the host stops serving the
+            # model once it is deleted
+            with Session.begin() as session:
+                session.query(HostedMLModels).filter(
+                    HostedMLModels.id == hosted_ml_model_id
                 ).delete()
+            self.stop_idle_shared_inference_host()
+            return
         try:
+            aws_resources.extend(self.inference_service_resources(hosted_ml_model))
+            self.clean_up_aws_resources(aws_resources)
+        except Exception as e:
+            log.error(str(e), exc_info=True)
+        with Session.begin() as session:
+            session.query(HostedMLModels).filter(
+                HostedMLModels.id == hosted_ml_model_id
+            ).delete()
+
+    def release_load_balancer(self, session, load_balancer_id, aws_resources):
+        """
+        Frees the place of a target group on a load balancer, and adds the load balancer
+        to aws_resources to be deleted when it has no target groups left.
+        """
+        session.query(OrgLoadBalancers).filter(
+            OrgLoadBalancers.id == load_balancer_id
+        ).update({"num_target_groups": OrgLoadBalancers.num_target_groups - 1})
+        org_load_balancer = (
+            session.query(OrgLoadBalancers)
+            .filter(OrgLoadBalancers.id == load_balancer_id)
+            .first()
+        )
+        if org_load_balancer.num_target_groups == 0:
             aws_resources.append(
                 {
-                    "resource_type": "ecs_service",
-                    "cluster_name": hosted_ml_model.ecs_cluster_name,
-                    "service_name": hosted_ml_model.ecs_service_name,
-                    "priority": 2,
-                }
-            )
-            aws_resources.append(
-                {
-                    "resource_type": "listener_rule",
-                    "resource_arn": hosted_ml_model.listener_rule_arn,
+                    "resource_type": "load_balancer",
+                    "resource_arn": org_load_balancer.load_balancer_arn,
                     "priority": 1,
                 }
             )
             aws_resources.append(
                 {
-                    "resource_type": "ecs_task_definition",
-                    "task_definition_arn": hosted_ml_model.task_definition_arn,
-                    "priority": 1,
+                    "resource_type": "security_group",
+                    "group_id": org_load_balancer.security_group_id,
+                    "priority": 4,
                 }
             )
-            aws_resources.append(
-                {
-                    "resource_type": "target_group",
-                    "resource_arn": hosted_ml_model.target_group_arn,
-                    "priority": 2,
-                }
+            if org_load_balancer.route_53_record is not None:
+                aws_resources.append(
+                    {
+                        "resource_type": "route_53_record",
+                        "record_set": org_load_balancer.route_53_record,
+                        "priority": 1,
+                    }
+                )
+            session.query(OrgLoadBalancers).filter(
+                OrgLoadBalancers.id == org_load_balancer.id
+            ).delete()
+
+    def inference_service_resources(self, inference_service):
+        """
+        Returns the resources of an inference engine service, as created by
+        create_inference_service, for clean_up_aws_resources.
+        """
+        return [
+            {
+                "resource_type": "ecs_service",
+                "cluster_name": inference_service.ecs_cluster_name,
+                "service_name": inference_service.ecs_service_name,
+                "priority": 2,
+            },
+            {
+                "resource_type": "listener_rule",
+                "resource_arn": inference_service.listener_rule_arn,
+                "priority": 1,
+            },
+            {
+                "resource_type": "ecs_task_definition",
+                "task_definition_arn": inference_service.task_definition_arn,
+                "priority": 1,
+            },
+            {
+                "resource_type": "target_group",
+                "resource_arn": inference_service.target_group_arn,
+                "priority": 2,
+            },
+            {
+                "resource_type": "security_group",
+                "group_id": inference_service.task_security_group_id,
+                "priority": 3,
+            },
+        ]
+
+    def stop_idle_shared_inference_host(self):
+        """
+        Stops the shared inference host of the organization once it serves no models.
+        The host is locked while its models are counted, so a model being deployed to it
+        at the same time either is counted or finds the host stopping.
+        """
+        aws_resources = []
+        with Session.begin() as session:
+            shared_host = (
+                session.query(SharedInferenceHosts)
+                .filter(
+                    SharedInferenceHosts.org_id == self.org_id,
+                    SharedInferenceHosts.status == HostedMLModelStatus.AVAILABLE.value,
+                )
+                .with_for_update()
+                .first()
             )
-            aws_resources.append(
-                {
-                    "resource_type": "security_group",
-                    "group_id": hosted_ml_model.task_security_group_id,
-                    "priority": 3,
-                }
+            if shared_host is None:
+                return
+            num_shared_ml_models = (
+                session.query(HostedMLModels)
+                .filter(HostedMLModels.shared_host_id == shared_host.id)
+                .count()
+            )
+            if num_shared_ml_models > 0:
+                return
+            session.query(SharedInferenceHosts).filter(
+                SharedInferenceHosts.id == shared_host.id
+            ).update({"status": HostedMLModelStatus.STOPPING.value})
+            self.release_load_balancer(
+                session, shared_host.load_balancer_id, aws_resources
             )
+        log.info(f"Stopping shared inference host {shared_host.id}")
+        try:
+            aws_resources.extend(self.inference_service_resources(shared_host))
             self.clean_up_aws_resources(aws_resources)
         except Exception as e:
             log.error(str(e), exc_info=True)
         with Session.begin() as session:
-            session.query(HostedMLModels).filter(
-                HostedMLModels.id == hosted_ml_model_id
+            session.query(SharedInferenceHosts).filter(
+                SharedInferenceHosts.id == shared_host.id
             ).delete()
 
     def delete_ml_model(self, ml_model_id: uuid.UUID):
@@ -2021,78 +2971,16 @@ class MLModelCore:
                 HostedMLModels.status == HostedMLModelStatus.AVAILABLE.value,
             ).update({"status": HostedMLModelStatus.STOPPING.value})
             for hosted_ml_model in hosted_ml_models:
-                session.query(OrgLoadBalancers).filter(
-                    OrgLoadBalancers.id == hosted_ml_model.load_balancer_id
-                ).update({"num_target_groups": OrgLoadBalancers.num_target_groups - 1})
-                org_load_balancer = (
-                    session.query(OrgLoadBalancers)
-                    .filter(OrgLoadBalancers.id == hosted_ml_model.load_balancer_id)
-                    .first()
-                )
-                if org_load_balancer.num_target_groups == 0:
-                    aws_resources.append(
-                        {
-                            "resource_type": "load_balancer",
-                            "resource_arn": org_load_balancer.load_balancer_arn,
-                            "priority": 1,
-                        }
-                    )
-                    aws_resources.append(
-                        {
-                            "resource_type": "security_group",
-                            "group_id": org_load_balancer.security_group_id,
-                            "priority": 4,
-                        },
+                if hosted_ml_model.hosting != HostingMode.SHARED.value:
+                    self.release_load_balancer(
+                        session, hosted_ml_model.load_balancer_id, aws_resources
                     )
-                    if org_load_balancer.route_53_record is not None:
-                        aws_resources.append(
-                            {
-                                "resource_type": "route_53_record",
-                                "record_set": org_load_balancer.route_53_record,
-                                "priority": 1,
-                            }
-                        )
-                    session.query(OrgLoadBalancers).filter(
-                        OrgLoadBalancers.id == org_load_balancer.id
-                    ).delete()
         try:
             for hosted_ml_model in hosted_ml_models:
-                aws_resources.append(
-                    {
-                        "resource_type": "ecs_service",
-                        "cluster_name": hosted_ml_model.ecs_cluster_name,
-                        "service_name": hosted_ml_model.ecs_service_name,
-                        "priority": 2,
-                    }
-                )
-                aws_resources.append(
-                    {
-                        "resource_type": "ecs_task_definition",
-                        "task_definition_arn": hosted_ml_model.task_definition_arn,
-                        "priority": 1,
-                    }
-                )
-                aws_resources.append(
-                    {
-                        "resource_type": "security_group",
-                        "group_id": hosted_ml_model.task_security_group_id,
-                        "priority": 3,
-                    }
-                )
-                aws_resources.append(
-                    {
-                        "resource_type": "listener_rule",
-                        "resource_arn": hosted_ml_model.listener_rule_arn,
-                        "priority": 1,
-                    }
-                )
-                aws_resources.append(
-                    {
-                        "resource_type": "target_group",
-                        "resource_arn": hosted_ml_model.target_group_arn,
-                        "priority": 2,
-                    }
-                )
+                if hosted_ml_model.hosting != HostingMode.SHARED.value:
+                    aws_resources.extend(
+                        self.inference_service_resources(hosted_ml_model)
+                    )
             aws_resources.append(
                 {
                     "resource_type": "s3_objects",
@@ -2112,6 +3000,7 @@ class MLModelCore:
             log.error(str(e), exc_info=True)
         with Session.begin() as session:
             session.query(MLModel).filter(MLModel.id == ml_model_id).delete()
+        self.stop_idle_shared_inference_host()
 
     def store_ml_model_info(
         self,
@@ -2435,6 +3324,183 @@ class MLModelCore:
         libraries_to_install_string = ",".join(libraries_to_install)
         return libraries_to_install_string
 
+    def build_inference_image(self, libs_string: str):
+        """
+        Starts building the image of the inference engine with the given libraries
+        installed, unless it was already built, and returns its id. Images are keyed by
+        the hash of the libraries and of the inference engine image they are built on,
+        so ML models with the same libraries share an image, and new releases of the
+        inference engine get new images.
+        """
+        libraries = ",".join(sorted(libs_string.split(",")))
+        ecr_client = boto3.client("ecr")
+        base_image_digest = ecr_client.describe_images(
+            repositoryName=constants.MODEL_INFERENCE_ENGINE_REPOSITORY,
+            imageIds=[{"imageTag": "latest"}],
+        )["imageDetails"][0]["imageDigest"]
+        dependency_hash = hashlib.sha256(
+            f"{base_image_digest}\n{libraries}".encode()
+        ).hexdigest()
+        try:
+            with Session.begin() as session:
+                inference_image = (
+                    session.query(InferenceImages)
+                    .filter(InferenceImages.dependency_hash == dependency_hash)
+                    .with_for_update()
+                    .first()
+                )
+                if inference_image is None:
+                    inference_image = InferenceImages(
+                        dependency_hash=dependency_hash,
+                        libraries=libraries,
+                        image_uri=f"{constants.MODEL_INFERENCE_ENGINE_IMAGE}:"
+                        f"libraries-{dependency_hash[:32]}",
+                        status=InferenceImageStatus.BUILDING.value,
+                    )
+                    session.add(inference_image)
+                    # the row is inserted before the build starts, so a request
+                    # racing this one fails on the hash instead of building too
+                    session.flush()
+                elif inference_image.status == InferenceImageStatus.FAILED.value or (
+                    inference_image.status == InferenceImageStatus.AVAILABLE.value
+                    and not self.inference_image_exists(inference_image.image_uri)
+                ):
+                    # failed builds are retried by the next model that needs the
+                    # image, as are images the repository's lifecycle rule expired
+                    inference_image.status = InferenceImageStatus.BUILDING.value
+                    inference_image.reason = None
+                else:
+                    return inference_image.id
+                # started while the row is locked, so it is never committed as
+                # building without the id of its build
+                inference_image.build_id = self.start_inference_image_build(
+                    base_image_digest, libraries, inference_image.image_uri
+                )
+                if inference_image.build_id is None:
+                    inference_image.status = InferenceImageStatus.FAILED.value
+                    inference_image.reason = "Image build failed to start"
+                return inference_image.id
+        except exc.IntegrityError:
+            # another request started the build first
+            with Session.begin() as session:
+                return (
+                    session.query(InferenceImages.id)
+                    .filter(InferenceImages.dependency_hash == dependency_hash)
+                    .scalar()
+                )
+
+    def inference_image_exists(self, image_uri: str) -> bool:
+        ecr_client = boto3.client("ecr")
+        try:
+            ecr_client.describe_images(
+                repositoryName=constants.MODEL_INFERENCE_ENGINE_REPOSITORY,
+                imageIds=[{"imageTag": image_uri.rsplit(":", 1)[1]}],
+            )
+        except ecr_client.exceptions.ImageNotFoundException:
+            return False
+        return True
+
+    def start_inference_image_build(
+        self, base_image_digest: str, libraries: str, image_uri: str
+    ) -> Optional[str]:
+        """
+        Starts the build of an inference image, and returns the id of the build, or
+        None if it could not be started.
+        """
+        log.info(f"Building inference image {image_uri} with {libraries}")
+        try:
+            codebuild_client = boto3.client("codebuild")
+            response = codebuild_client.start_build(
+                projectName=constants.MODEL_INFERENCE_ENGINE_IMAGE_BUILD_PROJECT,
+                environmentVariablesOverride=[
+                    {
+                        "name": "BASE_IMAGE",
+                        "value": f"{constants.MODEL_INFERENCE_ENGINE_IMAGE}"
+                        f"@{base_image_digest}",
+                        "type": "PLAINTEXT",
+                    },
+                    {"name": "LIBRARIES", "value": libraries, "type": "PLAINTEXT"},
+                    {"name": "IMAGE_URI", "value": image_uri, "type": "PLAINTEXT"},
+                ],
+            )
+        except Exception as e:
+            log.error(str(e), exc_info=True)
+            return None
+        return response["build"]["id"]
+
+    def prebuild_inference_image(self, libs_string: str):
+        # started with each new version of an ML model, so that its image is built
+        # by the time the version is deployed
+        if not libs_string:
+            return
+        try:
+            self.build_inference_image(libs_string)
+        except Exception as e:
+            log.error(str(e), exc_info=True)
+
+    def get_inference_image(
+        self,
+        libs_string: str,
+        max_retries=constants.INFERENCE_IMAGE_BUILD_RETRY_COUNT,
+        retry_interval=constants.INFERENCE_IMAGE_BUILD_RETRY_DELAY,
+    ):
+        """
+        Returns the image of the inference engine for ML models with the given
+        libraries, once it is built. ML models without libraries use the image of the
+        inference engine itself.
+        """
+        if not libs_string:
+            return f"{constants.MODEL_INFERENCE_ENGINE_IMAGE}:latest"
+        inference_image_id = self.build_inference_image(libs_string)
+        codebuild_client = boto3.client("codebuild")
+        for _ in range(max_retries):
+            with Session.begin() as session:
+                inference_image = (
+                    session.query(InferenceImages)
+                    .filter(InferenceImages.id == inference_image_id)
+                    .first()
+                )
+            if inference_image.status == InferenceImageStatus.AVAILABLE.value:
+                return inference_image.image_uri
+            if inference_image.status == InferenceImageStatus.FAILED.value:
+                raise Exception(
+                    f"Inference image build failed: {inference_image.reason}"
+                )
+            if inference_image.build_id is not None:
+                build = codebuild_client.batch_get_builds(
+                    ids=[inference_image.build_id]
+                )["builds"][0]
+                if build["buildStatus"] != "IN_PROGRESS":
+                    succeeded = build["buildStatus"] == "SUCCEEDED"
+                    with Session.begin() as session:
+                        session.query(InferenceImages).filter(
+                            InferenceImages.id == inference_image_id,
+                            InferenceImages.build_id == inference_image.build_id,
+                        ).update(
+                            {
+                                "status": InferenceImageStatus.AVAILABLE.value
+                                if succeeded
+                                else InferenceImageStatus.FAILED.value,
+                                "reason": None
+                                if succeeded
+                                else f"Image build {build['buildStatus'].lower()}",
+                            }
+                        )
+                    continue
+            time.sleep(retry_interval)
+        raise Exception("Inference image build timed out")
+
+    def get_inference_environment(self, inference_config: Optional[InferenceConfig]):
+        # the inference engine reads each setting from the variable of the
+        # same name in upper case
+        if inference_config is None:
+            return []
+        return [
+            {"name": setting.upper(), "value": str(value)}
+            for setting, value in inference_config.model_dump().items()
+            if value is not None
+        ]
+
     def encrypt_env_vars(self, env_vars_string: str):
         env_vars_encryption_key = os.getenv(
             "PRELOOP_USER_SCRIPT_ENV_VARS_ENCRYPTION_KEY"
@@ -0,0 +1,69 @@
+"""Unit tests for the datasource utilities"""
+import datetime
+import decimal
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.datasource.utilities import json_safe_statistic, read_s3_parquet_footer
+
+
+class FakeS3Client:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = Range.removeprefix("bytes=").split("-")
+        return {"Body": io.BytesIO(self.data[int(start) : int(end) + 1])}
+
+
+def test_json_safe_statistic_keeps_numbers_and_strings():
+    assert json_safe_statistic(3) == 3
+    assert json_safe_statistic(1.5) == 1.5
+    assert json_safe_statistic("a") == "a"
+    assert json_safe_statistic(True) is True
+
+
+def test_json_safe_statistic_keeps_the_type_of_other_values():
+    assert json_safe_statistic(datetime.datetime(2024, 3, 1, 10, 30)) == {
+        "type": "datetime",
+        "value": "2024-03-01T10:30:00",
+    }
+    assert json_safe_statistic(datetime.date(2024, 3, 1)) == {
+        "type": "date",
+        "value": "2024-03-01",
+    }
+    assert json_safe_statistic(decimal.Decimal("1.10")) == {
+        "type": "decimal",
+        "value": "1.10",
+    }
+    assert json_safe_statistic(b"\x00\xff") == {"type": "bytes", "value": "00ff"}
+    assert json_safe_statistic(float("inf")) == {"type": "float", "value": "inf"}
+
+
+def test_parquet_footer_statistics_are_json_serializable():
+    table = pa.table(
+        {
+            "id": [1, 2, 3, 4],
+            "created_at": pa.array(
+                [datetime.datetime(2024, 3, day) for day in range(1, 5)],
+                type=pa.timestamp("us"),
+            ),
+        }
+    )
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, row_group_size=2)
+    data = buffer.getvalue()
+
+    footer = read_s3_parquet_footer(
+        FakeS3Client(data), "bucket", "key.parquet", len(data)
+    )
+
+    json.dumps(footer)
+    assert footer["num_rows"] == 4
+    assert footer["row_groups"][1]["columns"]["created_at"]["min"] == {
+        "type": "datetime",
+        "value": "2024-03-03T00:00:00",
+    }
@@ -0,0 +1,36 @@
+"""Unit tests for streaming versions of features"""
+import io
+import struct
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+import src.feature.utilities as feature_utilities
+from src.feature.utilities import FeatureCore
+
+
+def read_chunks(stream) -> list:
+    data = io.BytesIO(b"".join(stream))
+    chunks = []
+    while header := data.read(8):
+        (size,) = struct.unpack(">Q", header)
+        chunks.append(pd.read_parquet(io.BytesIO(data.read(size))))
+    return chunks
+
+
+def test_stream_feature_version_reads_the_version_in_chunks(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/datastore.db")
+    pd.DataFrame(
+        {"id": range(10), "value": range(10), "__preloop_version": [1] * 5 + [2] * 5}
+    ).to_sql("feature", engine, index=False)
+    monkeypatch.setattr(feature_utilities, "create_engine", lambda url: engine)
+
+    chunks = read_chunks(
+        FeatureCore.stream_feature_version("main.feature", 2, ["id"], 2)
+    )
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    data = pd.concat(chunks)
+    assert data.index.name == "id"
+    assert list(data.columns) == ["value"]
+    assert sorted(data.index) == [5, 6, 7, 8, 9]
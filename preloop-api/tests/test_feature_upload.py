@@ -0,0 +1,221 @@
+"""Unit tests for chunked feature uploads"""
+import contextlib
+import io
+import uuid
+from unittest import mock
+
+import pandas as pd
+import pytest
+from fastapi import BackgroundTasks
+from sqlalchemy import create_engine, event, exc, inspect
+
+import src.feature.routers as feature_routers
+import src.feature.utilities as feature_utilities
+from src.feature.utilities import FeatureCore
+
+LOCATION_STRING = "main.feature"
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/datastore.db")
+
+    # sqlite has no ALTER COLUMN, and DROP DEFAULT only matters to later inserts
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def skip_drop_default(conn, cursor, statement, parameters, context, executemany):
+        if statement.endswith("DROP DEFAULT"):
+            return "SELECT 1", ()
+        return statement, parameters
+
+    monkeypatch.setattr(feature_utilities, "create_engine", lambda url: engine)
+    return engine
+
+
+def rows(ids, value) -> pd.DataFrame:
+    return pd.DataFrame({"value": [value] * len(ids)}, index=pd.Index(ids, name="id"))
+
+
+def store_version(engine, data: pd.DataFrame, version: int):
+    data.assign(__preloop_version=version).to_sql("feature", engine, if_exists="append")
+
+
+def read_version(engine, version: int) -> pd.DataFrame:
+    data = pd.read_sql(
+        f"SELECT * FROM feature WHERE __preloop_version = {version}", engine
+    )
+    return data.drop(columns=["__preloop_version"]).set_index("id").sort_index()
+
+
+def upload(
+    engine, parts, version, replace=False, merge_version=None, total_rows=None
+) -> uuid.UUID:
+    upload_id = uuid.uuid4()
+    for part_number, part in enumerate(parts):
+        FeatureCore.insert_feature_part(part, LOCATION_STRING, upload_id, part_number)
+    with engine.begin() as connection:
+        FeatureCore.commit_feature_upload(
+            connection=connection,
+            location_string=LOCATION_STRING,
+            upload_id=upload_id,
+            total_rows=sum(len(part) for part in parts)
+            if total_rows is None
+            else total_rows,
+            version=version,
+            replace=replace,
+            id_cols=["id"],
+            merge_version=merge_version,
+        )
+    return upload_id
+
+
+def test_commit_appends_the_upload_as_a_new_version(engine):
+    store_version(engine, rows([1, 2], "old"), 1)
+
+    upload_id = upload(engine, [rows([1], "new"), rows([3], "new")], version=2)
+
+    pd.testing.assert_frame_equal(read_version(engine, 1), rows([1, 2], "old"))
+    pd.testing.assert_frame_equal(read_version(engine, 2), rows([1, 3], "new"))
+    assert not inspect(engine).has_table(FeatureCore.upload_table_name(upload_id))
+
+
+def test_commit_merges_the_rows_of_the_prior_version(engine):
+    store_version(engine, rows([1, 2, 3], "old"), 1)
+
+    upload(engine, [rows([2], "new"), rows([4], "new")], version=2, merge_version=1)
+
+    expected = pd.DataFrame(
+        {"value": ["old", "new", "old", "new"]}, index=pd.Index([1, 2, 3, 4], name="id")
+    )
+    pd.testing.assert_frame_equal(read_version(engine, 2), expected)
+
+
+def test_commit_replaces_features_without_versioning(engine):
+    store_version(engine, rows([1, 2], "old"), 1)
+
+    upload_id = upload(
+        engine, [rows([3], "new"), rows([4], "new")], version=1, replace=True
+    )
+
+    pd.testing.assert_frame_equal(read_version(engine, 1), rows([3, 4], "new"))
+    columns = [column["name"] for column in inspect(engine).get_columns("feature")]
+    assert sorted(columns) == ["__preloop_version", "id", "value"]
+    assert not inspect(engine).has_table(FeatureCore.upload_table_name(upload_id))
+
+
+def test_a_part_sent_again_replaces_its_rows(engine):
+    upload_id = uuid.uuid4()
+    FeatureCore.insert_feature_part(
+        rows([1, 2], "first try"), LOCATION_STRING, upload_id, 0
+    )
+    FeatureCore.insert_feature_part(
+        rows([1, 2], "retry"), LOCATION_STRING, upload_id, 0
+    )
+    FeatureCore.insert_feature_part(rows([3], "retry"), LOCATION_STRING, upload_id, 1)
+    with engine.begin() as connection:
+        FeatureCore.commit_feature_upload(
+            connection=connection,
+            location_string=LOCATION_STRING,
+            upload_id=upload_id,
+            total_rows=3,
+            version=1,
+            replace=True,
+            id_cols=["id"],
+        )
+
+    pd.testing.assert_frame_equal(read_version(engine, 1), rows([1, 2, 3], "retry"))
+
+
+def test_commit_rejects_an_upload_with_missing_rows(engine):
+    store_version(engine, rows([1], "old"), 1)
+
+    with pytest.raises(ValueError):
+        upload(engine, [rows([2, 3], "new")], version=2, total_rows=3)
+
+    assert read_version(engine, 2).empty
+
+
+def test_abort_drops_the_staged_parts(engine, monkeypatch):
+    session = mock.MagicMock()
+    monkeypatch.setattr(
+        feature_utilities,
+        "Session",
+        mock.Mock(begin=lambda: contextlib.nullcontext(session)),
+    )
+    upload_id = uuid.uuid4()
+    FeatureCore.insert_feature_part(rows([1], "new"), LOCATION_STRING, upload_id, 0)
+
+    FeatureCore.abort_feature_upload(LOCATION_STRING, upload_id)
+
+    assert not inspect(engine).has_table(FeatureCore.upload_table_name(upload_id))
+    session.query.return_value.filter.return_value.delete.assert_called_once()
+
+
+def test_delete_feature_version_only_deletes_that_version(engine):
+    store_version(engine, rows([1], "old"), 1)
+    store_version(engine, rows([1], "new"), 2)
+
+    FeatureCore.delete_feature_version(LOCATION_STRING, 2)
+
+    pd.testing.assert_frame_equal(read_version(engine, 1), rows([1], "old"))
+    assert read_version(engine, 2).empty
+
+
+class FailingCommitSession:
+    """
+    Stands in for the control database, whose first transaction fails to commit.
+    """
+
+    def __init__(self) -> None:
+        self.sessions = []
+
+    @contextlib.contextmanager
+    def begin(self):
+        session = mock.MagicMock()
+        locked_feature = mock.Mock(latest_version=1)
+        session.query.return_value.filter.return_value.with_for_update.return_value.one.return_value = (
+            locked_feature
+        )
+        # the version is not recorded
+        session.query.return_value.filter.return_value.first.return_value = None
+        self.sessions.append(session)
+        yield session
+        if len(self.sessions) == 1:
+            raise exc.OperationalError("COMMIT", {}, Exception("connection lost"))
+
+
+def test_commit_deletes_the_rows_of_a_version_it_could_not_record(engine, monkeypatch):
+    feature_details = {
+        "id": uuid.uuid4(),
+        "location_string": LOCATION_STRING,
+        "versioning": True,
+        "id_cols": ["id"],
+        "latest_version": 1,
+    }
+    monkeypatch.setattr(FeatureCore, "__init__", lambda self, **kwargs: None)
+    monkeypatch.setattr(
+        feature_routers, "_upload_feature_details", lambda *args: feature_details
+    )
+    monkeypatch.setattr(feature_routers, "_register_upload", lambda *args: None)
+    monkeypatch.setattr(feature_routers, "create_engine", lambda url: engine)
+    session = FailingCommitSession()
+    monkeypatch.setattr(feature_routers, "Session", session)
+    store_version(engine, rows([1], "old"), 1)
+    part = io.BytesIO()
+    rows([2], "new").to_parquet(part)
+    part.seek(0)
+
+    with pytest.raises(exc.OperationalError):
+        feature_routers.commit_feature_upload(
+            feature_id=feature_details["id"],
+            operation_type="ad_hoc",
+            upload_id=uuid.uuid4(),
+            part_number=0,
+            total_rows=1,
+            data=mock.Mock(file=part),
+            background_tasks=BackgroundTasks(),
+            user=mock.Mock(),
+        )
+
+    assert len(session.sessions) == 2
+    pd.testing.assert_frame_equal(read_version(engine, 1), rows([1], "old"))
+    assert read_version(engine, 2).empty
@@ -0,0 +1,55 @@
+"""Unit tests for the scoring script of ML models"""
+import importlib
+import io
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def scoring_script(monkeypatch):
+    for name, value in {
+        "PRELOOP_API_ENDPOINT": "http://preloop",
+        "KEY_ID": "key",
+        "SECRET": "secret",
+        "SCORING_JOB_ID": "job",
+        "FEATURE_ID": "feature",
+        "FEATURE_VERSION": "1",
+        "OUTPUT_FEATURE_ID": "output",
+        "ID_COLS": '["id", "date"]',
+        "OPERATION_TYPE": "first_run",
+        "INFERENCE_SCRIPT_LOC": "s3://bucket/inference.py",
+        "PREDICT_FUNCTION_NAME": "predict",
+        "VECTORIZED": "True",
+    }.items():
+        monkeypatch.setenv(name, value)
+    import src.ml_model.scoring_script as scoring_script
+
+    return importlib.reload(scoring_script)
+
+
+def test_a_feature_without_rows_is_stored_as_an_empty_version(
+    scoring_script, monkeypatch
+):
+    posts = []
+
+    def post(url, **kwargs):
+        posts.append((url, kwargs))
+        return mock.Mock()
+
+    monkeypatch.setattr(scoring_script, "download_inference_script", lambda: None)
+    monkeypatch.setattr(scoring_script, "iter_chunks", lambda: iter(()))
+    monkeypatch.setattr(scoring_script.requests, "post", post)
+
+    scoring_script.main()
+
+    progress, commit = posts
+    assert progress[1]["json"]["rows_scored"] == 0
+    assert progress[1]["json"]["total_rows"] == 0
+    assert commit[0] == "http://preloop/api/feature/insert/commit"
+    assert commit[1]["data"]["total_rows"] == 0
+    part = pd.read_parquet(io.BytesIO(commit[1]["files"]["data"][1]))
+    assert part.empty
+    assert list(part.index.names) == ["id", "date"]
+    assert list(part.columns) == ["prediction"]
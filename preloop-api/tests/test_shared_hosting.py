@@ -0,0 +1,37 @@
+"""Unit tests for the validation of shared hosting"""
+import io
+from unittest import mock
+
+import pytest
+
+import src.ml_model.utilities as ml_model_utilities
+from src.ml_model.utilities import MLModelCore
+
+ML_MODEL = {"libraries": [], "env_vars": None, "script_dir": "user/model/scripts/"}
+
+
+def validate(monkeypatch, inference_script: bytes):
+    s3_client = mock.Mock()
+    s3_client.get_object.return_value = {"Body": io.BytesIO(inference_script)}
+    monkeypatch.setattr(ml_model_utilities.boto3, "client", lambda service: s3_client)
+    monkeypatch.setattr(MLModelCore, "__init__", lambda self: None)
+    monkeypatch.setattr(MLModelCore, "get_required_libraries", lambda self, libs: "")
+    ml_model_core = MLModelCore()
+    ml_model_core.org_id = "org"
+    session = mock.MagicMock()
+    session.query.return_value.filter.return_value.first.return_value = None
+    ml_model_core.validate_shared_hosting(session, ML_MODEL, None)
+    return s3_client
+
+
+def test_models_with_a_versioned_inference_script_can_be_shared(monkeypatch):
+    script = b"version = globals().get('__preloop_version__') or os.getenv('VERSION')"
+    s3_client = validate(monkeypatch, script)
+    assert s3_client.get_object.call_args.kwargs["Key"] == (
+        "user/model/scripts/inference.py"
+    )
+
+
+def test_models_with_an_older_inference_script_are_rejected(monkeypatch):
+    with pytest.raises(ValueError, match="predates shared hosting"):
+        validate(monkeypatch, b"version = os.getenv('VERSION')")
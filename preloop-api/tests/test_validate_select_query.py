@@ -0,0 +1,26 @@
+"""Unit tests for the validation of the queries of query-based datasources"""
+import pytest
+
+from src.datasource.utilities import validate_select_query
+
+
+def test_select_query_returns_the_referenced_tables():
+    tables = validate_select_query(
+        "SELECT o.id, c.name FROM orders o JOIN customers c ON c.id = o.customer_id;"
+    )
+    assert sorted(tables) == ["customers", "orders"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "DELETE FROM orders",
+        "SELECT 1 FROM orders; DROP TABLE orders",
+        "SELECT * INTO orders_copy FROM orders",
+        "WITH deleted AS (DELETE FROM orders RETURNING *) SELECT * FROM deleted",
+        "SELECT 1",
+    ],
+)
+def test_queries_that_are_not_plain_selects_are_rejected(query):
+    with pytest.raises(ValueError):
+        validate_select_query(query)
@@ -144,37 +144,60 @@ class ScriptGenerator(ast.NodeTransformer):
                         self.predict_function_inputs_and_types[arg.arg] = "Unknown Type"
                 else:
                     self.predict_function_inputs_and_types[arg.arg] = "Unknown Type"
+            # objects are stored with joblib, uncompressed, so the inference script can memory-map their arrays
             s3_upload_code = """
 import boto3
-import pickle
-from io import BytesIO
+import joblib
 import os
+import tempfile
 s3 = boto3.client('s3')
 """
             for var in self.global_vars_to_be_loaded_from_pickle:
                 s3_upload_code += f"""
-buffer = BytesIO()
-pickle.dump({var}, buffer)
-buffer.seek(0)
-s3.upload_fileobj(buffer, 'preloop-ml-objects-{os.getenv('DEPLOY_ENVIRONMENT')}', f'{self.s3_obj_prefix}{{os.getenv("VERSION")}}/{var}.pkl')
+joblib.dump({var}, os.path.join(tempfile.gettempdir(), '{var}.joblib'))
+s3.upload_file(os.path.join(tempfile.gettempdir(), '{var}.joblib'), 'preloop-ml-objects-{os.getenv('DEPLOY_ENVIRONMENT')}', f'{self.s3_obj_prefix}{{os.getenv("VERSION")}}/{var}.joblib')
 """
             s3_upload_nodes = ast.parse(s3_upload_code).body
             return [*s3_upload_nodes, node]
         return node
 
     def generate_inference_script(self):
-        pickled_object_download_code = """
-import boto3
-import pickle
-from io import BytesIO
+        """
+        Generates the inference script, which holds the predict function, the classes and
+        functions it uses, and code that loads the global objects it uses. The objects are
+        downloaded in parallel, once per task, into a directory that every worker loads
+        them from. Their arrays are memory-mapped read-only, so workers share one copy of
+        them instead of each holding their own.
+        """
+        pickled_object_download_code = f"""
+import fcntl
 import os
-s3 = boto3.client('s3')
-class CustomUnpickler(pickle.Unpickler):
-    def find_class(self, module, name):
-        if module == "training_script_module":
-            module = "src.inference"
-        return super().find_class(module, name)
-    """
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+import joblib
+sys.modules.setdefault('training_script_module', sys.modules[__name__])
+def _preloop_load_objects(names):
+    bucket = 'preloop-ml-objects-{os.getenv('DEPLOY_ENVIRONMENT')}'
+    # hosts that load several models set the version in the module, not the environment
+    version = globals().get('__preloop_version__') or os.getenv("VERSION")
+    prefix = f'{self.s3_obj_prefix}{{version}}/'
+    directory = os.path.join(os.getenv('PRELOOP_ARTIFACT_CACHE_DIR', '/tmp/preloop-artifacts'), prefix)
+    os.makedirs(directory, exist_ok=True)
+    s3 = boto3.client('s3')
+    def download(name):
+        path = os.path.join(directory, f'{{name}}.joblib')
+        s3.download_file(bucket, f'{{prefix}}{{name}}.joblib', f'{{path}}.part')
+        os.replace(f'{{path}}.part', path)
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        missing = [name for name in names if not os.path.exists(os.path.join(directory, f'{{name}}.joblib'))]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(16, len(missing))) as pool:
+                list(pool.map(download, missing))
+    mmap_mode = os.getenv('PRELOOP_ARTIFACT_MMAP_MODE', 'r') or None
+    return {{name: joblib.load(os.path.join(directory, f'{{name}}.joblib'), mmap_mode=mmap_mode) for name in names}}
+"""
         functions_and_classes_to_be_defined = set()
         temp_stack = [self.predict_function_name]
         while len(temp_stack) > 0:
@@ -199,13 +222,14 @@ class CustomUnpickler(pickle.Unpickler):
             if name in functions_and_classes_to_be_defined and name in self.script_info.defined_class_names:
                 inference_code_node.body.append(node)
                 functions_and_classes_to_be_defined.remove(name)
-        for var in self.global_vars_to_be_loaded_from_pickle:
+        object_names = sorted(self.global_vars_to_be_loaded_from_pickle)
+        pickled_object_download_code += f"""
+_preloop_objects = _preloop_load_objects({object_names!r})
+"""
+        for var in object_names:
             pickled_object_download_code += f"""
-buffer = BytesIO()
-s3.download_fileobj('preloop-ml-objects-{os.getenv('DEPLOY_ENVIRONMENT')}', f'{self.s3_obj_prefix}{{os.getenv("VERSION")}}/{var}.pkl', buffer)
-buffer.seek(0)
-{var} = CustomUnpickler(buffer).load()
-    """
+{var} = _preloop_objects['{var}']
+"""
         inference_code_node.body.append(ast.parse(pickled_object_download_code))
         for name, node in class_and_function_definitions_dict.items():
             if name in functions_and_classes_to_be_defined:
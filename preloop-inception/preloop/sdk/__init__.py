@@ -1,9 +1,13 @@
 from preloop.sdk.inception.constructs import datasources, feature
 from preloop.sdk.inception.models import (
+    DtypeBackend,
     PostgresAuthParams,
     PostgresConnectionDetails,
     PostgresConnectionParams,
     PostgresDatasource,
+    PostgresQueryConnectionDetails,
+    PostgresQueryConnectionParams,
+    PostgresQueryDatasource,
     S3ConnectionDetails,
     S3Datasource,
 )
@@ -0,0 +1,205 @@
+"""
+Cache of datasource reads, kept per organization so that executions, which each run in a
+new task, don't read a source again while it is unchanged. Reads are stored as uncompressed
+Arrow IPC files under a prefix per organization in PRELOOP_DATASOURCE_CACHE_BUCKET, and
+copied to PRELOOP_DATASOURCE_CACHE_DIR on the storage of the task, where they are memory
+mapped when read. Each organization keeps at most PRELOOP_DATASOURCE_CACHE_MAX_BYTES of
+reads in the bucket, and each task as much on its disk, past which the least recently used
+reads are removed. Without a bucket, or an organization, reads are only cached on the disk
+of the task.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict
+
+import boto3
+import pyarrow as pa
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import ClientError
+
+log = logging.getLogger(__name__)
+s3_client = boto3.client("s3")
+
+
+class DatasourceCache:
+    cache_dir = os.getenv("PRELOOP_DATASOURCE_CACHE_DIR")
+    bucket_name = os.getenv("PRELOOP_DATASOURCE_CACHE_BUCKET")
+    # least recently used entries are removed once the cache grows past this size
+    max_bytes = int(os.getenv("PRELOOP_DATASOURCE_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+    # entries in the bucket are marked as used by rewriting them, at most this often
+    touch_interval = datetime.timedelta(hours=1)
+
+    @staticmethod
+    def enabled() -> bool:
+        return DatasourceCache.cache_dir is not None
+
+    @staticmethod
+    def make_key(datasource_details: Dict[str, Any], source_version: Any, **read_options: Any) -> str:
+        """
+        Returns the cache key for a read. The key covers the datasource fingerprint, the
+        version of the data at the source (e.g. the ETag of an s3 object) and any options
+        that change what is read, such as the columns and filters.
+        """
+        hash_obj = hashlib.sha256()
+        hash_obj.update(json.dumps(datasource_details["connection_details"], sort_keys=True, default=str).encode())
+        hash_obj.update((datasource_details.get("hashed_value") or "").encode())
+        hash_obj.update(json.dumps(source_version, sort_keys=True, default=str).encode())
+        hash_obj.update(repr(sorted(read_options.items())).encode())
+        return hash_obj.hexdigest()
+
+    @staticmethod
+    def _path(key: str) -> str:
+        return os.path.join(DatasourceCache.cache_dir, f"{key}.arrow")
+
+    @staticmethod
+    def _object_key(org_id: Any, key: str) -> str | None:
+        if DatasourceCache.bucket_name is None or org_id is None:
+            return None
+        return f"{org_id}/{key}.arrow"
+
+    @staticmethod
+    def get(key: str, org_id: Any = None) -> pa.Table | None:
+        """
+        Returns the cached read, from the disk of the task or else from the prefix of the
+        organization in the bucket, or None if it isn't cached.
+        """
+        if not DatasourceCache.enabled():
+            return None
+        path = DatasourceCache._path(key)
+        table = DatasourceCache._read(path)
+        if table is None:
+            object_key = DatasourceCache._object_key(org_id, key)
+            if object_key is not None and DatasourceCache._download(object_key, path):
+                table = DatasourceCache._read(path)
+                DatasourceCache.evict()
+        return table
+
+    @staticmethod
+    def _read(path: str) -> pa.Table | None:
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            # the modification time is used as the last access time for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (pa.ArrowInvalid, OSError):
+            log.warning("Removing unreadable datasource cache entry %s", path, exc_info=True)
+            DatasourceCache._remove(path)
+            return None
+        return table
+
+    @staticmethod
+    def _download(object_key: str, path: str) -> bool:
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            last_modified = s3_client.head_object(Bucket=DatasourceCache.bucket_name, Key=object_key)["LastModified"]
+            os.makedirs(DatasourceCache.cache_dir, exist_ok=True)
+            s3_client.download_file(DatasourceCache.bucket_name, object_key, temp_path)
+            os.replace(temp_path, path)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                log.warning("Unable to read datasource cache entry %s", object_key, exc_info=True)
+            DatasourceCache._remove(temp_path)
+            return False
+        except OSError:
+            log.warning("Unable to write datasource cache entry %s", path, exc_info=True)
+            DatasourceCache._remove(temp_path)
+            return False
+        if datetime.datetime.now(datetime.timezone.utc) - last_modified > DatasourceCache.touch_interval:
+            DatasourceCache._touch(object_key)
+        return True
+
+    @staticmethod
+    def _touch(object_key: str) -> None:
+        # copying an object onto itself updates its last modified time, the only time the bucket keeps
+        try:
+            s3_client.copy_object(
+                Bucket=DatasourceCache.bucket_name,
+                Key=object_key,
+                CopySource={"Bucket": DatasourceCache.bucket_name, "Key": object_key},
+                MetadataDirective="REPLACE",
+            )
+        except ClientError:
+            # objects larger than 5 GB can't be copied in one request, and age out instead
+            log.warning("Unable to mark datasource cache entry %s as used", object_key, exc_info=True)
+
+    @staticmethod
+    def put(key: str, table: pa.Table, org_id: Any = None) -> None:
+        if not DatasourceCache.enabled() or table.nbytes > DatasourceCache.max_bytes:
+            return
+        path = DatasourceCache._path(key)
+        # write to a temporary file first so other threads never read a partial entry
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(DatasourceCache.cache_dir, exist_ok=True)
+            with pa.OSFile(temp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(temp_path, path)
+        except OSError:
+            log.warning("Unable to write datasource cache entry %s", path, exc_info=True)
+            DatasourceCache._remove(temp_path)
+            return
+        object_key = DatasourceCache._object_key(org_id, key)
+        if object_key is not None:
+            try:
+                s3_client.upload_file(path, DatasourceCache.bucket_name, object_key)
+            except (ClientError, S3UploadFailedError):
+                log.warning("Unable to upload datasource cache entry %s", object_key, exc_info=True)
+            else:
+                DatasourceCache.evict_organization(org_id)
+        DatasourceCache.evict()
+
+    @staticmethod
+    def evict() -> None:
+        entries = []
+        with os.scandir(DatasourceCache.cache_dir) as directory:
+            for entry in directory:
+                if not entry.name.endswith(".arrow"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= DatasourceCache.max_bytes:
+                break
+            DatasourceCache._remove(path)
+            total_bytes -= size
+
+    @staticmethod
+    def evict_organization(org_id: Any) -> None:
+        """
+        Removes the least recently used reads of the organization from the bucket until
+        they fit in max_bytes.
+        """
+        entries = []
+        paginator = s3_client.get_paginator("list_objects_v2")
+        try:
+            for page in paginator.paginate(Bucket=DatasourceCache.bucket_name, Prefix=f"{org_id}/"):
+                entries.extend(
+                    (entry["LastModified"], entry["Size"], entry["Key"])
+                    for entry in page.get("Contents", [])
+                    if entry["Key"].endswith(".arrow")
+                )
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, object_key in sorted(entries):
+                if total_bytes <= DatasourceCache.max_bytes:
+                    break
+                s3_client.delete_object(Bucket=DatasourceCache.bucket_name, Key=object_key)
+                total_bytes -= size
+        except ClientError:
+            log.warning("Unable to evict the datasource cache entries of %s", org_id, exc_info=True)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
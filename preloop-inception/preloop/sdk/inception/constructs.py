@@ -1,22 +1,25 @@
 import logging
 import os
 import sys
-from typing import Any, List
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
 
 import pandas as pd
 from preloop_private_api_stubs import (
     CreateFeatureRequest,
     ExecutionType,
+    FeatureWriteMode,
     GetDatasourceIdRequest,
     GetFeatureIdRequest,
     InsertFeatureRequest,
     ListDatasourcesRequest,
     PreloopError,
     PreloopPrivateClient,
+    StoreDatasourceWatermarkRequest,
     StoreFeatureDriftRequest,
 )
 
-from preloop.sdk.inception.models import Datasource
+from preloop.sdk.inception.models import Datasource, PostgresDatasource, datasource_concurrency
 
 preloop_client = PreloopPrivateClient()
 log = logging.getLogger(__name__)
@@ -25,6 +28,7 @@ log = logging.getLogger(__name__)
 class datasources:
     created_datasource_ids = []
     created_datasource_names = []
+    declared_datasources: List[Datasource] = []
     decorator_execution_status = False
     decorator_applied_status = False
 
@@ -39,22 +43,63 @@ class datasources:
             raise PreloopError("Datasources decorated function can only be executed once")
         datasources.decorator_execution_status = True
         datasource_list: List[Datasource] = list(self.func(*args, **kwargs))
-        if os.getenv("EXECUTION_TYPE") == ExecutionType.FIRST_RUN.value:
-            for datasource in datasource_list:
-                datasource_id = preloop_client.create_datasource(request=datasource).id
-                datasources.created_datasource_names.append(datasource.datasource_name)
-                datasources.created_datasource_ids.append(datasource_id)
+        datasources.declared_datasources = datasource_list
+        if not datasource_list:
             return datasource_list
-        for datasource in datasource_list:
-            preloop_client.list_datasources(
-                request=ListDatasourcesRequest(
-                    datasource_id=preloop_client.get_datasource_id(
-                        GetDatasourceIdRequest(datasource_name=datasource.datasource_name)
-                    ).details["datasource_id"]
-                )
-            )
+        with ThreadPoolExecutor(max_workers=min(datasource_concurrency, len(datasource_list))) as executor:
+            if os.getenv("EXECUTION_TYPE") == ExecutionType.FIRST_RUN.value:
+                futures = [
+                    executor.submit(preloop_client.create_datasource, request=datasource)
+                    for datasource in datasource_list
+                ]
+            else:
+                futures = [
+                    executor.submit(datasources._validate_datasource, datasource) for datasource in datasource_list
+                ]
+            first_error = None
+            for datasource, future in zip(datasource_list, futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                if os.getenv("EXECUTION_TYPE") == ExecutionType.FIRST_RUN.value:
+                    # record every created datasource, so they are all cleaned up if one fails
+                    datasources.created_datasource_names.append(datasource.datasource_name)
+                    datasources.created_datasource_ids.append(result.id)
+        if first_error is not None:
+            raise first_error
         return datasource_list
 
+    @staticmethod
+    def _validate_datasource(datasource: Datasource) -> None:
+        preloop_client.list_datasources(
+            request=ListDatasourcesRequest(
+                datasource_id=preloop_client.get_datasource_id(
+                    GetDatasourceIdRequest(datasource_name=datasource.datasource_name)
+                ).details["datasource_id"]
+            )
+        )
+
+    @staticmethod
+    def prefetch(read_options: Dict[str, Dict[str, Any]] | None = None, **kwargs: Any) -> Dict[str, Future]:
+        """
+        Starts reading all the datasources returned by the decorated function in parallel
+        and returns a future for each, keyed by datasource name. Keyword arguments are
+        passed on to the get_data of every datasource, and read_options, keyed by datasource
+        name, gives arguments for single datasources that are used instead. Calling get_data
+        with the same arguments returns the prefetched data.
+        """
+        if not datasources.decorator_execution_status:
+            raise PreloopError("Datasources decorated function must be executed before prefetching")
+        read_options = read_options or {}
+        return {
+            datasource.datasource_name: datasource.prefetch(
+                **{**kwargs, **read_options.get(datasource.datasource_name, {})}
+            )
+            for datasource in datasources.declared_datasources
+        }
+
 
 class feature:
     decorator_execution_status = False
@@ -69,6 +114,7 @@ class feature:
         feature_cols: List[str],
         existing_datasource_names: List[str] = None,
         target_cols: List[str] = None,
+        write_mode: FeatureWriteMode = FeatureWriteMode.OVERWRITE,
     ):
         if feature.decorator_applied_status:
             raise Exception("Feature decorator can only be applied to one function")
@@ -79,6 +125,7 @@ class feature:
         self.feature_cols = feature_cols
         self.target_cols = target_cols
         self.existing_datasource_names = existing_datasource_names
+        self.write_mode = FeatureWriteMode(write_mode)
         self.feature_drift_enabled = False if os.getenv("FEATURE_DRIFT_ENABLED").lower() == "false" else True
         self.scheduling_expression = os.getenv("SCHEDULING_EXPRESSION")
         self.versioning = False if os.getenv("VERSIONING").lower() == "false" else True
@@ -153,9 +200,16 @@ class feature:
                 )
                 preloop_client.store_feature_drift(store_feature_drift_request)
             insert_feature_data_request = InsertFeatureRequest(
-                feature_id=feature_id, operation_type=ExecutionType(os.getenv("EXECUTION_TYPE")), data=feature_data
+                feature_id=feature_id,
+                operation_type=ExecutionType(os.getenv("EXECUTION_TYPE")),
+                write_mode=self.write_mode.value,
+                data=feature_data,
             )
             preloop_client.insert_feature(insert_feature_data_request)
+            for watermark in PostgresDatasource.pop_pending_watermarks():
+                preloop_client.store_datasource_watermark(
+                    StoreDatasourceWatermarkRequest(feature_id=feature_id, execution_id=self.execution_id, **watermark)
+                )
             sys.exit(0)
 
         return wrapper
@@ -1,21 +1,479 @@
+import datetime
+import decimal
+import functools
+import inspect
+import io
 import os
+import threading
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
+from typing import Any, ClassVar, Dict, Iterator, List, Tuple
 
 import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from preloop_private_api_stubs import (
+    ExecutionType,
     GetDatasourceIdRequest,
+    GetDatasourceWatermarkRequest,
+    GetFeatureIdRequest,
     ListDatasourcesRequest,
     PreloopPrivateClient,
     SQLAuthParams,
     SQLConnectionDetails,
     SQLConnectionParams,
+    SQLQueryConnectionDetails,
+    SQLQueryConnectionParams,
 )
-from pydantic import BaseModel, Field
+from pyarrow import fs
+from pydantic import BaseModel, Field, PrivateAttr
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.sql.elements import TextClause
+
+from preloop.sdk.inception.cache import DatasourceCache
 
 preloop_client = PreloopPrivateClient()
 s3_client = boto3.client("s3")
+# the number of datasources resolved or read at the same time
+datasource_concurrency = int(os.getenv("PRELOOP_DATASOURCE_CONCURRENCY", 8))
+prefetch_executor = ThreadPoolExecutor(max_workers=datasource_concurrency, thread_name_prefix="preloop-prefetch")
+# prefetched datasources keyed by type and name, so get_data can find the reads started for them
+prefetched_datasources: Dict[Tuple[str, str], "Datasource"] = {}
+prefetched_datasources_lock = threading.Lock()
+
+
+class DtypeBackend(str, Enum):
+    """
+    The dtypes used for the dataframes returned by get_data. PYARROW keeps columns
+    backed by Arrow memory, which avoids object dtype columns for strings.
+    """
+
+    NUMPY = "numpy"
+    NUMPY_NULLABLE = "numpy_nullable"
+    PYARROW = "pyarrow"
+
+
+def _pandas_read_options(dtype_backend: DtypeBackend) -> Dict[str, Any]:
+    if DtypeBackend(dtype_backend) == DtypeBackend.NUMPY:
+        return {}
+    return {"dtype_backend": DtypeBackend(dtype_backend).value}
+
+
+_numpy_nullable_types = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+    pa.uint8(): pd.UInt8Dtype(),
+    pa.uint16(): pd.UInt16Dtype(),
+    pa.uint32(): pd.UInt32Dtype(),
+    pa.uint64(): pd.UInt64Dtype(),
+    pa.float32(): pd.Float32Dtype(),
+    pa.float64(): pd.Float64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+    pa.string(): pd.StringDtype(),
+    pa.large_string(): pd.StringDtype(),
+}
+
+
+def _table_to_pandas(table: pa.Table, dtype_backend: DtypeBackend) -> pd.DataFrame:
+    if DtypeBackend(dtype_backend) == DtypeBackend.PYARROW:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    if DtypeBackend(dtype_backend) == DtypeBackend.NUMPY_NULLABLE:
+        return table.to_pandas(types_mapper=_numpy_nullable_types.get)
+    return table.to_pandas()
+
+
+# operators that can be used in filters pushed into a SQL query, and their SQL form
+_SQL_FILTER_OPERATORS = {
+    "=": "=",
+    "==": "=",
+    "!=": "<>",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "in": "IN",
+    "not in": "NOT IN",
+}
+
+
+def _quote_identifier(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _build_pushdown_query(
+    from_clause: str,
+    columns: List[str] | None,
+    filters: List[Tuple[str, str, Any]] | None,
+    schema_and_types: Dict[str, Any] | None,
+) -> Tuple[TextClause, Dict[str, Any]]:
+    """
+    Builds a SELECT over from_clause that only returns the given columns and rows
+    matching all the filters, so that they are applied by the database. Filter values
+    are always sent as bound parameters.
+    """
+    filters = filters or []
+    for column in (columns or []) + [column for column, _, _ in filters]:
+        if schema_and_types is not None and column not in schema_and_types:
+            raise ValueError(f"{column} is not a column in the datasource")
+    select_list = ", ".join(_quote_identifier(column) for column in columns) if columns else "*"
+    conditions = []
+    parameters = {}
+    expanding_parameters = []
+    for i, (column, operator, value) in enumerate(filters):
+        sql_operator = _SQL_FILTER_OPERATORS.get(operator.lower())
+        if sql_operator is None:
+            raise ValueError(f"Unsupported filter operator {operator}")
+        parameter_name = f"preloop_filter_{i}"
+        if sql_operator in ("IN", "NOT IN"):
+            expanding_parameters.append(bindparam(parameter_name, expanding=True))
+            value = list(value)
+        conditions.append(f"{_quote_identifier(column)} {sql_operator} :{parameter_name}")
+        parameters[parameter_name] = value
+    sql = f"SELECT {select_list} FROM {from_clause}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return text(sql).bindparams(*expanding_parameters), parameters
+
+
+def _postgres_column_type(connection, table_name: str, column_name: str) -> str:
+    # format_type gives the declared type of the column as sql, e.g. timestamp with time zone
+    column_type = connection.execute(
+        text(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = to_regclass(:table_name) AND attname = :column_name AND NOT attisdropped"
+        ),
+        {"table_name": table_name, "column_name": column_name},
+    ).scalar()
+    if column_type is None:
+        raise ValueError(f"{column_name} is not a column in the datasource")
+    return column_type
+
+
+def _build_incremental_query(
+    table_name: str, watermark_column: str, column_type: str | None, watermark_value: str | None
+) -> Tuple[TextClause, Dict[str, Any]]:
+    """
+    Builds a SELECT over table_name that returns the rows at or past the watermark, or all
+    rows without one. The stored watermark is cast to the type of the watermark column, so
+    timestamps and numbers aren't compared as strings. Rows equal to the watermark are read
+    again, as rows committed after the last read can share its value.
+    """
+    if watermark_value is None:
+        return text(f"SELECT * FROM {table_name}"), {}
+    condition = f"{_quote_identifier(watermark_column)} >= CAST(:watermark_value AS {column_type})"
+    return text(f"SELECT * FROM {table_name} WHERE {condition}"), {"watermark_value": watermark_value}
+
+
+def _watermark_to_string(value: Any) -> str:
+    # ISO 8601 keeps the microseconds and time zone of timestamps, which postgres casts back exactly
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _deduplicate_incremental_rows(
+    df: pd.DataFrame, watermark_column: str, id_columns: List[str] | None
+) -> pd.DataFrame:
+    # only the latest row of each id is kept, rows read again at the watermark are replaced by the merge
+    if not id_columns or df.empty:
+        return df
+    return (
+        df.sort_values(watermark_column, kind="stable")
+        .drop_duplicates(subset=id_columns, keep="last")
+        .reset_index(drop=True)
+    )
+
+
+def _begin_read_only(connection) -> None:
+    # the database rejects any write made by the query, like a data modifying WITH clause
+    connection.begin()
+    connection.execute(text("SET TRANSACTION READ ONLY"))
+
+
+def _iter_sql_chunks(
+    connection_string: str, sql: TextClause, parameters: Dict[str, Any], chunksize: int, dtype_backend: DtypeBackend
+) -> Iterator[pd.DataFrame]:
+    # stream_results uses a server side cursor, so only one chunk is held in memory at a time
+    engine = create_engine(connection_string)
+    try:
+        with engine.connect().execution_options(stream_results=True) as connection:
+            _begin_read_only(connection)
+            yield from pd.read_sql_query(
+                sql,
+                connection,
+                params=parameters,
+                chunksize=chunksize,
+                **_pandas_read_options(dtype_backend),
+            )
+    finally:
+        engine.dispose()
+
+
+def _read_sql_query(
+    connection_string: str,
+    sql: TextClause,
+    parameters: Dict[str, Any],
+    chunksize: int | None,
+    dtype_backend: DtypeBackend,
+):
+    """
+    Runs the query in a read only transaction and returns its results as a dataframe, or as
+    an iterator of dataframes with at most chunksize rows each if chunksize is given.
+    """
+    if chunksize is not None:
+        return _iter_sql_chunks(connection_string, sql, parameters, chunksize, dtype_backend)
+    engine = create_engine(connection_string)
+    try:
+        with engine.connect() as connection:
+            _begin_read_only(connection)
+            return pd.read_sql_query(sql, connection, params=parameters, **_pandas_read_options(dtype_backend))
+    finally:
+        engine.dispose()
+
+
+def _postgres_table_version(
+    connection_string: str, table_name: str, schema_name: str | None, watermark_column: str | None
+) -> Dict[str, Any] | None:
+    """
+    Returns values that change whenever rows of a table are inserted, updated or deleted,
+    used to version cached reads, or None if the version of the table can't be read cheaply.
+    Only tables with a watermark column that leads an index are versioned: by the max of
+    that column, read from the index, by the relfilenode of the table, which changes when
+    it is truncated or rewritten, and by the counts of inserted, updated and deleted rows
+    in pg_stat_all_tables. Postgres reports the counts shortly after a write commits, and
+    until then a delete, or an update that doesn't move the watermark, isn't seen.
+    """
+    if watermark_column is None:
+        return None
+    table_query = text(
+        "SELECT c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del, EXISTS ("
+        "SELECT 1 FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+        "WHERE i.indrelid = c.oid AND a.attname = :watermark_column"
+        ") AS indexed FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "LEFT JOIN pg_stat_all_tables s ON s.relid = c.oid "
+        "WHERE c.relname = :table_name AND n.nspname = coalesce(:schema_name, current_schema())"
+    )
+    engine = create_engine(connection_string)
+    try:
+        with engine.connect() as connection:
+            table = (
+                connection.execute(
+                    table_query,
+                    {"table_name": table_name, "schema_name": schema_name, "watermark_column": watermark_column},
+                )
+                .mappings()
+                .first()
+            )
+            # without an index the max of the watermark column takes a scan of the table, and
+            # without statistics deletes aren't seen
+            if table is None or not table["indexed"] or table["n_tup_del"] is None:
+                return None
+            quoted_table_name = _quote_identifier(table_name)
+            if schema_name is not None:
+                quoted_table_name = f"{_quote_identifier(schema_name)}.{quoted_table_name}"
+            watermark = connection.execute(
+                text(f"SELECT max({_quote_identifier(watermark_column)}) FROM {quoted_table_name}")
+            ).scalar()
+    finally:
+        engine.dispose()
+    return {
+        "relfilenode": table["relfilenode"],
+        "watermark": watermark,
+        "inserted": table["n_tup_ins"],
+        "updated": table["n_tup_upd"],
+        "deleted": table["n_tup_del"],
+    }
+
+
+def _iter_table_chunks(table: pa.Table, chunksize: int, dtype_backend: DtypeBackend) -> Iterator[pd.DataFrame]:
+    for batch in table.to_batches(max_chunksize=chunksize):
+        yield _table_to_pandas(pa.Table.from_batches([batch]), dtype_backend)
+
+
+def _cache_dataframe(cache_key: str, df: pd.DataFrame, org_id: Any) -> None:
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # columns with mixed python types can't be stored as arrow, so the read is not cached
+        return
+    DatasourceCache.put(cache_key, table, org_id)
+
+
+def _is_comparable(statistic: Any, value: Any) -> bool:
+    if isinstance(statistic, bool) or isinstance(value, bool):
+        return False
+    if isinstance(statistic, (int, float)) and isinstance(value, (int, float)):
+        return True
+    return isinstance(value, type(statistic)) or isinstance(statistic, type(value))
+
+
+def _row_group_may_match(column_statistics: Dict[str, Dict[str, Any]], filters: List[Tuple[str, str, Any]]) -> bool:
+    """
+    Checks the min and max statistics of a row group against the filters. A row group
+    is only ruled out when its statistics prove that no row can satisfy a filter.
+    """
+    for column, operator, value in filters:
+        statistics = column_statistics.get(column)
+        if statistics is None:
+            continue
+        values = list(value) if operator in ("in", "not in") else [value]
+        if not all(_is_comparable(statistics["min"], v) for v in values):
+            continue
+        try:
+            if operator in ("=", "==", "in"):
+                matches = any(statistics["min"] <= v <= statistics["max"] for v in values)
+            elif operator == "<":
+                matches = statistics["min"] < value
+            elif operator == "<=":
+                matches = statistics["min"] <= value
+            elif operator == ">":
+                matches = statistics["max"] > value
+            elif operator == ">=":
+                matches = statistics["max"] >= value
+            else:
+                matches = True
+        except TypeError:
+            matches = True
+        if not matches:
+            return False
+    return True
+
+
+def _statistic_from_json(value: Any) -> Any:
+    """
+    Restores the type of a row group statistic stored by the Preloop API, which keeps
+    values that aren't JSON numbers or strings as a dictionary of their type and value.
+    """
+    if not isinstance(value, dict):
+        return value
+    if value["type"] == "float":
+        return float(value["value"])
+    if value["type"] == "bytes":
+        return bytes.fromhex(value["value"])
+    if value["type"] == "datetime":
+        return datetime.datetime.fromisoformat(value["value"])
+    if value["type"] == "date":
+        return datetime.date.fromisoformat(value["value"])
+    if value["type"] == "time":
+        return datetime.time.fromisoformat(value["value"])
+    if value["type"] == "decimal":
+        return decimal.Decimal(value["value"])
+    return value["value"]
+
+
+def _row_groups_from_json(row_groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "columns": {
+                column: {"min": _statistic_from_json(statistics["min"]), "max": _statistic_from_json(statistics["max"])}
+                for column, statistics in row_group["columns"].items()
+            }
+        }
+        for row_group in row_groups
+    ]
+
+
+class _S3ObjectFile(io.RawIOBase):
+    """
+    A read-only file over an s3 object, read with ranged GETs that only succeed while the
+    object has the given ETag, so the data read always belongs to the version of the object
+    its metadata was captured from.
+    """
+
+    def __init__(self, bucket_name: str, object_key: str, etag: str, size: int) -> None:
+        super().__init__()
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.etag = etag
+        self.size = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        s3_response = s3_client.get_object(
+            Bucket=self.bucket_name,
+            Key=self.object_key,
+            IfMatch=self.etag,
+            Range=f"bytes={self.position}-{self.position + length - 1}",
+        )
+        data = s3_response["Body"].read()
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def _select_row_groups(row_groups: List[Dict[str, Any]], filters: List[Tuple[str, str, Any]] | None) -> List[int]:
+    if not filters:
+        return list(range(len(row_groups)))
+    return [i for i, row_group in enumerate(row_groups) if _row_group_may_match(row_group["columns"], filters)]
+
+
+def _row_group_statistics(file_metadata: pq.FileMetaData) -> List[Dict[str, Any]]:
+    row_groups = []
+    for i in range(file_metadata.num_row_groups):
+        row_group = file_metadata.row_group(i)
+        column_statistics = {}
+        for j in range(row_group.num_columns):
+            statistics = row_group.column(j).statistics
+            if statistics is None or not statistics.has_min_max:
+                continue
+            column_statistics[row_group.column(j).path_in_schema] = {"min": statistics.min, "max": statistics.max}
+        row_groups.append({"columns": column_statistics})
+    return row_groups
+
+
+def _read_options(get_data, datasource_name: str, args: Tuple, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    # every argument of get_data but the name, with defaults, so equal reads compare equal however they are passed
+    arguments = inspect.signature(get_data).bind(datasource_name, *args, **kwargs)
+    arguments.apply_defaults()
+    return {name: value for name, value in arguments.arguments.items() if name != "datasource_name"}
+
+
+def _serves_prefetched_data(datasource_type: str):
+    """
+    Makes get_data return the result of a read started by Datasource.prefetch, if the
+    datasource was prefetched with the same arguments, instead of reading it again. Each
+    prefetched read is only returned once, since iterators of chunks can't be read twice.
+    """
+
+    def decorator(get_data):
+        @functools.wraps(get_data)
+        def wrapper(datasource_name: str, *args: Any, **kwargs: Any):
+            with prefetched_datasources_lock:
+                datasource = prefetched_datasources.get((datasource_type, datasource_name))
+            if datasource is not None:
+                future = datasource.take_prefetched_data(_read_options(get_data, datasource_name, args, kwargs))
+                if future is not None:
+                    return future.result()
+            return get_data(datasource_name, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
 
 
 class DatasourceType(str, Enum):
@@ -25,6 +483,7 @@ class DatasourceType(str, Enum):
     """
 
     POSTGRES = "postgres"
+    POSTGRES_QUERY = "postgres_query"
     MYSQL = "mysql"
     S3 = "s3"
 
@@ -42,6 +501,15 @@ class PostgresConnectionDetails(SQLConnectionDetails):
     auth_params: PostgresAuthParams
 
 
+class PostgresQueryConnectionParams(SQLQueryConnectionParams):
+    pass
+
+
+class PostgresQueryConnectionDetails(SQLQueryConnectionDetails):
+    connection_params: PostgresQueryConnectionParams
+    auth_params: PostgresAuthParams
+
+
 class S3ConnectionDetails(BaseModel):
     bucket_name: str
     object_key: str
@@ -53,20 +521,83 @@ class Datasource(BaseModel):
         title="The description of the datasource", max_length=400, default="Description of this datasource."
     )
     datasource_type: DatasourceType
-    connection_details: PostgresConnectionDetails | S3ConnectionDetails
+    connection_details: PostgresConnectionDetails | PostgresQueryConnectionDetails | S3ConnectionDetails
     execution_id: uuid.UUID = os.getenv("EXECUTION_ID")
+    # reads started ahead of time by prefetch, with the arguments they were started with
+    _prefetched_data: List[Tuple[Dict[str, Any], Future]] = PrivateAttr(default_factory=list)
 
     @staticmethod
     def get_data(datasource_name: str):
         pass
 
+    def prefetch(self, **kwargs: Any) -> Future:
+        """
+        Starts get_data for the datasource in the background with the given arguments and
+        returns a future with its result. The next get_data call for the datasource with
+        the same arguments returns the prefetched result instead of reading it again, and
+        prefetching with the same arguments before then returns the same future.
+        """
+        get_data = type(self).get_data
+        get_data = getattr(get_data, "__wrapped__", get_data)
+        read_options = _read_options(get_data, self.datasource_name, (), kwargs)
+        with prefetched_datasources_lock:
+            for prefetched_options, future in self._prefetched_data:
+                if prefetched_options == read_options:
+                    return future
+            future = prefetch_executor.submit(get_data, self.datasource_name, **read_options)
+            self._prefetched_data.append((read_options, future))
+            prefetched_datasources[(DatasourceType(self.datasource_type).value, self.datasource_name)] = self
+        return future
+
+    def take_prefetched_data(self, read_options: Dict[str, Any]) -> Future | None:
+        """
+        Returns the future of the read prefetched with the given arguments, if there is one,
+        and forgets it so the next read with the same arguments goes to the datasource.
+        """
+        with prefetched_datasources_lock:
+            for i, (prefetched_options, future) in enumerate(self._prefetched_data):
+                if prefetched_options == read_options:
+                    del self._prefetched_data[i]
+                    return future
+        return None
+
 
 class PostgresDatasource(Datasource):
     datasource_type: DatasourceType = DatasourceType.POSTGRES
     connection_details: PostgresConnectionDetails
+    # watermarks read in this execution, recorded once the feature is inserted. Datasources
+    # can be read from several threads, so the list is only used while holding the lock
+    pending_watermarks: ClassVar[List[Dict[str, Any]]] = []
+    pending_watermarks_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @classmethod
+    def pop_pending_watermarks(cls) -> List[Dict[str, Any]]:
+        """
+        Returns the watermarks read since the last call and clears them.
+        """
+        with cls.pending_watermarks_lock:
+            watermarks = list(cls.pending_watermarks)
+            cls.pending_watermarks.clear()
+        return watermarks
 
     @staticmethod
-    def get_data(datasource_name: str):
+    @_serves_prefetched_data(DatasourceType.POSTGRES.value)
+    def get_data(
+        datasource_name: str,
+        columns: List[str] | None = None,
+        filters: List[Tuple[str, str, Any]] | None = None,
+        chunksize: int | None = None,
+        dtype_backend: DtypeBackend = DtypeBackend.NUMPY,
+    ):
+        """
+        Returns the table as a dataframe. Columns and filters, given as (column, operator,
+        value) tuples that are combined with AND, are applied by the database so only the
+        rows and columns needed are transferred. If chunksize is given, an iterator of
+        dataframes with at most chunksize rows each is returned instead, and rows are
+        streamed from the database so tables larger than memory can be aggregated chunk
+        by chunk. If the datasource has a watermark column that leads an index, reads are
+        served from the datasource cache while the table is unchanged.
+        """
         datasource_id = preloop_client.get_datasource_id(
             GetDatasourceIdRequest(datasource_name=datasource_name)
         ).details["datasource_id"]
@@ -78,20 +609,176 @@ class PostgresDatasource(Datasource):
         if not datasource_details["datasource_type"] == DatasourceType.POSTGRES.value:
             raise TypeError("Datasource must be of type Postgres")
         connection_string = f"postgresql://{connection_details['connection_params']['user_name']}:{connection_details['auth_params']['password']}@{connection_details['connection_params']['host_name']}:{connection_details['connection_params']['port_number']}/{connection_details['connection_params']['database_name']}"
-        df = pd.read_sql_table(
-            connection_details["connection_params"]["table_name"],
-            connection_string,
-            schema=connection_details["connection_params"]["schema_name"],
-        )
+        cache_key = None
+        if DatasourceCache.enabled() and connection_details["connection_params"].get("watermark_column") is not None:
+            source_version = _postgres_table_version(
+                connection_string,
+                connection_details["connection_params"]["table_name"],
+                connection_details["connection_params"]["schema_name"],
+                connection_details["connection_params"].get("watermark_column"),
+            )
+            if source_version is not None:
+                cache_key = DatasourceCache.make_key(
+                    datasource_details, source_version, columns=columns, filters=filters, dtype_backend=dtype_backend
+                )
+                table = DatasourceCache.get(cache_key, datasource_details["org_id"])
+                if table is not None:
+                    if chunksize is not None:
+                        return _iter_table_chunks(table, chunksize, dtype_backend)
+                    return _table_to_pandas(table, dtype_backend)
+        if columns is None and filters is None and chunksize is None:
+            df = pd.read_sql_table(
+                connection_details["connection_params"]["table_name"],
+                connection_string,
+                schema=connection_details["connection_params"]["schema_name"],
+                **_pandas_read_options(dtype_backend),
+            )
+        else:
+            table_name = _quote_identifier(connection_details["connection_params"]["table_name"])
+            if connection_details["connection_params"]["schema_name"] is not None:
+                table_name = f'{_quote_identifier(connection_details["connection_params"]["schema_name"])}.{table_name}'
+            sql, parameters = _build_pushdown_query(
+                table_name, columns, filters, (datasource_details["datasource_details"] or {}).get("schema_and_types")
+            )
+            df = _read_sql_query(connection_string, sql, parameters, chunksize, dtype_backend)
+        # chunked reads are not cached, since they are never held in memory as a whole
+        if cache_key is not None and chunksize is None:
+            _cache_dataframe(cache_key, df, datasource_details["org_id"])
         return df
 
+    @staticmethod
+    def get_incremental_data(datasource_name: str, feature_name: str, id_columns: List[str] | None = None):
+        """
+        Returns the rows of the datasource whose watermark column is at or past the
+        high-water mark recorded by the last successful execution of the given feature.
+        The whole table is returned the first time the feature reads the datasource. Rows
+        at the high-water mark are returned again, so use together with write_mode="merge"
+        on the feature decorator, which replaces the stored rows sharing their id columns.
+        If id_columns are given, only the latest row of each id is returned.
+        """
+        datasource_id = preloop_client.get_datasource_id(
+            GetDatasourceIdRequest(datasource_name=datasource_name)
+        ).details["datasource_id"]
+        datasource_details = preloop_client.list_datasources(
+            ListDatasourcesRequest(datasource_id=datasource_id)
+        ).datasources[0]
+        datasource_details = datasource_details.model_dump()
+        connection_details = datasource_details["connection_details"]
+        if not datasource_details["datasource_type"] == DatasourceType.POSTGRES.value:
+            raise TypeError("Datasource must be of type Postgres")
+        connection_params = connection_details["connection_params"]
+        watermark_column = connection_params.get("watermark_column")
+        if watermark_column is None:
+            raise ValueError("Datasource must have a watermark column to be read incrementally")
+        watermark_value = None
+        if os.getenv("EXECUTION_TYPE") != ExecutionType.FIRST_RUN.value:
+            feature_id = preloop_client.get_feature_id(GetFeatureIdRequest(feature_name=feature_name)).details[
+                "feature_id"
+            ]
+            watermark = preloop_client.get_datasource_watermark(
+                GetDatasourceWatermarkRequest(datasource_id=datasource_id, feature_id=feature_id)
+            ).details
+            if watermark is not None and watermark["watermark_column"] == watermark_column:
+                watermark_value = watermark["watermark_value"]
+        connection_string = f"postgresql://{connection_params['user_name']}:{connection_details['auth_params']['password']}@{connection_params['host_name']}:{connection_params['port_number']}/{connection_params['database_name']}"
+        table_name = _quote_identifier(connection_params["table_name"])
+        if connection_params["schema_name"] is not None:
+            table_name = f'{_quote_identifier(connection_params["schema_name"])}.{table_name}'
+        engine = create_engine(connection_string)
+        try:
+            with engine.connect() as connection:
+                column_type = (
+                    _postgres_column_type(connection, table_name, watermark_column)
+                    if watermark_value is not None
+                    else None
+                )
+                sql, parameters = _build_incremental_query(table_name, watermark_column, column_type, watermark_value)
+                df = pd.read_sql_query(sql, connection, params=parameters)
+        finally:
+            engine.dispose()
+        df = _deduplicate_incremental_rows(df, watermark_column, id_columns)
+        if not df.empty:
+            with PostgresDatasource.pending_watermarks_lock:
+                PostgresDatasource.pending_watermarks.append(
+                    {
+                        "datasource_id": datasource_id,
+                        "watermark_column": watermark_column,
+                        "watermark_value": _watermark_to_string(df[watermark_column].max()),
+                    }
+                )
+        return df
+
+
+class PostgresQueryDatasource(Datasource):
+    datasource_type: DatasourceType = DatasourceType.POSTGRES_QUERY
+    connection_details: PostgresQueryConnectionDetails
+
+    @staticmethod
+    @_serves_prefetched_data(DatasourceType.POSTGRES_QUERY.value)
+    def get_data(
+        datasource_name: str,
+        columns: List[str] | None = None,
+        filters: List[Tuple[str, str, Any]] | None = None,
+        chunksize: int | None = None,
+        dtype_backend: DtypeBackend = DtypeBackend.NUMPY,
+        query_parameters: Dict[str, Any] | None = None,
+    ):
+        """
+        Runs the datasource query in a read only transaction and returns the results as a
+        dataframe. Columns and filters, given as (column, operator, value) tuples that are
+        combined with AND, are added to the query so they are applied by the database. If
+        chunksize is given, an iterator of dataframes with at most chunksize rows each is
+        returned instead. Values in query_parameters replace the values of the query
+        parameters stored with the datasource for this read.
+        """
+        datasource_id = preloop_client.get_datasource_id(
+            GetDatasourceIdRequest(datasource_name=datasource_name)
+        ).details["datasource_id"]
+        datasource_details = preloop_client.list_datasources(
+            ListDatasourcesRequest(datasource_id=datasource_id)
+        ).datasources[0]
+        datasource_details = datasource_details.model_dump()
+        connection_details = datasource_details["connection_details"]
+        if not datasource_details["datasource_type"] == DatasourceType.POSTGRES_QUERY.value:
+            raise TypeError("Datasource must be of type Postgres query")
+        connection_params = connection_details["connection_params"]
+        connection_string = f"postgresql://{connection_params['user_name']}:{connection_details['auth_params']['password']}@{connection_params['host_name']}:{connection_params['port_number']}/{connection_params['database_name']}"
+        query = connection_params["query"].strip().rstrip(";")
+        sql, parameters = _build_pushdown_query(
+            f"({query}) AS preloop_query",
+            columns,
+            filters,
+            (datasource_details["datasource_details"] or {}).get("schema_and_types"),
+        )
+        parameters = {**(connection_params["query_parameters"] or {}), **(query_parameters or {}), **parameters}
+        return _read_sql_query(connection_string, sql, parameters, chunksize, dtype_backend)
+
 
 class S3Datasource(Datasource):
     datasource_type: DatasourceType = DatasourceType.S3
     connection_details: S3ConnectionDetails
 
     @staticmethod
-    def get_data(datasource_name: str):
+    @_serves_prefetched_data(DatasourceType.S3.value)
+    def get_data(
+        datasource_name: str,
+        columns: List[str] | None = None,
+        filters: List[Tuple[str, str, Any]] | None = None,
+        chunksize: int | None = None,
+        dtype_backend: DtypeBackend = DtypeBackend.NUMPY,
+        lazy: bool = False,
+    ):
+        """
+        Returns the s3 object as a dataframe. Only the given columns are read, and filters
+        are given as (column, operator, value) tuples that are combined with AND. For parquet
+        objects, row groups whose statistics rule out the filters are never downloaded. Every
+        read of the object requires its ETag to be unchanged since the read started, and the
+        object is not downloaded at all if the same read is in the datasource cache.
+
+        If chunksize is given, an iterator of dataframes with at most chunksize rows each is
+        returned instead. If lazy is True, a pyarrow dataset is returned and nothing is read
+        until it is scanned, e.g. with dataset.to_batches(columns=..., filter=...).
+        """
         datasource_id = preloop_client.get_datasource_id(
             GetDatasourceIdRequest(datasource_name=datasource_name)
         ).details["datasource_id"]
@@ -102,13 +789,104 @@ class S3Datasource(Datasource):
         connection_details = datasource_details["connection_details"]
         if not datasource_details["datasource_type"] == DatasourceType.S3.value:
             raise TypeError("Datasource must be of type S3")
-        s3_response = s3_client.get_object(
-            Bucket=connection_details["bucket_name"], Key=connection_details["object_key"]
-        )
-        if connection_details["object_key"].split(".")[-1] == "csv":
-            df = pd.read_csv(s3_response["Body"])
-        elif connection_details["object_key"].split(".")[-1] == "parquet":
-            df = pd.read_parquet(s3_response["Body"])
-        else:
+        bucket_name = connection_details["bucket_name"]
+        object_key = connection_details["object_key"]
+        file_type = object_key.split(".")[-1]
+        if file_type not in ("csv", "parquet"):
             raise ValueError("Unsupported file type")
-        return df
+
+        if lazy:
+            if columns is not None or filters is not None:
+                raise ValueError("Columns and filters are applied when scanning a lazily read dataset")
+            return ds.dataset(
+                f"{bucket_name}/{object_key}",
+                format=file_type,
+                filesystem=fs.S3FileSystem(region=fs.resolve_s3_region(bucket_name)),
+            )
+
+        object_head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        etag = object_head["ETag"].strip('"')
+        object_size = object_head["ContentLength"]
+        disk_cache_key = DatasourceCache.make_key(datasource_details, etag, columns=columns, filters=filters)
+        if chunksize is not None:
+            table = DatasourceCache.get(disk_cache_key, datasource_details["org_id"])
+            if table is not None:
+                return _iter_table_chunks(table, chunksize, dtype_backend)
+            return S3Datasource._iter_chunks(
+                bucket_name,
+                object_key,
+                etag,
+                object_size,
+                datasource_details["datasource_details"],
+                columns,
+                filters,
+                chunksize,
+                dtype_backend,
+            )
+
+        table = DatasourceCache.get(disk_cache_key, datasource_details["org_id"])
+        if table is not None:
+            return _table_to_pandas(table, dtype_backend)
+
+        if file_type == "csv":
+            s3_response = s3_client.get_object(Bucket=bucket_name, Key=object_key, IfMatch=etag)
+            table = pa.Table.from_pandas(pd.read_csv(s3_response["Body"], usecols=columns), preserve_index=False)
+        else:
+            with _S3ObjectFile(bucket_name, object_key, etag, object_size) as s3_file:
+                parquet_file = pq.ParquetFile(s3_file, pre_buffer=True)
+                row_groups = S3Datasource._row_groups_to_read(
+                    parquet_file, etag, datasource_details["datasource_details"], filters
+                )
+                table = parquet_file.read_row_groups(row_groups, columns=columns, use_pandas_metadata=True)
+        if filters:
+            table = table.filter(pq.filters_to_expression(filters))
+        DatasourceCache.put(disk_cache_key, table, datasource_details["org_id"])
+        return _table_to_pandas(table, dtype_backend)
+
+    @staticmethod
+    def _row_groups_to_read(
+        parquet_file: pq.ParquetFile,
+        etag: str,
+        object_metadata: Dict[str, Any] | None,
+        filters: List[Tuple[str, str, Any]] | None,
+    ) -> List[int]:
+        # the statistics captured on creation are only valid while the ETag is unchanged
+        object_metadata = object_metadata or {}
+        if object_metadata.get("etag") == etag and "row_groups" in object_metadata:
+            return _select_row_groups(_row_groups_from_json(object_metadata["row_groups"]), filters)
+        return _select_row_groups(_row_group_statistics(parquet_file.metadata), filters)
+
+    @staticmethod
+    def _iter_chunks(
+        bucket_name: str,
+        object_key: str,
+        etag: str,
+        object_size: int,
+        object_metadata: Dict[str, Any] | None,
+        columns: List[str] | None,
+        filters: List[Tuple[str, str, Any]] | None,
+        chunksize: int,
+        dtype_backend: DtypeBackend,
+    ) -> Iterator[pd.DataFrame]:
+        expression = pq.filters_to_expression(filters) if filters else None
+        if object_key.endswith(".csv"):
+            s3_response = s3_client.get_object(Bucket=bucket_name, Key=object_key, IfMatch=etag)
+            for chunk in pd.read_csv(
+                s3_response["Body"], usecols=columns, chunksize=chunksize, **_pandas_read_options(dtype_backend)
+            ):
+                if expression is not None:
+                    chunk = _table_to_pandas(
+                        pa.Table.from_pandas(chunk, preserve_index=False).filter(expression), dtype_backend
+                    )
+                yield chunk
+            return
+        with _S3ObjectFile(bucket_name, object_key, etag, object_size) as s3_file:
+            parquet_file = pq.ParquetFile(s3_file)
+            row_groups = S3Datasource._row_groups_to_read(parquet_file, etag, object_metadata, filters)
+            for batch in parquet_file.iter_batches(
+                batch_size=chunksize, row_groups=row_groups, columns=columns, use_pandas_metadata=True
+            ):
+                table = pa.Table.from_batches([batch])
+                if expression is not None:
+                    table = table.filter(expression)
+                yield _table_to_pandas(table, dtype_backend)
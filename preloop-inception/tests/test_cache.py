@@ -0,0 +1,170 @@
+"""Unit tests for the datasource cache"""
+import datetime
+import os
+import shutil
+
+import pyarrow as pa
+import pytest
+from botocore.exceptions import ClientError
+
+from preloop.sdk.inception import cache, models
+from preloop.sdk.inception.cache import DatasourceCache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(DatasourceCache, "cache_dir", str(tmp_path))
+    return tmp_path
+
+
+class FakeBucket:
+    def __init__(self, directory) -> None:
+        self.directory = directory
+        self.last_modified = {}
+        self.copies = []
+
+    def _path(self, key: str):
+        return self.directory / key.replace("/", "--")
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.last_modified:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"LastModified": self.last_modified[Key]}
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copyfile(self._path(Key), Filename)
+
+    def upload_file(self, Filename, Bucket, Key):
+        shutil.copyfile(Filename, self._path(Key))
+        self.last_modified[Key] = datetime.datetime.now(datetime.timezone.utc)
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective):
+        self.copies.append(Key)
+        self.last_modified[Key] = datetime.datetime.now(datetime.timezone.utc)
+
+    def delete_object(self, Bucket, Key):
+        self._path(Key).unlink()
+        del self.last_modified[Key]
+
+    def get_paginator(self, operation_name):
+        bucket = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                contents = [
+                    {"Key": key, "LastModified": last_modified, "Size": bucket._path(key).stat().st_size}
+                    for key, last_modified in bucket.last_modified.items()
+                    if key.startswith(Prefix)
+                ]
+                yield {"Contents": contents}
+
+        return Paginator()
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    bucket_dir = tmp_path / "bucket"
+    bucket_dir.mkdir()
+    fake_bucket = FakeBucket(bucket_dir)
+    monkeypatch.setattr(cache, "s3_client", fake_bucket)
+    monkeypatch.setattr(DatasourceCache, "bucket_name", "preloop-datasource-cache")
+    return fake_bucket
+
+
+def new_task_dir(tmp_path, monkeypatch, name: str):
+    task_dir = tmp_path / name
+    monkeypatch.setattr(DatasourceCache, "cache_dir", str(task_dir))
+    return task_dir
+
+
+def datasource_details(hashed_value: str = "hash"):
+    return {"connection_details": {"bucket_name": "bucket", "object_key": "key.parquet"}, "hashed_value": hashed_value}
+
+
+def test_cache_is_disabled_without_a_directory(monkeypatch):
+    monkeypatch.setattr(DatasourceCache, "cache_dir", None)
+    DatasourceCache.put("key", pa.table({"a": [1]}))
+    assert DatasourceCache.get("key") is None
+
+
+def test_cached_tables_are_read_back(cache_dir):
+    table = pa.table({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+    DatasourceCache.put("key", table)
+    assert DatasourceCache.get("key").equals(table)
+    assert DatasourceCache.get("missing") is None
+
+
+def test_keys_change_with_the_source_version_and_read_options():
+    key = DatasourceCache.make_key(datasource_details(), "etag", columns=["a"])
+    assert key == DatasourceCache.make_key(datasource_details(), "etag", columns=["a"])
+    assert key != DatasourceCache.make_key(datasource_details(), "new-etag", columns=["a"])
+    assert key != DatasourceCache.make_key(datasource_details(), "etag", columns=["b"])
+    assert key != DatasourceCache.make_key(datasource_details("other"), "etag", columns=["a"])
+
+
+def test_least_recently_used_entries_are_evicted(cache_dir, monkeypatch):
+    table = pa.table({"a": list(range(1000))})
+    DatasourceCache.put("old", table)
+    DatasourceCache.put("recent", table)
+    os.utime(cache_dir / "old.arrow", (0, 0))
+    monkeypatch.setattr(DatasourceCache, "max_bytes", os.path.getsize(cache_dir / "recent.arrow") * 2)
+
+    DatasourceCache.put("new", table)
+
+    assert DatasourceCache.get("old") is None
+    assert DatasourceCache.get("recent") is not None
+    assert DatasourceCache.get("new") is not None
+
+
+def test_unreadable_entries_are_removed(cache_dir):
+    (cache_dir / "broken.arrow").write_bytes(b"not arrow")
+    assert DatasourceCache.get("broken") is None
+    assert not (cache_dir / "broken.arrow").exists()
+
+
+def test_postgres_tables_without_a_watermark_column_are_not_versioned():
+    assert models._postgres_table_version("postgresql://user@localhost/db", "orders", None, None) is None
+
+
+def test_reads_cached_by_a_task_are_served_to_later_tasks_of_the_organization(tmp_path, monkeypatch, bucket):
+    table = pa.table({"a": [1, 2, 3]})
+    new_task_dir(tmp_path, monkeypatch, "first-task")
+    DatasourceCache.put("key", table, "org")
+
+    new_task_dir(tmp_path, monkeypatch, "second-task")
+    assert DatasourceCache.get("key", "other-org") is None
+    assert DatasourceCache.get("key", "org").equals(table)
+    assert (tmp_path / "second-task" / "key.arrow").exists()
+
+
+def test_reads_without_an_organization_stay_on_the_task(tmp_path, monkeypatch, bucket):
+    new_task_dir(tmp_path, monkeypatch, "task")
+    DatasourceCache.put("key", pa.table({"a": [1]}), None)
+    assert bucket.last_modified == {}
+
+
+def test_entries_read_from_the_bucket_are_marked_as_used(tmp_path, monkeypatch, bucket):
+    new_task_dir(tmp_path, monkeypatch, "first-task")
+    DatasourceCache.put("old", pa.table({"a": [1]}), "org")
+    DatasourceCache.put("recent", pa.table({"a": [1]}), "org")
+    bucket.last_modified["org/old.arrow"] -= datetime.timedelta(days=1)
+
+    new_task_dir(tmp_path, monkeypatch, "second-task")
+    DatasourceCache.get("old", "org")
+    DatasourceCache.get("recent", "org")
+
+    assert bucket.copies == ["org/old.arrow"]
+
+
+def test_least_recently_used_entries_of_an_organization_are_evicted(tmp_path, monkeypatch, bucket):
+    table = pa.table({"a": list(range(1000))})
+    new_task_dir(tmp_path, monkeypatch, "task")
+    DatasourceCache.put("other-org", table, "other")
+    DatasourceCache.put("old", table, "org")
+    DatasourceCache.put("recent", table, "org")
+    bucket.last_modified["org/old.arrow"] -= datetime.timedelta(days=1)
+    monkeypatch.setattr(DatasourceCache, "max_bytes", os.path.getsize(tmp_path / "task" / "recent.arrow") * 2)
+
+    DatasourceCache.put("new", table, "org")
+
+    assert sorted(bucket.last_modified) == ["org/new.arrow", "org/recent.arrow", "other/other-org.arrow"]
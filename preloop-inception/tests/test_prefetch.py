@@ -0,0 +1,60 @@
+"""Unit tests for prefetching datasources"""
+import pytest
+
+from preloop.sdk.inception import models
+from preloop.sdk.inception.constructs import datasources
+from preloop.sdk.inception.models import PostgresDatasource, S3Datasource
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    reads = []
+
+    def get_data(datasource_name, columns=None, filters=None, chunksize=None, dtype_backend="numpy", lazy=False):
+        reads.append((datasource_name, columns))
+        return f"{datasource_name}:{columns}"
+
+    monkeypatch.setattr(S3Datasource, "get_data", staticmethod(models._serves_prefetched_data("s3")(get_data)))
+    monkeypatch.setattr(models, "prefetched_datasources", {})
+    return reads
+
+
+def s3_datasource(name: str) -> S3Datasource:
+    return S3Datasource(
+        datasource_name=name, connection_details={"bucket_name": "bucket", "object_key": f"{name}.parquet"}
+    )
+
+
+def test_get_data_returns_the_prefetched_read_once(reads):
+    datasource = s3_datasource("orders")
+    future = datasource.prefetch(columns=["id"])
+
+    assert datasource.prefetch(columns=["id"]) is future
+    assert S3Datasource.get_data("orders", ["id"]) == "orders:['id']"
+    assert S3Datasource.get_data("orders", columns=["id"]) == "orders:['id']"
+    assert reads == [("orders", ["id"]), ("orders", ["id"])]
+
+
+def test_get_data_with_other_arguments_reads_the_datasource(reads):
+    s3_datasource("orders").prefetch(columns=["id"])
+
+    assert S3Datasource.get_data("orders") == "orders:None"
+    assert S3Datasource.get_data("orders", columns=["id"]) == "orders:['id']"
+    assert len(reads) == 2
+
+
+def test_datasources_are_prefetched_with_their_own_read_options(reads, monkeypatch):
+    monkeypatch.setattr(datasources, "decorator_execution_status", True)
+    monkeypatch.setattr(datasources, "declared_datasources", [s3_datasource("orders"), s3_datasource("users")])
+
+    futures = datasources.prefetch(read_options={"users": {"columns": ["name"]}}, columns=["id"])
+
+    assert futures["orders"].result() == "orders:['id']"
+    assert futures["users"].result() == "users:['name']"
+
+
+def test_prefetched_reads_are_kept_per_datasource_type(reads, monkeypatch):
+    monkeypatch.setattr(PostgresDatasource, "get_data", staticmethod(lambda datasource_name: "postgres"))
+    s3_datasource("orders").prefetch()
+
+    assert PostgresDatasource.get_data("orders") == "postgres"
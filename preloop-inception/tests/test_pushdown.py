@@ -0,0 +1,94 @@
+"""Unit tests for the reads of query-based Postgres datasources"""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from preloop.sdk.inception import models
+from preloop.sdk.inception.models import PostgresQueryDatasource, _begin_read_only, _build_pushdown_query
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def begin(self):
+        self.calls.append("BEGIN")
+
+    def execute(self, statement):
+        self.calls.append(str(statement))
+
+
+class FakeDatasource:
+    def model_dump(self):
+        return {
+            "datasource_type": "postgres_query",
+            "datasource_details": {"schema_and_types": {"id": "integer", "country": "text"}},
+            "connection_details": {
+                "connection_params": {
+                    "user_name": "user",
+                    "host_name": "localhost",
+                    "port_number": 5432,
+                    "database_name": "db",
+                    "query": "SELECT * FROM orders WHERE created_at >= :since;",
+                    "query_parameters": {"since": "2024-01-01", "limit": 10},
+                },
+                "auth_params": {"password": "password"},
+            },
+        }
+
+
+class FakeClient:
+    def get_datasource_id(self, request):
+        return SimpleNamespace(details={"datasource_id": str(uuid.uuid4())})
+
+    def list_datasources(self, request):
+        return SimpleNamespace(datasources=[FakeDatasource()])
+
+
+def test_pushdown_query_selects_columns_and_binds_filters():
+    sql, parameters = _build_pushdown_query(
+        '"orders"', ["id", "country"], [("id", ">", 5), ("country", "in", ("DE", "FR"))], None
+    )
+    assert str(sql) == (
+        'SELECT "id", "country" FROM "orders" WHERE "id" > :preloop_filter_0 '
+        'AND "country" IN (__[POSTCOMPILE_preloop_filter_1])'
+    )
+    assert parameters == {"preloop_filter_0": 5, "preloop_filter_1": ["DE", "FR"]}
+
+
+def test_pushdown_query_rejects_unknown_columns_and_operators():
+    with pytest.raises(ValueError, match="not a column"):
+        _build_pushdown_query('"orders"', ["missing"], None, {"id": "integer"})
+    with pytest.raises(ValueError, match="Unsupported filter operator"):
+        _build_pushdown_query('"orders"', None, [("id", "like", "1%")], None)
+
+
+def test_pushdown_query_quotes_identifiers():
+    sql, _ = _build_pushdown_query('"orders"', ['a"; DROP TABLE orders; --'], None, None)
+    assert str(sql) == 'SELECT "a""; DROP TABLE orders; --" FROM "orders"'
+
+
+def test_reads_run_in_a_read_only_transaction():
+    connection = FakeConnection()
+    _begin_read_only(connection)
+    assert connection.calls == ["BEGIN", "SET TRANSACTION READ ONLY"]
+
+
+def test_query_parameters_are_overridden_per_read(monkeypatch):
+    reads = []
+    monkeypatch.setattr(models, "preloop_client", FakeClient())
+    monkeypatch.setattr(
+        models,
+        "_read_sql_query",
+        lambda connection_string, sql, parameters, *args: reads.append((str(sql), parameters)),
+    )
+
+    PostgresQueryDatasource.get_data("orders", filters=[("id", "=", 1)], query_parameters={"since": "2024-03-01"})
+
+    sql, parameters = reads[0]
+    assert sql == (
+        "SELECT * FROM (SELECT * FROM orders WHERE created_at >= :since) AS preloop_query "
+        'WHERE "id" = :preloop_filter_0'
+    )
+    assert parameters == {"since": "2024-03-01", "limit": 10, "preloop_filter_0": 1}
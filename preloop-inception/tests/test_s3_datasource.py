@@ -0,0 +1,74 @@
+"""Unit tests for the reads of S3 datasources"""
+import datetime
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from botocore.exceptions import ClientError
+
+from preloop.sdk.inception import models
+from preloop.sdk.inception.models import _row_groups_from_json, _S3ObjectFile, _select_row_groups
+
+
+class FakeS3Client:
+    def __init__(self, data: bytes, etag: str) -> None:
+        self.data = data
+        self.etag = etag
+        self.requests = []
+
+    def get_object(self, Bucket, Key, IfMatch, Range):
+        self.requests.append(Range)
+        if IfMatch != self.etag:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+        start, end = Range.removeprefix("bytes=").split("-")
+        return {"Body": io.BytesIO(self.data[int(start) : int(end) + 1])}
+
+
+@pytest.fixture
+def parquet_bytes():
+    table = pa.table({"id": list(range(100)), "value": [float(i) for i in range(100)]})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, row_group_size=10)
+    return buffer.getvalue()
+
+
+def test_object_file_reads_the_object_with_if_match(monkeypatch, parquet_bytes):
+    s3_client = FakeS3Client(parquet_bytes, "etag")
+    monkeypatch.setattr(models, "s3_client", s3_client)
+
+    with _S3ObjectFile("bucket", "key.parquet", "etag", len(parquet_bytes)) as s3_file:
+        parquet_file = pq.ParquetFile(s3_file, pre_buffer=True)
+        table = parquet_file.read_row_groups([3], columns=["id"])
+
+    assert table.column("id").to_pylist() == list(range(30, 40))
+    assert all(request.startswith("bytes=") for request in s3_client.requests)
+
+
+def test_object_file_fails_when_the_object_changed(monkeypatch, parquet_bytes):
+    monkeypatch.setattr(models, "s3_client", FakeS3Client(parquet_bytes, "new-etag"))
+
+    with pytest.raises(ClientError):
+        with _S3ObjectFile("bucket", "key.parquet", "etag", len(parquet_bytes)) as s3_file:
+            pq.ParquetFile(s3_file)
+
+
+def test_row_groups_from_the_api_are_pruned_by_typed_statistics():
+    row_groups = [
+        {
+            "columns": {
+                "created_at": {
+                    "min": {"type": "datetime", "value": f"2024-03-0{day}T00:00:00"},
+                    "max": {"type": "datetime", "value": f"2024-03-0{day}T23:59:59"},
+                    "null_count": 0,
+                }
+            }
+        }
+        for day in range(1, 4)
+    ]
+
+    selected = _select_row_groups(
+        _row_groups_from_json(row_groups), [("created_at", ">=", datetime.datetime(2024, 3, 2, 12))]
+    )
+
+    assert selected == [1, 2]
@@ -0,0 +1,73 @@
+"""Unit tests for the incremental reads of Postgres datasources"""
+import datetime
+import threading
+
+import pandas as pd
+
+from preloop.sdk.inception.models import (
+    PostgresDatasource,
+    _build_incremental_query,
+    _deduplicate_incremental_rows,
+    _watermark_to_string,
+)
+
+
+def test_incremental_query_reads_everything_without_a_watermark():
+    sql, parameters = _build_incremental_query('"public"."events"', "updated_at", None, None)
+    assert str(sql) == 'SELECT * FROM "public"."events"'
+    assert parameters == {}
+
+
+def test_incremental_query_casts_the_watermark_to_the_column_type():
+    sql, parameters = _build_incremental_query(
+        '"events"', "updated_at", "timestamp with time zone", "2024-03-01T10:00:00+00:00"
+    )
+    assert str(sql) == (
+        'SELECT * FROM "events" WHERE "updated_at" >= CAST(:watermark_value AS timestamp with time zone)'
+    )
+    assert parameters == {"watermark_value": "2024-03-01T10:00:00+00:00"}
+
+
+def test_incremental_query_quotes_the_watermark_column():
+    sql, _ = _build_incremental_query('"events"', 'odd"name', "bigint", "10")
+    assert '"odd""name" >= ' in str(sql)
+
+
+def test_watermark_to_string_keeps_timestamps_exact():
+    timestamp = pd.Timestamp("2024-03-01 10:00:00.123456", tz="UTC")
+    assert _watermark_to_string(timestamp) == "2024-03-01T10:00:00.123456+00:00"
+    assert _watermark_to_string(datetime.date(2024, 3, 1)) == "2024-03-01"
+    assert _watermark_to_string(42) == "42"
+
+
+def test_deduplicate_keeps_the_latest_row_of_each_id():
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 1],
+            "updated_at": pd.to_datetime(["2024-03-02", "2024-03-01", "2024-03-01"]),
+            "value": ["new", "only", "old"],
+        }
+    )
+    deduplicated = _deduplicate_incremental_rows(df, "updated_at", ["id"])
+    assert sorted(deduplicated["value"]) == ["new", "only"]
+
+
+def test_deduplicate_without_id_columns_returns_the_rows():
+    df = pd.DataFrame({"id": [1, 1], "updated_at": [1, 2]})
+    assert _deduplicate_incremental_rows(df, "updated_at", None) is df
+
+
+def test_pop_pending_watermarks_clears_them():
+    PostgresDatasource.pop_pending_watermarks()
+
+    def record(i):
+        with PostgresDatasource.pending_watermarks_lock:
+            PostgresDatasource.pending_watermarks.append({"watermark_value": str(i)})
+
+    threads = [threading.Thread(target=record, args=(i,)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(PostgresDatasource.pop_pending_watermarks()) == 50
+    assert PostgresDatasource.pop_pending_watermarks() == []
@@ -0,0 +1,81 @@
+"""
+Throughput of datasource downloads through PreloopPrivateClient.get_datasource, served by a
+local stub server, for parquet payloads from 1 MB to 5 GB and each way the response can be
+read: in memory, into download_path, and into a memory mapped temporary file. Run from the
+root of the package:
+
+    python -m benchmarks.download_throughput --sizes 1MB 100MB 1GB --modes download_path memory_map
+
+Reading 5 GB in memory needs several times that in RAM, so pick the sizes and modes that
+fit the machine.
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from benchmarks.stub_server import StubServer
+from preloop_private_api_stubs import GetDatasourceRequest, PreloopPrivateClient
+from preloop_private_api_stubs.api_paths import DatasourceAPIPaths
+
+SIZES = {"1MB": 1 << 20, "10MB": 10 << 20, "100MB": 100 << 20, "1GB": 1 << 30, "5GB": 5 << 30}
+MODES = ("in_memory", "download_path", "memory_map")
+ROW_GROUP_ROWS = 1 << 17
+
+
+def write_parquet(path: str, size: int) -> None:
+    """
+    Writes an uncompressed parquet file of roughly size bytes, one row group of random
+    float columns at a time, so that even the largest payloads never have to fit in memory.
+    """
+    rng = np.random.default_rng(0)
+    row_group = pa.table({f"column_{i}": rng.random(ROW_GROUP_ROWS) for i in range(8)})
+    rows = max(size // (row_group.nbytes // ROW_GROUP_ROWS), 1)
+    with pq.ParquetWriter(path, row_group.schema, compression="NONE", use_dictionary=False) as writer:
+        while rows > 0:
+            writer.write_table(row_group.slice(0, min(rows, ROW_GROUP_ROWS)))
+            rows -= ROW_GROUP_ROWS
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=list(SIZES))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--repeat", type=int, default=3, help="downloads per size and mode, the fastest is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir, StubServer() as server:
+        path = DatasourceAPIPaths.DATASOURCE_GET.value
+        client = PreloopPrivateClient(endpoint_url=server.endpoint_url, key_id="key", secret="secret")
+        request = GetDatasourceRequest(datasource_id=uuid.uuid4())
+        payload_path = os.path.join(temp_dir, "payload.parquet")
+        download_path = os.path.join(temp_dir, "download.parquet")
+        server.add_file(path, payload_path)
+        print(f"{'size':>6} {'mode':<14} {'seconds':>9} {'MB/s':>9} {'max rss MB':>11}")
+        for size_name in args.sizes:
+            write_parquet(payload_path, SIZES[size_name])
+            payload_mb = os.path.getsize(payload_path) / (1 << 20)
+            for mode in args.modes:
+                best = float("inf")
+                for _ in range(args.repeat):
+                    started_at = time.perf_counter()
+                    df = client.get_datasource(
+                        request,
+                        download_path=download_path if mode == "download_path" else None,
+                        memory_map=mode == "memory_map",
+                    )
+                    best = min(best, time.perf_counter() - started_at)
+                    del df
+                # the peak resident size of the process so far, in KB on linux
+                max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                print(f"{size_name:>6} {mode:<14} {best:9.3f} {payload_mb / best:9.1f} {max_rss_mb:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Per-call latency of PreloopPrivateClient against a local stub server, compared with a new
+connection per call, which is what calling requests.post directly does. Run from the root
+of the package:
+
+    python -m benchmarks.session_latency --calls 500 --tls
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Callable, List
+
+import requests
+
+from benchmarks.stub_server import StubServer
+from preloop_private_api_stubs import GetDatasourceIdRequest, PreloopPrivateClient
+from preloop_private_api_stubs.api_paths import DatasourceAPIPaths
+
+
+def time_calls(call: Callable[[], None], calls: int) -> List[float]:
+    call()
+    latencies = []
+    for _ in range(calls):
+        started_at = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    latencies = sorted(latencies)
+    print(
+        f"{name:<28} mean {statistics.mean(latencies) * 1e3:7.3f} ms   "
+        f"p50 {latencies[len(latencies) // 2] * 1e3:7.3f} ms   "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:7.3f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--tls", action="store_true", help="serve over TLS, so every new connection pays a handshake")
+    args = parser.parse_args()
+
+    with StubServer(tls=args.tls) as server:
+        path = DatasourceAPIPaths.DATASOURCE_GET_ID.value
+        server.add_json(path, json.dumps({"message": "", "details": {"datasource_id": "id"}}).encode())
+        request = GetDatasourceIdRequest(datasource_name="datasource")
+        client = PreloopPrivateClient(
+            endpoint_url=server.endpoint_url, key_id="key", secret="secret", metadata_cache_ttl=0
+        )
+        if server.cert_file is not None:
+            # requests takes the CA bundle from the environment over the verify setting of a session
+            os.environ["REQUESTS_CA_BUNDLE"] = server.cert_file
+
+        def new_connection_call() -> None:
+            response = requests.post(
+                f"{server.endpoint_url}{path}",
+                headers=client.headers,
+                json=request.model_dump(),
+            )
+            response.raise_for_status()
+
+        print(f"{args.calls} calls to {path} over {'https' if args.tls else 'http'}")
+        report("new connection per call", time_calls(new_connection_call, args.calls))
+        report("PreloopPrivateClient", time_calls(lambda: client.get_datasource_id(request), args.calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Local stand-in for the Preloop API, used by the benchmarks. Every request is answered with
+the JSON body or the file registered for its path, over keep-alive HTTP/1.1 connections,
+optionally with TLS so the cost of new handshakes shows up in the timings.
+"""
+import http.server
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+from typing import Dict
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, which Nagle's algorithm would hold back on a
+    # kept-alive connection until the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def _respond(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        file_path = self.server.file_responses.get(self.path)
+        if file_path is not None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(file_path)))
+            self.end_headers()
+            with open(file_path, "rb") as file:
+                shutil.copyfileobj(file, self.wfile, 8 * 1024 * 1024)
+            return
+        body = self.server.json_responses.get(self.path, b"{}")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class StubServer:
+    """
+    Serves the registered responses on a free local port for as long as it is open.
+    """
+
+    def __init__(self, tls: bool = False) -> None:
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.json_responses: Dict[str, bytes] = {}
+        self.server.file_responses: Dict[str, str] = {}
+        self.cert_dir = None
+        self.cert_file = None
+        if tls:
+            self.cert_dir = tempfile.mkdtemp()
+            self.cert_file = os.path.join(self.cert_dir, "cert.pem")
+            key_file = os.path.join(self.cert_dir, "key.pem")
+            subprocess.run(
+                [
+                    "openssl",
+                    "req",
+                    "-x509",
+                    "-newkey",
+                    "rsa:2048",
+                    "-nodes",
+                    "-days",
+                    "1",
+                    "-subj",
+                    "/CN=localhost",
+                    "-addext",
+                    "subjectAltName=DNS:localhost,IP:127.0.0.1",
+                    "-keyout",
+                    key_file,
+                    "-out",
+                    self.cert_file,
+                ],
+                check=True,
+                capture_output=True,
+            )
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.cert_file, key_file)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        scheme = "https" if tls else "http"
+        self.endpoint_url = f"{scheme}://localhost:{self.server.server_address[1]}"
+
+    def add_json(self, path: str, body: bytes) -> None:
+        self.server.json_responses[path] = body
+
+    def add_file(self, path: str, file_path: str) -> None:
+        self.server.file_responses[path] = file_path
+
+    def __enter__(self) -> "StubServer":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.cert_dir is not None:
+            shutil.rmtree(self.cert_dir)
@@ -1,3 +1,4 @@
+from .async_client import AsyncPreloopPrivateClient
 from .client import PreloopPrivateClient
 from .exceptions import PreloopError
 from .models import *
@@ -22,6 +22,8 @@ class DatasourceAPIPaths(str, Enum):
     DATASOURCE_CONNECT = "/api/datasource/connect"  # internal use only
     DATASOURCE_GET = "/api/datasource/get"
     DATASOURCE_GET_ID = "/api/datasource/get/id"
+    DATASOURCE_GET_WATERMARK = "/api/datasource/watermark/get"
+    DATASOURCE_STORE_WATERMARK = "/api/datasource/watermark/store"
 
 
 class FeatureAPIPaths(str, Enum):
@@ -44,9 +46,33 @@ class FeatureAPIPaths(str, Enum):
     FEATURE_MODIFY = "/api/feature/modify"
     FEATURE_RUN = "/api/feature/run"
     FEATURE_INSERT = "/api/feature/insert"
+    FEATURE_INSERT_PART = "/api/feature/insert/part"
+    FEATURE_INSERT_COMMIT = "/api/feature/insert/commit"
+    FEATURE_INSERT_ABORT = "/api/feature/insert/abort"
     FEATURE_GET = "/api/feature/get"
+    FEATURE_STREAM = "/api/feature/stream"
     FEATURE_EXPERIMENTAL_GET = "/api/feature/experimental/get"
     FEATURE_EXPERIMENTAL_CREATE = "/api/feature/experimental/create"
     FEATURE_GET_ID = "/api/feature/get/id"
     FEATURE_SCHEDULED_EXECUTION = "/api/feature/scheduled-execution"
     FEATURE_STORE_DRIFT = "/api/feature/store-drift"
+
+
+# endpoints that only read, or set values that are the same however many times they are
+# sent, so requests to them can be retried safely
+IDEMPOTENT_API_PATHS = (
+    DatasourceAPIPaths.DATASOURCE_LIST.value,
+    DatasourceAPIPaths.DATASOURCE_DESCRIBE.value,
+    DatasourceAPIPaths.DATASOURCE_MODIFY.value,
+    DatasourceAPIPaths.DATASOURCE_GET.value,
+    DatasourceAPIPaths.DATASOURCE_GET_WATERMARK.value,
+    DatasourceAPIPaths.DATASOURCE_STORE_WATERMARK.value,
+    FeatureAPIPaths.FEATURE_LIST.value,
+    FeatureAPIPaths.FEATURE_DESCRIBE.value,
+    FeatureAPIPaths.FEATURE_MODIFY.value,
+    FeatureAPIPaths.FEATURE_GET.value,
+    FeatureAPIPaths.FEATURE_STREAM.value,
+    # a part that is sent again replaces the rows stored for it
+    FeatureAPIPaths.FEATURE_INSERT_PART.value,
+    FeatureAPIPaths.FEATURE_EXPERIMENTAL_GET.value,
+)
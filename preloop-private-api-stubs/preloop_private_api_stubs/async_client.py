@@ -0,0 +1,384 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import struct
+import tempfile
+import uuid
+from typing import AsyncIterator, Hashable, Optional, Tuple, Type, TypeVar
+
+import httpx
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import BaseModel
+
+from .api_paths import IDEMPOTENT_API_PATHS, DatasourceAPIPaths, FeatureAPIPaths
+from .client import DOWNLOAD_CHUNK_SIZE, UPLOAD_PART_SIZE
+from .exceptions import PreloopError
+from .metadata_cache import DEFAULT_METADATA_CACHE_TTL, get_metadata_cache
+from .models import (
+    CreateDatasourceRequest,
+    CreateDatasourceResult,
+    CreateFeatureRequest,
+    CreateFeatureResult,
+    DeleteDatasourceRequest,
+    DeleteDatasourceResult,
+    DeleteFeatureRequest,
+    DeleteFeatureResult,
+    ExperimentalCreateFeatureRequest,
+    ExperimentalCreateFeatureResult,
+    ExperimentalGetFeatureRequest,
+    GetDatasourceIdRequest,
+    GetDatasourceIdResult,
+    GetDatasourceRequest,
+    GetDatasourceWatermarkRequest,
+    GetDatasourceWatermarkResult,
+    GetFeatureIdRequest,
+    GetFeatureIdResult,
+    GetFeatureRequest,
+    InsertFeatureRequest,
+    InsertFeatureResult,
+    ListDatasourcesRequest,
+    ListDatasourcesResult,
+    ListFeaturesRequest,
+    ListFeaturesResult,
+    ModifyDatasourceRequest,
+    ModifyDatasourceResult,
+    ModifyFeatureRequest,
+    ModifyFeatureResult,
+    ScheduledFeatureExecutionRequest,
+    ScheduledFeatureExecutionResult,
+    StoreDatasourceWatermarkRequest,
+    StoreDatasourceWatermarkResult,
+    StoreFeatureDriftRequest,
+    StoreFeatureDriftResult,
+)
+from .session import DEFAULT_BACKOFF_FACTOR, DEFAULT_MAX_RETRIES, DEFAULT_TIMEOUT, get_async_client, send_with_retries
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("PRELOOP_MAX_CONCURRENCY", 16))
+
+ResultModel = TypeVar("ResultModel", bound=BaseModel)
+
+
+async def _raise_for_status(response: httpx.Response) -> None:
+    if response.is_error:
+        await response.aread()
+        raise PreloopError(message=json.loads(response.text)["detail"])
+
+
+def _read_parquet_bytes(data: bytes | memoryview) -> pd.DataFrame:
+    return pq.read_table(pa.BufferReader(data)).to_pandas()
+
+
+def _read_parquet_file(path: str) -> pd.DataFrame:
+    return pq.read_table(path, memory_map=True).to_pandas()
+
+
+def _to_parquet(df: pd.DataFrame) -> bytes:
+    bytes_obj = io.BytesIO()
+    df.to_parquet(bytes_obj)
+    return bytes_obj.getvalue()
+
+
+class AsyncPreloopPrivateClient:
+    """
+    Asyncio version of PreloopPrivateClient that takes and returns the same models. Requests
+    share one pool of keep-alive connections, and at most max_concurrency of them are in
+    flight at once however many coroutines are awaiting. Parquet is encoded and decoded on
+    a thread, so large features don't block the event loop.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str = os.getenv("PRELOOP_API_ENDPOINT"),
+        key_id: str = os.getenv("KEY_ID"),
+        secret: str = os.getenv("SECRET"),
+        timeout: float | Tuple[float, float] = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        metadata_cache_ttl: float = DEFAULT_METADATA_CACHE_TTL,
+    ) -> None:
+        self.endpoint_url = endpoint_url
+        headers = {
+            "User-Agent": "PreloopPrivateClient/1.0",
+            "key-id": key_id,
+            "secret": secret,
+        }
+        # requests leaves out headers that are None, httpx refuses them
+        self.headers = {key: value for key, value in headers.items() if value is not None}
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.http_client = get_async_client(timeout=timeout, max_connections=max_concurrency)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # id lookups and descriptors are cached for metadata_cache_ttl seconds, 0 turns this off
+        self.metadata_cache_ttl = metadata_cache_ttl
+        self.metadata_cache = get_metadata_cache(endpoint_url, key_id)
+
+    async def __aenter__(self) -> "AsyncPreloopPrivateClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.http_client.aclose()
+
+    async def _send(self, method: str, path: str, stream: bool = False, **kwargs) -> httpx.Response:
+        return await send_with_retries(
+            self.http_client,
+            method,
+            f"{self.endpoint_url}{path}",
+            idempotent=method == "GET" or path in IDEMPOTENT_API_PATHS,
+            max_retries=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            stream=stream,
+            headers=self.headers,
+            **kwargs,
+        )
+
+    async def _post(
+        self, path: str, result_model: Type[ResultModel], request: Optional[BaseModel] = None
+    ) -> ResultModel:
+        async with self.semaphore:
+            response = await self._send(
+                "POST", path, json=None if request is None else json.loads(request.model_dump_json())
+            )
+        await _raise_for_status(response)
+        return result_model.model_validate_json(json_data=response.text)
+
+    async def _post_cached(
+        self,
+        namespace: str,
+        cache_key: Hashable,
+        path: str,
+        result_model: Type[ResultModel],
+        request: Optional[BaseModel] = None,
+    ) -> ResultModel:
+        if self.metadata_cache_ttl > 0:
+            cached_response = self.metadata_cache.get(namespace, cache_key)
+            if cached_response is not None:
+                return cached_response
+        response = await self._post(path, result_model, request)
+        if self.metadata_cache_ttl > 0:
+            self.metadata_cache.put(namespace, cache_key, response, self.metadata_cache_ttl)
+        return response
+
+    async def _post_change(
+        self, namespace: str, path: str, result_model: Type[ResultModel], request: BaseModel
+    ) -> ResultModel:
+        try:
+            return await self._post(path, result_model, request)
+        finally:
+            self.metadata_cache.invalidate(namespace)
+
+    @contextlib.asynccontextmanager
+    async def _stream(self, method: str, path: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        # the connection stays checked out while the body is read, so it counts towards max_concurrency
+        async with self.semaphore:
+            response = await self._send(method, path, stream=True, **kwargs)
+            try:
+                await _raise_for_status(response)
+                yield response
+            finally:
+                await response.aclose()
+
+    async def _read_parquet_response(
+        self, response: httpx.Response, download_path: Optional[str] = None, memory_map: bool = False
+    ) -> pd.DataFrame:
+        """
+        Reads a streamed parquet response into a dataframe like PreloopPrivateClient does,
+        in memory or through download_path or a temporary file.
+        """
+        if download_path is None and not memory_map:
+            buffer = io.BytesIO()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                buffer.write(chunk)
+            return await asyncio.to_thread(_read_parquet_bytes, buffer.getbuffer())
+
+        if download_path is None:
+            file_descriptor, path = tempfile.mkstemp(suffix=".parquet")
+            os.close(file_descriptor)
+        else:
+            path = download_path
+        try:
+            with open(path, "wb") as file:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    await asyncio.to_thread(file.write, chunk)
+            return await asyncio.to_thread(_read_parquet_file, path)
+        finally:
+            if download_path is None:
+                os.remove(path)
+
+    # Datasource methods
+    async def list_datasources(self, request: Optional[ListDatasourcesRequest] = None) -> ListDatasourcesResult:
+        cache_key = ("list", None if request is None else str(request.datasource_id))
+        return await self._post_cached(
+            "datasource", cache_key, DatasourceAPIPaths.DATASOURCE_LIST.value, ListDatasourcesResult, request
+        )
+
+    async def create_datasource(self, request: CreateDatasourceRequest) -> CreateDatasourceResult:
+        return await self._post_change(
+            "datasource", DatasourceAPIPaths.DATASOURCE_CREATE.value, CreateDatasourceResult, request
+        )
+
+    async def delete_datasource(self, request: DeleteDatasourceRequest) -> DeleteDatasourceResult:
+        return await self._post_change(
+            "datasource", DatasourceAPIPaths.DATASOURCE_DELETE.value, DeleteDatasourceResult, request
+        )
+
+    async def modify_datasource(self, request: ModifyDatasourceRequest) -> ModifyDatasourceResult:
+        return await self._post_change(
+            "datasource", DatasourceAPIPaths.DATASOURCE_MODIFY.value, ModifyDatasourceResult, request
+        )
+
+    async def get_datasource(
+        self, request: GetDatasourceRequest, download_path: Optional[str] = None, memory_map: bool = False
+    ) -> pd.DataFrame:
+        async with self._stream(
+            "GET", DatasourceAPIPaths.DATASOURCE_GET.value, json=json.loads(request.model_dump_json())
+        ) as response:
+            return await self._read_parquet_response(response, download_path=download_path, memory_map=memory_map)
+
+    async def get_datasource_id(self, request: GetDatasourceIdRequest) -> GetDatasourceIdResult:
+        cache_key = ("id", request.datasource_name)
+        return await self._post_cached(
+            "datasource", cache_key, DatasourceAPIPaths.DATASOURCE_GET_ID.value, GetDatasourceIdResult, request
+        )
+
+    async def get_datasource_watermark(self, request: GetDatasourceWatermarkRequest) -> GetDatasourceWatermarkResult:
+        return await self._post(
+            DatasourceAPIPaths.DATASOURCE_GET_WATERMARK.value, GetDatasourceWatermarkResult, request
+        )
+
+    async def store_datasource_watermark(
+        self, request: StoreDatasourceWatermarkRequest
+    ) -> StoreDatasourceWatermarkResult:
+        return await self._post(
+            DatasourceAPIPaths.DATASOURCE_STORE_WATERMARK.value, StoreDatasourceWatermarkResult, request
+        )
+
+    # Feature methods
+    async def list_features(self, request: Optional[ListFeaturesRequest] = None) -> ListFeaturesResult:
+        cache_key = ("list", None if request is None else request.model_dump_json())
+        return await self._post_cached(
+            "feature", cache_key, FeatureAPIPaths.FEATURE_LIST.value, ListFeaturesResult, request
+        )
+
+    async def create_feature(self, request: CreateFeatureRequest) -> CreateFeatureResult:
+        return await self._post_change("feature", FeatureAPIPaths.FEATURE_CREATE.value, CreateFeatureResult, request)
+
+    async def delete_feature(self, request: DeleteFeatureRequest) -> DeleteFeatureResult:
+        return await self._post_change("feature", FeatureAPIPaths.FEATURE_DELETE.value, DeleteFeatureResult, request)
+
+    async def modify_feature(self, request: ModifyFeatureRequest) -> ModifyFeatureResult:
+        return await self._post_change("feature", FeatureAPIPaths.FEATURE_MODIFY.value, ModifyFeatureResult, request)
+
+    async def insert_feature(
+        self, request: InsertFeatureRequest, part_size: int = UPLOAD_PART_SIZE
+    ) -> InsertFeatureResult:
+        """
+        Uploads the rows of a feature in parts, see PreloopPrivateClient.insert_feature.
+        """
+        df: pd.DataFrame = request.data
+        fields = {key: str(value) for key, value in request.model_dump(exclude=["data"]).items()}
+        upload_id = str(uuid.uuid4())
+        total_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        rows_per_part = max(1, len(df) * part_size // max(total_bytes, 1))
+        part_starts = range(0, max(len(df), 1), rows_per_part)
+        try:
+            for part_number, part_start in enumerate(part_starts):
+                part = await asyncio.to_thread(_to_parquet, df.iloc[part_start : part_start + rows_per_part])
+                part_fields = {"feature_id": fields["feature_id"], "upload_id": upload_id, "part_number": part_number}
+                if part_number < len(part_starts) - 1:
+                    path = FeatureAPIPaths.FEATURE_INSERT_PART.value
+                else:
+                    path = FeatureAPIPaths.FEATURE_INSERT_COMMIT.value
+                    part_fields = {**fields, **part_fields, "total_rows": len(df)}
+                async with self.semaphore:
+                    response = await self._send("POST", path, data=part_fields, files={"data": ("part.parquet", part)})
+                await _raise_for_status(response)
+        except BaseException:
+            await self._abort_feature_upload(fields["feature_id"], upload_id)
+            raise
+        finally:
+            self.metadata_cache.invalidate("feature")
+        return InsertFeatureResult.model_validate_json(json_data=response.text)
+
+    async def _abort_feature_upload(self, feature_id: str, upload_id: str) -> None:
+        # best effort, the upload failed already and that is the error the caller should see
+        try:
+            await self._send(
+                "POST",
+                FeatureAPIPaths.FEATURE_INSERT_ABORT.value,
+                json={"feature_id": feature_id, "upload_id": upload_id},
+            )
+        except httpx.HTTPError:
+            pass
+
+    async def get_feature(
+        self, request: GetFeatureRequest, download_path: Optional[str] = None, memory_map: bool = False
+    ) -> pd.DataFrame:
+        async with self._stream(
+            "POST", FeatureAPIPaths.FEATURE_GET.value, json=json.loads(request.model_dump_json())
+        ) as response:
+            return await self._read_parquet_response(response, download_path=download_path, memory_map=memory_map)
+
+    async def iter_feature(self, request: GetFeatureRequest, batch_size: int = 65536) -> AsyncIterator[pd.DataFrame]:
+        """
+        Yields a version of a feature as dataframes of at most batch_size rows, indexed by the
+        id columns of the feature. The API streams the version as parquet chunks, each preceded
+        by its size as an 8 byte big endian integer, and every chunk is decoded as soon as it
+        has arrived, so neither the whole feature nor the whole response is ever held.
+        """
+        fields = {"feature_id": request.feature_id, "version": request.version, "chunk_rows": batch_size}
+        async with self._stream("POST", FeatureAPIPaths.FEATURE_STREAM.value, json=fields) as response:
+            buffer = bytearray()
+            async for data in response.aiter_bytes():
+                buffer += data
+                while len(buffer) >= 8:
+                    (size,) = struct.unpack_from(">Q", buffer)
+                    if len(buffer) < 8 + size:
+                        break
+                    chunk = bytes(buffer[8 : 8 + size])
+                    del buffer[: 8 + size]
+                    yield await asyncio.to_thread(_read_parquet_bytes, chunk)
+            if buffer:
+                raise PreloopError(message="The feature stream ended in the middle of a chunk")
+
+    async def experimental_create_feature(
+        self, request: ExperimentalCreateFeatureRequest
+    ) -> ExperimentalCreateFeatureResult:
+        return await self._post_change(
+            "feature", FeatureAPIPaths.FEATURE_EXPERIMENTAL_CREATE.value, ExperimentalCreateFeatureResult, request
+        )
+
+    async def experimental_get_feature(
+        self, request: ExperimentalGetFeatureRequest, download_path: Optional[str] = None, memory_map: bool = False
+    ) -> pd.DataFrame:
+        # the route reads the signature from a JSON body
+        async with self._stream(
+            "POST", FeatureAPIPaths.FEATURE_EXPERIMENTAL_GET.value, json=json.loads(request.model_dump_json())
+        ) as response:
+            try:
+                return await self._read_parquet_response(response, download_path=download_path, memory_map=memory_map)
+            except Exception as e:
+                raise PreloopError(message=str(e)) from None
+
+    async def get_feature_id(self, request: GetFeatureIdRequest) -> GetFeatureIdResult:
+        cache_key = ("id", request.feature_name)
+        return await self._post_cached(
+            "feature", cache_key, FeatureAPIPaths.FEATURE_GET_ID.value, GetFeatureIdResult, request
+        )
+
+    async def scheduled_feature_execution(
+        self, request: ScheduledFeatureExecutionRequest
+    ) -> ScheduledFeatureExecutionResult:
+        return await self._post_change(
+            "feature", FeatureAPIPaths.FEATURE_SCHEDULED_EXECUTION.value, ScheduledFeatureExecutionResult, request
+        )
+
+    async def store_feature_drift(self, request: StoreFeatureDriftRequest) -> StoreFeatureDriftResult:
+        return await self._post(FeatureAPIPaths.FEATURE_STORE_DRIFT.value, StoreFeatureDriftResult, request)
@@ -1,13 +1,18 @@
 import io
 import json
 import os
-from typing import Optional
+import tempfile
+import uuid
+from typing import Optional, Tuple
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
 
-from .api_paths import DatasourceAPIPaths, FeatureAPIPaths
+from .api_paths import IDEMPOTENT_API_PATHS, DatasourceAPIPaths, FeatureAPIPaths
 from .exceptions import PreloopError
+from .metadata_cache import DEFAULT_METADATA_CACHE_TTL, get_metadata_cache
 from .models import (
     CreateDatasourceRequest,
     CreateDatasourceResult,
@@ -23,6 +28,8 @@ from .models import (
     GetDatasourceIdRequest,
     GetDatasourceIdResult,
     GetDatasourceRequest,
+    GetDatasourceWatermarkRequest,
+    GetDatasourceWatermarkResult,
     GetFeatureIdRequest,
     GetFeatureIdResult,
     GetFeatureRequest,
@@ -38,9 +45,47 @@ from .models import (
     ModifyFeatureResult,
     ScheduledFeatureExecutionRequest,
     ScheduledFeatureExecutionResult,
+    StoreDatasourceWatermarkRequest,
+    StoreDatasourceWatermarkResult,
     StoreFeatureDriftRequest,
     StoreFeatureDriftResult,
 )
+from .session import DEFAULT_BACKOFF_FACTOR, DEFAULT_MAX_RETRIES, DEFAULT_POOL_MAXSIZE, DEFAULT_TIMEOUT, get_session
+
+# responses are read in chunks of this many bytes when downloading data
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# features are uploaded in parts that take up about this many bytes of memory as dataframes
+UPLOAD_PART_SIZE = int(os.getenv("PRELOOP_UPLOAD_PART_SIZE", 64 * 1024 * 1024))
+
+
+def _read_parquet_response(
+    response: requests.Response, download_path: Optional[str] = None, memory_map: bool = False
+) -> pd.DataFrame:
+    """
+    Reads a streamed parquet response into a dataframe. By default the response is held in
+    memory. If download_path is given the file is written there and kept, and if memory_map
+    is True it is written to a temporary file instead. Files are memory mapped when parsed,
+    so the raw bytes never have to be copied into the python heap.
+    """
+    if download_path is None and not memory_map:
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            buffer.write(chunk)
+        return pq.read_table(pa.BufferReader(buffer.getbuffer())).to_pandas()
+
+    if download_path is None:
+        file_descriptor, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(file_descriptor)
+    else:
+        path = download_path
+    try:
+        with open(path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                file.write(chunk)
+        return pq.read_table(path, memory_map=True).to_pandas()
+    finally:
+        if download_path is None:
+            os.remove(path)
 
 
 class PreloopPrivateClient:
@@ -49,6 +94,11 @@ class PreloopPrivateClient:
         endpoint_url: str = os.getenv("PRELOOP_API_ENDPOINT"),
         key_id: str = os.getenv("KEY_ID"),
         secret: str = os.getenv("SECRET"),
+        timeout: float | Tuple[float, float] = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        metadata_cache_ttl: float = DEFAULT_METADATA_CACHE_TTL,
     ) -> None:
         self.endpoint_url = endpoint_url
         self.headers = {
@@ -56,16 +106,32 @@ class PreloopPrivateClient:
             "key-id": key_id,
             "secret": secret,
         }
+        self.session = get_session(
+            endpoint_url,
+            IDEMPOTENT_API_PATHS,
+            timeout=timeout,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor,
+            pool_maxsize=pool_maxsize,
+        )
+        # id lookups and descriptors are cached for metadata_cache_ttl seconds, 0 turns this off
+        self.metadata_cache_ttl = metadata_cache_ttl
+        self.metadata_cache = get_metadata_cache(endpoint_url, key_id)
 
     # Datasource methods
     def list_datasources(self, request: Optional[ListDatasourcesRequest] = None) -> ListDatasourcesResult:
+        cache_key = ("list", None if request is None else str(request.datasource_id))
+        if self.metadata_cache_ttl > 0:
+            cached_response = self.metadata_cache.get("datasource", cache_key)
+            if cached_response is not None:
+                return cached_response
         try:
             if request is None:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_LIST.value}", headers=self.headers
                 )
             else:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_LIST.value}",
                     headers=self.headers,
                     json=json.loads(request.model_dump_json()),
@@ -74,11 +140,13 @@ class PreloopPrivateClient:
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
         response = ListDatasourcesResult.model_validate_json(json_data=response.text)
+        if self.metadata_cache_ttl > 0:
+            self.metadata_cache.put("datasource", cache_key, response, self.metadata_cache_ttl)
         return response
 
     def create_datasource(self, request: CreateDatasourceRequest) -> CreateDatasourceResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_CREATE.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -86,12 +154,14 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("datasource")
         response = CreateDatasourceResult.model_validate_json(json_data=response.text)
         return response
 
     def delete_datasource(self, request: DeleteDatasourceRequest) -> DeleteDatasourceResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_DELETE.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -99,12 +169,14 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("datasource")
         response = DeleteDatasourceResult.model_validate_json(json_data=response.text)
         return response
 
     def modify_datasource(self, request: ModifyDatasourceRequest) -> ModifyDatasourceResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_MODIFY.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -112,12 +184,16 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("datasource")
         response = ModifyDatasourceResult.model_validate_json(json_data=response.text)
         return response
 
-    def get_datasource(self, request: GetDatasourceRequest):
+    def get_datasource(
+        self, request: GetDatasourceRequest, download_path: Optional[str] = None, memory_map: bool = False
+    ):
         try:
-            response = requests.get(
+            response = self.session.get(
                 url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_GET.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -126,16 +202,17 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
-        buffer = io.BytesIO()
-        for chunk in response.iter_content():
-            buffer.write(chunk)
-        buffer.seek(0)
-        df = pd.read_parquet(buffer)
+        df = _read_parquet_response(response, download_path=download_path, memory_map=memory_map)
         return df
 
     def get_datasource_id(self, request: GetDatasourceIdRequest) -> GetDatasourceIdResult:
+        cache_key = ("id", request.datasource_name)
+        if self.metadata_cache_ttl > 0:
+            cached_response = self.metadata_cache.get("datasource", cache_key)
+            if cached_response is not None:
+                return cached_response
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_GET_ID.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -144,18 +221,51 @@ class PreloopPrivateClient:
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
         response = GetDatasourceIdResult.model_validate_json(json_data=response.text)
+        if self.metadata_cache_ttl > 0:
+            self.metadata_cache.put("datasource", cache_key, response, self.metadata_cache_ttl)
+        return response
+
+    def get_datasource_watermark(self, request: GetDatasourceWatermarkRequest) -> GetDatasourceWatermarkResult:
+        try:
+            response = self.session.post(
+                url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_GET_WATERMARK.value}",
+                headers=self.headers,
+                json=json.loads(request.model_dump_json()),
+            )
+            response.raise_for_status()
+        except requests.HTTPError as http_error:
+            raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        response = GetDatasourceWatermarkResult.model_validate_json(json_data=response.text)
+        return response
+
+    def store_datasource_watermark(self, request: StoreDatasourceWatermarkRequest) -> StoreDatasourceWatermarkResult:
+        try:
+            response = self.session.post(
+                url=f"{self.endpoint_url}{DatasourceAPIPaths.DATASOURCE_STORE_WATERMARK.value}",
+                headers=self.headers,
+                json=json.loads(request.model_dump_json()),
+            )
+            response.raise_for_status()
+        except requests.HTTPError as http_error:
+            raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        response = StoreDatasourceWatermarkResult.model_validate_json(json_data=response.text)
         return response
 
     # Feature methods
     def list_features(self, request: Optional[ListFeaturesRequest] = None) -> ListFeaturesResult:
+        cache_key = ("list", None if request is None else request.model_dump_json())
+        if self.metadata_cache_ttl > 0:
+            cached_response = self.metadata_cache.get("feature", cache_key)
+            if cached_response is not None:
+                return cached_response
         try:
             if request is None:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_LIST.value}", headers=self.headers
                 )
                 response.raise_for_status()
             else:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_LIST.value}",
                     headers=self.headers,
                     json=json.loads(request.model_dump_json()),
@@ -164,11 +274,13 @@ class PreloopPrivateClient:
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
         response = ListFeaturesResult.model_validate_json(json_data=response.text)
+        if self.metadata_cache_ttl > 0:
+            self.metadata_cache.put("feature", cache_key, response, self.metadata_cache_ttl)
         return response
 
     def create_feature(self, request: CreateFeatureRequest) -> CreateFeatureResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_CREATE.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -176,12 +288,14 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("feature")
         response = CreateFeatureResult.model_validate_json(json_data=response.text)
         return response
 
     def delete_feature(self, request: DeleteFeatureRequest) -> DeleteFeatureResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_DELETE.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -189,12 +303,14 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("feature")
         response = DeleteFeatureResult.model_validate_json(json_data=response.text)
         return response
 
     def modify_feature(self, request: ModifyFeatureRequest) -> ModifyFeatureResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_MODIFY.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -202,30 +318,62 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("feature")
         response = ModifyFeatureResult.model_validate_json(json_data=response.text)
         return response
 
-    def insert_feature(self, request: InsertFeatureRequest):
-        bytes_obj = io.BytesIO()
+    def insert_feature(self, request: InsertFeatureRequest, part_size: int = UPLOAD_PART_SIZE):
+        """
+        Uploads the rows of a feature in parts of about part_size bytes each, so neither side
+        holds more than one part at a time. Parts are staged by the server as they arrive and
+        a failed part is retried on its own. The rows are stored as a new version of the
+        feature when the last part is sent, and a failed upload leaves no version behind.
+        """
         df: pd.DataFrame = request.data
-        df.to_parquet(bytes_obj)
-        bytes_obj.seek(0)
+        fields = request.model_dump(exclude=["data"])
+        upload_id = str(uuid.uuid4())
+        total_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        rows_per_part = max(1, len(df) * part_size // max(total_bytes, 1))
+        part_starts = range(0, max(len(df), 1), rows_per_part)
         try:
-            response = requests.post(
-                url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_INSERT.value}",
-                headers=self.headers,
-                data=request.model_dump(exclude=["data"]),
-                files={"data": bytes_obj},
-            )
-            response.raise_for_status()
+            for part_number, part_start in enumerate(part_starts):
+                bytes_obj = io.BytesIO()
+                df.iloc[part_start : part_start + rows_per_part].to_parquet(bytes_obj)
+                bytes_obj.seek(0)
+                part_fields = {"feature_id": fields["feature_id"], "upload_id": upload_id, "part_number": part_number}
+                if part_number < len(part_starts) - 1:
+                    url = f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_INSERT_PART.value}"
+                else:
+                    url = f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_INSERT_COMMIT.value}"
+                    part_fields = {**fields, **part_fields, "total_rows": len(df)}
+                response = self.session.post(url=url, headers=self.headers, data=part_fields, files={"data": bytes_obj})
+                response.raise_for_status()
         except requests.exceptions.HTTPError as http_error:
+            self._abort_feature_upload(fields["feature_id"], upload_id)
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        except Exception:
+            self._abort_feature_upload(fields["feature_id"], upload_id)
+            raise
+        finally:
+            self.metadata_cache.invalidate("feature")
         response = InsertFeatureResult.model_validate_json(json_data=response.text)
         return response
 
-    def get_feature(self, request: GetFeatureRequest):
+    def _abort_feature_upload(self, feature_id: uuid.UUID, upload_id: str) -> None:
+        # best effort, the upload failed already and that is the error the caller should see
         try:
-            response = requests.post(
+            self.session.post(
+                url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_INSERT_ABORT.value}",
+                headers=self.headers,
+                json={"feature_id": str(feature_id), "upload_id": upload_id},
+            )
+        except requests.exceptions.RequestException:
+            pass
+
+    def get_feature(self, request: GetFeatureRequest, download_path: Optional[str] = None, memory_map: bool = False):
+        try:
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_GET.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -234,16 +382,12 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
-        buffer = io.BytesIO()
-        for chunk in response.iter_content():
-            buffer.write(chunk)
-        buffer.seek(0)
-        df = pd.read_parquet(buffer)
+        df = _read_parquet_response(response, download_path=download_path, memory_map=memory_map)
         return df
 
     def experimental_create_feature(self, request: ExperimentalCreateFeatureRequest) -> ExperimentalCreateFeatureResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_EXPERIMENTAL_CREATE.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -251,12 +395,16 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("feature")
         response = ExperimentalCreateFeatureResult.model_validate_json(json_data=response.text)
         return response
 
-    def experimental_get_feature(self, request: ExperimentalGetFeatureRequest):
+    def experimental_get_feature(
+        self, request: ExperimentalGetFeatureRequest, download_path: Optional[str] = None, memory_map: bool = False
+    ):
         try:
-            response = requests.get(
+            response = self.session.get(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_EXPERIMENTAL_GET.value}",
                 headers=self.headers,
                 data=request.model_dump(),
@@ -266,18 +414,19 @@ class PreloopPrivateClient:
         except requests.exceptions.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
         try:
-            buffer = io.BytesIO()
-            for chunk in response.iter_content():
-                buffer.write(chunk)
-            buffer.seek(0)
-            df = pd.read_parquet(buffer)
+            df = _read_parquet_response(response, download_path=download_path, memory_map=memory_map)
         except Exception as e:
             raise PreloopError(message=str(e)) from None
         return df
 
     def get_feature_id(self, request: GetFeatureIdRequest):
+        cache_key = ("id", request.feature_name)
+        if self.metadata_cache_ttl > 0:
+            cached_response = self.metadata_cache.get("feature", cache_key)
+            if cached_response is not None:
+                return cached_response
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_GET_ID.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -286,11 +435,13 @@ class PreloopPrivateClient:
         except requests.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
         response = GetFeatureIdResult.model_validate_json(json_data=response.text)
+        if self.metadata_cache_ttl > 0:
+            self.metadata_cache.put("feature", cache_key, response, self.metadata_cache_ttl)
         return response
 
     def scheduled_feature_execution(self, request: ScheduledFeatureExecutionRequest) -> ScheduledFeatureExecutionResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_SCHEDULED_EXECUTION.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -298,12 +449,14 @@ class PreloopPrivateClient:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_error:
             raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        finally:
+            self.metadata_cache.invalidate("feature")
         response = ScheduledFeatureExecutionResult.model_validate_json(json_data=response.text)
         return response
 
     def store_feature_drift(self, request: StoreFeatureDriftRequest) -> StoreFeatureDriftResult:
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{FeatureAPIPaths.FEATURE_STORE_DRIFT.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -0,0 +1,51 @@
+"""
+Cache of datasource and feature metadata, such as name to id lookups, used by the Preloop
+clients. Clients with the same endpoint and credentials share a cache, so a change made
+through any of them invalidates the entries the others would return.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, Tuple
+
+from pydantic import BaseModel
+
+# seconds that metadata is cached for, 0 turns the cache off
+DEFAULT_METADATA_CACHE_TTL = float(os.getenv("PRELOOP_METADATA_CACHE_TTL", 60))
+
+_metadata_caches: Dict[Tuple, "MetadataCache"] = {}
+_metadata_caches_lock = threading.Lock()
+
+
+class MetadataCache:
+    def __init__(self) -> None:
+        self.entries: Dict[Tuple[str, Hashable], Tuple[float, BaseModel]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, namespace: str, key: Hashable) -> Any:
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[(namespace, key)]
+                return None
+        # callers get their own copy, so changing a result never changes the cache
+        return value.model_copy(deep=True)
+
+    def put(self, namespace: str, key: Hashable, value: BaseModel, ttl: float) -> None:
+        with self.lock:
+            self.entries[(namespace, key)] = (time.monotonic() + ttl, value.model_copy(deep=True))
+
+    def invalidate(self, namespace: str) -> None:
+        with self.lock:
+            for cache_key in [cache_key for cache_key in self.entries if cache_key[0] == namespace]:
+                del self.entries[cache_key]
+
+
+def get_metadata_cache(endpoint_url: str, key_id: str) -> MetadataCache:
+    with _metadata_caches_lock:
+        if (endpoint_url, key_id) not in _metadata_caches:
+            _metadata_caches[(endpoint_url, key_id)] = MetadataCache()
+        return _metadata_caches[(endpoint_url, key_id)]
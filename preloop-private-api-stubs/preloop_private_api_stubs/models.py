@@ -14,6 +14,7 @@ class DatasourceType(str, Enum):
     """
 
     POSTGRES = "postgres"
+    POSTGRES_QUERY = "postgres_query"
     MYSQL = "mysql"
     S3 = "s3"
 
@@ -24,6 +25,11 @@ class ExecutionType(str, Enum):
     SCHEDULED = "scheduled"
 
 
+class FeatureWriteMode(str, Enum):
+    OVERWRITE = "overwrite"
+    MERGE = "merge"
+
+
 class SQLConnectionParams(BaseModel):
     user_name: str
     host_name: str
@@ -31,6 +37,16 @@ class SQLConnectionParams(BaseModel):
     database_name: str
     table_name: str
     schema_name: str | None = None
+    watermark_column: str | None = None
+
+
+class SQLQueryConnectionParams(BaseModel):
+    user_name: str
+    host_name: str
+    port_number: int
+    database_name: str
+    query: str
+    query_parameters: Dict[str, Any] | None = None
 
 
 class SQLAuthParams(BaseModel):
@@ -47,6 +63,11 @@ class SQLConnectionDetails(BaseModel):
     auth_params: SQLAuthParams
 
 
+class SQLQueryConnectionDetails(BaseModel):
+    connection_params: SQLQueryConnectionParams
+    auth_params: SQLAuthParams
+
+
 # Pydantic models to validate inputs
 class CreateDatasourceRequest(BaseModel):
     datasource_name: str
@@ -54,7 +75,7 @@ class CreateDatasourceRequest(BaseModel):
         title="The description of the datasource", max_length=400, default="Description of this datasource."
     )
     datasource_type: DatasourceType
-    connection_details: SQLConnectionDetails | S3ConnectionDetails
+    connection_details: SQLConnectionDetails | SQLQueryConnectionDetails | S3ConnectionDetails
     execution_id: uuid.UUID
 
 
@@ -70,12 +91,15 @@ class ListDatasourcesRequest(BaseModel):
 
 class DataSourceDetails(BaseModel):
     id: str | uuid.UUID
+    # the organization of the user listing the datasource, which scopes its cached reads
+    org_id: Optional[str | uuid.UUID] = None
     team: Optional[str] = None
     datasource_name: str
     datasource_description: Optional[str] = None
     datasource_type: DatasourceType
-    connection_details: SQLConnectionDetails | S3ConnectionDetails
+    connection_details: SQLConnectionDetails | SQLQueryConnectionDetails | S3ConnectionDetails
     datasource_details: Optional[Dict[Any, Any]] = None
+    hashed_value: Optional[str] = None
     creation_date: datetime
     last_updated: datetime | None
 
@@ -100,7 +124,7 @@ class DatasourceIdentifierField(BaseModel):
 class ModifiableDatasourceFields(BaseModel):
     datasource_name: Optional[str] = None
     datasource_description: Optional[str] = None
-    connection_details: Optional[SQLConnectionDetails | S3ConnectionDetails] = None
+    connection_details: Optional[SQLConnectionDetails | SQLQueryConnectionDetails | S3ConnectionDetails] = None
 
 
 class ModifyDatasourceRequest(BaseModel):
@@ -127,6 +151,29 @@ class GetDatasourceIdResult(BaseModel):
     details: Dict[str, Any]
 
 
+class GetDatasourceWatermarkRequest(BaseModel):
+    datasource_id: uuid.UUID
+    feature_id: uuid.UUID
+
+
+class GetDatasourceWatermarkResult(BaseModel):
+    message: str
+    details: Dict[str, Any] | None
+
+
+class StoreDatasourceWatermarkRequest(BaseModel):
+    datasource_id: uuid.UUID
+    feature_id: uuid.UUID
+    watermark_column: str
+    watermark_value: str
+    execution_id: Optional[uuid.UUID] = None
+
+
+class StoreDatasourceWatermarkResult(BaseModel):
+    message: str
+    details: Dict[str, Any] | List[Dict[str, Any]] | None
+
+
 # Feature models
 class ListFeaturesRequest(BaseModel):
     feature_id: uuid.UUID
@@ -211,6 +258,7 @@ class ModifyFeatureResult(BaseModel):
 class InsertFeatureRequest(BaseModel):
     feature_id: uuid.UUID
     operation_type: str
+    write_mode: str = FeatureWriteMode.OVERWRITE.value
     data: Any
 
 
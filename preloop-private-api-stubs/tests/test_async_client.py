@@ -0,0 +1,110 @@
+"""Unit tests for AsyncPreloopPrivateClient"""
+import asyncio
+import io
+import json
+import struct
+import uuid
+
+import httpx
+import pandas as pd
+import pytest
+
+from preloop_private_api_stubs import AsyncPreloopPrivateClient, GetFeatureRequest, PreloopError
+from preloop_private_api_stubs.models import DeleteFeatureRequest
+
+
+def make_client(handler) -> AsyncPreloopPrivateClient:
+    client = AsyncPreloopPrivateClient(
+        endpoint_url="http://preloop", key_id="key", secret="secret", backoff_factor=0, metadata_cache_ttl=0
+    )
+    client.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def stream_body(chunks, piece_size):
+    """
+    Frames the chunks like /api/feature/stream does, and returns the body in pieces of
+    piece_size bytes, so chunks arrive split across reads.
+    """
+    body = b""
+    for chunk in chunks:
+        part = io.BytesIO()
+        chunk.to_parquet(part)
+        body += struct.pack(">Q", len(part.getvalue())) + part.getvalue()
+
+    async def pieces():
+        for start in range(0, len(body), piece_size):
+            yield body[start : start + piece_size]
+
+    return pieces()
+
+
+@pytest.mark.parametrize("piece_size", [3, 1000, 1 << 20])
+def test_iter_feature_decodes_chunks_as_they_arrive(piece_size):
+    chunks = [
+        pd.DataFrame({"value": [1.0, 2.0]}, index=pd.Index([1, 2], name="id")),
+        pd.DataFrame({"value": [3.0]}, index=pd.Index([3], name="id")),
+    ]
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, content=stream_body(chunks, piece_size))
+
+    async def collect():
+        async with make_client(handler) as client:
+            return [df async for df in client.iter_feature(GetFeatureRequest(feature_id="f", version=2), batch_size=2)]
+
+    batches = asyncio.run(collect())
+    assert requests == [{"feature_id": "f", "version": 2, "chunk_rows": 2}]
+    assert len(batches) == 2
+    for batch, chunk in zip(batches, chunks):
+        pd.testing.assert_frame_equal(batch, chunk)
+
+
+def test_iter_feature_raises_on_a_truncated_stream():
+    chunks = [pd.DataFrame({"value": [1.0]})]
+
+    async def truncated():
+        body = b"".join([piece async for piece in stream_body(chunks, 1 << 20)])
+        yield body[:-1]
+
+    async def collect():
+        async with make_client(lambda request: httpx.Response(200, content=truncated())) as client:
+            return [df async for df in client.iter_feature(GetFeatureRequest(feature_id="f", version=1))]
+
+    with pytest.raises(PreloopError):
+        asyncio.run(collect())
+
+
+def test_idempotent_requests_are_retried():
+    statuses = [503, 503, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = statuses.pop(0)
+        if status != 200:
+            return httpx.Response(status, json={"detail": "unavailable"})
+        return httpx.Response(200, json={"datasources": []})
+
+    async def call():
+        async with make_client(handler) as client:
+            return await client.list_datasources()
+
+    assert asyncio.run(call()).datasources == []
+    assert statuses == []
+
+
+def test_changes_are_not_retried():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(503, json={"detail": "unavailable"})
+
+    async def call():
+        async with make_client(handler) as client:
+            await client.delete_feature(DeleteFeatureRequest(feature_id=uuid.uuid4()))
+
+    with pytest.raises(PreloopError):
+        asyncio.run(call())
+    assert calls == ["/api/feature/delete"]
@@ -1,3 +1,5 @@
+from typing import Any, Dict
+
 from pydantic import BaseModel, Field
 
 
@@ -8,6 +10,16 @@ class SQLConnectionParams(BaseModel):
     database_name: str
     table_name: str
     schema_name: str | None = None
+    watermark_column: str | None = None
+
+
+class SQLQueryConnectionParams(BaseModel):
+    user_name: str
+    host_name: str
+    port_number: int
+    database_name: str
+    query: str
+    query_parameters: Dict[str, Any] | None = None
 
 
 class SQLAuthParams(BaseModel):
@@ -32,6 +44,20 @@ class PostgresConnectionDetails(SQLConnectionDetails):
     auth_params: PostgresAuthParams
 
 
+class SQLQueryConnectionDetails(BaseModel):
+    connection_params: SQLQueryConnectionParams
+    auth_params: SQLAuthParams
+
+
+class PostgresQueryConnectionParams(SQLQueryConnectionParams):
+    pass
+
+
+class PostgresQueryConnectionDetails(SQLQueryConnectionDetails):
+    connection_params: PostgresQueryConnectionParams
+    auth_params: PostgresAuthParams
+
+
 class S3ConnectionDetails(BaseModel):
     bucket_name: str
     object_key: str
@@ -42,12 +68,16 @@ class Datasource(BaseModel):
     datasource_description: str = Field(
         title="The description of the datasource", max_length=400, default="Description of this datasource."
     )
-    connection_details: PostgresConnectionDetails | S3ConnectionDetails
+    connection_details: PostgresConnectionDetails | PostgresQueryConnectionDetails | S3ConnectionDetails
 
 
 class PostgresDatasource(Datasource):
     connection_details: PostgresConnectionDetails
 
 
+class PostgresQueryDatasource(Datasource):
+    connection_details: PostgresQueryConnectionDetails
+
+
 class S3Datasource(Datasource):
     connection_details: S3ConnectionDetails
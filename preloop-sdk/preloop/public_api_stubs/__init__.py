@@ -1,4 +1,5 @@
 from preloop.public_api_stubs.api_paths import *
+from preloop.public_api_stubs.async_preloop_client import *
 from preloop.public_api_stubs.exceptions import *
 from preloop.public_api_stubs.models import *
 from preloop.public_api_stubs.preloop_client import *
@@ -57,3 +57,15 @@ class MLModelAPIPaths(str, Enum):
     ML_MODEL_DELETE = "/api/ml-model/delete"
     ML_MODEL_STOP = "/api/ml-model/stop"
     ML_MODEL_LIST_VERSIONS = "/api/ml-model/list-versions"
+    ML_MODEL_SCORE = "/api/ml-model/score"
+    ML_MODEL_LIST_SCORING_JOBS = "/api/ml-model/list-scoring-jobs"
+
+
+# endpoints that only read, so requests to them can be retried safely
+IDEMPOTENT_API_PATHS = (
+    MLModelAPIPaths.ML_MODEL_LIST.value,
+    MLModelAPIPaths.ML_MODEL_LIST_TRAINING_JOBS.value,
+    MLModelAPIPaths.ML_MODEL_LIST_HOSTED_MODELS.value,
+    MLModelAPIPaths.ML_MODEL_LIST_VERSIONS.value,
+    MLModelAPIPaths.ML_MODEL_LIST_SCORING_JOBS.value,
+)
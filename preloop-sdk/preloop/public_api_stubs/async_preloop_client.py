@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import pathlib
+from typing import Optional, Tuple, Type, TypeVar
+
+import httpx
+from pydantic import BaseModel
+
+from preloop.public_api_stubs.api_paths import IDEMPOTENT_API_PATHS, MLModelAPIPaths
+from preloop.public_api_stubs.exceptions import PreloopError
+from preloop.public_api_stubs.models import (
+    CreateMLModelRequest,
+    CreateMLModelResult,
+    CreateScoringJobRequest,
+    CreateScoringJobResult,
+    DeleteMLModelRequest,
+    DeleteMLModelResult,
+    DeployMLModelRequest,
+    DeployMLModelResult,
+    ListHostedMLModelsRequest,
+    ListHostedMLModelsResult,
+    ListMLModelsRequest,
+    ListMLModelsResult,
+    ListMLModelVersionsRequest,
+    ListMLModelVersionsResult,
+    ListScoringJobsRequest,
+    ListScoringJobsResult,
+    ListTrainingJobsRequest,
+    ListTrainingJobsResult,
+    RetrainMLModelRequest,
+    RetrainMLModelResult,
+    StopMLModelRequest,
+    StopMLModelResult,
+)
+from preloop.public_api_stubs.session import (
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_TIMEOUT,
+    get_async_client,
+    send_with_retries,
+)
+
+ResultModel = TypeVar("ResultModel", bound=BaseModel)
+
+
+async def _raise_for_status(response: httpx.Response) -> None:
+    if response.is_error:
+        await response.aread()
+        raise PreloopError(message=json.loads(response.text)["detail"])
+
+
+class AsyncPreloopClient:
+    def __init__(
+        self,
+        endpoint_url: str = "https://api.preloop.com",
+        key_id: str = os.getenv("PRELOOP_KEY_ID"),
+        secret: str = os.getenv("PRELOOP_SECRET"),
+        timeout: float | Tuple[float, float] = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        max_concurrency: int = int(os.getenv("PRELOOP_MAX_CONCURRENCY", 16)),
+    ) -> None:
+        """
+        Initialize a new instance of the AsyncPreloopClient class. It has the same methods as
+        PreloopClient, which take and return the same models but have to be awaited. Requests share
+        one pool of keep-alive connections.
+
+        Args:
+            endpoint_url (str, optional): The endpoint URL of the Preloop API. Defaults to "api.preloop.com".
+            key_id (str, optional): The key ID for the Preloop API. Defaults to the value of the "PRELOOP_KEY_ID" environment variable.
+            secret (str, optional): The secret for the Preloop API. Defaults to the value of the "PRELOOP_SECRET" environment variable.
+            timeout (float | Tuple[float, float], optional): The request timeout in seconds, or a (connect, read) tuple. Defaults to (10, 300).
+            max_retries (int, optional): The number of times a failed request is retried. Requests that change state are only retried if they never reached the API. Defaults to 3.
+            backoff_factor (float, optional): Retries wait backoff_factor * 2 ** (retry number - 1) seconds. Defaults to 0.5.
+            max_concurrency (int, optional): The maximum number of requests in flight at once, however many calls are being awaited. Defaults to 16.
+        """
+        self.endpoint_url = endpoint_url
+        headers = {
+            "User-Agent": "PreloopClient/1.0",
+            "key-id": key_id,
+            "secret": secret,
+        }
+        # requests leaves out headers that are None, httpx refuses them
+        self.headers = {key: value for key, value in headers.items() if value is not None}
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.http_client = get_async_client(timeout=timeout, max_connections=max_concurrency)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self) -> "AsyncPreloopClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Close the connections to the API.
+        """
+        await self.http_client.aclose()
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        return await send_with_retries(
+            self.http_client,
+            method,
+            f"{self.endpoint_url}{path}",
+            idempotent=method == "GET" or path in IDEMPOTENT_API_PATHS,
+            max_retries=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            headers=self.headers,
+            **kwargs,
+        )
+
+    async def _post(
+        self, path: str, result_model: Type[ResultModel], request: Optional[BaseModel] = None
+    ) -> ResultModel:
+        async with self.semaphore:
+            response = await self._send(
+                "POST", path, json=None if request is None else json.loads(request.model_dump_json())
+            )
+        await _raise_for_status(response)
+        return result_model.model_validate_json(json_data=response.text)
+
+    async def list_ml_models(self, request: Optional[ListMLModelsRequest] = None) -> ListMLModelsResult:
+        """
+        List all ML models. If a request is provided, the request is used to filter the ML models. See PreloopClient.list_ml_models.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_LIST.value, ListMLModelsResult, request)
+
+    async def create_ml_model(self, request: CreateMLModelRequest) -> CreateMLModelResult:
+        """
+        Create an ML model. See PreloopClient.create_ml_model.
+        """
+        training_script = await asyncio.to_thread(pathlib.Path(request.training_script_path).read_bytes)
+        fields = json.loads(request.model_dump_json(exclude=["training_script_path"]))
+        async with self.semaphore:
+            response = await self._send(
+                "POST",
+                MLModelAPIPaths.ML_MODEL_CREATE.value,
+                # None fields are left out of the form, like requests does
+                data={key: value for key, value in fields.items() if value is not None},
+                files={"training_script": (os.path.basename(request.training_script_path), training_script)},
+            )
+        await _raise_for_status(response)
+        return CreateMLModelResult.model_validate_json(json_data=response.text)
+
+    async def retrain_ml_model(self, request: RetrainMLModelRequest) -> RetrainMLModelResult:
+        """
+        Retrain an ML model. See PreloopClient.retrain_ml_model.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_RETRAIN.value, RetrainMLModelResult, request)
+
+    async def list_training_jobs(self, request: Optional[ListTrainingJobsRequest] = None) -> ListTrainingJobsResult:
+        """
+        List training jobs. If a request is provided, the request is used to filter the training jobs. See PreloopClient.list_training_jobs.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_LIST_TRAINING_JOBS.value, ListTrainingJobsResult, request)
+
+    async def create_scoring_job(self, request: CreateScoringJobRequest) -> CreateScoringJobResult:
+        """
+        Score a version of a feature with an ML model. See PreloopClient.create_scoring_job.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_SCORE.value, CreateScoringJobResult, request)
+
+    async def list_scoring_jobs(self, request: Optional[ListScoringJobsRequest] = None) -> ListScoringJobsResult:
+        """
+        List scoring jobs. If a request is provided, the request is used to filter the scoring jobs. See PreloopClient.list_scoring_jobs.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_LIST_SCORING_JOBS.value, ListScoringJobsResult, request)
+
+    async def list_hosted_ml_models(
+        self, request: Optional[ListHostedMLModelsRequest] = None
+    ) -> ListHostedMLModelsResult:
+        """
+        List hosted ML models. If a request is provided, the request is used to filter the hosted ML models. See PreloopClient.list_hosted_ml_models.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_LIST_HOSTED_MODELS.value, ListHostedMLModelsResult, request)
+
+    async def deploy_ml_model(self, request: DeployMLModelRequest) -> DeployMLModelResult:
+        """
+        Deploy an ML model. See PreloopClient.deploy_ml_model.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_DEPLOY.value, DeployMLModelResult, request)
+
+    async def delete_ml_model(self, request: DeleteMLModelRequest) -> DeleteMLModelResult:
+        """
+        Delete an ML model. See PreloopClient.delete_ml_model.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_DELETE.value, DeleteMLModelResult, request)
+
+    async def stop_ml_model(self, request: StopMLModelRequest) -> StopMLModelResult:
+        """
+        Stop a hosted ML model. See PreloopClient.stop_ml_model.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_STOP.value, StopMLModelResult, request)
+
+    async def list_ml_model_versions(self, request: ListMLModelVersionsRequest) -> ListMLModelVersionsResult:
+        """
+        List the versions of an ML model. See PreloopClient.list_ml_model_versions.
+        """
+        return await self._post(MLModelAPIPaths.ML_MODEL_LIST_VERSIONS.value, ListMLModelVersionsResult, request)
@@ -295,6 +295,63 @@ class ListTrainingJobsResult(BaseModel):
     training_jobs: List[TrainingJobDetails]
 
 
+class CreateScoringJobRequest(BaseModel):
+    """
+    The request body for scoring a version of a feature with an ML model.
+    The predictions are stored as a new feature named output_feature_name,
+    or as a new version of output_feature_id, which must be the output of
+    an earlier scoring job.
+
+    feature_version: The version of the feature to score, the latest when
+        it is not given.
+    vectorized: Whether the predict function takes a list of values for
+        each argument and returns one prediction per row, the same as for
+        batched inference. Otherwise it is called once per row.
+    """
+
+    ml_model_id: uuid.UUID
+    version: Annotated[int, Field(strict=True, gt=0)] | Literal["latest"] = "latest"
+    feature_id: uuid.UUID
+    feature_version: Optional[Annotated[int, Field(strict=True, gt=0)]] = None
+    output_feature_name: Optional[str] = None
+    output_feature_id: Optional[uuid.UUID] = None
+    vectorized: bool = True
+
+
+class CreateScoringJobResult(BaseModel):
+    """
+    The response body for creating a scoring job.
+    """
+
+    message: str
+    details: Dict[str, Any] | List[Dict[str, Any]] | None
+
+
+class ListScoringJobsRequest(BaseModel):
+    job_id: Optional[uuid.UUID] = None
+    ml_model_id: Optional[uuid.UUID] = None
+
+
+class ScoringJobDetails(BaseModel):
+    id: uuid.UUID
+    ml_model_id: uuid.UUID
+    ml_model_version: int
+    feature_id: uuid.UUID
+    feature_version: Optional[int] = None
+    output_feature_id: uuid.UUID
+    output_feature_version: Optional[int] = None
+    status: str
+    start_time: datetime
+    end_time: Optional[datetime] = None
+    reason: Optional[str] = None
+    rows_scored: int
+    total_rows: Optional[int] = None
+
+
+class ListScoringJobsResult(BaseModel):
+    scoring_jobs: List[ScoringJobDetails]
+
+
 class DeleteMLModelRequest(BaseModel):
     """
     The request body for deleting an ML model.
@@ -303,14 +360,71 @@ class DeleteMLModelRequest(BaseModel):
     ml_model_id: uuid.UUID
 
 
+class InferenceConfig(BaseModel):
+    """
+    Settings of the inference engine that serves a deployed ML model.
+    Settings that are not given use the defaults of the inference engine.
+
+    max_batch_size: The most requests passed to the predict function in one
+        call. Above 1, the predict function is called with a list of values
+        for each argument and must return one prediction per request.
+    max_batch_wait_ms: How long a request waits for others to batch with.
+    predict_executor: Whether predictions run on a thread pool, for models
+        that release the GIL, or a process pool, for pure python models.
+    predict_workers: How many predictions run at once in each worker.
+    max_queued_predictions: How many predictions can wait for a free
+        worker before requests are rejected with a 503.
+    prediction_cache_size: How many predictions each worker caches, so
+        repeated requests with the same body are served without running
+        the model. Only for models that always make the same prediction
+        for the same inputs. Caching is off when not given.
+    prediction_cache_ttl_seconds: How long cached predictions are served.
+    preload_model: Whether the model is loaded once before the workers
+        start, so they share its memory. On by default.
+    workers: How many worker processes serve the model. When not given,
+        it is derived from the cpus and memory of the container and the
+        memory the model takes.
+    compile_model: Whether scikit-learn and xgboost models are compiled to
+        ONNX when they are loaded, which makes predictions faster. Models are
+        only replaced by their compiled versions when both make the same
+        predictions, and are served by their library otherwise.
+    quantize_model: Whether the Linear and LSTM layers of PyTorch models
+        are quantized to int8 when they are loaded, which makes predictions
+        on cpus a few times faster for a small loss of accuracy. Models are
+        only replaced by their quantized versions when the predictions of
+        both differ by less than 5%, and are served in fp32 otherwise.
+    """
+
+    max_batch_size: Optional[Annotated[int, Field(gt=0)]] = None
+    max_batch_wait_ms: Optional[Annotated[float, Field(ge=0)]] = None
+    predict_executor: Optional[Literal["thread", "process"]] = None
+    predict_workers: Optional[Annotated[int, Field(gt=0)]] = None
+    max_queued_predictions: Optional[Annotated[int, Field(ge=0)]] = None
+    prediction_cache_size: Optional[Annotated[int, Field(gt=0)]] = None
+    prediction_cache_ttl_seconds: Optional[Annotated[float, Field(gt=0)]] = None
+    preload_model: Optional[bool] = None
+    workers: Optional[Annotated[int, Field(gt=0)]] = None
+    compile_model: Optional[bool] = None
+    quantize_model: Optional[bool] = None
+
+
 class DeployMLModelRequest(BaseModel):
     """
     The request body for starting an ML model.
+
+    hosting: Whether the model gets an inference engine of its own, or is
+        served with the other shared models of the organization by one
+        inference engine, which loads models on their first request and
+        unloads the least recently used ones when it runs out of memory.
+        Shared models can't use extra libraries, environment variables or
+        an inference config.
     """
 
     ml_model_id: str
     version: Annotated[int, Field(strict=True, gt=0)] | Literal["latest"]
     require_api_key: Optional[bool] = False
+    inference_config: Optional[InferenceConfig] = None
+    hosting: Literal["dedicated", "shared"] = "dedicated"
 
 
 class DeployMLModelResult(BaseModel):
@@ -322,6 +436,33 @@ class DeployMLModelResult(BaseModel):
     details: Dict[str, Any] | List[Dict[str, Any]] | None
 
 
+class HostedMLModelMetrics(BaseModel):
+    """
+    Summary of the requests to the predict endpoint of a hosted ML model, since its
+    workers last started. Times are in milliseconds and are None until a request is served.
+
+    requests: Requests to the predict and bulk endpoints.
+    errors: Requests that got a 4xx or 5xx status code.
+    error_rate: Share of the requests that got an error.
+    mean_latency_ms, p50_latency_ms, p95_latency_ms, p99_latency_ms: Time to serve a
+        request to the predict endpoint. Percentiles are estimated from histogram buckets.
+    mean_predict_ms: Time spent in the predict function for each call.
+    mean_queue_wait_ms: Time predictions waited for a free worker.
+    mean_request_bytes: Size of the request bodies of the predict endpoint.
+    """
+
+    requests: int
+    errors: int
+    error_rate: float
+    mean_latency_ms: Optional[float] = None
+    p50_latency_ms: Optional[float] = None
+    p95_latency_ms: Optional[float] = None
+    p99_latency_ms: Optional[float] = None
+    mean_predict_ms: Optional[float] = None
+    mean_queue_wait_ms: Optional[float] = None
+    mean_request_bytes: Optional[float] = None
+
+
 class HostedMLModelDetails(BaseModel):
     """
     The response body for getting hosted ML model details.
@@ -338,6 +479,8 @@ class HostedMLModelDetails(BaseModel):
     require_api_key: bool
     owner: str
     is_latest_version: bool = False
+    hosting: str = "dedicated"
+    metrics: Optional[HostedMLModelMetrics] = None
 
 
 class ListHostedMLModelsResult(BaseModel):
@@ -350,10 +493,12 @@ class ListHostedMLModelsResult(BaseModel):
 
 class ListHostedMLModelsRequest(BaseModel):
     """
-    The request body for listing hosted ML models.
+    The request body for listing hosted ML models. With include_metrics, the metrics of
+    each available hosted ML model are read from its endpoint and summarized.
     """
 
-    ml_model_id: uuid.UUID
+    ml_model_id: Optional[uuid.UUID] = None
+    include_metrics: bool = False
 
 
 class DeleteMLModelResult(BaseModel):
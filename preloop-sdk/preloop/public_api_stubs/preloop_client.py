@@ -1,14 +1,16 @@
 import json
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
 import requests
 
-from preloop.public_api_stubs.api_paths import MLModelAPIPaths
+from preloop.public_api_stubs.api_paths import IDEMPOTENT_API_PATHS, MLModelAPIPaths
 from preloop.public_api_stubs.exceptions import PreloopError
 from preloop.public_api_stubs.models import (
     CreateMLModelRequest,
     CreateMLModelResult,
+    CreateScoringJobRequest,
+    CreateScoringJobResult,
     DeleteMLModelRequest,
     DeleteMLModelResult,
     DeployMLModelRequest,
@@ -19,6 +21,8 @@ from preloop.public_api_stubs.models import (
     ListMLModelsResult,
     ListMLModelVersionsRequest,
     ListMLModelVersionsResult,
+    ListScoringJobsRequest,
+    ListScoringJobsResult,
     ListTrainingJobsRequest,
     ListTrainingJobsResult,
     RetrainMLModelRequest,
@@ -26,6 +30,13 @@ from preloop.public_api_stubs.models import (
     StopMLModelRequest,
     StopMLModelResult,
 )
+from preloop.public_api_stubs.session import (
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_TIMEOUT,
+    get_session,
+)
 
 
 class PreloopClient:
@@ -34,6 +45,10 @@ class PreloopClient:
         endpoint_url: str = "https://api.preloop.com",
         key_id: str = os.getenv("PRELOOP_KEY_ID"),
         secret: str = os.getenv("PRELOOP_SECRET"),
+        timeout: float | Tuple[float, float] = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
     ) -> None:
         """
         Initialize a new instance of the PreloopClient class.
@@ -42,6 +57,10 @@ class PreloopClient:
             endpoint_url (str, optional): The endpoint URL of the Preloop API. Defaults to "api.preloop.com".
             key_id (str, optional): The key ID for the Preloop API. Defaults to the value of the "PRELOOP_KEY_ID" environment variable.
             secret (str, optional): The secret for the Preloop API. Defaults to the value of the "PRELOOP_SECRET" environment variable.
+            timeout (float | Tuple[float, float], optional): The request timeout in seconds, or a (connect, read) tuple. Defaults to (10, 300).
+            max_retries (int, optional): The number of times a failed request is retried. Requests that change state are only retried if they never reached the API. Defaults to 3.
+            backoff_factor (float, optional): Retries wait backoff_factor * 2 ** (retry number - 1) seconds. Defaults to 0.5.
+            pool_maxsize (int, optional): The number of connections kept open to the API. Defaults to 16.
         """
         self.endpoint_url = endpoint_url
         self.headers = {
@@ -49,6 +68,14 @@ class PreloopClient:
             "key-id": key_id,
             "secret": secret,
         }
+        self.session = get_session(
+            endpoint_url,
+            IDEMPOTENT_API_PATHS,
+            timeout=timeout,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor,
+            pool_maxsize=pool_maxsize,
+        )
 
     # def list_datasources(self, request: Optional[ListDatasourcesRequest] = None) -> ListDatasourcesResult:
     #     """
@@ -366,11 +393,11 @@ class PreloopClient:
         """
         try:
             if request is None:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST.value}", headers=self.headers
                 )
             else:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST.value}",
                     headers=self.headers,
                     json=json.loads(request.model_dump_json()),
@@ -396,7 +423,7 @@ class PreloopClient:
         """
         try:
             with open(request.training_script_path, "rb") as script:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_CREATE.value}",
                     headers=self.headers,
                     data=json.loads(request.model_dump_json(exclude=["training_script_path"])),
@@ -422,7 +449,7 @@ class PreloopClient:
             PreloopError: If an HTTP error occurs.
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_RETRAIN.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -448,11 +475,11 @@ class PreloopClient:
         """
         try:
             if request is None:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST_TRAINING_JOBS.value}", headers=self.headers
                 )
             else:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST_TRAINING_JOBS.value}",
                     headers=self.headers,
                     json=json.loads(request.model_dump_json()),
@@ -463,12 +490,69 @@ class PreloopClient:
         response = ListTrainingJobsResult.model_validate_json(json_data=response.text)
         return response
 
+    def create_scoring_job(self, request: CreateScoringJobRequest) -> CreateScoringJobResult:
+        """
+        Score a version of a feature with an ML model. The predictions are stored as a new
+        version of a feature, and the job runs in the background, see list_scoring_jobs.
+
+        Args:
+            request (CreateScoringJobRequest): The request object for scoring a feature.
+
+        Returns:
+            CreateScoringJobResult: The id of the scoring job.
+
+        Raises:
+            PreloopError: If an HTTP error occurs.
+        """
+        try:
+            response = self.session.post(
+                url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_SCORE.value}",
+                headers=self.headers,
+                json=json.loads(request.model_dump_json()),
+            )
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as http_error:
+            raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        response = CreateScoringJobResult.model_validate_json(json_data=response.text)
+        return response
+
+    def list_scoring_jobs(self, request: Optional[ListScoringJobsRequest] = None) -> ListScoringJobsResult:
+        """
+        List scoring jobs, with how many rows each has scored.
+
+        Args:
+            request (ListScoringJobsRequest): The request object for listing scoring jobs.
+
+        Returns:
+            ListScoringJobsResult: A list of scoring jobs.
+
+        Raises:
+            PreloopError: If an HTTP error occurs.
+        """
+        try:
+            if request is None:
+                response = self.session.post(
+                    url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST_SCORING_JOBS.value}", headers=self.headers
+                )
+            else:
+                response = self.session.post(
+                    url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST_SCORING_JOBS.value}",
+                    headers=self.headers,
+                    json=json.loads(request.model_dump_json()),
+                )
+            response.raise_for_status()
+        except requests.HTTPError as http_error:
+            raise PreloopError(message=json.loads(http_error.response.text)["detail"]) from None
+        response = ListScoringJobsResult.model_validate_json(json_data=response.text)
+        return response
+
     def list_hosted_ml_models(self, request: Optional[ListHostedMLModelsRequest] = None) -> ListHostedMLModelsResult:
         """
         List all hosted ML models.
 
         Args:
-            request (ListHostedMLModelsRequest): The request object for listing hosted ML models.
+            request (ListHostedMLModelsRequest): The request object for listing hosted ML models. Set include_metrics
+                to get a summary of the requests served by each available model.
 
         Returns:
             ListHostedMLModelsResult: A list of hosted ML models.
@@ -478,11 +562,11 @@ class PreloopClient:
         """
         try:
             if request is None:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST_HOSTED_MODELS.value}", headers=self.headers
                 )
             else:
-                response = requests.post(
+                response = self.session.post(
                     url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST_HOSTED_MODELS.value}",
                     headers=self.headers,
                     json=json.loads(request.model_dump_json()),
@@ -507,7 +591,7 @@ class PreloopClient:
             PreloopError: If an HTTP error occurs.
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_DEPLOY.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -532,7 +616,7 @@ class PreloopClient:
             PreloopError: If an HTTP error occurs.
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_DELETE.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -557,7 +641,7 @@ class PreloopClient:
             PreloopError: If an HTTP error occurs.
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_STOP.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
@@ -582,7 +666,7 @@ class PreloopClient:
             PreloopError: If an HTTP error occurs.
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 url=f"{self.endpoint_url}{MLModelAPIPaths.ML_MODEL_LIST_VERSIONS.value}",
                 headers=self.headers,
                 json=json.loads(request.model_dump_json()),
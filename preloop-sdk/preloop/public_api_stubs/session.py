@@ -0,0 +1,146 @@
+"""
+HTTP transport used by the Preloop clients. Clients talking to the same endpoint share one
+session, so connections are pooled and kept alive across calls instead of paying for a new
+TLS handshake every time. Every request has a timeout, and failed requests are retried with
+exponential backoff when doing so can't apply a change twice. The asyncio clients get the
+same behaviour from an httpx client.
+"""
+import asyncio
+import os
+import threading
+from typing import Dict, Iterable, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (float(os.getenv("PRELOOP_CONNECT_TIMEOUT", 10)), float(os.getenv("PRELOOP_READ_TIMEOUT", 300)))
+DEFAULT_MAX_RETRIES = int(os.getenv("PRELOOP_MAX_RETRIES", 3))
+# retries wait backoff_factor * 2 ** (retry number - 1) seconds
+DEFAULT_BACKOFF_FACTOR = float(os.getenv("PRELOOP_RETRY_BACKOFF_FACTOR", 0.5))
+DEFAULT_POOL_MAXSIZE = int(os.getenv("PRELOOP_POOL_MAXSIZE", 16))
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+_sessions: Dict[Tuple, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout to requests made without one.
+    """
+
+    def __init__(self, timeout: float | Tuple[float, float], *args, **kwargs) -> None:
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _retry(max_retries: int, backoff_factor: float, idempotent: bool) -> Retry:
+    # connection errors are always retried, since the request never reached the server.
+    # Read errors and error statuses are only retried for requests that are safe to repeat.
+    allowed_methods = Retry.DEFAULT_ALLOWED_METHODS | {"POST"} if idempotent else Retry.DEFAULT_ALLOWED_METHODS
+    return Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=allowed_methods,
+        raise_on_status=False,
+    )
+
+
+def get_session(
+    endpoint_url: str,
+    idempotent_paths: Iterable[str],
+    timeout: float | Tuple[float, float] = DEFAULT_TIMEOUT,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+) -> requests.Session:
+    """
+    Returns the session shared by all clients with the same endpoint and settings. POST
+    requests to the idempotent paths are retried like GET requests.
+    """
+    idempotent_paths = tuple(idempotent_paths)
+    session_key = (endpoint_url, idempotent_paths, timeout, max_retries, backoff_factor, pool_maxsize)
+    with _sessions_lock:
+        if session_key in _sessions:
+            return _sessions[session_key]
+        session = requests.Session()
+        adapter = TimeoutHTTPAdapter(
+            timeout=timeout,
+            max_retries=_retry(max_retries, backoff_factor, idempotent=False),
+            pool_connections=1,
+            pool_maxsize=pool_maxsize,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        for path in idempotent_paths:
+            idempotent_adapter = TimeoutHTTPAdapter(
+                timeout=timeout,
+                max_retries=_retry(max_retries, backoff_factor, idempotent=True),
+                pool_connections=1,
+                pool_maxsize=pool_maxsize,
+            )
+            # share the connection pool, so only the retry policy differs between paths
+            idempotent_adapter.poolmanager = adapter.poolmanager
+            session.mount(f"{endpoint_url}{path}", idempotent_adapter)
+        _sessions[session_key] = session
+        return session
+
+
+def get_async_client(
+    timeout: float | Tuple[float, float] = DEFAULT_TIMEOUT, max_connections: int = DEFAULT_POOL_MAXSIZE
+) -> httpx.AsyncClient:
+    """
+    Returns an asyncio client that keeps at most max_connections connections open and alive
+    across calls. Its connections belong to the event loop they were opened on, so unlike
+    sessions it is not shared between Preloop clients.
+    """
+    if isinstance(timeout, tuple):
+        connect_timeout, read_timeout = timeout
+        client_timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    else:
+        client_timeout = httpx.Timeout(timeout)
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(timeout=client_timeout, limits=limits)
+
+
+async def send_with_retries(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    idempotent: bool,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    stream: bool = False,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Sends a request with the same retries as the sessions. If stream is True the body is left
+    for the caller to read, who then has to close the response.
+    """
+    for retry in range(max_retries + 1):
+        if retry > 0:
+            await asyncio.sleep(backoff_factor * 2 ** (retry - 1))
+        can_retry = retry < max_retries
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if can_retry:
+                continue
+            raise
+        except (httpx.ReadError, httpx.ReadTimeout, httpx.RemoteProtocolError):
+            if can_retry and idempotent:
+                continue
+            raise
+        if can_retry and idempotent and response.status_code in RETRY_STATUS_CODES:
+            await response.aclose()
+            continue
+        return response